@@ -1,10 +1,26 @@
+import os
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from app.utils.storage import storage_backend
 from config import Config
 
+def check_config():
+    """Refuse settings that cannot work together"""
+    if str(Config.TENANT_MODE).lower() in ('1', 'true', 'yes') and Config.ARCHIVE_DATABASE_PATH:
+        # One archive file would be shared, and overwritten, by every tenant
+        raise ValueError('ARCHIVE_DATABASE_PATH cannot be used with TENANT_MODE; '
+                         'each database is archived next to its own file')
+    if str(Config.TENANT_MODE).lower() in ('1', 'true', 'yes') and Config.REPLICA_OF:
+        # A replica follows the primary's global database only; tenant files would never catch up
+        raise ValueError('REPLICA_OF cannot be used with TENANT_MODE')
+    if int(Config.STORAGE_SHARDS) > 1 and (Config.REPLICA_OF or Config.REPLICATION_KEY):
+        # The change feed covers shard 0 only, so the other shards would never replicate
+        raise ValueError('STORAGE_SHARDS > 1 cannot be used with replication (REPLICA_OF, REPLICATION_KEY)')
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    check_config()
     
     # Enable CORS
     CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -22,6 +38,43 @@ def create_app(config_class=Config):
     from app.widget import bp as widget_bp
     app.register_blueprint(widget_bp)
     
+    # Change log triggers are installed (or dropped, once the feed is turned
+    # off) here rather than on every database open
+    if storage_backend() == 'sqlite':
+        from app.utils.database import DatabaseManager, change_feed_enabled
+        from app.utils.sharding import shard_paths
+        enabled = change_feed_enabled()
+        for db_path in shard_paths(app.config['DATABASE_PATH']):
+            if enabled or os.path.exists(db_path):
+                DatabaseManager(db_path).sync_change_feed()
+    
+    # Replicas follow the primary's change feed; its retention deletes arrive that way
+    if app.config.get('REPLICA_OF'):
+        from app.utils.replication import start_follower
+        start_follower(
+            app.config['DATABASE_PATH'], app.config['REPLICA_OF'], app.config['REPLICA_API_KEY'],
+            float(app.config['REPLICA_POLL_INTERVAL']), int(app.config['REPLICA_BATCH_SIZE']),
+            float(app.config['REPLICA_FORWARD_TIMEOUT'])
+        )
+    
+    # Background retention runs (batched TTL deletes + incremental vacuum).
+    # Replicas only expire their own bookkeeping tables
+    if app.config.get('RETENTION_INTERVAL') and storage_backend() == 'sqlite':
+        from app.utils.retention import start_retention_scheduler
+        from app.utils.sharding import shard_paths
+        for db_path in shard_paths(app.config['DATABASE_PATH']):
+            start_retention_scheduler(db_path, float(app.config['RETENTION_INTERVAL']))
+    
+    # Online backups, copied a few pages at a time so writers are not held up
+    if app.config.get('BACKUP_INTERVAL') and storage_backend() == 'sqlite':
+        from app.utils.backup import start_backup_scheduler
+        start_backup_scheduler(app.config['DATABASE_PATH'], float(app.config['BACKUP_INTERVAL']))
+    
+    # Build the search index in the background if it is enabled but missing
+    if str(app.config.get('SEARCH_INDEX_ENABLED')).lower() in ('1', 'true', 'yes') and storage_backend() == 'sqlite':
+        from app.utils.search import get_search_index_builder
+        get_search_index_builder(app.config['DATABASE_PATH']).trigger()
+    
     # Add error handlers for API endpoints
     @app.errorhandler(405)
     def method_not_allowed(error):
@@ -1,15 +1,66 @@
-from flask import Blueprint, request, jsonify, render_template, current_app
+from flask import Blueprint, request, jsonify, render_template, current_app, Response, stream_with_context, send_file
 from app.utils.database import DatabaseManager
 from app.api.auth import require_admin_auth
+from app.api.replica import forward_to_primary, is_replica
+from app.utils.backup import get_backup_scheduler
+from app.utils.retention import get_retention_scheduler
+from app.utils.search import SearchQueryError, get_search_index_builder
+from app.utils.export import ExportError, gzip_stream, ndjson, normalize_timestamp, parse_tables
+from app.utils.columnar import COLUMNAR_TABLES, ColumnarUnavailable
+from app.utils.analytics import to_epoch
+from app.utils.session_metadata import MetadataColumnError, parse_filters
+from app.utils.timeline import TimelineError
+from app.utils.replication import get_follower
+from app.utils.sharding import shard_count
+from app.utils.storage import open_database, storage_backend
+from app.utils.tenants import TenantError, request_db_path
+from app.api.tenancy import select_tenant, tenant_mode
+from config import Config
 from datetime import datetime
+from functools import wraps
 import json
+import os
 
 bp = Blueprint('admin', __name__)
 
 def get_db():
-    """Get database manager instance"""
-    db_path = current_app.config.get('DATABASE_PATH', 'web_chat_bridge.db')
-    return DatabaseManager(db_path)
+    """Get database manager instance for the request's tenant (sharded if configured)"""
+    return open_database(request_db_path())
+
+def get_global_db():
+    """Get the global database manager, which holds the tenant list"""
+    return DatabaseManager(current_app.config.get('DATABASE_PATH', 'web_chat_bridge.db'))
+
+def unsupported(feature):
+    """501 response for a feature the storage backend does not have"""
+    sharded = f' with {shard_count()} shards' if storage_backend() == 'sqlite' and shard_count() > 1 else ''
+    return jsonify({
+        'success': False,
+        'error': f'Not supported by the {storage_backend()} storage backend{sharded} ({feature})'
+    }), 501
+
+def requires_feature(feature):
+    """Answer 501 instead of running the view when the storage backend lacks a feature"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not get_db().supports(feature):
+                return unsupported(feature)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+@bp.before_request
+def route_tenant_requests():
+    """Tenant mode: ?tenant= or X-Tenant-Id selects the tenant database to administer"""
+    return select_tenant()
+
+@bp.before_request
+def forward_admin_writes():
+    """Replica: admin reads are served locally, changes go to the primary"""
+    if is_replica() and request.method not in ('GET', 'HEAD', 'OPTIONS') and request.path.startswith('/admin/api/'):
+        return forward_to_primary()
+    return None
 
 @bp.route('/')
 def admin_interface():
@@ -19,16 +70,20 @@ def admin_interface():
 @bp.route('/api/sessions')
 @require_admin_auth
 def get_sessions():
-    """Get active sessions"""
+    """Get active sessions, optionally filtered by metadata (meta.<key>=<value>)"""
     db = get_db()
     
     limit = min(int(request.args.get('limit', 50)), 100)
     offset = int(request.args.get('offset', 0))
     active = request.args.get('active', 'true')
+    try:
+        metadata = parse_filters(request.args)
+    except MetadataColumnError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     try:
-        sessions = db.get_active_sessions(limit, offset, active == 'true')
-        total = db.get_session_count(active == 'true')
+        sessions = db.get_active_sessions(limit, offset, active == 'true', metadata or None)
+        total = db.get_session_count(active == 'true', metadata or None)
         
         return jsonify({
             'success': True,
@@ -59,54 +114,420 @@ def get_session_messages():
         return jsonify({'success': False, 'error': 'Missing session_id'}), 400
     
     try:
-        # Get session info
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM web_chat_sessions WHERE id = ?
-        """, (session_id,))
-        session = cursor.fetchone()
+        data = db.get_session_messages(session_id)
+        if data is None:
+            return jsonify({'success': False, 'error': 'Session not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
         
-        if not session:
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/session_timeline')
+@require_admin_auth
+@requires_feature('timeline')
+def get_session_timeline():
+    """Page through a session's messages and responses merged in time order"""
+    db = get_db()
+    
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({'success': False, 'error': 'Missing session_id'}), 400
+    
+    try:
+        limit = min(max(int(request.args.get('limit', Config.TIMELINE_PAGE_SIZE)), 1),
+                    int(Config.TIMELINE_MAX_PAGE_SIZE))
+        if not db.session_exists(session_id):
             return jsonify({'success': False, 'error': 'Session not found'}), 404
+        data = db.get_session_timeline(session_id, limit, request.args.get('cursor') or None)
+        data['limit'] = limit
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
         
-        # Get messages
-        cursor.execute("""
-            SELECT id, session_id, message, timestamp FROM web_chat_messages 
-            WHERE session_id = ? ORDER BY timestamp ASC
-        """, (session_id,))
-        messages = [dict(row) for row in cursor.fetchall()]
-        
-        # Get responses
-        cursor.execute("""
-            SELECT id, response, message_id, timestamp FROM web_chat_responses 
-            WHERE session_id = ? ORDER BY timestamp ASC
-        """, (session_id,))
-        responses = []
-        for row in cursor.fetchall():
-            responses.append({
-                'id': row['id'],
-                'response': row['response'],
-                'timestamp': row['timestamp'],
-                'message_id': row['message_id']
-            })
+    except (TimelineError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/consumer_groups')
+@require_admin_auth
+def get_consumer_groups():
+    """Live members of the inbox consumer groups"""
+    try:
+        db = get_db()
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': {'groups': db.get_consumer_groups(), 'ttl': int(Config.CONSUMER_TTL)}
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/replication')
+@require_admin_auth
+@requires_feature('change_feed')
+def get_replication_status():
+    """Replication role, change log head and (on a replica) follower progress"""
+    try:
+        db = get_db()
+        follower = get_follower(db.db_path)
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': {
+                'role': 'replica' if is_replica() else 'primary',
+                'last_seq': db.get_change_log_head(),
+                'follower': follower.status() if follower is not None else None
+            }
+        })
         
-        conn.close()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/tenants', methods=['GET', 'POST', 'DELETE'])
+@require_admin_auth
+def handle_tenants():
+    """List tenants, register one (or rotate its key), or remove one"""
+    db = get_global_db()
+    
+    try:
+        if request.method == 'POST':
+            body = request.get_json(silent=True) or {}
+            data = db.save_tenant(body.get('tenant_id', ''), body.get('api_key'))
+        elif request.method == 'DELETE':
+            tenant_id = request.args.get('tenant_id', '')
+            delete_data = request.args.get('delete_data', 'false') == 'true'
+            data = {'removed': db.remove_tenant(tenant_id, delete_data)}
+        else:
+            data = {
+                'tenant_mode': tenant_mode(),
+                'tenants': db.list_tenants()
+            }
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
         
+    except TenantError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/search')
+@require_admin_auth
+@requires_feature('search')
+def search_conversations():
+    """Full-text search over messages and responses"""
+    db = get_db()
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'Missing q'}), 400
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        data = db.search_conversations(
+            query,
+            limit=limit,
+            cursor=request.args.get('cursor') or None,
+            session_id=request.args.get('session_id') or None,
+            order=request.args.get('order', 'rank'),
+            raw=request.args.get('syntax') == 'fts'
+        )
+        if data is None:
+            return jsonify({'success': False, 'error': 'Search index unavailable'}), 503
+        data['limit'] = limit
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
+        
+    except (SearchQueryError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/search_index', methods=['GET', 'POST'])
+@require_admin_auth
+@requires_feature('search')
+def search_index_status():
+    """Get the search index build status, or build it (rebuild=true empties and refills it)"""
+    builder = get_search_index_builder(request_db_path())
+    
+    try:
+        if request.method == 'POST':
+            if str(Config.SEARCH_INDEX_ENABLED).lower() not in ('1', 'true', 'yes'):
+                return jsonify({'success': False, 'error': 'Search index is disabled (SEARCH_INDEX_ENABLED)'}), 400
+            wait = request.args.get('wait', 'false') == 'true'
+            rebuild = request.args.get('rebuild', 'false') == 'true'
+            if not builder.trigger(rebuild=rebuild, wait=wait):
+                return jsonify({'success': False, 'error': 'Search index build already in progress'}), 409
+        
+        data = builder.status()
+        data['ready'] = get_db().ensure_search_index()
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/export')
+@require_admin_auth
+@requires_feature('export')
+def export_data():
+    """Stream sessions, messages and responses as NDJSON (optionally gzipped)
+    
+    format=npz|arrow|parquet writes message/response metadata as a columnar file instead.
+    """
+    db = get_db()
+    
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        tables = parse_tables(request.args.get('tables'))
+        start = normalize_timestamp(request.args.get('from'))
+        end = normalize_timestamp(request.args.get('to'))
+    except ExportError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if fmt != 'ndjson':
+        if not db.supports('columnar'):
+            return unsupported('columnar')
+        return export_columnar(db, fmt, tables if request.args.get('tables') else list(COLUMNAR_TABLES), start, end)
+    
+    body = ndjson(db.export_rows(tables, start, end))
+    filename = f"export_{datetime.now().strftime('%Y%m%d%H%M%S')}.ndjson"
+    mimetype = 'application/x-ndjson'
+    if request.args.get('gzip', 'false') == 'true':
+        body = gzip_stream(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def export_columnar(db, fmt, tables, start, end):
+    """Send a columnar export file and delete it once the response is closed"""
+    try:
+        path, counts = db.export_columnar(fmt, tables, start, end)
+    except ColumnarUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 501
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    response = send_file(
+        path,
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f"export_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    )
+    response.headers['X-Export-Rows'] = json.dumps(counts)
+    response.call_on_close(lambda: os.remove(path) if os.path.exists(path) else None)
+    return response
+
+@bp.route('/api/analytics')
+@require_admin_auth
+@requires_feature('analytics')
+def get_analytics():
+    """Response latency percentiles, messages per hour and session distributions"""
+    db = get_db()
+    
+    try:
+        end = to_epoch(request.args.get('to')) or int(datetime.now().timestamp())
+        start = to_epoch(request.args.get('from')) or end - 24 * 3600
+    except ValueError:
+        return jsonify({'success': False, 'error': 'from and to must be ISO 8601 timestamps'}), 400
+    if start >= end:
+        return jsonify({'success': False, 'error': 'from must be before to'}), 400
+    if end - start > int(Config.ANALYTICS_MAX_HOURS) * 3600:
+        return jsonify({'success': False, 'error': f'Range is limited to {Config.ANALYTICS_MAX_HOURS} hours'}), 400
+    
+    try:
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': db.get_analytics(start, end)
+        })
+        
+    except ColumnarUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 501
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/rollups')
+@require_admin_auth
+@requires_feature('rollups')
+def get_rollups():
+    """Hourly message, response, session and per-endpoint request counts"""
+    db = get_db()
+    
+    metrics = [m.strip() for m in request.args.get('metrics', '').split(',') if m.strip()]
+    try:
+        rows = db.get_rollups(
+            normalize_timestamp(request.args.get('from')),
+            normalize_timestamp(request.args.get('to')),
+            metrics or None
+        )
+        totals = {}
+        for row in rows:
+            totals[row['metric']] = totals.get(row['metric'], 0) + row['value']
         return jsonify({
             'success': True,
             'message': 'Success',
             'timestamp': datetime.now().isoformat(),
             'data': {
-                'session': dict(session),
-                'messages': messages,
-                'responses': responses
+                'rows': rows,
+                'totals': totals
             }
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@bp.route('/api/stats')
+@require_admin_auth
+def get_stats():
+    """Get in-process cache and buffer statistics"""
+    db = get_db()
+    
+    try:
+        data = db.get_runtime_stats()
+        # Scanning stored bodies reads every row, so only on request
+        if request.args.get('storage', 'false') == 'true':
+            if not db.supports('compression'):
+                return unsupported('compression')
+            data['compression']['stored'] = db.get_compression_stats()
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/retention', methods=['GET', 'POST'])
+@require_admin_auth
+@requires_feature('retention')
+def retention_status():
+    """Get retention scheduler progress and timings, or trigger a run"""
+    db_path = request_db_path()
+    scheduler = get_retention_scheduler(db_path)
+    
+    try:
+        if request.method == 'POST':
+            wait = request.args.get('wait', 'false') == 'true'
+            started = scheduler.trigger(wait=wait)
+            if not started:
+                return jsonify({'success': False, 'error': 'Retention run already in progress'}), 409
+        
+        data = scheduler.status()
+        data['policies'] = [policy.describe() for policy in get_db().get_retention_policies()]
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/backup', methods=['GET', 'POST'])
+@require_admin_auth
+@requires_feature('backup')
+def backup_status():
+    """Get online backup timings and the kept copies, or back up now"""
+    scheduler = get_backup_scheduler(request_db_path())
+    
+    try:
+        if request.method == 'POST':
+            wait = request.args.get('wait', 'false') == 'true'
+            started = scheduler.trigger(wait=wait)
+            if not started:
+                return jsonify({'success': False, 'error': 'Backup already in progress'}), 409
+        
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': scheduler.status()
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/archive', methods=['GET', 'POST'])
+@require_admin_auth
+@requires_feature('archive')
+def archive_status():
+    """Get archive size and row counts, or move old rows into the archive now"""
+    db = get_db()
+    
+    try:
+        archive = db.get_archive_manager()
+        data = {}
+        if request.method == 'POST':
+            data['results'] = db.run_archive()
+        data.update(archive.stats())
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@bp.route('/api/storage_format', methods=['GET', 'POST'])
+@require_admin_auth
+@requires_feature('storage_format')
+def storage_format():
+    """Get the storage format version, or migrate to integer session keys and timestamps"""
+    db = get_db()
+    
+    try:
+        data = {}
+        if request.method == 'POST':
+            data['results'] = db.migrate_storage_format()
+        data.update(db.get_storage_format())
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': data
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @bp.route('/api/config', methods=['GET', 'POST'])
 @require_admin_auth
 def handle_config():
@@ -139,6 +560,8 @@ def handle_config():
                 'timestamp': datetime.now().isoformat()
             })
             
+        except MetadataColumnError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -170,25 +593,21 @@ def clear_all_data():
     db = get_db()
     
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Get counts before deletion
-        cursor.execute("SELECT COUNT(*) FROM web_chat_sessions")
-        sessions_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM web_chat_messages")
-        messages_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM web_chat_responses")
-        responses_count = cursor.fetchone()[0]
-        
-        # Clear all data
-        cursor.execute("DELETE FROM web_chat_responses")
-        cursor.execute("DELETE FROM web_chat_messages")
-        cursor.execute("DELETE FROM web_chat_sessions")
-        cursor.execute("DELETE FROM rate_limits")
-        
-        conn.commit()
-        conn.close()
+        # Fast reset: swap in an empty database file instead of deleting rows
+        if request.args.get('mode') == 'swap':
+            result = db.reset_database(archive=request.args.get('archive', 'false') == 'true')
+            return jsonify({
+                'success': True,
+                'message': 'Success',
+                'timestamp': datetime.now().isoformat(),
+                'data': {
+                    'message': 'All data cleared successfully',
+                    'mode': 'swap',
+                    'cleaned_data': result['cleaned_data'],
+                    'estimated': result['estimated'],
+                    'archive_path': result['archive_path']
+                }
+            })
         
         return jsonify({
             'success': True,
@@ -196,11 +615,7 @@ def clear_all_data():
             'timestamp': datetime.now().isoformat(),
             'data': {
                 'message': 'All data cleared successfully',
-                'cleaned_data': {
-                    'sessions': sessions_count,
-                    'messages': messages_count,
-                    'responses': responses_count
-                }
+                'cleaned_data': db.clear_all_data()
             }
         })
         
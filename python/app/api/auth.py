@@ -1,6 +1,21 @@
 from functools import wraps
 from flask import request, jsonify, current_app
 from app.utils.database import DatabaseManager
+from app.utils.storage import open_database, storage_backend
+from app.utils.tenants import request_db_path
+
+def get_auth_db():
+    """Storage holding the API and admin keys: SQLite, or the configured backend"""
+    if storage_backend() == 'sqlite':
+        return DatabaseManager()
+    return open_database(request_db_path())
+
+def get_admin_auth_db():
+    """Storage holding the admin key: always the global database, also in tenant mode"""
+    db_path = current_app.config.get('DATABASE_PATH', 'web_chat_bridge.db')
+    if storage_backend() == 'sqlite':
+        return DatabaseManager(db_path)
+    return open_database(db_path)
 
 def require_auth(f):
     """Require API key authentication"""
@@ -17,7 +32,7 @@ def require_auth(f):
         api_key = auth_header[7:]  # Remove 'Bearer ' prefix
         
         # Get API key from database
-        db_manager = DatabaseManager()
+        db_manager = get_auth_db()
         config = db_manager.get_all_config()
         stored_api_key = config.get('api_key', current_app.config['DEFAULT_API_KEY'])
         
@@ -45,8 +60,8 @@ def require_admin_auth(f):
         
         admin_key = auth_header[7:]  # Remove 'Bearer ' prefix
         
-        # Get admin key from database
-        db_manager = DatabaseManager()
+        # Get admin key from the global database
+        db_manager = get_admin_auth_db()
         config = db_manager.get_all_config()
         stored_admin_key = config.get('admin_key', current_app.config['DEFAULT_ADMIN_KEY'])
         
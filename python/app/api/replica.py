@@ -0,0 +1,33 @@
+from flask import request, jsonify
+from app.utils.replication import FORWARDED_HEADERS, REPLICATION_KEY_HEADER, forward_request
+from config import Config
+
+def is_replica():
+    """True when this node follows a primary (Config.REPLICA_OF is set)"""
+    return bool(Config.REPLICA_OF)
+
+def trust_forwarded_address():
+    """On the primary, use the client address of requests forwarded by a replica
+
+    Only requests carrying the shared REPLICATION_KEY are trusted, so rate
+    limits keep applying per client rather than per replica.
+    """
+    key = Config.REPLICATION_KEY
+    if key and request.headers.get(REPLICATION_KEY_HEADER) == key:
+        forwarded = request.headers.get('X-Forwarded-For', '').split(',')[0].strip()
+        if forwarded:
+            request.remote_addr = forwarded
+
+def forward_to_primary():
+    """Send the current request to the primary and relay its response"""
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    headers['X-Forwarded-For'] = request.remote_addr or ''
+    if Config.REPLICATION_KEY:
+        headers[REPLICATION_KEY_HEADER] = Config.REPLICATION_KEY
+    try:
+        return forward_request(
+            Config.REPLICA_OF, request.method, request.path, request.query_string,
+            request.get_data(), headers, float(Config.REPLICA_FORWARD_TIMEOUT)
+        )
+    except Exception:
+        return jsonify({'success': False, 'error': 'Primary unavailable'}), 502
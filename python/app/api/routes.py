@@ -1,16 +1,23 @@
 from flask import Blueprint, request, jsonify, current_app
-from app.utils.database import DatabaseManager
 from app.utils.rate_limiting import RateLimitManager
-from app.api.auth import require_auth, require_admin_auth
+from app.api.auth import get_admin_auth_db, require_auth, require_admin_auth
+from app.api.replica import forward_to_primary, is_replica, trust_forwarded_address
+from app.utils.idempotency import DuplicateRequest, IdempotencyKeyError, parse_key
+from app.utils.fair_inbox import parse_mode
+from app.utils.consumer_groups import parse_member
+from app.utils.replication import is_write
+from app.utils.storage import open_database
+from app.utils.tenants import request_db_path
+from app.api.tenancy import select_tenant
+from config import Config
 import re
 from datetime import datetime
 
 bp = Blueprint('api', __name__)
 
 def get_db():
-    """Get database manager instance"""
-    db_path = current_app.config.get('DATABASE_PATH', 'web_chat_bridge.db')
-    return DatabaseManager(db_path)
+    """Get database manager instance for the request's tenant (sharded if configured)"""
+    return open_database(request_db_path())
 
 def get_rate_limiter():
     """Get rate limiter instance"""
@@ -23,6 +30,17 @@ def validate_session_id(session_id: str) -> bool:
     pattern = r'^session_[a-zA-Z0-9_]+$'
     return bool(re.match(pattern, session_id)) and len(session_id) <= 64
 
+def idempotent_replay(data: dict):
+    """Answer a retried write with the result of the original request"""
+    response = jsonify({
+        'success': True,
+        'message': 'Success',
+        'timestamp': datetime.now().isoformat(),
+        'data': data
+    })
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
 def validate_message(message: str) -> bool:
     """Validate message content - IDENTICAL to PHP version"""
     return (
@@ -32,6 +50,27 @@ def validate_message(message: str) -> bool:
         message.strip() != ''
     )
 
+@bp.before_request
+def route_tenant_requests():
+    """Tenant mode: use the database of the request's tenant"""
+    return select_tenant()
+
+@bp.before_request
+def route_replicated_requests():
+    """Replica: forward writes to the primary and serve reads locally"""
+    trust_forwarded_address()
+    if not is_replica() or request.method == 'OPTIONS':
+        return None
+    action = request.args.get('action') or request.path.rstrip('/').rsplit('/', 1)[-1]
+    if is_write(action, request.method):
+        return forward_to_primary()
+    if action == 'responses':
+        # Sessions are created on the primary; until one replicates, poll there
+        session_id = request.args.get('session_id', '').strip()
+        if validate_session_id(session_id) and not get_db().session_exists(session_id):
+            return forward_to_primary()
+    return None
+
 # Single entry point for API - IDENTICAL to PHP structure
 @bp.route('/', methods=['GET', 'POST', 'OPTIONS'])
 def api_entry_point():
@@ -66,6 +105,10 @@ def api_entry_point():
         return handle_clear_data()
     elif action == 'cleanup_logs':
         return handle_cleanup_logs()
+    elif action == 'changes':
+        return handle_changes()
+    elif action == 'activity':
+        return handle_activity()
     else:
         return jsonify({'success': False, 'error': 'Invalid action'}), 400
 
@@ -92,6 +135,18 @@ def handle_responses_direct():
     """Direct route for responses - same as ?action=responses"""
     return handle_responses()
 
+@bp.route('/changes', methods=['GET'])
+@require_auth
+def handle_changes_direct():
+    """Direct route for changes - same as ?action=changes"""
+    return handle_changes()
+
+@bp.route('/activity', methods=['POST'])
+@require_auth
+def handle_activity_direct():
+    """Direct route for activity - same as ?action=activity"""
+    return handle_activity()
+
 @bp.route('/sessions', methods=['GET'])
 @require_admin_auth
 def handle_sessions_direct():
@@ -151,9 +206,20 @@ def handle_messages():
     if not validate_message(message):
         return jsonify({'success': False, 'error': 'Invalid message'}), 400
     
+    # Retries carrying the same key return the first result instead of a second message
+    try:
+        idempotency_key = parse_key(request.headers.get('Idempotency-Key'), data.get('client_msg_id'))
+    except IdempotencyKeyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     try:
         db = get_db()
         
+        if idempotency_key:
+            original = db.find_idempotent_response('messages', session_id, idempotency_key)
+            if original is not None:
+                return idempotent_replay(original)
+        
         # Check if session exists and create if needed - IDENTICAL to PHP
         session_existed = db.session_exists(session_id)
         if not session_existed:
@@ -165,21 +231,25 @@ def handle_messages():
         # A user is new if the session didn't exist before this request
         is_new_user = not session_existed
         
+        result = {
+            'session_id': session_id,
+            'timestamp': timestamp,
+            'uid': uid,
+            'is_new_user': is_new_user
+        }
+        
         # Store message - IDENTICAL to PHP
-        message_id = db.create_message(session_id, message)
+        try:
+            message_id = db.create_message(session_id, message, idempotency_key=idempotency_key, response=result)
+        except DuplicateRequest as e:
+            return idempotent_replay(e.response)
         
         # Response format - IDENTICAL to PHP
         return jsonify({
             'success': True,
             'message': 'Success',
             'timestamp': datetime.now().isoformat(),
-            'data': {
-                'message_id': message_id,
-                'session_id': session_id,
-                'timestamp': timestamp,
-                'uid': uid,
-                'is_new_user': is_new_user
-            }
+            'data': dict(message_id=message_id, **result)
         })
         
     except Exception as e:
@@ -204,15 +274,39 @@ def handle_inbox():
     limit = min(int(request.args.get('limit', 50)), 100)
     offset = int(request.args.get('offset', 0))
     since = request.args.get('since', '')
+    try:
+        mode = parse_mode(request.args.get('mode'), Config.INBOX_MODE)
+        per_session = int(request.args.get('per_session', Config.INBOX_SESSION_CAP))
+        member = parse_member(request.args.get('group'), request.args.get('consumer'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     try:
         db = get_db()
         
-        # Get messages with UID information - IDENTICAL to PHP
-        messages = db.get_unprocessed_messages(limit, offset, since)
+        # Consumer groups: each member only receives the sessions it owns
+        assignment = None
+        if member:
+            if request.args.get('leave', '').lower() in ('1', 'true'):
+                return jsonify({
+                    'success': True,
+                    'message': 'Success',
+                    'timestamp': datetime.now().isoformat(),
+                    'data': {'left': db.leave_consumer_group(*member)}
+                })
+            assignment = db.join_consumer_group(*member)
+        
+        # Get messages with UID information - IDENTICAL to PHP (in the default fifo mode)
+        if mode == 'fifo' and not assignment:
+            messages = db.get_unprocessed_messages(limit, offset, since)
+        else:
+            messages = db.get_unprocessed_messages(limit, offset, since, mode, per_session, assignment)
         
         # Get total count - IDENTICAL to PHP
-        total = db.get_unprocessed_message_count(since)
+        if assignment:
+            total = db.get_unprocessed_message_count(since, assignment)
+        else:
+            total = db.get_unprocessed_message_count(since)
         
         # Mark messages as processed - IDENTICAL to PHP
         if messages:
@@ -220,19 +314,22 @@ def handle_inbox():
             db.mark_messages_processed(message_ids)
         
         # Response format - IDENTICAL to PHP
+        data = {
+            'messages': messages,
+            'pagination': {
+                'total': total,
+                'limit': limit,
+                'offset': offset,
+                'has_more': (offset + limit) < total
+            }
+        }
+        if assignment:
+            data['assignment'] = assignment.to_dict()
         return jsonify({
             'success': True,
             'message': 'Success',
             'timestamp': datetime.now().isoformat(),
-            'data': {
-                'messages': messages,
-                'pagination': {
-                    'total': total,
-                    'limit': limit,
-                    'offset': offset,
-                    'has_more': (offset + limit) < total
-                }
-            }
+            'data': data
         })
         
     except Exception as e:
@@ -273,26 +370,42 @@ def handle_outbox():
     if not validate_session_id(session_id):
         return jsonify({'success': False, 'error': 'Invalid session ID'}), 400
     
+    try:
+        idempotency_key = parse_key(request.headers.get('Idempotency-Key'), data.get('client_msg_id'))
+    except IdempotencyKeyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
     try:
         db = get_db()
         
+        if idempotency_key:
+            original = db.find_idempotent_response('outbox', session_id, idempotency_key)
+            if original is not None:
+                return idempotent_replay(original)
+        
         # Validate session - IDENTICAL to PHP
         if not db.session_exists(session_id):
             return jsonify({'success': False, 'error': 'Invalid session'}), 400
         
+        result = {
+            'session_id': session_id,
+            'timestamp': timestamp
+        }
+        
         # Store response - IDENTICAL to PHP (with message_id)
-        response_id = db.create_response_with_message_id(session_id, response, message_id if message_id else None)
+        try:
+            response_id = db.create_response_with_message_id(
+                session_id, response, message_id if message_id else None, idempotency_key, result
+            )
+        except DuplicateRequest as e:
+            return idempotent_replay(e.response)
         
         # Response format - IDENTICAL to PHP
         return jsonify({
             'success': True,
             'message': 'Success',
             'timestamp': datetime.now().isoformat(),
-            'data': {
-                'response_id': response_id,
-                'session_id': session_id,
-                'timestamp': timestamp
-            }
+            'data': dict(response_id=response_id, **result)
         })
         
     except Exception as e:
@@ -341,6 +454,73 @@ def handle_responses():
     except Exception as e:
         return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+def handle_changes():
+    """Handle GET /api/v1/?action=changes - tail the change log by sequence number"""
+    if request.method != 'GET':
+        return jsonify({'success': False, 'error': 'Method not allowed'}), 405
+    
+    auth_result = require_auth_internal()
+    if auth_result:
+        return auth_result
+    
+    rate_limiter = get_rate_limiter()
+    if not rate_limiter.check_rate_limit(request.remote_addr, '/api/changes', 120):
+        return jsonify({'success': False, 'error': 'Rate limit exceeded'}), 429
+    
+    try:
+        after_seq = int(request.args.get('after_seq', 0))
+        limit = min(max(int(request.args.get('limit', Config.CHANGE_FEED_PAGE_SIZE)), 1),
+                    int(Config.CHANGE_FEED_MAX_PAGE_SIZE))
+        if after_seq < 0:
+            raise ValueError('after_seq must not be negative')
+        entities = [e.strip() for e in request.args.get('entity', '').split(',') if e.strip()] or None
+        db = get_db()
+        data = db.get_changes(after_seq, limit, entities)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+    
+    if data is None:
+        return jsonify({'success': False, 'error': 'Change feed unavailable'}), 503
+    data['limit'] = limit
+    return jsonify({
+        'success': True,
+        'message': 'Success',
+        'timestamp': datetime.now().isoformat(),
+        'data': data
+    })
+
+def handle_activity():
+    """Handle POST /api/v1/?action=activity - session activity reported by replicas"""
+    if request.method != 'POST':
+        return jsonify({'success': False, 'error': 'Method not allowed'}), 405
+    
+    auth_result = require_auth_internal()
+    if auth_result:
+        return auth_result
+    
+    data = request.get_json(silent=True) or {}
+    session_ids = data.get('session_ids')
+    if not isinstance(session_ids, list) or len(session_ids) > 1000:
+        return jsonify({'success': False, 'error': 'session_ids must be a list of at most 1000 ids'}), 400
+    
+    try:
+        db = get_db()
+        updated = 0
+        for session_id in session_ids:
+            if isinstance(session_id, str) and validate_session_id(session_id):
+                db.update_session_activity(session_id)
+                updated += 1
+        return jsonify({
+            'success': True,
+            'message': 'Success',
+            'timestamp': datetime.now().isoformat(),
+            'data': {'updated': updated}
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+
 def handle_sessions():
     """Handle GET /api/v1/?action=sessions - IDENTICAL to PHP"""
     if request.method != 'GET':
@@ -466,25 +646,28 @@ def handle_clear_data():
     
     try:
         db = get_db()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Get counts before deletion - IDENTICAL to PHP
-        cursor.execute("SELECT COUNT(*) FROM web_chat_responses")
-        responses_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM web_chat_messages")
-        messages_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM web_chat_sessions")
-        sessions_count = cursor.fetchone()[0]
-        
-        # Clear all data - IDENTICAL to PHP
-        cursor.execute("DELETE FROM web_chat_responses")
-        cursor.execute("DELETE FROM web_chat_messages")
-        cursor.execute("DELETE FROM web_chat_sessions")
-        cursor.execute("DELETE FROM rate_limits")
-        
-        conn.commit()
-        conn.close()
+        
+        # Fast reset: swap in an empty database file instead of deleting rows
+        if request.args.get('mode') == 'swap':
+            result = db.reset_database(archive=request.args.get('archive', 'false') == 'true')
+            return jsonify({
+                'success': True,
+                'message': 'Success',
+                'timestamp': datetime.now().isoformat(),
+                'data': {
+                    'message': 'All data cleared successfully',
+                    'mode': 'swap',
+                    'cleared_estimate': result['cleaned_data'],
+                    'archive_path': result['archive_path'],
+                    'remaining_data': {
+                        'responses': 0,
+                        'messages': 0,
+                        'sessions': 0
+                    }
+                }
+            })
+        
+        db.clear_all_data()
         
         # Log the action (we'll implement logging later)
         # log_message('WARNING', 'All data cleared by admin', {'admin_ip': request.remote_addr})
@@ -563,11 +746,15 @@ def require_auth_internal():
     db_manager = get_db()
     config = db_manager.get_all_config()
     stored_api_key = config.get('api_key', current_app.config['DEFAULT_API_KEY'])
-    stored_admin_key = config.get('admin_key', current_app.config['DEFAULT_ADMIN_KEY'])
     
-    # Accept either API key or admin key for inbox access
-    if key != stored_api_key and key != stored_admin_key:
-        return jsonify({'success': False, 'error': 'Invalid API key'}), 401
+    # Accept either API key or admin key for inbox access; the admin key
+    # is the global one, also for a tenant's database
+    if key != stored_api_key:
+        if request_db_path() != current_app.config.get('DATABASE_PATH'):
+            config = get_admin_auth_db().get_all_config()
+        stored_admin_key = config.get('admin_key', current_app.config['DEFAULT_ADMIN_KEY'])
+        if key != stored_admin_key:
+            return jsonify({'success': False, 'error': 'Invalid API key'}), 401
     
     return None
 
@@ -578,7 +765,7 @@ def require_admin_auth_internal():
         return jsonify({'success': False, 'error': 'Authentication required'}), 401
     
     admin_key = auth_header[7:]
-    db_manager = get_db()
+    db_manager = get_admin_auth_db()
     config = db_manager.get_all_config()
     stored_admin_key = config.get('admin_key', current_app.config['DEFAULT_ADMIN_KEY'])
     
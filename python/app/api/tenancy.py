@@ -0,0 +1,44 @@
+from flask import current_app, g, jsonify, request
+from app.utils.storage import storage_backend
+from app.utils.tenants import get_registry, start_tenant_jobs, tenant_db_path
+from config import Config
+
+def tenant_mode():
+    """True when requests are routed to per-tenant database files"""
+    return str(Config.TENANT_MODE).lower() in ('1', 'true', 'yes')
+
+def select_tenant():
+    """Tenant mode: point this request's DatabaseManager at the tenant's file
+
+    The tenant is named by ?tenant= or X-Tenant-Id (admin tools), or else
+    found from the request's API key. Requests matching neither use the
+    global database.
+    """
+    if not tenant_mode():
+        return None
+    g.tenant = None
+    g.db_path = None
+    base_path = current_app.config.get('DATABASE_PATH', 'web_chat_bridge.db')
+    registry = get_registry(base_path, float(Config.TENANT_CACHE_TTL))
+    
+    tenant_id = request.args.get('tenant') or request.headers.get('X-Tenant-Id')
+    if tenant_id:
+        tenant = registry.get(tenant_id)
+        if tenant is None:
+            return jsonify({'success': False, 'error': 'Unknown tenant'}), 404
+    else:
+        auth_header = request.headers.get('Authorization', '')
+        tenant = registry.by_key(auth_header[7:]) if auth_header.startswith('Bearer ') else None
+    
+    if tenant is not None:
+        g.tenant = tenant['id']
+        g.db_path = tenant_db_path(base_path, tenant['id'])
+        # Each tenant file (and its shards) gets its own retention runs and backups
+        if storage_backend() == 'sqlite':
+            replica = current_app.config.get('REPLICA_OF')
+            start_tenant_jobs(
+                g.db_path,
+                0 if replica else float(current_app.config.get('RETENTION_INTERVAL') or 0),
+                float(current_app.config.get('BACKUP_INTERVAL') or 0)
+            )
+    return None
@@ -0,0 +1,196 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from app import create_app
+from config import Config
+
+# Bytes of a streamed response (exports) pulled per trip to a worker thread
+STREAM_BATCH_BYTES = 64 * 1024
+
+PAYLOAD_TOO_LARGE = b'{"error":"Request body too large","success":false}'
+
+# _read_body's result when the client went away before the body was complete
+DISCONNECTED = object()
+
+
+class AsgiApp:
+    """Serve the Flask app over ASGI, running its handlers on a bounded thread pool
+
+    The event loop reads request bodies and writes responses, so slow
+    uploads, slow readers and idle keep-alive connections cost a
+    coroutine rather than a thread. Only the Flask handler itself (and
+    with it every DatabaseManager call) runs on one of ``max_workers``
+    threads; requests beyond that wait on the loop. Routes, auth and the
+    JSON contract are those of the WSGI app, unchanged.
+    """
+
+    def __init__(self, wsgi_app: Callable, max_workers: int = 32, max_body_size: int = 16 * 1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.max_workers = max_workers
+        self.max_body_size = max_body_size
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='asgi-worker')
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close', 'code': 1000})
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope: Dict, receive: Callable, send: Callable):
+        body = await self._read_body(receive)
+        if body is DISCONNECTED:
+            # Never dispatch a truncated request; there is no one to answer
+            return
+        if body is None:
+            await send({
+                'type': 'http.response.start',
+                'status': 413,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(PAYLOAD_TOO_LARGE)).encode())]
+            })
+            await send({'type': 'http.response.body', 'body': PAYLOAD_TOO_LARGE})
+            return
+
+        loop = asyncio.get_running_loop()
+        status, headers, stream, chunks = await loop.run_in_executor(
+            self.executor, self._start, build_environ(scope, body)
+        )
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while not stream.done:
+                if chunks:
+                    await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+                chunks = await loop.run_in_executor(self.executor, stream.read, STREAM_BATCH_BYTES)
+            await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+        finally:
+            if not stream.done:
+                # The client went away mid-stream
+                await loop.run_in_executor(self.executor, stream.close)
+
+    async def _read_body(self, receive: Callable):
+        """The whole request body; None when it exceeds max_body_size, DISCONNECTED if the client left"""
+        parts = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return DISCONNECTED
+            part = message.get('body', b'')
+            size += len(part)
+            if size > self.max_body_size:
+                return None
+            parts.append(part)
+            if not message.get('more_body', False):
+                break
+        return b''.join(parts)
+
+    def _start(self, environ: Dict) -> Tuple[int, List, 'ResponseStream', List[bytes]]:
+        """Call the WSGI app on a worker thread and read what it has ready
+
+        Responses with a Content-Length (every JSON reply) are read whole,
+        so they cost one trip to the pool; streamed ones (exports) are
+        read STREAM_BATCH_BYTES at a time.
+        """
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in response_headers]
+            return lambda data: None
+
+        stream = ResponseStream(self.wsgi_app(environ, start_response))
+        try:
+            chunks = stream.read(STREAM_BATCH_BYTES)
+            if any(name == b'content-length' for name, _ in started['headers']):
+                while not stream.done:
+                    chunks += stream.read(STREAM_BATCH_BYTES)
+        except BaseException:
+            stream.close()
+            raise
+        return started['status'], started['headers'], stream, chunks
+
+
+class ResponseStream:
+    """A WSGI response body read a batch at a time, closed once fully read"""
+
+    def __init__(self, result):
+        self.result = result
+        self.iterator = iter(result)
+        self.done = False
+
+    def read(self, limit: int) -> List[bytes]:
+        chunks = []
+        size = 0
+        for chunk in self.iterator:
+            if chunk:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= limit:
+                    return chunks
+        self.close()
+        return chunks
+
+    def close(self):
+        if self.done:
+            return
+        self.done = True
+        close = getattr(self.result, 'close', None)
+        if close is not None:
+            close()
+
+
+def build_environ(scope: Dict, body: bytes) -> Dict:
+    """WSGI environ for an ASGI HTTP scope (PEP 3333 strings are latin-1)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'asgi.scope': scope
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def create_asgi_app(config_class=Config) -> AsgiApp:
+    """The application for an ASGI server, e.g. ``uvicorn asgi:app``"""
+    app = create_app(config_class)
+    return AsgiApp(app, int(app.config.get('ASGI_WORKER_THREADS', 32)),
+                   int(app.config.get('ASGI_MAX_BODY_SIZE', 16 * 1024 * 1024)))
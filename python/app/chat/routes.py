@@ -1,13 +1,14 @@
 from flask import Blueprint, request, jsonify, render_template, current_app
-from app.utils.database import DatabaseManager
+from app.utils.storage import open_database
+from app.utils.tenants import request_db_path
 from datetime import datetime
 import json
 
 bp = Blueprint('chat', __name__)
 
 def get_db():
-    """Get database manager instance"""
-    return DatabaseManager()
+    """Get database manager instance (the configured storage backend)"""
+    return open_database(request_db_path())
 
 @bp.route('/')
 def chat_interface():
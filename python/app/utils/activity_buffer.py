@@ -0,0 +1,174 @@
+import atexit
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+class ActivityBuffer:
+    """Write-behind buffer that coalesces session last_active updates.
+
+    Only the latest activity time per session is kept in memory. Pending
+    entries are written in one batched UPDATE every ``flush_interval``
+    seconds by a daemon thread, at interpreter shutdown, or inline when the
+    oldest pending entry is older than ``max_staleness`` seconds.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 30, max_staleness: float = 60):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_staleness = max_staleness
+        self._pending: Dict[str, str] = {}
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flush_count = 0
+        self.rows_written = 0
+
+    def record(self, session_id: str, when: datetime = None):
+        """Record activity for a session, flushing inline if the buffer is too stale"""
+        if when is None:
+            when = datetime.now(timezone.utc)
+        # Same format as SQLite datetime('now') so string comparisons keep working
+        timestamp = when.strftime('%Y-%m-%d %H:%M:%S')
+
+        with self._lock:
+            current = self._pending.get(session_id)
+            if current is None or timestamp > current:
+                self._pending[session_id] = timestamp
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            too_stale = time.monotonic() - self._oldest >= self.max_staleness
+
+        self._ensure_thread()
+        if too_stale:
+            self.flush()
+
+    def pending_count(self) -> int:
+        """Number of sessions with unflushed activity"""
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'flushes': self.flush_count,
+                'rows_written': self.rows_written,
+                'flush_interval': self.flush_interval,
+                'max_staleness': self.max_staleness
+            }
+
+    def discard(self, session_ids=None):
+        """Drop pending activity for the given sessions (all sessions if None)"""
+        with self._lock:
+            if session_ids is None:
+                self._pending.clear()
+            else:
+                for session_id in session_ids:
+                    self._pending.pop(session_id, None)
+            if not self._pending:
+                self._oldest = None
+
+    def flush(self) -> int:
+        """Write all pending activity in a single transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+                self._oldest = None
+
+            rows = [(timestamp, session_id, timestamp) for session_id, timestamp in batch.items()]
+            try:
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    # Never move last_active backwards if a direct write landed first
+                    conn.executemany("""
+                        UPDATE web_chat_sessions
+                        SET last_active = ?
+                        WHERE id = ? AND (last_active IS NULL OR last_active < ?)
+                    """, rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception:
+                self._requeue(batch)
+                raise
+
+            # Readers and record() hold _lock, not _flush_lock
+            with self._lock:
+                self.flush_count += 1
+                self.rows_written += len(rows)
+            return len(rows)
+
+    def stop(self):
+        """Stop the background flusher and write anything still pending"""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def _requeue(self, batch: Dict[str, str]):
+        """Merge a failed batch back into the pending set"""
+        with self._lock:
+            for session_id, timestamp in batch.items():
+                current = self._pending.get(session_id)
+                if current is None or timestamp > current:
+                    self._pending[session_id] = timestamp
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='activity-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # Entries were requeued; try again on the next tick
+                pass
+
+
+_buffers: Dict[str, ActivityBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_activity_buffer(db_path: str, flush_interval: float = 30, max_staleness: float = 60) -> ActivityBuffer:
+    """Get the process-wide activity buffer for a database"""
+    with _buffers_lock:
+        buffer = _buffers.get(db_path)
+        if buffer is None:
+            buffer = ActivityBuffer(db_path, flush_interval, max_staleness)
+            _buffers[db_path] = buffer
+        else:
+            # Settings may be changed at runtime through system_config
+            buffer.flush_interval = flush_interval
+            buffer.max_staleness = max_staleness
+        return buffer
+
+
+def flush_all_buffers():
+    """Flush every activity buffer (registered to run at shutdown)"""
+    with _buffers_lock:
+        buffers = list(_buffers.values())
+    for buffer in buffers:
+        buffer.stop()
+
+
+atexit.register(flush_all_buffers)
@@ -0,0 +1,238 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.utils import columnar
+from app.utils.columnar import ColumnarUnavailable, iter_chunks
+
+HOUR = 3600
+
+# An hour is treated as closed (and cached) once it ended this long ago,
+# leaving room for transactions that were still in flight at the boundary.
+CLOSE_GRACE_SECONDS = 60
+
+PERCENTILES = (50, 90, 99)
+
+# Upper bounds (seconds) of the session duration histogram; the last bucket is open
+DURATION_BOUNDS = (60, 300, 900, 1800, 3600, 4 * 3600, 24 * 3600)
+
+
+def to_epoch(value: Optional[str]) -> Optional[int]:
+    """Epoch seconds for an ISO 8601 timestamp (naive values are UTC, like SQLite's datetime('now'))"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def to_sqlite(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def to_iso(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+class HourBucket:
+    """Messages, responses and sorted response latencies for one hour"""
+
+    __slots__ = ('messages', 'responses', 'latencies')
+
+    def __init__(self, messages: int, responses: int, latencies):
+        self.messages = messages
+        self.responses = responses
+        self.latencies = latencies
+
+
+class BucketCache:
+    """LRU cache of closed hour buckets, per database"""
+
+    def __init__(self, max_hours: int = 24 * 93):
+        self.max_hours = max_hours
+        self._buckets: 'OrderedDict[Tuple[str, int], HourBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db_path: str, hour: int) -> Optional[HourBucket]:
+        with self._lock:
+            bucket = self._buckets.get((db_path, hour))
+            if bucket is None:
+                self.misses += 1
+                return None
+            self._buckets.move_to_end((db_path, hour))
+            self.hits += 1
+            return bucket
+
+    def put(self, db_path: str, hour: int, bucket: HourBucket):
+        with self._lock:
+            self._buckets[(db_path, hour)] = bucket
+            self._buckets.move_to_end((db_path, hour))
+            while len(self._buckets) > self.max_hours:
+                self._buckets.popitem(last=False)
+
+    def clear(self, db_path: Optional[str] = None):
+        with self._lock:
+            if db_path is None:
+                self._buckets.clear()
+                return
+            for key in [key for key in self._buckets if key[0] == db_path]:
+                del self._buckets[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'cached_hours': len(self._buckets), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = BucketCache()
+
+
+def reset_analytics_cache(db_path: Optional[str] = None):
+    """Drop cached hour buckets, e.g. after the data was cleared"""
+    _cache.clear(db_path)
+
+
+def percentiles(values) -> Dict:
+    np = columnar.np
+    if len(values) == 0:
+        return {f'p{p}': None for p in PERCENTILES}
+    results = np.percentile(values, PERCENTILES)
+    return {f'p{p}': round(float(result), 3) for p, result in zip(PERCENTILES, results)}
+
+
+def split_by_hour(timestamps, values, first_hour: int, hours: int) -> List:
+    """Split values into per-hour arrays (timestamps sorted ascending) without a Python loop per row"""
+    np = columnar.np
+    edges = first_hour + HOUR * np.arange(1, hours)
+    return np.split(values, np.searchsorted(timestamps, edges, side='left'))
+
+
+def fetch_buckets(conn, first_hour: int, hours: int, chunk_size: int, archived: bool) -> List[HourBucket]:
+    """Compute buckets for a contiguous span of hours from batched column fetches"""
+    np = columnar.np
+    start, end = to_sqlite(first_hour), to_sqlite(first_hour + hours * HOUR)
+
+    message_times = [chunk['timestamp'] for chunk in iter_chunks(conn, 'messages', start, end, chunk_size, None, archived)]
+    message_times = np.concatenate(message_times) if message_times else np.empty(0, dtype='int64')
+    message_times = message_times[message_times >= first_hour]
+    message_counts = np.bincount((message_times - first_hour) // HOUR, minlength=hours)[:hours]
+
+    response_times = []
+    latencies = []
+    for chunk in iter_chunks(conn, 'responses', start, end, chunk_size, None, archived):
+        response_times.append(chunk['timestamp'])
+        latencies.append(chunk['latency_seconds'])
+    response_times = np.concatenate(response_times) if response_times else np.empty(0, dtype='int64')
+    latencies = np.concatenate(latencies) if latencies else np.empty(0, dtype='float64')
+    # Rows without a parseable timestamp come back as MISSING_ID
+    dated = response_times >= first_hour
+    response_times, latencies = response_times[dated], latencies[dated]
+    response_counts = np.bincount((response_times - first_hour) // HOUR, minlength=hours)[:hours]
+
+    # Responses without a message (or pushed before it) carry no wait time
+    answered = ~np.isnan(latencies) & (latencies >= 0)
+    per_hour = split_by_hour(response_times[answered], latencies[answered], first_hour, hours)
+    return [
+        HourBucket(int(message_counts[i]), int(response_counts[i]), np.sort(per_hour[i]))
+        for i in range(hours)
+    ]
+
+
+def compute_traffic(conn, db_path: str, start: int, end: int, chunk_size: int = 50000,
+                    archived: bool = False, now: Optional[float] = None) -> Dict:
+    """Latency percentiles and hourly traffic between two epoch times (widened to whole hours)"""
+    np = columnar.np
+    if np is None:
+        raise ColumnarUnavailable('Analytics requires numpy')
+    first_hour = start - start % HOUR
+    last_hour = end - end % HOUR + (HOUR if end % HOUR else 0)
+    hours = list(range(first_hour, last_hour, HOUR))
+    closed_before = (now if now is not None else time.time()) - CLOSE_GRACE_SECONDS
+
+    buckets: Dict[int, HourBucket] = {}
+    missing = []
+    for hour in hours:
+        closed = hour + HOUR <= closed_before
+        bucket = _cache.get(db_path, hour) if closed else None
+        if bucket is None:
+            missing.append(hour)
+        else:
+            buckets[hour] = bucket
+
+    # One fetch per contiguous run of uncached hours
+    runs = []
+    for hour in missing:
+        if runs and runs[-1][1] == hour:
+            runs[-1][1] = hour + HOUR
+        else:
+            runs.append([hour, hour + HOUR])
+    for run_start, run_end in runs:
+        fetched = fetch_buckets(conn, run_start, (run_end - run_start) // HOUR, chunk_size, archived)
+        for offset, bucket in enumerate(fetched):
+            hour = run_start + offset * HOUR
+            buckets[hour] = bucket
+            if hour + HOUR <= closed_before:
+                _cache.put(db_path, hour, bucket)
+
+    ordered = [buckets[hour] for hour in hours]
+    latencies = np.concatenate([bucket.latencies for bucket in ordered]) if ordered else np.empty(0)
+    latency = {'count': int(len(latencies))}
+    latency.update(percentiles(latencies))
+    latency['mean'] = round(float(latencies.mean()), 3) if len(latencies) else None
+    latency['max'] = round(float(latencies.max()), 3) if len(latencies) else None
+
+    return {
+        'from': to_iso(first_hour),
+        'to': to_iso(last_hour),
+        'latency_seconds': latency,
+        'hourly': [
+            {'hour': to_iso(hour), 'messages': bucket.messages, 'responses': bucket.responses}
+            for hour, bucket in zip(hours, ordered)
+        ],
+        'totals': {
+            'messages': sum(bucket.messages for bucket in ordered),
+            'responses': sum(bucket.responses for bucket in ordered)
+        },
+        'cache': _cache.stats()
+    }
+
+
+def compute_sessions(conn, start: int, end: int, chunk_size: int = 50000) -> Dict:
+    """Duration and message-count distributions of sessions created in the range"""
+    np = columnar.np
+    if np is None:
+        raise ColumnarUnavailable('Analytics requires numpy')
+    cursor = conn.execute("""
+        SELECT CAST(strftime('%s', s.last_active) AS INTEGER) - CAST(strftime('%s', s.created_at) AS INTEGER),
+               (SELECT COUNT(*) FROM web_chat_messages m WHERE m.session_id = s.id)
+        FROM web_chat_sessions s
+        WHERE s.created_at >= ? AND s.created_at < ?
+    """, (to_sqlite(start), to_sqlite(end)))
+    durations = []
+    counts = []
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = np.array(rows, dtype='float64')
+        durations.append(chunk[:, 0])
+        counts.append(chunk[:, 1])
+    durations = np.concatenate(durations) if durations else np.empty(0)
+    counts = np.concatenate(counts) if counts else np.empty(0)
+    durations = durations[~np.isnan(durations)].clip(min=0)
+
+    histogram = np.bincount(np.searchsorted(DURATION_BOUNDS, durations, side='left'),
+                            minlength=len(DURATION_BOUNDS) + 1)
+    return {
+        'count': int(len(counts)),
+        'duration_seconds': percentiles(durations),
+        'duration_histogram': [
+            {'le': bound, 'count': int(count)}
+            for bound, count in zip(list(DURATION_BOUNDS) + [None], histogram)
+        ],
+        'messages_per_session': dict(percentiles(counts), max=int(counts.max()) if len(counts) else None)
+    }
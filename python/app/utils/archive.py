@@ -0,0 +1,158 @@
+import os
+import time
+from typing import Dict, List
+
+# Tables that are moved to the archive and the age condition for each
+ARCHIVE_TABLES = {
+    'web_chat_messages': "processed = 1 AND timestamp < datetime('now', ?)",
+    'web_chat_responses': "timestamp < datetime('now', ?)"
+}
+
+ARCHIVE_SCHEMA = 'archive'
+
+
+def default_archive_path(db_path: str) -> str:
+    """Archive file that sits next to the hot database"""
+    base, ext = os.path.splitext(db_path)
+    return f"{base}_archive{ext or '.db'}"
+
+
+def attach_archive(conn, archive_path: str) -> bool:
+    """Attach the archive database to a connection if it exists
+
+    Returns True when the ``archive`` schema is available on the connection.
+    A missing archive is never created here, so read paths stay read-only
+    (``PRAGMA query_only`` on pooled readers covers attached schemas too).
+    """
+    if not os.path.exists(archive_path):
+        return False
+    attached = [row[1] for row in conn.execute("PRAGMA database_list").fetchall()]
+    if ARCHIVE_SCHEMA not in attached:
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path,))
+    return True
+
+
+def unified_source(table: str, columns: str, archived: bool) -> str:
+    """FROM-clause source that covers the hot table and, if attached, its archive"""
+    if not archived:
+        return f"main.{table}"
+    return f"(SELECT {columns} FROM main.{table} UNION ALL SELECT {columns} FROM {ARCHIVE_SCHEMA}.{table})"
+
+
+class ArchiveManager:
+    """Moves processed messages and old responses into an attached archive database.
+
+    The hot database only keeps rows the widget and agent still touch, so
+    its indexes and pages stay small enough to live in the page cache.
+    Each batch copies rows into the archive and deletes them from the hot
+    table in one transaction.
+    """
+
+    def __init__(self, db_manager, archive_path: str = None, batch_size: int = 500, pause: float = 0.05):
+        self.db_manager = db_manager
+        self.archive_path = archive_path or default_archive_path(db_manager.db_path)
+        self.batch_size = max(int(batch_size), 1)
+        self.pause = pause
+
+    def ensure_archive(self, conn):
+        """Create the archive tables, adding any columns the hot tables gained since"""
+        attached = [row[1] for row in conn.execute("PRAGMA database_list").fetchall()]
+        if ARCHIVE_SCHEMA not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (self.archive_path,))
+        for table in ARCHIVE_TABLES:
+            hot_columns = self._column_types(conn, 'main', table)
+            if not hot_columns:
+                continue
+            archive_columns = set(self._columns(conn, ARCHIVE_SCHEMA, table))
+            if not archive_columns:
+                # Plain copy of the hot columns; ids are carried over, not generated
+                definitions = ', '.join(
+                    f"{name} INTEGER PRIMARY KEY" if name == 'id' else f"{name} {declared}"
+                    for name, declared in hot_columns
+                )
+                conn.execute(f"CREATE TABLE {ARCHIVE_SCHEMA}.{table} ({definitions})")
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_{table}_session ON {table}(session_id)"
+                )
+                continue
+            for name, declared in hot_columns:
+                if name not in archive_columns:
+                    conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {name} {declared}")
+        conn.commit()
+
+    def _columns(self, conn, schema: str, table: str) -> List[str]:
+        return [name for name, _ in self._column_types(conn, schema, table)]
+
+    def _column_types(self, conn, schema: str, table: str):
+        # table_xinfo also lists generated columns (hidden != 0); those cannot be inserted
+        rows = conn.execute(f"PRAGMA {schema}.table_xinfo({table})").fetchall()
+        return [(row[1], row[2]) for row in rows if row[6] == 0]
+
+    def archive_table(self, table: str, age_seconds: int) -> Dict:
+        """Move rows older than age_seconds from one hot table into the archive"""
+        started = time.perf_counter()
+        moved = 0
+        batches = 0
+        conn = self.db_manager.get_connection()
+        try:
+            self.ensure_archive(conn)
+            columns = ', '.join(self._columns(conn, 'main', table))
+            where = ARCHIVE_TABLES[table]
+            while True:
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM main.{table} WHERE {where} ORDER BY id LIMIT ?",
+                    (f'-{int(age_seconds)} seconds', self.batch_size)
+                ).fetchall()]
+                if not ids:
+                    break
+                placeholders = ','.join('?' for _ in ids)
+                # INSERT OR REPLACE keeps a batch retried after a crash idempotent
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table} ({columns}) "
+                    f"SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})", ids
+                )
+                conn.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+                conn.commit()
+                moved += len(ids)
+                batches += 1
+                if len(ids) < self.batch_size:
+                    break
+                if self.pause:
+                    time.sleep(self.pause)
+        finally:
+            conn.close()
+        return {
+            'table': table,
+            'moved': moved,
+            'batches': batches,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def run(self, message_age: int, response_age: int) -> List[Dict]:
+        """Archive processed messages and old responses (an age of 0 skips the table)"""
+        results = []
+        if message_age > 0:
+            results.append(self.archive_table('web_chat_messages', message_age))
+        if response_age > 0:
+            results.append(self.archive_table('web_chat_responses', response_age))
+        return results
+
+    def stats(self) -> Dict:
+        """Archive file size and approximate row counts"""
+        if not os.path.exists(self.archive_path):
+            return {'path': self.archive_path, 'exists': False}
+        conn = self.db_manager.get_connection()
+        try:
+            attach_archive(conn, self.archive_path)
+            tables = {}
+            for table in ARCHIVE_TABLES:
+                row = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {ARCHIVE_SCHEMA}.{table}").fetchone()
+                tables[table] = 0 if row[0] is None else row[1] - row[0] + 1
+            return {
+                'path': self.archive_path,
+                'exists': True,
+                'size_bytes': os.path.getsize(self.archive_path),
+                'estimated_rows': tables
+            }
+        finally:
+            conn.close()
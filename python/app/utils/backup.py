@@ -0,0 +1,236 @@
+import glob
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+BACKUP_TIME_FORMAT = '%Y%m%d-%H%M%S-%f'
+
+
+def backup_dir(db_path: str, directory: str = '') -> str:
+    """Where backups of db_path go: directory, or backups/ next to the database"""
+    return directory or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+
+
+def backup_pattern(db_path: str, directory: str) -> str:
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(directory, f'{stem}-*.db')
+
+
+def list_backups(db_path: str, directory: str) -> List[str]:
+    """Backups of db_path, oldest first (the timestamped names sort in time order)"""
+    return sorted(glob.glob(backup_pattern(db_path, directory)))
+
+
+def rotate_backups(db_path: str, directory: str, keep: int) -> List[str]:
+    """Delete all but the newest ``keep`` backups; returns the deleted paths"""
+    backups = list_backups(db_path, directory)
+    expired = backups[:-keep] if keep > 0 else []
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+class BackupRestarted(Exception):
+    """The source database changed under a stepped copy too many times"""
+
+    def __init__(self, restarts: int):
+        super().__init__(f'Backup restarted {restarts} times as the database kept changing; try again later')
+        self.restarts = restarts
+
+
+def online_backup(db_path: str, target_path: str, pages: int = 100, pause: float = 0.01,
+                  max_restarts: int = 3) -> Dict:
+    """Copy a live database with the SQLite backup API, ``pages`` pages per step
+
+    The copy is written next to target_path and renamed into place once
+    complete. In WAL mode the source connection holds one read
+    transaction for the whole copy: writers carry on, and the backup sees
+    a single snapshot instead of restarting whenever another connection
+    commits. Other journal modes take the read lock per step only, so
+    writers wait at most one step. Each write between steps restarts the
+    copy; after max_restarts restarts it gives up with BackupRestarted
+    rather than copying the whole file under one lock. The pause between
+    steps yields the disk to the message path.
+    """
+    started = time.perf_counter()
+    temp_path = f"{target_path}.tmp"
+    steps = restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        # Each step copies pages, so remaining only fails to drop when the copy restarted
+        if last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupRestarted(restarts)
+        last_remaining = remaining
+        if remaining and pause > 0:
+            time.sleep(pause)
+
+    source = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    target = sqlite3.connect(temp_path)
+    try:
+        snapshot = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal'
+        if snapshot:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=max(1, int(pages)), progress=progress)
+        if snapshot:
+            source.execute("COMMIT")
+        page_count = target.execute("PRAGMA page_count").fetchone()[0]
+    except BaseException:
+        target.close()
+        source.close()
+        os.remove(temp_path)
+        raise
+    target.close()
+    source.close()
+    os.replace(temp_path, target_path)
+    return {
+        'path': target_path,
+        'pages': page_count,
+        'steps': steps,
+        'restarts': restarts,
+        'bytes': os.path.getsize(target_path),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+class BackupScheduler:
+    """Online backups of one database (and its shard files) on a background thread"""
+
+    def __init__(self, db_path: str, interval: float = 86400):
+        self.db_path = db_path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running = False
+        self.current_path: Optional[str] = None
+        self.last_run: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+
+    def start(self):
+        """Start periodic backups"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self, wait: bool = False) -> bool:
+        """Request a backup now; returns False if one is already in progress"""
+        if self.running:
+            return False
+        if wait:
+            self.run_once()
+            return True
+        if self._thread is not None and self._thread.is_alive():
+            self._wake.set()
+        else:
+            threading.Thread(target=self.run_once, name='backup-run', daemon=True).start()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
+
+    def run_once(self) -> Optional[Dict]:
+        """Back up every file of the database and rotate old copies"""
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+
+        # Imported here: the sharding module imports the database module
+        from config import Config
+        from app.utils.sharding import shard_paths
+
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        stamp = datetime.now().strftime(BACKUP_TIME_FORMAT)
+        directory = backup_dir(self.db_path, Config.BACKUP_DIR)
+        files = []
+        removed = []
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for path in shard_paths(self.db_path):
+                if not os.path.exists(path):
+                    continue
+                self.current_path = path
+                stem = os.path.splitext(os.path.basename(path))[0]
+                files.append(online_backup(
+                    path, os.path.join(directory, f'{stem}-{stamp}.db'),
+                    int(Config.BACKUP_PAGES_PER_STEP), float(Config.BACKUP_STEP_PAUSE)
+                ))
+                removed.extend(rotate_backups(path, directory, int(Config.BACKUP_KEEP)))
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            self.current_path = None
+            self.running = False
+
+        self.runs += 1
+        self.last_run = {
+            'started_at': started_at,
+            'finished_at': datetime.now().isoformat(),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            'directory': directory,
+            'files': files,
+            'bytes': sum(backup['bytes'] for backup in files),
+            'removed': removed,
+            'error': self.last_error
+        }
+        return self.last_run
+
+    def status(self) -> Dict:
+        from config import Config
+        directory = backup_dir(self.db_path, Config.BACKUP_DIR)
+        return {
+            'scheduled': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'running': self.running,
+            'progress': {'path': self.current_path} if self.running else None,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'backups': [os.path.basename(path) for path in list_backups(self.db_path, directory)]
+        }
+
+
+_schedulers: Dict[str, BackupScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_backup_scheduler(db_path: str, interval: float = 86400) -> BackupScheduler:
+    """Get the process-wide backup scheduler for a database (not started)"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(db_path)
+        if scheduler is None:
+            scheduler = BackupScheduler(db_path, interval)
+            _schedulers[db_path] = scheduler
+        return scheduler
+
+
+def start_backup_scheduler(db_path: str, interval: float) -> BackupScheduler:
+    """Start periodic backups of a database"""
+    scheduler = get_backup_scheduler(db_path, interval)
+    scheduler.interval = interval
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,175 @@
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from app.utils.storage_format import epoch_ms, table_columns
+
+CHANGE_TABLE = 'change_log'
+
+# Entity -> (table, key column, columns returned with the event)
+CHANGE_SOURCES = {
+    'session': ('web_chat_sessions', 'id', ('id', 'uid', 'created_at', 'last_active', 'ip_address', 'metadata')),
+    'message': ('web_chat_messages', 'id', ('id', 'session_id', 'message', 'timestamp', 'processed')),
+    'response': ('web_chat_responses', 'id', ('id', 'session_id', 'response', 'timestamp', 'message_id'))
+}
+
+# Columns whose change is an event. Bookkeeping columns maintained by
+# other triggers (session_key, ts) and bodies rewritten by
+# the compression job (same content, new encoding) are left out.
+WATCHED_COLUMNS = {
+    'session': ('uid', 'last_active', 'ip_address', 'metadata'),
+    'message': ('processed',),
+    'response': ('message_id',)
+}
+
+# Entity of events that are not about a single row (op 'reset')
+DATABASE_ENTITY = 'database'
+
+BODY_COLUMNS = {'message': 'message', 'response': 'response'}
+
+NOW_MS = epoch_ms("'now'")
+
+# seq is AUTOINCREMENT so it never goes backwards, even after the newest
+# events are deleted or the database is reset (sqlite_sequence is kept)
+CHANGE_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {CHANGE_TABLE} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        op TEXT NOT NULL,
+        entity_id TEXT,
+        session_id TEXT,
+        created_at INTEGER NOT NULL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS idx_change_log_created ON {CHANGE_TABLE}(created_at)"
+]
+for _entity, (_table, _key, _columns) in CHANGE_SOURCES.items():
+    _session = 'id' if _entity == 'session' else 'session_id'
+    _changed = ' OR '.join(f"old.{column} IS NOT new.{column}" for column in WATCHED_COLUMNS[_entity])
+    for _op, _when, _row in (('insert', 'AFTER INSERT', 'new'), ('update', 'AFTER UPDATE', 'new'),
+                             ('delete', 'AFTER DELETE', 'old')):
+        _condition = f" WHEN {_changed}" if _op == 'update' else ''
+        CHANGE_SCHEMA.append(
+            f"""CREATE TRIGGER IF NOT EXISTS {_table}_change_{_op} {_when} ON {_table}{_condition} BEGIN
+                INSERT INTO {CHANGE_TABLE} (entity, op, entity_id, session_id, created_at)
+                VALUES ('{_entity}', '{_op}', {_row}.{_key}, {_row}.{_session}, {NOW_MS});
+            END"""
+        )
+
+_ready: Set[str] = set()
+_ready_lock = threading.Lock()
+
+
+class ChangeFeedError(ValueError):
+    """Raised for invalid change feed parameters"""
+    pass
+
+
+def is_change_feed_ready(db_path: str) -> bool:
+    return db_path in _ready
+
+
+def ensure_change_feed(conn, db_path: str) -> bool:
+    """Create the change log and its triggers once per process
+
+    Returns False for databases without the standard columns (the basic
+    fallback schema), whose writes the triggers could not record.
+    """
+    if db_path in _ready:
+        return True
+    with _ready_lock:
+        if db_path in _ready:
+            return True
+        for _, (table, _, columns) in CHANGE_SOURCES.items():
+            if not set(columns) <= table_columns(conn, table):
+                return False
+        for sql in CHANGE_SCHEMA:
+            conn.execute(sql)
+        conn.commit()
+        _ready.add(db_path)
+        return True
+
+
+def change_log_exists(conn) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (CHANGE_TABLE,)
+    ).fetchone() is not None
+
+
+def drop_change_triggers(conn):
+    """Stop recording changes; the change log and its events stay"""
+    for _, (table, _, _) in CHANGE_SOURCES.items():
+        for op in ('insert', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_change_{op}")
+    conn.commit()
+
+
+def reset_change_feed(db_path: str):
+    with _ready_lock:
+        _ready.discard(db_path)
+
+
+def record_event(conn, entity: str, op: str):
+    """Log an event no row trigger sees, such as a database reset"""
+    conn.execute(
+        f"INSERT INTO {CHANGE_TABLE} (entity, op, created_at) VALUES (?, ?, {NOW_MS})", (entity, op)
+    )
+    conn.commit()
+
+
+def last_seq(conn) -> int:
+    return conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {CHANGE_TABLE}").fetchone()[0]
+
+
+def read_changes(conn, after_seq: int, limit: int, decode: Optional[Callable] = None,
+                 entities: Optional[List[str]] = None) -> Dict:
+    """Events with seq > after_seq in order, with the current row for each
+
+    ``row`` is the row as it is now (None once deleted or archived), so a
+    consumer that applies events in order ends up with the current state.
+    Resume by passing the returned ``last_seq`` as the next ``after_seq``.
+    Database-wide events (a reset) are included whatever ``entities`` asks for.
+    """
+    if entities:
+        unknown = set(entities) - set(CHANGE_SOURCES)
+        if unknown:
+            raise ChangeFeedError(f"Unknown entity: {', '.join(sorted(unknown))}")
+    where = "seq > ?"
+    params: List = [int(after_seq)]
+    if entities:
+        where += f" AND entity IN ({','.join('?' for _ in entities)}, ?)"
+        params.extend(list(entities) + [DATABASE_ENTITY])
+    params.append(int(limit) + 1)
+    events = [dict(row) for row in conn.execute(f"""
+        SELECT seq, entity, op, entity_id, session_id, created_at FROM {CHANGE_TABLE}
+        WHERE {where} ORDER BY seq LIMIT ?
+    """, params).fetchall()]
+
+    has_more = len(events) > limit
+    events = events[:limit]
+    for event in events:
+        event['row'] = None
+        if event['entity'] != 'session' and event['entity_id'] is not None:
+            event['entity_id'] = int(event['entity_id'])
+
+    # One primary-key lookup per entity type for the rows still present
+    for entity, (table, key, columns) in CHANGE_SOURCES.items():
+        ids = list({event['entity_id'] for event in events
+                    if event['entity'] == entity and event['entity_id'] is not None})
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for row in conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {key} IN ({','.join('?' for _ in chunk)})", chunk
+            ).fetchall():
+                row = dict(row)
+                if decode and entity in BODY_COLUMNS:
+                    row[BODY_COLUMNS[entity]] = decode(row[BODY_COLUMNS[entity]])
+                rows[row[key]] = row
+        for event in events:
+            if event['entity'] == entity:
+                event['row'] = rows.get(event['entity_id'])
+
+    return {
+        'changes': events,
+        'last_seq': events[-1]['seq'] if events else int(after_seq),
+        'has_more': has_more
+    }
@@ -0,0 +1,217 @@
+import os
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+from app.utils.archive import unified_source
+
+COLUMNAR_FORMATS = ('npz', 'arrow', 'parquet')
+COLUMNAR_TABLES = ('messages', 'responses')
+
+# Session ids are limited to 64 characters (MAX_SESSION_ID_LENGTH), so they
+# fit a fixed-width unicode column that loads without pickling.
+SESSION_ID_DTYPE = 'U64'
+
+# Export name -> (table, columns for the unified source, select list, table alias)
+# Timestamps are UTC epoch seconds; lengths are characters of the decoded body.
+_QUERIES = {
+    'messages': (
+        'web_chat_messages', 'id, session_id, message, timestamp, processed',
+        """m.id, m.session_id, CAST(strftime('%s', m.timestamp) AS INTEGER),
+           CASE WHEN typeof(m.message) = 'blob' THEN NULL ELSE length(m.message) END,
+           m.processed,
+           CASE WHEN typeof(m.message) = 'blob' THEN m.message END""",
+        'm'
+    ),
+    'responses': (
+        'web_chat_responses', 'id, session_id, response, message_id, timestamp',
+        """r.id, r.session_id, CAST(strftime('%s', r.timestamp) AS INTEGER),
+           CASE WHEN typeof(r.response) = 'blob' THEN NULL ELSE length(r.response) END,
+           r.message_id,
+           CAST(strftime('%s', r.timestamp) AS INTEGER) - CAST(strftime('%s', m.timestamp) AS INTEGER),
+           CASE WHEN typeof(r.response) = 'blob' THEN r.response END""",
+        'r'
+    )
+}
+
+COLUMNS = {
+    'messages': [('id', 'int64'), ('session_id', SESSION_ID_DTYPE), ('timestamp', 'int64'),
+                 ('length', 'int32'), ('processed', 'int8')],
+    'responses': [('id', 'int64'), ('session_id', SESSION_ID_DTYPE), ('timestamp', 'int64'),
+                  ('length', 'int32'), ('message_id', 'int64'), ('latency_seconds', 'float64')]
+}
+
+# Stand-in for NULL in integer columns
+MISSING_ID = -1
+
+
+class ColumnarUnavailable(RuntimeError):
+    """Raised when the libraries for a columnar format are not installed"""
+    pass
+
+
+def check_format(fmt: str):
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+    if np is None:
+        raise ColumnarUnavailable('Columnar export requires numpy')
+    if fmt in ('arrow', 'parquet') and pa is None:
+        raise ColumnarUnavailable(f'{fmt} export requires pyarrow')
+
+
+def iter_chunks(conn, name: str, start: str = None, end: str = None, chunk_size: int = 50000,
+                decode=None, archived: bool = False) -> Iterator[Dict[str, 'np.ndarray']]:
+    """Yield dicts of column arrays, chunk_size rows at a time
+
+    SQLite computes epoch seconds, lengths and latencies; each chunk is
+    transposed once and converted column by column.
+    """
+    table, source_columns, select, alias = _QUERIES[name]
+    source = unified_source(table, source_columns, archived)
+    join = ''
+    if name == 'responses':
+        messages = unified_source('web_chat_messages', 'id, timestamp', archived)
+        join = f"LEFT JOIN {messages} m ON m.id = r.message_id"
+    where = []
+    params = []
+    if start:
+        where.append(f"{alias}.timestamp >= ?")
+        params.append(start)
+    if end:
+        where.append(f"{alias}.timestamp < ?")
+        params.append(end)
+    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    cursor = conn.execute(
+        f"SELECT {select} FROM {source} {alias} {join} {where_clause} ORDER BY {alias}.timestamp, {alias}.id",
+        params
+    )
+    columns = COLUMNS[name]
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        values = list(zip(*rows))
+        blobs = values.pop()
+        lengths = values[3]
+        if decode is not None and any(blob is not None for blob in blobs):
+            lengths = tuple(
+                len(decode(blob)) if blob is not None else length
+                for blob, length in zip(blobs, lengths)
+            )
+            values[3] = lengths
+        chunk = {}
+        for (column, dtype), data in zip(columns, values):
+            if dtype == 'float64':
+                chunk[column] = np.array([np.nan if v is None else v for v in data], dtype=dtype)
+            elif dtype.startswith('int'):
+                chunk[column] = np.array([MISSING_ID if v is None else v for v in data], dtype=dtype)
+            else:
+                chunk[column] = np.array(data, dtype=dtype)
+        yield chunk
+
+
+def empty_columns(name: str) -> Dict[str, 'np.ndarray']:
+    return {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS[name]}
+
+
+def write_npz(path: str, chunks_by_table: Dict[str, Iterator[Dict]]) -> Dict[str, int]:
+    """Write every table into one .npz archive with keys like 'messages.timestamp'"""
+    arrays = {}
+    counts = {}
+    for name, chunks in chunks_by_table.items():
+        parts: Dict[str, List] = {column: [] for column, _ in COLUMNS[name]}
+        for chunk in chunks:
+            for column, array in chunk.items():
+                parts[column].append(array)
+        empty = empty_columns(name)
+        for column, arrays_for_column in parts.items():
+            arrays[f'{name}.{column}'] = np.concatenate(arrays_for_column) if arrays_for_column else empty[column]
+        counts[name] = len(arrays[f'{name}.id'])
+    # Stored uncompressed: loading is a plain read with no inflate pass
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+    return counts
+
+
+def arrow_schema(name: str) -> 'pa.Schema':
+    types = {'int64': pa.int64(), 'int32': pa.int32(), 'int8': pa.int8(), 'float64': pa.float64(),
+             SESSION_ID_DTYPE: pa.string()}
+    fields = [pa.field('timestamp', pa.timestamp('s', tz='UTC')) if column == 'timestamp'
+              else pa.field(column, types[dtype]) for column, dtype in COLUMNS[name]]
+    return pa.schema(fields)
+
+
+def to_record_batch(name: str, chunk: Dict, schema: 'pa.Schema') -> 'pa.RecordBatch':
+    arrays = []
+    for field in schema:
+        data = chunk[field.name]
+        if field.name == 'timestamp':
+            arrays.append(pa.array(data, type=pa.int64()).cast(field.type))
+        elif field.name in ('message_id', 'latency_seconds'):
+            mask = (data == MISSING_ID) if field.name == 'message_id' else np.isnan(data)
+            arrays.append(pa.array(data, type=field.type, mask=mask))
+        else:
+            arrays.append(pa.array(data, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_arrow(path: str, name: str, chunks: Iterator[Dict], fmt: str = 'arrow') -> Dict[str, int]:
+    """Write one table as an Arrow IPC file (memory-mappable) or Parquet, batch by batch"""
+    schema = arrow_schema(name)
+    rows = 0
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    try:
+        for chunk in chunks:
+            batch = to_record_batch(name, chunk, schema)
+            if fmt == 'parquet':
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return {name: rows}
+
+
+def export_columnar(conn, fmt: str, tables: List[str], start: str = None, end: str = None,
+                    chunk_size: int = 50000, decode=None, archived: bool = False,
+                    directory: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+    """Write a columnar export to a temporary file and return its path and row counts
+
+    npz holds any number of tables; arrow and parquet hold exactly one.
+    The caller removes the file once it has been sent.
+    """
+    check_format(fmt)
+    unknown = [name for name in tables if name not in COLUMNAR_TABLES]
+    if unknown:
+        raise ValueError(f"Columnar export supports {', '.join(COLUMNAR_TABLES)}; got {', '.join(unknown)}")
+    if fmt != 'npz' and len(tables) != 1:
+        raise ValueError(f'{fmt} export takes exactly one table')
+
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}', dir=directory)
+    os.close(fd)
+    try:
+        if fmt == 'npz':
+            counts = write_npz(path, {
+                name: iter_chunks(conn, name, start, end, chunk_size, decode, archived) for name in tables
+            })
+        else:
+            counts = write_arrow(path, tables[0], iter_chunks(conn, tables[0], start, end, chunk_size, decode, archived), fmt)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, counts
@@ -0,0 +1,204 @@
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Compressed bodies are stored as BLOBs starting with a marker and the
+# CRC32 of the dictionary used, so plain TEXT rows (and rows written by the
+# PHP bridge) are always told apart and a dictionary mismatch fails loudly.
+ZLIB_MARKER = b'\x00zl1'
+ZSTD_MARKER = b'\x00zs1'
+HEADER_SIZE = len(ZLIB_MARKER) + 4
+
+# zlib only uses the last 32KB of a preset dictionary
+ZLIB_MAX_DICTIONARY = 32768
+
+
+class CompressionError(Exception):
+    """Raised when a stored body cannot be decompressed"""
+    pass
+
+
+def dictionary_id(dictionary: Optional[bytes]) -> bytes:
+    return zlib.crc32(dictionary or b'').to_bytes(4, 'big')
+
+
+def build_dictionary(samples: Iterable[str], size: int = 16384, algorithm: str = 'zlib') -> bytes:
+    """Build a compression dictionary from sample bodies
+
+    zstd trains a real dictionary (requires the ``zstandard`` package);
+    zlib uses the most recent samples as a preset dictionary.
+    """
+    encoded = [sample.encode('utf-8') for sample in samples if sample]
+    if not encoded:
+        raise ValueError('No samples to build a dictionary from')
+    if algorithm == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstd compression requires the zstandard package')
+        return zstandard.train_dictionary(size, encoded).as_bytes()
+    size = min(size, ZLIB_MAX_DICTIONARY)
+    dictionary = b''
+    # Most recent samples last: zlib matches closer bytes more cheaply
+    for sample in reversed(encoded):
+        if len(dictionary) >= size:
+            break
+        dictionary = sample + dictionary
+    return dictionary[-size:]
+
+
+class BodyCodec:
+    """Compresses message and response bodies above a size threshold.
+
+    Bodies shorter than ``threshold`` bytes (or all bodies when the
+    threshold is 0) are stored as plain TEXT. ``decode`` accepts both
+    forms and both algorithms, so changing settings never strands rows.
+    """
+
+    def __init__(self, algorithm: str = 'zlib', threshold: int = 0, level: int = 6,
+                 dictionary: Optional[bytes] = None):
+        if algorithm not in ('zlib', 'zstd'):
+            raise ValueError(f'Unknown compression algorithm: {algorithm}')
+        if algorithm == 'zstd' and zstandard is None:
+            raise RuntimeError('zstd compression requires the zstandard package')
+        self.algorithm = algorithm
+        self.threshold = int(threshold)
+        self.level = int(level)
+        self.dictionary = dictionary or None
+        self.dictionary_id = dictionary_id(self.dictionary)
+        self._zstd_dict = None
+        if self.dictionary and zstandard is not None:
+            self._zstd_dict = zstandard.ZstdCompressionDict(self.dictionary)
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.skipped = 0
+        self.decoded = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_seconds = 0.0
+        self.decompress_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def encode(self, text: str) -> Union[str, bytes]:
+        """Value to store for a body"""
+        if not self.enabled or text is None:
+            return text
+        raw = text.encode('utf-8')
+        if len(raw) < self.threshold:
+            with self._lock:
+                self.skipped += 1
+            return text
+
+        started = time.perf_counter()
+        if self.algorithm == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._zstd_dict)
+            payload = ZSTD_MARKER + self.dictionary_id + compressor.compress(raw)
+        else:
+            if self.dictionary:
+                compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+            else:
+                compressor = zlib.compressobj(self.level)
+            payload = ZLIB_MARKER + self.dictionary_id + compressor.compress(raw) + compressor.flush()
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.compress_seconds += elapsed
+            if len(payload) >= len(raw):
+                # Incompressible; keep it readable
+                self.skipped += 1
+                return text
+            self.compressed += 1
+            self.bytes_in += len(raw)
+            self.bytes_out += len(payload)
+        return payload
+
+    def decode(self, value: Union[str, bytes, None]) -> Optional[str]:
+        """Body text for a stored value"""
+        if not isinstance(value, (bytes, bytearray)):
+            return value
+        value = bytes(value)
+        marker = value[:len(ZLIB_MARKER)]
+        if marker not in (ZLIB_MARKER, ZSTD_MARKER):
+            return value.decode('utf-8')
+        stored_id = value[len(marker):HEADER_SIZE]
+        if stored_id != dictionary_id(None) and stored_id != self.dictionary_id:
+            raise CompressionError('Body was compressed with a different dictionary')
+        dictionary = self.dictionary if stored_id == self.dictionary_id else None
+
+        started = time.perf_counter()
+        try:
+            if marker == ZSTD_MARKER:
+                if zstandard is None:
+                    raise CompressionError('Body is zstd-compressed but zstandard is not installed')
+                dict_data = self._zstd_dict if dictionary else None
+                raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(value[HEADER_SIZE:])
+            elif dictionary:
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                raw = decompressor.decompress(value[HEADER_SIZE:]) + decompressor.flush()
+            else:
+                raw = zlib.decompress(value[HEADER_SIZE:])
+        except (zlib.error, ValueError) as e:
+            raise CompressionError(f'Corrupt compressed body: {e}')
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.decoded += 1
+            self.decompress_seconds += elapsed
+        return raw.decode('utf-8')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'algorithm': self.algorithm,
+                'threshold': self.threshold,
+                'level': self.level,
+                'dictionary_bytes': len(self.dictionary) if self.dictionary else 0,
+                'compressed': self.compressed,
+                'skipped': self.skipped,
+                'decoded': self.decoded,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else None,
+                'compress_ms': round(self.compress_seconds * 1000, 3),
+                'decompress_ms': round(self.decompress_seconds * 1000, 3)
+            }
+
+
+_codecs: Dict[Tuple, BodyCodec] = {}
+_codecs_lock = threading.Lock()
+
+
+def load_dictionary(path: str) -> Optional[bytes]:
+    if not path:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return f.read() or None
+    except FileNotFoundError:
+        return None
+
+
+def get_codec(algorithm: str = 'zlib', threshold: int = 0, level: int = 6,
+              dictionary_path: str = '') -> BodyCodec:
+    """Get the process-wide codec for a set of compression settings"""
+    key = (algorithm, int(threshold), int(level), dictionary_path or '')
+    with _codecs_lock:
+        codec = _codecs.get(key)
+        if codec is None:
+            codec = BodyCodec(algorithm, threshold, level, load_dictionary(dictionary_path))
+            _codecs[key] = codec
+        return codec
+
+
+def reset_codecs():
+    """Forget cached codecs, e.g. after a dictionary file is replaced"""
+    with _codecs_lock:
+        _codecs.clear()
@@ -0,0 +1,154 @@
+import os
+import queue
+import sqlite3
+import threading
+from typing import Dict, Optional
+from urllib.parse import quote
+
+
+class PooledConnection:
+    """Proxy around a pooled sqlite3 connection; close() returns it to the pool"""
+
+    def __init__(self, pool: 'ReadOnlyPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ReadOnlyPool:
+    """Small pool of read-only connections for admin and reporting queries.
+
+    Connections are opened with a ``mode=ro`` URI and ``PRAGMA query_only``
+    so a reporting query can never take a write lock. With the database in
+    WAL mode each read transaction sees a snapshot and never blocks writers;
+    in rollback-journal mode a writer waits for open reads to finish, so
+    connections end their read transaction when returned. ``journal_mode``
+    switches the file's (persistent) mode on first use; None leaves it.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, journal_mode: Optional[str] = None, timeout: float = 30):
+        self.db_path = db_path
+        self.size = size
+        self.journal_mode = journal_mode
+        self.timeout = timeout
+        self._idle: 'queue.LifoQueue[sqlite3.Connection]' = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._journal_checked = False
+        self.opened = 0
+        self.reused = 0
+
+    def _uri(self) -> str:
+        return 'file:{}?mode=ro'.format(quote(os.path.abspath(self.db_path)))
+
+    def _ensure_journal_mode(self):
+        # journal_mode is persistent, so one writable connection per process is enough
+        if self._journal_checked or not self.journal_mode:
+            self._journal_checked = True
+            return
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            current = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if current.lower() != self.journal_mode.lower():
+                conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        except sqlite3.OperationalError:
+            # Another connection holds a lock; readers still work in rollback mode
+            pass
+        finally:
+            conn.close()
+        self._journal_checked = True
+
+    def _open(self) -> sqlite3.Connection:
+        self._ensure_journal_mode()
+        conn = sqlite3.connect(self._uri(), uri=True, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        self.opened += 1
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Borrow a read-only connection"""
+        try:
+            conn = self._idle.get_nowait()
+            self.reused += 1
+        except queue.Empty:
+            conn = self._open()
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection, ending its read transaction so writers (or a WAL checkpoint) can proceed"""
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection (used before the database file is replaced)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        self._journal_checked = False
+
+    def stats(self) -> Dict:
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'opened': self.opened,
+            'reused': self.reused
+        }
+
+
+_pools: Dict[str, ReadOnlyPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_read_pool(db_path: str, size: int = 4, journal_mode: Optional[str] = None) -> ReadOnlyPool:
+    """Get the process-wide read-only pool for a database"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ReadOnlyPool(db_path, size, journal_mode)
+            _pools[db_path] = pool
+        else:
+            pool.size = size
+        return pool
+
+
+def close_pool(db_path: str):
+    """Close the idle connections of one database's pool"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+    if pool is not None:
+        pool.close_all()
+
+
+def close_all_pools():
+    """Close the idle connections of every pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
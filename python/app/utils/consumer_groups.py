@@ -0,0 +1,134 @@
+import hashlib
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+CONSUMER_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS inbox_consumers (
+        group_name TEXT NOT NULL,
+        consumer TEXT NOT NULL,
+        last_seen REAL NOT NULL,
+        PRIMARY KEY (group_name, consumer)
+    )"""
+]
+
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+# SQL function answering which consumer of the group owns a session
+OWNER_FUNCTION = 'inbox_owner'
+
+_ready: Set[str] = set()
+_ready_lock = threading.Lock()
+
+
+class ConsumerGroupError(ValueError):
+    """Invalid group or consumer parameters"""
+    pass
+
+
+def parse_member(group: Optional[str], consumer: Optional[str]) -> Optional[Tuple[str, str]]:
+    """The (group, consumer) of an inbox request, or None when not consuming in a group"""
+    if not group and not consumer:
+        return None
+    if not group or not consumer:
+        raise ConsumerGroupError('group and consumer must be given together')
+    for value in (group, consumer):
+        if not NAME_PATTERN.match(value):
+            raise ConsumerGroupError('group and consumer must be 1-64 letters, digits or _ . : -')
+    return group, consumer
+
+
+def ensure_consumer_table(conn, db_path: str):
+    """Create the membership table once per process"""
+    if db_path in _ready:
+        return
+    with _ready_lock:
+        for statement in CONSUMER_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        _ready.add(db_path)
+
+
+def reset_consumer_groups(db_path: str):
+    with _ready_lock:
+        _ready.discard(db_path)
+
+
+def owner(session_id: str, consumers: Sequence[str]) -> Optional[str]:
+    """Rendezvous hashing: the consumer with the highest hash of (consumer, session)
+
+    A session only moves when its owner leaves or a new consumer outranks
+    it, so a join or expiry reshuffles about 1/n of the sessions.
+    """
+    if session_id is None or not consumers:
+        return None
+    return max(
+        consumers,
+        key=lambda consumer: hashlib.blake2b(f'{consumer}\0{session_id}'.encode(), digest_size=8).digest()
+    )
+
+
+def heartbeat(conn, group: str, consumer: str, ttl: float, now: float = None) -> List[str]:
+    """Register or refresh a consumer, expire silent ones and return the live members"""
+    now = time.time() if now is None else now
+    conn.execute("""
+        INSERT INTO inbox_consumers (group_name, consumer, last_seen) VALUES (?, ?, ?)
+        ON CONFLICT(group_name, consumer) DO UPDATE SET last_seen = excluded.last_seen
+    """, (group, consumer, now))
+    conn.execute("DELETE FROM inbox_consumers WHERE group_name = ? AND last_seen < ?", (group, now - ttl))
+    conn.commit()
+    rows = conn.execute(
+        "SELECT consumer FROM inbox_consumers WHERE group_name = ? ORDER BY consumer", (group,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def leave(conn, group: str, consumer: str) -> bool:
+    cursor = conn.execute(
+        "DELETE FROM inbox_consumers WHERE group_name = ? AND consumer = ?", (group, consumer)
+    )
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+class Assignment:
+    """The share of the inbox a consumer owns given the current members"""
+
+    def __init__(self, group: str, consumer: str, consumers: Sequence[str]):
+        self.group = group
+        self.consumer = consumer
+        self.consumers = tuple(consumers)
+
+    def register(self, conn):
+        """Make inbox_owner(session_id) available on a connection"""
+        consumers = self.consumers
+        conn.create_function(OWNER_FUNCTION, 1, lambda session_id: owner(session_id, consumers),
+                             deterministic=True)
+
+    def clause(self, column: str = 'session_id') -> Tuple[str, List]:
+        """Condition selecting rows of the sessions this consumer owns"""
+        return f"{OWNER_FUNCTION}({column}) = ?", [self.consumer]
+
+    def to_dict(self) -> Dict:
+        return {
+            'group': self.group,
+            'consumer': self.consumer,
+            'members': len(self.consumers)
+        }
+
+
+def group_members(conn, ttl: float, now: float = None) -> Dict[str, List[Dict]]:
+    """Live members of every group, for the admin view"""
+    now = time.time() if now is None else now
+    groups: Dict[str, List[Dict]] = {}
+    rows = conn.execute("""
+        SELECT group_name, consumer, last_seen FROM inbox_consumers
+        WHERE last_seen >= ? ORDER BY group_name, consumer
+    """, (now - ttl,)).fetchall()
+    for group, consumer, last_seen in rows:
+        groups.setdefault(group, []).append({
+            'consumer': consumer,
+            'idle_seconds': round(now - last_seen, 1)
+        })
+    return groups
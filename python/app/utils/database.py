@@ -3,16 +3,76 @@ import json
 import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
+from config import Config
+from app.utils.activity_buffer import get_activity_buffer
+from app.utils.session_directory import get_session_directory, reset_session_directory
+from app.utils.connection_pool import get_read_pool, close_pool
+from app.utils.retention import RetentionManager, build_policies
+from app.utils.archive import ArchiveManager, attach_archive, default_archive_path, unified_source
+from app.utils.compression import BodyCodec, build_dictionary, get_codec, reset_codecs
+from app.utils.export import iter_rows
+from app.utils.columnar import export_columnar
+from app.utils.analytics import compute_sessions, compute_traffic, reset_analytics_cache
+from app.utils.rollups import RollupManager, query_rollups
+from app.utils.change_feed import (
+    change_log_exists, drop_change_triggers, ensure_change_feed, is_change_feed_ready, last_seq, read_changes,
+    record_event, reset_change_feed
+)
+from app.utils.consumer_groups import Assignment, ensure_consumer_table, group_members, heartbeat, leave, reset_consumer_groups
+from app.utils.fair_inbox import ensure_fair_index, fair_params, fair_query, reset_fair_index
+from app.utils.idempotency import ensure_idempotency_table, purge_expired, recall, reset_idempotency, write_once
+from app.utils.session_metadata import CONFIG_KEY as METADATA_COLUMNS_KEY, filter_clause, indexed_keys, parse_keys, sync_columns
+from app.utils.storage_format import (
+    STORAGE_FORMAT_VERSION, StorageFormatMigration, epoch_ms, get_storage_version, reset_storage_version,
+    set_storage_version, storage_status, to_epoch_ms
+)
+from app.utils.storage import StorageBackend
+from app.utils.tenants import get_registry, request_db_path, reset_tenants, stop_tenant_jobs, tenant_db_path
+from app.utils.timeline import timeline_page
+from app.utils.search import (
+    SEARCH_TABLE, backfill_search_index, create_search_index, index_body, reset_search_index, search,
+    search_index_exists
+)
 
-class DatabaseManager:
+
+def get_body_codec() -> BodyCodec:
+    """Codec for message and response bodies under the current configuration"""
+    return get_codec(
+        Config.COMPRESSION_ALGORITHM or 'zlib', int(Config.COMPRESSION_THRESHOLD),
+        int(Config.COMPRESSION_LEVEL), Config.COMPRESSION_DICTIONARY_PATH
+    )
+
+
+def change_feed_enabled() -> bool:
+    """Whether writes are recorded in change_log
+
+    On for CHANGE_FEED_ENABLED, or on a primary with REPLICATION_KEY set
+    (its replicas read the feed). Replicas apply the primary's feed and
+    keep none of their own.
+    """
+    if Config.REPLICA_OF:
+        return False
+    return str(Config.CHANGE_FEED_ENABLED).lower() in ('1', 'true', 'yes') or bool(Config.REPLICATION_KEY)
+
+
+class DatabaseManager(StorageBackend):
+    # Tables whose rows survive a fast reset
+    PRESERVED_TABLES = ('system_config', 'stats_hourly', 'stats_watermarks', 'tenants')
+    
+    FEATURES = frozenset((
+        'analytics', 'archive', 'backup', 'change_feed', 'columnar', 'compression', 'export', 'retention',
+        'rollups', 'search', 'storage_format', 'timeline'
+    ))
+    
     def __init__(self, db_path: str = None):
         if db_path is None:
-            from flask import current_app
-            db_path = current_app.config['DATABASE_PATH']
+            # The request's tenant database in tenant mode
+            db_path = request_db_path()
         
         self.db_path = db_path
         self.ensure_db_directory()
         self.init_database()
+        self.ensure_idempotency_table()
     
     def ensure_db_directory(self):
         """Ensure database directory exists"""
@@ -26,6 +86,17 @@ class DatabaseManager:
         conn.row_factory = sqlite3.Row
         return conn
     
+    def get_read_connection(self):
+        """Get a pooled read-only connection for admin and reporting queries
+        
+        Closing the returned connection hands it back to the pool. Falls back
+        to a regular connection when the pool is disabled.
+        """
+        size = int(Config.READ_POOL_SIZE)
+        if size <= 0:
+            return self.get_connection()
+        return get_read_pool(self.db_path, size, Config.DATABASE_JOURNAL_MODE or None).acquire()
+    
     def init_database(self):
         """Initialize database with schema"""
         conn = self.get_connection()
@@ -37,6 +108,19 @@ class DatabaseManager:
                 # Tables already exist, skip initialization
                 return
             
+            # A fresh database file invalidates anything cached for this path
+            reset_session_directory(self.db_path)
+            reset_search_index(self.db_path)
+            reset_analytics_cache(self.db_path)
+            # New databases start on the text format (see migrate_storage_format)
+            set_storage_version(self.db_path, 0)
+            reset_idempotency(self.db_path)
+            reset_fair_index(self.db_path)
+            reset_consumer_groups(self.db_path)
+            reset_change_feed(self.db_path)
+            reset_tenants(self.db_path)
+            close_pool(self.db_path)
+            
             # Try to find the initialization script
             # First, try relative to the database path
             init_script_path = os.path.join(os.path.dirname(self.db_path), 'init_database.sql')
@@ -52,6 +136,10 @@ class DatabaseManager:
                         break
                     current_dir = os.path.dirname(current_dir)
             
+            # Must be set before the first table exists; lets retention
+            # runs hand freed pages back with PRAGMA incremental_vacuum
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
             if os.path.exists(init_script_path):
                 with open(init_script_path, 'r') as f:
                     init_script = f.read()
@@ -70,6 +158,10 @@ class DatabaseManager:
                 # If no init script, create basic tables
                 self.create_basic_schema(conn)
                 conn.commit()
+            
+            # Record changes from the first write on
+            if change_feed_enabled():
+                ensure_change_feed(conn, self.db_path)
                 
         except Exception as e:
             print(f"Database initialization error: {e}")
@@ -182,13 +274,75 @@ class DatabaseManager:
             ('rate_limit_window', '3600')
         """)
     
+    def get_session_directory(self):
+        """Get the in-process session directory, or None when it is disabled"""
+        capacity = int(Config.SESSION_DIRECTORY_SIZE)
+        if capacity <= 0:
+            return None
+        directory = get_session_directory(
+            self.db_path,
+            capacity,
+            int(Config.SESSION_BLOOM_CAPACITY),
+            float(Config.SESSION_BLOOM_ERROR_RATE),
+            str(Config.SESSION_DIRECTORY_AUTHORITATIVE).lower() in ('1', 'true', 'yes')
+        )
+        if directory.authoritative and not directory.warmed:
+            conn = self.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM web_chat_sessions")
+                directory.warm(row[0] for row in cursor)
+            finally:
+                conn.close()
+        return directory
+    
+    def invalidate_session_directory(self, session_ids: List[str] = None, full: bool = False):
+        """Drop cached session entries after sessions were deleted"""
+        directory = self.get_session_directory()
+        if directory is None:
+            return
+        if full:
+            directory.clear()
+        else:
+            directory.invalidate(session_ids)
+    
+    def clear_all_data(self) -> Dict[str, int]:
+        """Delete all sessions, messages, responses and rate limits; returns the counts deleted"""
+        conn = self.get_connection()
+        try:
+            cleared = {}
+            for name, table in (('responses', 'web_chat_responses'), ('messages', 'web_chat_messages'),
+                                ('sessions', 'web_chat_sessions')):
+                cleared[name] = conn.execute(f"DELETE FROM {table}").rowcount
+            conn.execute("DELETE FROM rate_limits")
+            conn.commit()
+        finally:
+            conn.close()
+        self.invalidate_session_directory(full=True)
+        self.reset_analytics()
+        self.clear_archive()
+        self.clear_idempotency_keys()
+        return cleared
+    
     def session_exists(self, session_id: str) -> bool:
         """Check if session exists - IDENTICAL to PHP"""
+        directory = self.get_session_directory()
+        if directory is not None:
+            if directory.get_uid(session_id) is not None:
+                return True
+            if directory.known_absent(session_id):
+                return False
+        
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT id FROM web_chat_sessions WHERE id = ?", (session_id,))
-            return cursor.fetchone() is not None
+            cursor.execute("SELECT id, uid FROM web_chat_sessions WHERE id = ?", (session_id,))
+            result = cursor.fetchone()
+            if result is None:
+                return False
+            if directory is not None and result['uid']:
+                directory.add(session_id, result['uid'])
+            return True
         finally:
             conn.close()
     
@@ -205,10 +359,31 @@ class DatabaseManager:
                 VALUES (?, ?, ?, ?)
             """, (session_id, uid, ip_address, json.dumps({})))
             conn.commit()
+            
+            directory = self.get_session_directory()
+            if directory is not None:
+                directory.add(session_id, uid)
             return uid
         finally:
             conn.close()
     
+    def restore_cached_session(self, conn, session_id: str):
+        """Recreate a session row deleted by another process while this one had it cached
+        
+        Positive directory hits skip the database, and only deletions made in
+        this process invalidate them. Writes for a cached session therefore
+        re-insert its row (with the cached uid) if it is gone, instead of
+        leaving orphaned messages behind. A no-op lookup when the row exists.
+        """
+        directory = self.get_session_directory()
+        if directory is None:
+            return
+        uid = directory.peek(session_id)
+        if uid is not None:
+            conn.execute("""
+                INSERT OR IGNORE INTO web_chat_sessions (id, uid, metadata) VALUES (?, ?, ?)
+            """, (session_id, uid, json.dumps({})))
+    
     def generate_uid(self) -> str:
         """Generate a unique 16-character hexadecimal UID"""
         import secrets
@@ -216,6 +391,14 @@ class DatabaseManager:
     
     def get_or_create_uid(self, session_id: str, ip_address: str = None) -> Dict[str, Any]:
         """Get existing UID or create new one - IDENTICAL to PHP"""
+        directory = self.get_session_directory()
+        if directory is not None:
+            uid = directory.get_uid(session_id)
+            if uid is not None:
+                return {'uid': uid, 'is_new': False}
+            if directory.known_absent(session_id):
+                return {'uid': self.create_session(session_id, ip_address), 'is_new': True}
+        
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
@@ -223,6 +406,8 @@ class DatabaseManager:
             result = cursor.fetchone()
             
             if result:
+                if directory is not None and result['uid']:
+                    directory.add(session_id, result['uid'])
                 return {'uid': result['uid'], 'is_new': False}
             else:
                 # Create new session and return new UID
@@ -231,64 +416,156 @@ class DatabaseManager:
         finally:
             conn.close()
     
-    def create_message(self, session_id: str, message: str, message_type: str = 'user') -> int:
-        """Create new message - IDENTICAL to PHP"""
+    def create_message(self, session_id: str, message: str, message_type: str = 'user',
+                       idempotency_key: str = None, response: Dict = None) -> int:
+        """Create new message - IDENTICAL to PHP
+        
+        With idempotency_key, the API response data is stored with the key in
+        the same transaction; a repeated key raises DuplicateRequest instead
+        of inserting again.
+        """
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO web_chat_messages (session_id, message, timestamp)
-                VALUES (?, ?, datetime('now'))
-            """, (session_id, message))
+            stored = get_body_codec().encode(message)
+            
+            def insert():
+                self.restore_cached_session(conn, session_id)
+                if self.uses_integer_keys(conn):
+                    cursor.execute(f"""
+                        INSERT INTO web_chat_messages (session_id, message, timestamp, session_key, ts)
+                        VALUES (?, ?, datetime('now'), (SELECT session_key FROM web_chat_sessions WHERE id = ?),
+                                {epoch_ms("datetime('now')")})
+                    """, (session_id, stored, session_id))
+                else:
+                    cursor.execute("""
+                        INSERT INTO web_chat_messages (session_id, message, timestamp)
+                        VALUES (?, ?, datetime('now'))
+                    """, (session_id, stored))
+                if isinstance(stored, bytes) and search_index_exists(conn, self.db_path):
+                    index_body(conn, 'message', cursor.lastrowid, session_id, message)
+                return cursor.lastrowid
+            
+            if idempotency_key:
+                self.purge_idempotency_keys(conn)
+                message_id = write_once(conn, 'messages', session_id, idempotency_key, insert, response or {},
+                                      int(Config.IDEMPOTENCY_TTL))
+            else:
+                message_id = insert()
             conn.commit()
-            return cursor.lastrowid
+            return message_id
         finally:
             conn.close()
     
-    def get_unprocessed_messages(self, limit: int, offset: int, since: str = None) -> List[Dict]:
-        """Get unprocessed messages - IDENTICAL to PHP version"""
+    def get_unprocessed_messages(self, limit: int, offset: int, since: str = None,
+                                 mode: str = 'fifo', per_session: int = 0,
+                                 assignment: Assignment = None) -> List[Dict]:
+        """Get unprocessed messages - IDENTICAL to PHP version
+        
+        mode='fair' schedules the page round-robin across sessions instead
+        of oldest-first globally, with at most per_session messages (0 for
+        no cap) from any one session. An assignment from
+        join_consumer_group() limits the page to the consumer's sessions.
+        """
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
+            if assignment:
+                assignment.register(conn)
+            
+            if mode == 'fair':
+                rows = self._fair_unprocessed_messages(conn, limit, offset, since, int(per_session or 0), assignment)
+                codec = get_body_codec()
+                messages = [dict(dict(row), message=codec.decode(row['message'])) for row in rows]
+                for message in messages:
+                    del message['inbox_round']
+                return messages
             
             where_conditions = ["m.processed = 0"]
             params = []
+            since_ms = to_epoch_ms(since)
+            integer_keys = self.uses_integer_keys(conn) and (not since or since_ms is not None)
             
             if since:
-                where_conditions.append("m.timestamp > ?")
-                params.append(since)
+                where_conditions.append("m.ts > ?" if integer_keys else "m.timestamp > ?")
+                params.append(since_ms if integer_keys else since)
+            
+            if assignment:
+                condition, condition_params = assignment.clause('m.session_id')
+                where_conditions.append(condition)
+                params.extend(condition_params)
             
             where_clause = " AND ".join(where_conditions)
             
-            # Query IDENTICAL to PHP version
-            sql = f"""
-                SELECT m.id, m.session_id, m.message, m.timestamp, s.uid
-                FROM web_chat_messages m
-                LEFT JOIN web_chat_sessions s ON m.session_id = s.id
-                WHERE {where_clause}
-                ORDER BY m.timestamp ASC
-                LIMIT ? OFFSET ?
-            """
+            if integer_keys:
+                # Same rows and columns, joined and ordered on the integer columns
+                sql = f"""
+                    SELECT m.id, m.session_id, m.message, m.timestamp, s.uid
+                    FROM web_chat_messages m
+                    LEFT JOIN web_chat_sessions s ON m.session_key = s.session_key
+                    WHERE {where_clause}
+                    ORDER BY m.ts ASC
+                    LIMIT ? OFFSET ?
+                """
+            else:
+                # Query IDENTICAL to PHP version
+                sql = f"""
+                    SELECT m.id, m.session_id, m.message, m.timestamp, s.uid
+                    FROM web_chat_messages m
+                    LEFT JOIN web_chat_sessions s ON m.session_id = s.id
+                    WHERE {where_clause}
+                    ORDER BY m.timestamp ASC
+                    LIMIT ? OFFSET ?
+                """
             params.extend([limit, offset])
             
             cursor.execute(sql, params)
-            return [dict(row) for row in cursor.fetchall()]
+            codec = get_body_codec()
+            messages = []
+            for row in cursor.fetchall():
+                message = dict(row)
+                message['message'] = codec.decode(message['message'])
+                messages.append(message)
+            return messages
         finally:
             conn.close()
     
-    def get_unprocessed_message_count(self, since: str = None) -> int:
+    def _fair_unprocessed_messages(self, conn, limit: int, offset: int, since: str, per_session: int,
+                                   assignment: Assignment = None):
+        since_ms = to_epoch_ms(since)
+        integer_keys = self.uses_integer_keys(conn) and (not since or since_ms is not None)
+        ensure_fair_index(conn, self.db_path, integer_keys)
+        since_value = (since_ms if integer_keys else since) if since else None
+        partition, partition_params = assignment.clause() if assignment else ('', [])
+        return conn.execute(
+            fair_query(integer_keys, since_value is not None, partition),
+            fair_params(since_value, per_session, limit, offset, partition_params)
+        ).fetchall()
+    
+    def get_unprocessed_message_count(self, since: str = None, assignment: Assignment = None) -> int:
         """Get total count of unprocessed messages - IDENTICAL to PHP"""
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
+            if assignment:
+                assignment.register(conn)
             
             where_conditions = ["processed = 0"]
             params = []
+            since_ms = to_epoch_ms(since)
             
-            if since:
+            if since and since_ms is not None and self.uses_integer_keys(conn):
+                where_conditions.append("ts > ?")
+                params.append(since_ms)
+            elif since:
                 where_conditions.append("timestamp > ?")
                 params.append(since)
             
+            if assignment:
+                condition, condition_params = assignment.clause()
+                where_conditions.append(condition)
+                params.extend(condition_params)
+            
             where_clause = " AND ".join(where_conditions)
             
             sql = f"SELECT COUNT(*) as total FROM web_chat_messages WHERE {where_clause}"
@@ -297,6 +574,37 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def join_consumer_group(self, group: str, consumer: str) -> Assignment:
+        """Heartbeat a consumer and return its share of the inbox
+        
+        Consumers that have not polled within Config.CONSUMER_TTL seconds
+        are dropped from the group and their sessions rebalanced.
+        """
+        conn = self.get_connection()
+        try:
+            ensure_consumer_table(conn, self.db_path)
+            members = heartbeat(conn, group, consumer, float(Config.CONSUMER_TTL))
+            return Assignment(group, consumer, members)
+        finally:
+            conn.close()
+    
+    def leave_consumer_group(self, group: str, consumer: str) -> bool:
+        conn = self.get_connection()
+        try:
+            ensure_consumer_table(conn, self.db_path)
+            return leave(conn, group, consumer)
+        finally:
+            conn.close()
+    
+    def get_consumer_groups(self) -> Dict[str, List[Dict]]:
+        """Live members of every consumer group"""
+        conn = self.get_connection()
+        try:
+            ensure_consumer_table(conn, self.db_path)
+            return group_members(conn, float(Config.CONSUMER_TTL))
+        finally:
+            conn.close()
+    
     def mark_messages_processed(self, message_ids: List[int]):
         """Mark messages as processed"""
         if not message_ids:
@@ -312,23 +620,78 @@ class DatabaseManager:
         finally:
             conn.close()
     
-    def create_response(self, session_id: str, response: str, message_id: int = None) -> int:
-        """Create new response - IDENTICAL to PHP"""
+    def create_response(self, session_id: str, response: str, message_id: int = None,
+                        idempotency_key: str = None, result: Dict = None) -> int:
+        """Create new response - IDENTICAL to PHP (idempotency_key works as in create_message)"""
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO web_chat_responses (session_id, response, message_id, timestamp)
-                VALUES (?, ?, ?, datetime('now'))
-            """, (session_id, response, message_id))
+            stored = get_body_codec().encode(response)
+            
+            def insert():
+                self.restore_cached_session(conn, session_id)
+                if self.uses_integer_keys(conn):
+                    cursor.execute(f"""
+                        INSERT INTO web_chat_responses (session_id, response, message_id, timestamp, session_key, ts)
+                        VALUES (?, ?, ?, datetime('now'), (SELECT session_key FROM web_chat_sessions WHERE id = ?),
+                                {epoch_ms("datetime('now')")})
+                    """, (session_id, stored, message_id, session_id))
+                else:
+                    cursor.execute("""
+                        INSERT INTO web_chat_responses (session_id, response, message_id, timestamp)
+                        VALUES (?, ?, ?, datetime('now'))
+                    """, (session_id, stored, message_id))
+                if isinstance(stored, bytes) and search_index_exists(conn, self.db_path):
+                    index_body(conn, 'response', cursor.lastrowid, session_id, response)
+                return cursor.lastrowid
+            
+            if idempotency_key:
+                self.purge_idempotency_keys(conn)
+                response_id = write_once(conn, 'outbox', session_id, idempotency_key, insert, result or {},
+                                      int(Config.IDEMPOTENCY_TTL))
+            else:
+                response_id = insert()
             conn.commit()
-            return cursor.lastrowid
+            return response_id
         finally:
             conn.close()
     
-    def create_response_with_message_id(self, session_id: str, response: str, message_id: int = None) -> int:
+    def create_response_with_message_id(self, session_id: str, response: str, message_id: int = None,
+                                        idempotency_key: str = None, result: Dict = None) -> int:
         """Create new response with message_id - IDENTICAL to PHP"""
-        return self.create_response(session_id, response, message_id)
+        return self.create_response(session_id, response, message_id, idempotency_key, result)
+    
+    def ensure_idempotency_table(self):
+        conn = self.get_connection()
+        try:
+            ensure_idempotency_table(conn, self.db_path)
+        except sqlite3.Error as e:
+            print(f"Idempotency table initialization error: {e}")
+        finally:
+            conn.close()
+    
+    def find_idempotent_response(self, scope: str, session_id: str, key: str) -> Optional[Dict]:
+        """The stored response data of an earlier write under the same key, if any"""
+        conn = self.get_connection()
+        try:
+            return recall(conn, scope, session_id, key, int(Config.IDEMPOTENCY_TTL))
+        finally:
+            conn.close()
+    
+    def purge_idempotency_keys(self, conn):
+        """Opportunistically drop expired keys on the write path (throttled)"""
+        purge_expired(conn, self.db_path, int(Config.IDEMPOTENCY_TTL), float(Config.IDEMPOTENCY_PURGE_INTERVAL))
+    
+    def clear_idempotency_keys(self):
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM idempotency_keys")
+            conn.commit()
+        except sqlite3.OperationalError:
+            # Table not created (basic schema)
+            pass
+        finally:
+            conn.close()
     
 
     
@@ -338,6 +701,25 @@ class DatabaseManager:
         try:
             cursor = conn.cursor()
             
+            # Only a full history load can reach responses that were archived
+            archived = not since and self.attach_archive(conn)
+            since_ms = to_epoch_ms(since)
+            if not archived and (not since or since_ms is not None) and self.uses_integer_keys(conn):
+                # Responses pushed for a session that was never created have no key
+                sql = """
+                    SELECT id, response, timestamp, message_id FROM web_chat_responses
+                    WHERE (session_key = (SELECT session_key FROM web_chat_sessions WHERE id = ?)
+                           OR (session_key IS NULL AND session_id = ?))
+                """
+                params = [session_id, session_id]
+                if since:
+                    sql += " AND ts > ?"
+                    params.append(since_ms)
+                cursor.execute(sql + " ORDER BY ts ASC", params)
+                return self._decode_responses(cursor.fetchall())
+            
+            source = unified_source('web_chat_responses', 'id, session_id, response, timestamp, message_id', archived)
+            
             where_conditions = ["session_id = ?"]
             params = [session_id]
             
@@ -349,75 +731,120 @@ class DatabaseManager:
             
             sql = f"""
                 SELECT id, response, timestamp, message_id
-                FROM web_chat_responses
+                FROM {source}
                 WHERE {where_clause}
                 ORDER BY timestamp ASC
             """
             
             cursor.execute(sql, params)
-            responses = []
-            for row in cursor.fetchall():
-                responses.append({
-                    'id': row['id'],
-                    'response': row['response'],
-                    'timestamp': row['timestamp'],
-                    'message_id': row['message_id']
-                })
-            return responses
+            return self._decode_responses(cursor.fetchall())
         finally:
             conn.close()
     
-    def get_active_sessions(self, limit: int, offset: int, active: bool = True) -> List[Dict]:
-        """Get active sessions with message/response counts - IDENTICAL to PHP"""
-        conn = self.get_connection()
+    def _decode_responses(self, rows) -> List[Dict]:
+        codec = get_body_codec()
+        return [
+            {
+                'id': row['id'],
+                'response': codec.decode(row['response']),
+                'timestamp': row['timestamp'],
+                'message_id': row['message_id']
+            }
+            for row in rows
+        ]
+    
+    def get_active_sessions(self, limit: int, offset: int, active: bool = True,
+                            metadata: Dict[str, str] = None) -> List[Dict]:
+        """Get active sessions with message/response counts - IDENTICAL to PHP
+        
+        metadata filters sessions by metadata keys ({key: value}).
+        """
+        conn = self.get_read_connection()
         try:
             cursor = conn.cursor()
+            conditions, params = filter_clause(metadata, indexed_keys(conn)) if metadata else ([], [])
+            extra = ''.join(f" AND {condition}" for condition in conditions)
             
-            # Query IDENTICAL to PHP version
-            sql = """
-                SELECT s.id, s.uid, s.created_at, s.last_active, s.ip_address, s.metadata,
-                       COUNT(DISTINCT m.id) as message_count,
-                       COUNT(DISTINCT r.id) as response_count
-                FROM web_chat_sessions s
-                LEFT JOIN web_chat_messages m ON s.id = m.session_id
-                LEFT JOIN web_chat_responses r ON s.id = r.session_id
-                WHERE s.last_active > datetime('now', '-1 day')
-                GROUP BY s.id
-                ORDER BY s.last_active DESC
-                LIMIT ? OFFSET ?
-            """
+            if self.uses_integer_keys(conn):
+                # Counted per session through the integer key indexes instead of a cross join
+                sql = f"""
+                    SELECT s.id, s.uid, s.created_at, s.last_active, s.ip_address, s.metadata,
+                           (SELECT COUNT(*) FROM web_chat_messages m WHERE m.session_key = s.session_key) as message_count,
+                           (SELECT COUNT(*) FROM web_chat_responses r WHERE r.session_key = s.session_key) as response_count
+                    FROM web_chat_sessions s
+                    WHERE s.last_active > datetime('now', '-1 day'){extra}
+                    ORDER BY s.last_active DESC
+                    LIMIT ? OFFSET ?
+                """
+            else:
+                # Query IDENTICAL to PHP version
+                sql = f"""
+                    SELECT s.id, s.uid, s.created_at, s.last_active, s.ip_address, s.metadata,
+                           COUNT(DISTINCT m.id) as message_count,
+                           COUNT(DISTINCT r.id) as response_count
+                    FROM web_chat_sessions s
+                    LEFT JOIN web_chat_messages m ON s.id = m.session_id
+                    LEFT JOIN web_chat_responses r ON s.id = r.session_id
+                    WHERE s.last_active > datetime('now', '-1 day'){extra}
+                    GROUP BY s.id
+                    ORDER BY s.last_active DESC
+                    LIMIT ? OFFSET ?
+                """
             
-            cursor.execute(sql, [limit, offset])
+            cursor.execute(sql, params + [limit, offset])
             return [dict(row) for row in cursor.fetchall()]
         finally:
             conn.close()
     
-    def get_session_count(self, active: bool = True) -> int:
+    def get_session_count(self, active: bool = True, metadata: Dict[str, str] = None) -> int:
         """Get total session count - IDENTICAL to PHP"""
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             cursor = conn.cursor()
+            conditions, params = filter_clause(metadata, indexed_keys(conn)) if metadata else ([], [])
             if active:
-                cursor.execute("SELECT COUNT(*) FROM web_chat_sessions WHERE last_active > datetime('now', '-1 day')")
-            else:
-                cursor.execute("SELECT COUNT(*) FROM web_chat_sessions")
+                conditions.insert(0, "s.last_active > datetime('now', '-1 day')")
+            where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+            cursor.execute(f"SELECT COUNT(*) FROM web_chat_sessions s{where_clause}", params)
             return cursor.fetchone()[0]
         finally:
             conn.close()
     
     def cleanup_inactive_sessions(self) -> int:
         """Clean up inactive sessions - IDENTICAL to PHP"""
+        # Buffered activity must land first or live sessions look inactive
+        self.flush_session_activity()
+        
+        # Batched; the sessions' messages and responses go too only with RETENTION_CASCADE
+        cascade = str(Config.RETENTION_CASCADE).lower() in ('1', 'true', 'yes')
+        policy = build_policies(int(Config.SESSION_TIMEOUT), rate_limit_ttl=0, cascade=cascade)[0]
+        manager = RetentionManager(self, int(Config.RETENTION_BATCH_SIZE), float(Config.RETENTION_BATCH_PAUSE))
+        return manager.purge(policy)['deleted']
+    
+    def get_retention_policies(self):
+        """Get the TTL policies applied by the retention scheduler
+        
+        The retention_message_ttl and retention_response_ttl config keys
+        override the Config values for this database (e.g. per tenant). On
+        a replica only the local bookkeeping tables expire: conversation
+        deletes arrive through the primary's change feed.
+        """
+        config = self.get_all_config()
         conn = self.get_connection()
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                DELETE FROM web_chat_sessions 
-                WHERE last_active < datetime('now', '-1800 seconds')
-            """)
-            conn.commit()
-            return cursor.rowcount
+            has_change_log = change_log_exists(conn)
         finally:
             conn.close()
+        replica = bool(Config.REPLICA_OF)
+        return build_policies(
+            0 if replica else int(Config.RETENTION_SESSION_TTL),
+            0 if replica else int(config.get('retention_message_ttl') or Config.RETENTION_MESSAGE_TTL),
+            0 if replica else int(config.get('retention_response_ttl') or Config.RETENTION_RESPONSE_TTL),
+            int(Config.RETENTION_RATE_LIMIT_TTL),
+            int(Config.IDEMPOTENCY_TTL),
+            int(Config.CHANGE_LOG_TTL) if has_change_log else 0,
+            str(Config.RETENTION_CASCADE).lower() in ('1', 'true', 'yes')
+        )
     
     def get_all_config(self) -> Dict[str, str]:
         """Get all configuration values from system_config table"""
@@ -442,6 +869,8 @@ class DatabaseManager:
     
     def update_config(self, config_data: Dict[str, str]):
         """Update configuration values"""
+        # Validated before anything is written
+        metadata_keys = parse_keys(config_data[METADATA_COLUMNS_KEY]) if METADATA_COLUMNS_KEY in config_data else None
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
@@ -462,11 +891,41 @@ class DatabaseManager:
                         VALUES (?, ?, datetime('now'))
                     """, (key, value))
             conn.commit()
+            if metadata_keys is not None:
+                sync_columns(conn, metadata_keys)
+        finally:
+            conn.close()
+    
+    def sync_metadata_columns(self) -> Dict[str, Any]:
+        """Bring the generated metadata columns in line with the session_metadata_columns setting"""
+        keys = parse_keys(self.get_config(METADATA_COLUMNS_KEY) or '')
+        conn = self.get_connection()
+        try:
+            return sync_columns(conn, keys)
         finally:
             conn.close()
     
+    def get_activity_buffer(self):
+        """Get the write-behind activity buffer, or None when it is disabled"""
+        flush_interval = float(Config.ACTIVITY_FLUSH_INTERVAL)
+        if flush_interval <= 0:
+            return None
+        return get_activity_buffer(self.db_path, flush_interval, float(Config.ACTIVITY_MAX_STALENESS))
+    
+    def flush_session_activity(self) -> int:
+        """Write any buffered last_active updates to the database"""
+        buffer = self.get_activity_buffer()
+        if buffer is None:
+            return 0
+        return buffer.flush()
+    
     def update_session_activity(self, session_id: str):
         """Update the last_active timestamp for a session - IDENTICAL to PHP"""
+        buffer = self.get_activity_buffer()
+        if buffer is not None:
+            buffer.record(session_id)
+            return
+        
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
@@ -479,6 +938,503 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def ensure_search_index(self) -> bool:
+        """Whether the full-text index is enabled and has been built (see build_search_index)"""
+        if str(Config.SEARCH_INDEX_ENABLED).lower() not in ('1', 'true', 'yes'):
+            return False
+        conn = self.get_connection()
+        try:
+            return search_index_exists(conn, self.db_path)
+        finally:
+            conn.close()
+    
+    def build_search_index(self, rebuild: bool = False) -> int:
+        """Create the full-text index and its triggers, then index existing rows in batches
+        
+        An existing index is left alone unless ``rebuild``, which empties and
+        refills it. Run from the admin API or SearchIndexBuilder, not on the
+        request path. Returns the number of rows indexed.
+        """
+        if str(Config.SEARCH_INDEX_ENABLED).lower() not in ('1', 'true', 'yes'):
+            return 0
+        conn = self.get_connection()
+        try:
+            if search_index_exists(conn, self.db_path) and not rebuild:
+                return 0
+            if not create_search_index(conn):
+                return 0
+            if rebuild:
+                conn.execute(f"DELETE FROM {SEARCH_TABLE}")
+                conn.commit()
+            return backfill_search_index(
+                conn, get_body_codec().decode,
+                int(Config.SEARCH_INDEX_BATCH_SIZE), float(Config.RETENTION_BATCH_PAUSE)
+            )
+        finally:
+            conn.close()
+    
+    def rebuild_search_index(self) -> int:
+        """Repopulate the full-text index from the message and response tables"""
+        return self.build_search_index(rebuild=True)
+    
+    def search_conversations(self, query: str, limit: int = 20, cursor: str = None, session_id: str = None,
+                             order: str = 'rank', raw: bool = False) -> Optional[Dict[str, Any]]:
+        """Full-text search over messages and responses; None when the index is unavailable"""
+        if not self.ensure_search_index():
+            return None
+        conn = self.get_read_connection()
+        try:
+            return search(conn, query, limit, cursor, session_id, order, raw)
+        finally:
+            conn.close()
+    
+    def ensure_change_feed(self) -> bool:
+        """Make sure the change log and its triggers exist (checked once per process)
+        
+        Returns False when the feed is disabled (see change_feed_enabled).
+        """
+        if not change_feed_enabled():
+            return False
+        if is_change_feed_ready(self.db_path):
+            return True
+        conn = self.get_connection()
+        try:
+            return ensure_change_feed(conn, self.db_path)
+        except Exception as e:
+            print(f"Change feed initialization error: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def sync_change_feed(self) -> bool:
+        """Install the change log triggers if the feed is enabled, drop them if not
+        
+        Run at startup: a database that once had the feed on stops paying
+        for a change_log insert per write once it is turned off. Recorded
+        events are kept.
+        """
+        if self.ensure_change_feed():
+            return True
+        conn = self.get_connection()
+        try:
+            drop_change_triggers(conn)
+        finally:
+            conn.close()
+        reset_change_feed(self.db_path)
+        return False
+    
+    def get_changes(self, after_seq: int = 0, limit: int = 100,
+                    entities: List[str] = None) -> Optional[Dict[str, Any]]:
+        """Change log events after a sequence number; None when the feed is unavailable"""
+        if not self.ensure_change_feed():
+            return None
+        conn = self.get_read_connection()
+        try:
+            return read_changes(conn, after_seq, limit, get_body_codec().decode, entities)
+        finally:
+            conn.close()
+    
+    def get_change_log_head(self) -> Optional[int]:
+        """Newest change log sequence number; None when the feed is unavailable"""
+        if not self.ensure_change_feed():
+            return None
+        conn = self.get_read_connection()
+        try:
+            return last_seq(conn)
+        finally:
+            conn.close()
+    
+    def get_tenant_registry(self):
+        """Tenants whose databases live next to this (global) database"""
+        return get_registry(self.db_path, float(Config.TENANT_CACHE_TTL))
+    
+    def list_tenants(self) -> List[Dict[str, Any]]:
+        """Registered tenants with their database file and its size"""
+        tenants = []
+        for tenant in self.get_tenant_registry().list():
+            path = tenant_db_path(self.db_path, tenant['id'])
+            tenants.append(dict(
+                tenant,
+                db_path=path,
+                size_bytes=os.path.getsize(path) if os.path.exists(path) else None
+            ))
+        return tenants
+    
+    def save_tenant(self, tenant_id: str, api_key: str = None) -> Dict[str, Any]:
+        """Register a tenant or rotate its API key, creating its database
+        
+        The tenant database's api_key is the tenant's key, so the API key
+        check works unchanged once a request is routed there. Admin keys
+        are always checked against this (global) database.
+        """
+        tenant = self.get_tenant_registry().save(tenant_id, api_key)
+        tenant_db = DatabaseManager(tenant_db_path(self.db_path, tenant_id))
+        tenant_db.update_config({'api_key': tenant['api_key']})
+        return dict(tenant, db_path=tenant_db.db_path)
+    
+    def remove_tenant(self, tenant_id: str, delete_data: bool = False) -> bool:
+        """Unregister a tenant; its database file is kept unless delete_data is set"""
+        path = tenant_db_path(self.db_path, tenant_id)
+        removed = self.get_tenant_registry().remove(tenant_id)
+        stop_tenant_jobs(path)
+        if delete_data:
+            close_pool(path)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        return removed
+    
+    def get_session_messages(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """A session with all its messages and responses, archived ones included
+        
+        Read from the pool so large sessions never block ingest. Returns
+        None when the session does not exist.
+        """
+        conn = self.get_read_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, uid, created_at, last_active, ip_address, metadata FROM web_chat_sessions WHERE id = ?
+            """, (session_id,))
+            session = cursor.fetchone()
+            if not session:
+                return None
+            
+            # Full history spans the hot tables and, once populated, the archive
+            archived = self.attach_archive(conn)
+            codec = get_body_codec()
+            
+            messages_source = unified_source('web_chat_messages', 'id, session_id, message, timestamp', archived)
+            cursor.execute(f"""
+                SELECT id, session_id, message, timestamp FROM {messages_source} 
+                WHERE session_id = ? ORDER BY timestamp ASC
+            """, (session_id,))
+            messages = []
+            for row in cursor.fetchall():
+                message = dict(row)
+                message['message'] = codec.decode(message['message'])
+                messages.append(message)
+            
+            responses_source = unified_source('web_chat_responses', 'id, session_id, response, message_id, timestamp', archived)
+            cursor.execute(f"""
+                SELECT id, response, message_id, timestamp FROM {responses_source} 
+                WHERE session_id = ? ORDER BY timestamp ASC
+            """, (session_id,))
+            responses = [{
+                'id': row['id'],
+                'response': codec.decode(row['response']),
+                'timestamp': row['timestamp'],
+                'message_id': row['message_id']
+            } for row in cursor.fetchall()]
+            
+            return {'session': dict(session), 'messages': messages, 'responses': responses}
+        finally:
+            conn.close()
+    
+    def get_session_timeline(self, session_id: str, limit: int = 100, cursor: str = None) -> Dict[str, Any]:
+        """One page of a session's messages and responses merged in time order (keyset paginated)"""
+        conn = self.get_read_connection()
+        try:
+            archived = self.attach_archive(conn)
+            integer_keys = not archived and self.uses_integer_keys(conn)
+            return timeline_page(conn, session_id, limit, cursor, integer_keys, archived, get_body_codec().decode)
+        finally:
+            conn.close()
+    
+    def export_rows(self, tables: List[str], start: str = None, end: str = None, chunk_size: int = None):
+        """Generator over export rows; the read connection is held until it is exhausted or closed"""
+        conn = self.get_read_connection()
+        try:
+            archived = self.attach_archive(conn)
+            yield from iter_rows(
+                conn, tables, start, end, int(chunk_size or Config.EXPORT_CHUNK_SIZE),
+                get_body_codec().decode, archived
+            )
+        finally:
+            conn.close()
+    
+    def export_columnar(self, fmt: str, tables: List[str], start: str = None, end: str = None):
+        """Write messages/responses metadata to a temporary .npz, Arrow or Parquet file
+        
+        Returns (path, row counts); the caller deletes the file.
+        """
+        conn = self.get_read_connection()
+        try:
+            archived = self.attach_archive(conn)
+            return export_columnar(
+                conn, fmt, tables, start, end, int(Config.COLUMNAR_CHUNK_SIZE),
+                get_body_codec().decode, archived
+            )
+        finally:
+            conn.close()
+    
+    def get_analytics(self, start: int, end: int) -> Dict[str, Any]:
+        """Response latency, hourly traffic and session distributions between two epoch times"""
+        self.flush_session_activity()
+        conn = self.get_read_connection()
+        try:
+            archived = self.attach_archive(conn)
+            chunk_size = int(Config.COLUMNAR_CHUNK_SIZE)
+            data = compute_traffic(conn, self.db_path, start, end, chunk_size, archived)
+            data['sessions'] = compute_sessions(conn, start, end, chunk_size)
+            return data
+        finally:
+            conn.close()
+    
+    def reset_analytics(self):
+        """Forget cached analytics buckets after data was removed"""
+        reset_analytics_cache(self.db_path)
+    
+    def run_rollups(self) -> Dict[str, Any]:
+        """Fold rows added since the last run into stats_hourly"""
+        return RollupManager(self, int(Config.ROLLUP_BATCH_SIZE)).run()
+    
+    def get_rollups(self, start: str = None, end: str = None, metrics: List[str] = None) -> List[Dict]:
+        """Hourly counts from stats_hourly, caught up to the latest rows first"""
+        self.run_rollups()
+        conn = self.get_read_connection()
+        try:
+            return query_rollups(conn, start, end, metrics)
+        finally:
+            conn.close()
+    
+    def uses_integer_keys(self, conn) -> bool:
+        """Whether every row carries its integer session key and epoch-millisecond timestamp"""
+        return get_storage_version(conn, self.db_path) >= STORAGE_FORMAT_VERSION
+    
+    def migrate_storage_format(self, batch_size: int = None) -> Dict[str, Any]:
+        """Add and backfill the integer session keys and timestamps; safe to re-run"""
+        if batch_size is None:
+            batch_size = int(Config.STORAGE_MIGRATION_BATCH_SIZE)
+        return StorageFormatMigration(self, batch_size, float(Config.RETENTION_BATCH_PAUSE)).run()
+    
+    def get_storage_format(self) -> Dict[str, Any]:
+        conn = self.get_connection()
+        try:
+            return storage_status(conn)
+        finally:
+            conn.close()
+    
+    def get_archive_path(self) -> str:
+        """Path of the cold archive database for this database"""
+        return Config.ARCHIVE_DATABASE_PATH or default_archive_path(self.db_path)
+    
+    def attach_archive(self, conn) -> bool:
+        """Attach the archive to a connection; True when archived rows are reachable"""
+        return attach_archive(conn, self.get_archive_path())
+    
+    def get_archive_manager(self) -> ArchiveManager:
+        return ArchiveManager(
+            self, self.get_archive_path(),
+            int(Config.RETENTION_BATCH_SIZE), float(Config.RETENTION_BATCH_PAUSE)
+        )
+    
+    def run_archive(self) -> List[Dict]:
+        """Move processed messages and old responses into the archive"""
+        return self.get_archive_manager().run(int(Config.ARCHIVE_MESSAGE_AGE), int(Config.ARCHIVE_RESPONSE_AGE))
+    
+    def clear_archive(self, keep: bool = False) -> Optional[str]:
+        """Remove the archive file (or move it aside when keep=True); returns the kept path"""
+        archive_path = self.get_archive_path()
+        if not os.path.exists(archive_path):
+            return None
+        # Pooled readers may have the archive attached
+        close_pool(self.db_path)
+        kept_path = None
+        if keep:
+            base, ext = os.path.splitext(archive_path)
+            kept_path = f"{base}-{datetime.now().strftime('%Y%m%d%H%M%S')}{ext or '.db'}"
+            os.replace(archive_path, kept_path)
+        else:
+            os.remove(archive_path)
+        for suffix in ('-wal', '-shm', '-journal'):
+            try:
+                os.remove(archive_path + suffix)
+            except OSError:
+                pass
+        return kept_path
+    
+    def estimate_row_count(self, conn, table: str) -> int:
+        """Cheap row count from sqlite_stat1 or the rowid range, without a table scan"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                return int(str(row[0]).split()[0])
+        except sqlite3.OperationalError:
+            # No ANALYZE has been run yet
+            pass
+        cursor.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}")
+        low, high = cursor.fetchone()
+        return 0 if low is None else high - low + 1
+    
+    def build_empty_database(self, target_path: str, schema: List[Any], auto_vacuum: int = 2):
+        """Create an empty copy of this database's schema, config rows and id counters"""
+        virtual_tables = [name for _, name, sql in schema if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+        tables = [
+            sql for kind, name, sql in schema
+            if kind == 'table' and not any(name.startswith(v + '_') for v in virtual_tables)
+        ]
+        # Indexes and triggers go in after the preserved rows are copied
+        others = [sql for kind, _, sql in schema if kind in ('index', 'view', 'trigger')]
+        
+        conn = sqlite3.connect(target_path)
+        try:
+            conn.execute(f"PRAGMA auto_vacuum = {int(auto_vacuum)}")
+            for sql in tables:
+                conn.execute(sql)
+            conn.execute("ATTACH DATABASE ? AS src", (self.db_path,))
+            source_tables = {row[0] for row in conn.execute("SELECT name FROM src.sqlite_master WHERE type = 'table'")}
+            for table in self.PRESERVED_TABLES:
+                if table in source_tables:
+                    conn.execute(f"INSERT INTO main.{table} SELECT * FROM src.{table}")
+            # The storage format travels with the schema
+            conn.execute(f"PRAGMA user_version = {int(conn.execute('PRAGMA src.user_version').fetchone()[0])}")
+            if 'sqlite_sequence' in source_tables:
+                # Keep ids monotonic so consumers tracking the last id never see reuse
+                conn.execute("DELETE FROM main.sqlite_sequence")
+                conn.execute("INSERT INTO main.sqlite_sequence (name, seq) SELECT name, seq FROM src.sqlite_sequence")
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+            for sql in others:
+                conn.execute(sql)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def reset_database(self, archive: bool = False) -> Dict[str, Any]:
+        """Clear all data by swapping in a freshly built empty database file
+        
+        Runs in time independent of the data size: the old file is replaced
+        with os.replace() instead of deleting rows. With archive=True the
+        old file is kept next to the database. Cleared counts are estimates.
+        Connections opened before the swap (a request in flight) still see
+        the old file; this app opens one connection per call, so anything
+        after the swap uses the new one.
+        """
+        conn = self.get_connection()
+        try:
+            counts = {
+                'sessions': self.estimate_row_count(conn, 'web_chat_sessions'),
+                'messages': self.estimate_row_count(conn, 'web_chat_messages'),
+                'responses': self.estimate_row_count(conn, 'web_chat_responses')
+            }
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT type, name, sql FROM sqlite_master
+                WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+            """)
+            schema = [tuple(row) for row in cursor.fetchall()]
+            auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+            # Fold the WAL into the main file so the archive is self-contained
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        temp_path = f"{self.db_path}.reset-{stamp}-{os.getpid()}"
+        self.build_empty_database(temp_path, schema, auto_vacuum)
+        
+        # Reconnect: pooled readers and cached state must not outlive the old file
+        close_pool(self.db_path)
+        buffer = self.get_activity_buffer()
+        if buffer is not None:
+            buffer.discard()
+        
+        archive_path = None
+        if archive:
+            base, ext = os.path.splitext(self.db_path)
+            archive_path = f"{base}-{stamp}{ext or '.db'}"
+            try:
+                os.link(self.db_path, archive_path)
+            except OSError:
+                import shutil
+                shutil.copy2(self.db_path, archive_path)
+        
+        os.replace(temp_path, self.db_path)
+        # The new file starts in rollback mode; stale sidecars belong to the old one
+        for suffix in ('-wal', '-shm'):
+            try:
+                os.remove(self.db_path + suffix)
+            except OSError:
+                pass
+        reset_session_directory(self.db_path)
+        reset_analytics_cache(self.db_path)
+        reset_storage_version(self.db_path)
+        self.clear_archive(keep=archive)
+        
+        # Rows vanished without delete events; tell change feed consumers
+        if self.ensure_change_feed():
+            conn = self.get_connection()
+            try:
+                record_event(conn, 'database', 'reset')
+            finally:
+                conn.close()
+        
+        return {
+            'mode': 'swap',
+            'cleaned_data': counts,
+            'estimated': True,
+            'archive_path': archive_path
+        }
+    
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """Get statistics for the in-process caches and buffers of this database"""
+        directory = self.get_session_directory()
+        buffer = self.get_activity_buffer()
+        read_pool_size = int(Config.READ_POOL_SIZE)
+        return {
+            'session_directory': directory.stats() if directory is not None else {'enabled': False},
+            'activity_buffer': buffer.stats() if buffer is not None else {'enabled': False},
+            'read_pool': get_read_pool(self.db_path, read_pool_size).stats() if read_pool_size > 0 else {'enabled': False},
+            'compression': get_body_codec().stats()
+        }
+    
+    def get_compression_stats(self) -> Dict[str, Any]:
+        """Stored size of message and response bodies, split by plain and compressed rows"""
+        conn = self.get_read_connection()
+        try:
+            stored = {}
+            for table, column in (('web_chat_messages', 'message'), ('web_chat_responses', 'response')):
+                row = conn.execute(f"""
+                    SELECT
+                        SUM(typeof({column}) = 'blob') AS compressed_rows,
+                        SUM(CASE WHEN typeof({column}) = 'blob' THEN length({column}) ELSE 0 END) AS compressed_bytes,
+                        SUM(typeof({column}) = 'text') AS plain_rows,
+                        SUM(CASE WHEN typeof({column}) = 'text' THEN length(CAST({column} AS BLOB)) ELSE 0 END) AS plain_bytes
+                    FROM {table}
+                """).fetchone()
+                stored[table] = {key: row[key] or 0 for key in row.keys()}
+            return stored
+        finally:
+            conn.close()
+    
+    def train_compression_dictionary(self, path: str, size: int = 16384, sample_limit: int = 2000) -> Dict[str, Any]:
+        """Build a dictionary from recent bodies and write it to path
+        
+        Point COMPRESSION_DICTIONARY_PATH at the file afterwards. Rows already
+        compressed with a previous dictionary can no longer be read once it
+        is replaced, so train once before enabling compression.
+        """
+        codec = get_body_codec()
+        conn = self.get_read_connection()
+        try:
+            samples = []
+            for table, column in (('web_chat_messages', 'message'), ('web_chat_responses', 'response')):
+                rows = conn.execute(
+                    f"SELECT {column} FROM {table} ORDER BY id DESC LIMIT ?", (int(sample_limit),)
+                ).fetchall()
+                samples.extend(codec.decode(row[0]) for row in rows)
+        finally:
+            conn.close()
+        
+        dictionary = build_dictionary(samples, size, Config.COMPRESSION_ALGORITHM or 'zlib')
+        with open(path, 'wb') as f:
+            f.write(dictionary)
+        reset_codecs()
+        return {'path': path, 'bytes': len(dictionary), 'samples': len(samples)}
+    
     def cleanup_expired_sessions(self) -> int:
         """Clean up expired sessions (alias for cleanup_inactive_sessions)"""
         return self.cleanup_inactive_sessions()
@@ -0,0 +1,98 @@
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.utils.archive import unified_source
+
+# Export name -> (table, columns, time column used by from/to)
+EXPORT_TABLES = {
+    'sessions': ('web_chat_sessions', 'id, uid, created_at, last_active, ip_address, metadata', 'created_at'),
+    'messages': ('web_chat_messages', 'id, session_id, message, timestamp, processed', 'timestamp'),
+    'responses': ('web_chat_responses', 'id, session_id, response, message_id, timestamp', 'timestamp')
+}
+
+# Body columns that may be stored compressed
+BODY_COLUMNS = {'message', 'response'}
+
+
+class ExportError(ValueError):
+    """Raised for invalid export parameters"""
+    pass
+
+
+def parse_tables(value: Optional[str]) -> List[str]:
+    """Export names from a comma separated list (all tables when empty)"""
+    if not value:
+        return list(EXPORT_TABLES)
+    tables = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in tables if name not in EXPORT_TABLES]
+    if unknown:
+        raise ExportError(f"Unknown tables: {', '.join(unknown)}")
+    return tables
+
+
+def normalize_timestamp(value: Optional[str]) -> Optional[str]:
+    """Accept ISO 8601 input for comparison with SQLite's 'YYYY-MM-DD HH:MM:SS' text"""
+    if not value:
+        return None
+    return value.replace('T', ' ').rstrip('Z')
+
+
+def iter_rows(conn, tables: Iterable[str], start: str = None, end: str = None, chunk_size: int = 1000,
+              decode=None, archived: bool = False) -> Iterator[Dict]:
+    """Yield export rows table by table, holding at most chunk_size rows in memory
+
+    Rows come from a single cursor per table read with fetchmany, so one
+    consistent snapshot is streamed without materialising the result set.
+    """
+    for name in tables:
+        table, columns, time_column = EXPORT_TABLES[name]
+        source = table if name == 'sessions' else unified_source(table, columns, archived)
+        where = []
+        params = []
+        if start:
+            where.append(f"{time_column} >= ?")
+            params.append(start)
+        if end:
+            where.append(f"{time_column} < ?")
+            params.append(end)
+        where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+        cursor = conn.execute(f"SELECT {columns} FROM {source} {where_clause} ORDER BY {time_column}, id", params)
+        keys = [description[0] for description in cursor.description]
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                record = {'table': name}
+                for key, value in zip(keys, row):
+                    if key in BODY_COLUMNS and decode is not None:
+                        value = decode(value)
+                    record[key] = value
+                yield record
+
+
+def ndjson(rows: Iterable[Dict]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON, batching small writes"""
+    buffer = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, ensure_ascii=False, default=str) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= 65536:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a byte stream incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
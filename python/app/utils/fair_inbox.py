@@ -0,0 +1,94 @@
+import threading
+from typing import List, Optional, Set, Tuple
+
+from app.utils.session_metadata import extract
+
+INBOX_MODES = ('fifo', 'fair')
+
+# Session metadata key giving a session more turns per round (1 to MAX_WEIGHT)
+WEIGHT_KEY = 'inbox_weight'
+MAX_WEIGHT = 10
+
+# Pending messages per session in time order; lets each session's queue
+# head be read without touching other sessions' backlogs. Queues are keyed
+# on session_id in both layouts: session_key is NULL for messages whose
+# session row does not exist, which would merge those sessions into one.
+FAIR_INDEXES = {
+    True: "CREATE INDEX IF NOT EXISTS idx_messages_pending_session_ts "
+          "ON web_chat_messages(processed, session_id, ts)",
+    False: "CREATE INDEX IF NOT EXISTS idx_messages_pending_session_timestamp "
+           "ON web_chat_messages(processed, session_id, timestamp)"
+}
+
+_ready: Set[Tuple[str, bool]] = set()
+_ready_lock = threading.Lock()
+
+
+def ensure_fair_index(conn, db_path: str, integer_keys: bool):
+    """Create the per-session pending index once per process"""
+    if (db_path, integer_keys) in _ready:
+        return
+    with _ready_lock:
+        conn.execute(FAIR_INDEXES[integer_keys])
+        conn.commit()
+        _ready.add((db_path, integer_keys))
+
+
+def reset_fair_index(db_path: str):
+    with _ready_lock:
+        for key in [key for key in _ready if key[0] == db_path]:
+            _ready.discard(key)
+
+
+def fair_query(integer_keys: bool, since: bool, partition: str = '') -> str:
+    """SQL for one inbox page scheduled round-robin across sessions
+
+    Each session contributes at most ``cap`` of its oldest pending
+    messages, read from its own slice of the pending index. Messages are
+    then handed out by round: every session's first message (oldest
+    first), then every session's second, and so on. A session with
+    metadata inbox_weight = w gets w messages per round. ``partition``
+    is an extra condition on session_id restricting the queues (a
+    consumer's share of the inbox). Rows carry their round as
+    ``inbox_round``, the key for merging pages from several shards.
+    Parameters: [since], [partition], [since], cap, limit, offset.
+    """
+    group = 'session_id'
+    order = 'ts' if integer_keys else 'timestamp'
+    since_clause = f" AND {order} > ?" if since else ''
+    partition_clause = f" AND {partition}" if partition else ''
+    weight = f"MAX(1, MIN({MAX_WEIGHT}, COALESCE(CAST({extract('s.metadata', WEIGHT_KEY)} AS INTEGER), 1)))"
+    return f"""
+        WITH queues AS (
+            SELECT DISTINCT {group} AS queue FROM web_chat_messages WHERE processed = 0{since_clause}{partition_clause}
+        ),
+        candidates AS (
+            SELECT m.id, m.session_id, m.message, m.timestamp, m.{order} AS sort_key, m.{group} AS queue,
+                   ROW_NUMBER() OVER (PARTITION BY m.{group} ORDER BY m.{order}, m.id) AS turn
+            FROM queues q JOIN web_chat_messages m ON m.id IN (
+                SELECT id FROM web_chat_messages
+                WHERE processed = 0 AND {group} IS q.queue{since_clause}
+                ORDER BY {order}, id LIMIT ?
+            )
+        )
+        SELECT c.id, c.session_id, c.message, c.timestamp, s.uid, (c.turn - 1) / {weight} AS inbox_round
+        FROM candidates c
+        LEFT JOIN web_chat_sessions s ON s.id = c.queue
+        ORDER BY (c.turn - 1) / {weight}, c.sort_key, c.id
+        LIMIT ? OFFSET ?
+    """
+
+
+def fair_params(since_value, cap: int, limit: int, offset: int, partition_params: List = None) -> List:
+    since_params = [since_value] if since_value is not None else []
+    params = since_params + list(partition_params or []) + since_params
+    # No session can place more than limit + offset messages on a page
+    effective_cap = limit + offset if cap <= 0 else min(cap, limit + offset)
+    return params + [effective_cap, limit, offset]
+
+
+def parse_mode(value: Optional[str], default: str) -> str:
+    mode = (value or default or 'fifo').lower()
+    if mode not in INBOX_MODES:
+        raise ValueError(f"mode must be one of {', '.join(INBOX_MODES)}")
+    return mode
@@ -0,0 +1,154 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set
+
+IDEMPOTENCY_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS idempotency_keys (
+        id INTEGER PRIMARY KEY,
+        scope TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        key TEXT NOT NULL,
+        result_id INTEGER NOT NULL,
+        response TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )""",
+    # A retry that races the original loses on this index instead of inserting twice
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_idempotency_keys ON idempotency_keys(scope, session_id, key)",
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)"
+]
+
+# Scope -> field of the response data that carries the created row's id
+ID_FIELDS = {
+    'messages': 'message_id',
+    'outbox': 'response_id'
+}
+
+MAX_KEY_LENGTH = 128
+
+_ready: Set[str] = set()
+_ready_lock = threading.Lock()
+
+# Last opportunistic purge of expired keys per database path (monotonic seconds)
+_last_purge: Dict[str, float] = {}
+_purge_lock = threading.Lock()
+
+
+class IdempotencyKeyError(ValueError):
+    """An Idempotency-Key header or client_msg_id that cannot be used"""
+    pass
+
+
+class DuplicateRequest(Exception):
+    """A write was already made under the same idempotency key"""
+
+    def __init__(self, response: Dict):
+        super().__init__('Duplicate request')
+        self.response = response
+
+
+def parse_key(header: Optional[str], body_value=None) -> Optional[str]:
+    """The idempotency key of a request, from the header or else the client_msg_id field"""
+    key = header if header is not None else body_value
+    if key is None:
+        return None
+    key = str(key).strip()
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise IdempotencyKeyError(f'Idempotency key must be at most {MAX_KEY_LENGTH} printable characters')
+    return key
+
+
+def ensure_idempotency_table(conn, db_path: str):
+    """Create the key table once per process"""
+    if db_path in _ready:
+        return
+    with _ready_lock:
+        if db_path in _ready:
+            return
+        for sql in IDEMPOTENCY_SCHEMA:
+            conn.execute(sql)
+        conn.commit()
+        _ready.add(db_path)
+
+
+def reset_idempotency(db_path: str):
+    with _ready_lock:
+        _ready.discard(db_path)
+
+
+def max_age(ttl: int):
+    """SQLite datetime modifier for keys still remembered; ttl <= 0 never expires"""
+    return f'-{int(ttl)} seconds' if ttl > 0 else None
+
+
+def remember(conn, scope: str, session_id: str, key: str, result_id: int, response: Dict):
+    """Record the result of a write; raises sqlite3.IntegrityError if the key was already used"""
+    conn.execute(
+        "INSERT INTO idempotency_keys (scope, session_id, key, result_id, response) VALUES (?, ?, ?, ?, ?)",
+        (scope, session_id, key, result_id, json.dumps(response))
+    )
+
+
+def recall(conn, scope: str, session_id: str, key: str, ttl: int = 0) -> Optional[Dict]:
+    """The original response data for a key younger than ttl seconds, with the id of the row it created"""
+    sql = "SELECT result_id, response FROM idempotency_keys WHERE scope = ? AND session_id = ? AND key = ?"
+    params = [scope, session_id, key]
+    if max_age(ttl):
+        sql += " AND created_at >= datetime('now', ?)"
+        params.append(max_age(ttl))
+    row = conn.execute(sql, params).fetchone()
+    if row is None:
+        return None
+    response = json.loads(row[1]) if row[1] else {}
+    response[ID_FIELDS[scope]] = row[0]
+    return response
+
+
+def forget(conn, scope: str, session_id: str, key: str, ttl: int):
+    """Drop a key once it has expired, so the key can be used again"""
+    if max_age(ttl):
+        conn.execute(
+            "DELETE FROM idempotency_keys WHERE scope = ? AND session_id = ? AND key = ? "
+            "AND created_at < datetime('now', ?)",
+            (scope, session_id, key, max_age(ttl))
+        )
+
+
+def purge_expired(conn, db_path: str, ttl: int, interval: float) -> int:
+    """Delete every expired key, at most once per interval seconds per database
+
+    The retention scheduler does the same when it runs; this keeps the
+    table bounded when it does not (RETENTION_INTERVAL defaults to 0).
+    """
+    if not max_age(ttl):
+        return 0
+    now = time.monotonic()
+    with _purge_lock:
+        last = _last_purge.get(db_path)
+        if last is not None and now - last < interval:
+            return 0
+        _last_purge[db_path] = now
+    return conn.execute("DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)",
+                        (max_age(ttl),)).rowcount
+
+
+def write_once(conn, scope: str, session_id: str, key: str, insert, response: Dict, ttl: int = 0) -> int:
+    """Run insert() (returning the new row id) and record it under key in one transaction
+
+    Raises DuplicateRequest with the original response when the key was
+    used less than ttl seconds ago; the duplicate insert is rolled back.
+    """
+    forget(conn, scope, session_id, key, ttl)
+    result_id = insert()
+    try:
+        remember(conn, scope, session_id, key, result_id, response)
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        original = recall(conn, scope, session_id, key, ttl)
+        if original is None:
+            raise
+        raise DuplicateRequest(original)
+    return result_id
@@ -0,0 +1,632 @@
+import bisect
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.utils.consumer_groups import Assignment, ensure_consumer_table, group_members, heartbeat, leave, owner
+from app.utils.fair_inbox import MAX_WEIGHT, WEIGHT_KEY
+from app.utils.idempotency import ID_FIELDS, DuplicateRequest
+from app.utils.storage import StorageBackend
+from config import Config
+
+# Tables kept in a private in-memory SQLite database, for the code that
+# works on them with SQL (rate limiting, consumer groups)
+AUX_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS rate_limits (
+        ip_address VARCHAR(45),
+        endpoint VARCHAR(50),
+        count INTEGER,
+        window_start TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_rate_limits_ip_endpoint ON rate_limits(ip_address, endpoint)"
+]
+
+_aux_ids = count(1)
+
+
+def utc_now(offset_seconds: float = 0) -> str:
+    """UTC time as SQLite's datetime('now') writes it"""
+    moment = datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def metadata_value(metadata: Optional[str], key: str) -> Optional[str]:
+    """A metadata key compared as text, like CAST(json_extract(...) AS TEXT)"""
+    try:
+        value = json.loads(metadata or '{}').get(key)
+    except (ValueError, AttributeError):
+        return None
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+class MemoryStorage(StorageBackend):
+    """Chat storage in process memory, persisted with snapshots and an append-only log
+
+    Sessions, messages and responses live in dicts; the inbox is an
+    insertion-ordered dict of pending ids plus a deque per session, and
+    session activity is a sorted (last_active, id) list. Every change is
+    applied through _apply(), which also appends it to the log, so
+    replaying the log after the last snapshot restores the state. A
+    background thread writes a snapshot (and truncates the log) and runs
+    the inactive-session cleanup every ``snapshot_interval`` seconds.
+    """
+
+    def __init__(self, db_path: str, persistence: bool = True, snapshot_interval: float = 0):
+        self.db_path = db_path
+        base, _ = os.path.splitext(db_path)
+        self.snapshot_path = f"{base}.snapshot.json"
+        self.log_path = f"{base}.aof"
+        self.persistence = persistence
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+        self._log = None
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_snapshot: Optional[Dict] = None
+        self._clear_state()
+        self._aux_uri = f"file:memory-storage-{next(_aux_ids)}?mode=memory&cache=shared"
+        # The shared in-memory database lives while a connection is open
+        self._aux_keeper = sqlite3.connect(self._aux_uri, uri=True, check_same_thread=False)
+        for sql in AUX_SCHEMA:
+            self._aux_keeper.execute(sql)
+        self._aux_keeper.commit()
+        if persistence:
+            self._load()
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+
+    def _clear_state(self):
+        self.sessions: Dict[str, Dict] = {}
+        self.activity: List[Tuple[str, str]] = []
+        self.messages: Dict[int, Dict] = {}
+        self.pending: Dict[int, None] = {}
+        self.pending_by_session: Dict[str, Deque[int]] = {}
+        self.session_messages: Dict[str, List[int]] = {}
+        self.responses: Dict[int, Dict] = {}
+        self.session_responses: Dict[str, List[int]] = {}
+        self.config: Dict[str, str] = {}
+        self.idempotency: Dict[Tuple[str, str, str], Dict] = {}
+        self.last_message_id = 0
+        self.last_response_id = 0
+
+    # Persistence
+
+    def _apply(self, op: str, args: Dict, replay: bool = False):
+        """Change the state; logged unless replaying the log"""
+        getattr(self, f'_op_{op}')(**args)
+        if not replay:
+            self._dirty = True
+            if self._log is not None:
+                self._log.write(json.dumps({'op': op, 'args': args}) + '\n')
+                self._log.flush()
+
+    def _op_session(self, session: Dict):
+        previous = self.sessions.get(session['id'])
+        if previous is not None:
+            self._unindex_activity(previous)
+        self.sessions[session['id']] = session
+        bisect.insort(self.activity, (session['last_active'], session['id']))
+
+    def _op_activity(self, session_id: str, last_active: str):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self._unindex_activity(session)
+            session['last_active'] = last_active
+            bisect.insort(self.activity, (last_active, session_id))
+
+    def _op_message(self, message: Dict):
+        self.messages[message['id']] = message
+        self.last_message_id = max(self.last_message_id, message['id'])
+        self.session_messages.setdefault(message['session_id'], []).append(message['id'])
+        if not message['processed']:
+            self.pending[message['id']] = None
+            self.pending_by_session.setdefault(message['session_id'], deque()).append(message['id'])
+
+    def _op_processed(self, message_ids: List[int]):
+        for message_id in message_ids:
+            message = self.messages.get(message_id)
+            if message is None or message['processed']:
+                continue
+            message['processed'] = 1
+            self.pending.pop(message_id, None)
+            queue = self.pending_by_session.get(message['session_id'])
+            if queue is not None:
+                # Acks are almost always of a queue's head
+                if queue and queue[0] == message_id:
+                    queue.popleft()
+                else:
+                    queue.remove(message_id)
+                if not queue:
+                    del self.pending_by_session[message['session_id']]
+
+    def _op_response(self, response: Dict):
+        self.responses[response['id']] = response
+        self.last_response_id = max(self.last_response_id, response['id'])
+        self.session_responses.setdefault(response['session_id'], []).append(response['id'])
+
+    def _op_idempotency(self, scope: str, session_id: str, key: str, result_id: int, response: Dict,
+                        created_at: str = None):
+        # Re-inserted, so the dict stays ordered oldest first
+        self.idempotency.pop((scope, session_id, key), None)
+        self.idempotency[(scope, session_id, key)] = {'result_id': result_id, 'response': response,
+                                                      'created_at': created_at or utc_now()}
+
+    def _op_expire_idempotency(self, cutoff: str):
+        while self.idempotency:
+            oldest = next(iter(self.idempotency))
+            if self.idempotency[oldest]['created_at'] >= cutoff:
+                break
+            del self.idempotency[oldest]
+
+    def _op_config(self, values: Dict[str, str]):
+        self.config.update(values)
+
+    def _op_delete_sessions(self, session_ids: List[str], cascade: bool = True):
+        for session_id in session_ids:
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                self._unindex_activity(session)
+            if not cascade:
+                continue
+            for message_id in self.session_messages.pop(session_id, []):
+                self.messages.pop(message_id, None)
+                self.pending.pop(message_id, None)
+            self.pending_by_session.pop(session_id, None)
+            for response_id in self.session_responses.pop(session_id, []):
+                self.responses.pop(response_id, None)
+
+    def _op_clear(self):
+        # Config and id counters survive, as with the SQLite reset
+        config, last_message_id, last_response_id = self.config, self.last_message_id, self.last_response_id
+        self._clear_state()
+        self.config, self.last_message_id, self.last_response_id = config, last_message_id, last_response_id
+
+    def _unindex_activity(self, session: Dict):
+        entry = (session['last_active'], session['id'])
+        index = bisect.bisect_left(self.activity, entry)
+        if index < len(self.activity) and self.activity[index] == entry:
+            del self.activity[index]
+
+    def _load(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            for session in state['sessions']:
+                self._op_session(session)
+            for message in state['messages']:
+                self._op_message(message)
+            for response in state['responses']:
+                self._op_response(response)
+            for entry in state['idempotency']:
+                self._op_idempotency(**entry)
+            self.config = state['config']
+            self.last_message_id = max(self.last_message_id, state['last_message_id'])
+            self.last_response_id = max(self.last_response_id, state['last_response_id'])
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A write cut short by a crash; nothing follows it
+                        break
+                    self._apply(entry['op'], entry['args'], replay=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Write the whole state to the snapshot file and start a new log"""
+        if not self.persistence:
+            return {'enabled': False}
+        started = time.perf_counter()
+        with self._lock:
+            state = {
+                'sessions': list(self.sessions.values()),
+                'messages': list(self.messages.values()),
+                'responses': list(self.responses.values()),
+                'idempotency': [
+                    dict(scope=scope, session_id=session_id, key=key, **entry)
+                    for (scope, session_id, key), entry in self.idempotency.items()
+                ],
+                'config': self.config,
+                'last_message_id': self.last_message_id,
+                'last_response_id': self.last_response_id
+            }
+            temp_path = f"{self.snapshot_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            self._log.close()
+            self._log = open(self.log_path, 'w', encoding='utf-8')
+            self._dirty = False
+            self.last_snapshot = {
+                'finished_at': datetime.now().isoformat(),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'bytes': os.path.getsize(self.snapshot_path)
+            }
+            return self.last_snapshot
+
+    def start(self):
+        if self.snapshot_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='memory-storage', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                if int(Config.RETENTION_SESSION_TTL) > 0:
+                    self._expire_sessions(int(Config.RETENTION_SESSION_TTL))
+                if self._dirty:
+                    self.snapshot()
+            except Exception:
+                # Retried on the next tick
+                pass
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        self._aux_keeper.close()
+
+    # Sessions
+
+    def session_exists(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def create_session(self, session_id: str, ip_address: str = None, user_agent: str = None) -> str:
+        with self._lock:
+            if session_id in self.sessions:
+                raise ValueError(f'Session {session_id} already exists')
+            now = utc_now()
+            uid = secrets.token_hex(8)
+            self._apply('session', {'session': {
+                'id': session_id, 'uid': uid, 'created_at': now, 'last_active': now,
+                'ip_address': ip_address, 'metadata': json.dumps({})
+            }})
+            return uid
+
+    def get_or_create_uid(self, session_id: str, ip_address: str = None) -> Dict[str, Any]:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                return {'uid': session['uid'], 'is_new': False}
+            return {'uid': self.create_session(session_id, ip_address), 'is_new': True}
+
+    def update_session_activity(self, session_id: str):
+        with self._lock:
+            if session_id in self.sessions:
+                self._apply('activity', {'session_id': session_id, 'last_active': utc_now()})
+
+    def flush_session_activity(self) -> int:
+        return 0
+
+    def _active_sessions(self, active: bool, metadata: Dict[str, str] = None):
+        """Sessions most recently active first"""
+        cutoff = utc_now(-24 * 3600)
+        for last_active, session_id in reversed(self.activity):
+            if active and last_active <= cutoff:
+                break
+            session = self.sessions[session_id]
+            if metadata and any(metadata_value(session['metadata'], key) != value for key, value in metadata.items()):
+                continue
+            yield session
+
+    def get_active_sessions(self, limit: int, offset: int, active: bool = True,
+                            metadata: Dict[str, str] = None) -> List[Dict]:
+        with self._lock:
+            sessions = []
+            for index, session in enumerate(self._active_sessions(True, metadata)):
+                if index < offset:
+                    continue
+                if len(sessions) >= limit:
+                    break
+                sessions.append(dict(
+                    session,
+                    message_count=len(self.session_messages.get(session['id'], ())),
+                    response_count=len(self.session_responses.get(session['id'], ()))
+                ))
+            return sessions
+
+    def get_session_count(self, active: bool = True, metadata: Dict[str, str] = None) -> int:
+        with self._lock:
+            if not active and not metadata:
+                return len(self.sessions)
+            return sum(1 for _ in self._active_sessions(active, metadata))
+
+    def cleanup_inactive_sessions(self) -> int:
+        return self._expire_sessions(int(Config.SESSION_TIMEOUT))
+
+    def _expire_sessions(self, ttl: int) -> int:
+        """Delete sessions idle longer than ttl seconds, their rows too with RETENTION_CASCADE"""
+        cascade = str(Config.RETENTION_CASCADE).lower() in ('1', 'true', 'yes')
+        with self._lock:
+            cutoff = utc_now(-ttl)
+            expired = [session_id for last_active, session_id
+                       in self.activity[:bisect.bisect_left(self.activity, (cutoff, ''))]]
+            if expired:
+                self._apply('delete_sessions', {'session_ids': expired, 'cascade': cascade})
+            return len(expired)
+
+    # Messages and responses
+
+    def _remember(self, scope: str, session_id: str, key: str) -> None:
+        ttl = int(Config.IDEMPOTENCY_TTL)
+        if ttl > 0 and self.idempotency:
+            cutoff = utc_now(-ttl)
+            if self.idempotency[next(iter(self.idempotency))]['created_at'] < cutoff:
+                self._apply('expire_idempotency', {'cutoff': cutoff})
+        original = self.find_idempotent_response(scope, session_id, key)
+        if original is not None:
+            raise DuplicateRequest(original)
+
+    def create_message(self, session_id: str, message: str, message_type: str = 'user',
+                       idempotency_key: str = None, response: Dict = None) -> int:
+        with self._lock:
+            if idempotency_key:
+                self._remember('messages', session_id, idempotency_key)
+            message_id = self.last_message_id + 1
+            self._apply('message', {'message': {
+                'id': message_id, 'session_id': session_id, 'message': message,
+                'timestamp': utc_now(), 'processed': 0
+            }})
+            if idempotency_key:
+                self._apply('idempotency', {'scope': 'messages', 'session_id': session_id, 'key': idempotency_key,
+                                            'result_id': message_id, 'response': response or {},
+                                            'created_at': utc_now()})
+            return message_id
+
+    def create_response(self, session_id: str, response: str, message_id: int = None,
+                        idempotency_key: str = None, result: Dict = None) -> int:
+        with self._lock:
+            if idempotency_key:
+                self._remember('outbox', session_id, idempotency_key)
+            response_id = self.last_response_id + 1
+            self._apply('response', {'response': {
+                'id': response_id, 'session_id': session_id, 'response': response,
+                'timestamp': utc_now(), 'message_id': message_id
+            }})
+            if idempotency_key:
+                self._apply('idempotency', {'scope': 'outbox', 'session_id': session_id, 'key': idempotency_key,
+                                            'result_id': response_id, 'response': result or {},
+                                            'created_at': utc_now()})
+            return response_id
+
+    def find_idempotent_response(self, scope: str, session_id: str, key: str) -> Optional[Dict]:
+        entry = self.idempotency.get((scope, session_id, key))
+        ttl = int(Config.IDEMPOTENCY_TTL)
+        if entry is None or (ttl > 0 and entry['created_at'] < utc_now(-ttl)):
+            return None
+        return dict(entry['response'], **{ID_FIELDS[scope]: entry['result_id']})
+
+    def _inbox_row(self, message_id: int) -> Dict:
+        message = self.messages[message_id]
+        session = self.sessions.get(message['session_id'])
+        return {
+            'id': message_id,
+            'session_id': message['session_id'],
+            'message': message['message'],
+            'timestamp': message['timestamp'],
+            'uid': session['uid'] if session else None
+        }
+
+    def _pending(self, since: str = None, assignment: Assignment = None):
+        for message_id in self.pending:
+            message = self.messages[message_id]
+            if since and message['timestamp'] <= since:
+                continue
+            if assignment and owner(message['session_id'], assignment.consumers) != assignment.consumer:
+                continue
+            yield message_id
+
+    def get_unprocessed_messages(self, limit: int, offset: int, since: str = None,
+                                 mode: str = 'fifo', per_session: int = 0,
+                                 assignment: Assignment = None) -> List[Dict]:
+        with self._lock:
+            if mode == 'fair':
+                return self._fair_messages(limit, offset, since, int(per_session or 0), assignment)
+            page = []
+            for index, message_id in enumerate(self._pending(since, assignment)):
+                if index < offset:
+                    continue
+                if len(page) >= limit:
+                    break
+                page.append(self._inbox_row(message_id))
+            return page
+
+    def _fair_messages(self, limit: int, offset: int, since: str, per_session: int,
+                       assignment: Assignment = None) -> List[Dict]:
+        """Round-robin across session queues, as fair_inbox.fair_query orders it"""
+        cap = limit + offset if per_session <= 0 else min(per_session, limit + offset)
+        candidates = []
+        for session_id, queue in self.pending_by_session.items():
+            if assignment and owner(session_id, assignment.consumers) != assignment.consumer:
+                continue
+            session = self.sessions.get(session_id)
+            try:
+                weight = int(metadata_value(session['metadata'], WEIGHT_KEY) or 1) if session else 1
+            except ValueError:
+                weight = 1
+            weight = max(1, min(MAX_WEIGHT, weight))
+            turn = 0
+            for message_id in queue:
+                message = self.messages[message_id]
+                if since and message['timestamp'] <= since:
+                    continue
+                candidates.append((turn // weight, message['timestamp'], message_id))
+                turn += 1
+                if turn >= cap:
+                    break
+        candidates.sort()
+        return [self._inbox_row(message_id) for _, _, message_id in candidates[offset:offset + limit]]
+
+    def get_unprocessed_message_count(self, since: str = None, assignment: Assignment = None) -> int:
+        with self._lock:
+            if not since and not assignment:
+                return len(self.pending)
+            return sum(1 for _ in self._pending(since, assignment))
+
+    def mark_messages_processed(self, message_ids: List[int]):
+        if not message_ids:
+            return
+        with self._lock:
+            self._apply('processed', {'message_ids': [int(message_id) for message_id in message_ids]})
+
+    def get_session_responses(self, session_id: str, since: str = None) -> List[Dict]:
+        with self._lock:
+            ids = self.session_responses.get(session_id, [])
+            if since:
+                # Appended in time order, so the timestamps are sorted
+                ids = ids[bisect.bisect_right(ids, since, key=lambda i: self.responses[i]['timestamp']):]
+            return [
+                {key: self.responses[response_id][key] for key in ('id', 'response', 'timestamp', 'message_id')}
+                for response_id in ids
+            ]
+
+    def get_session_messages(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            messages = [
+                {key: self.messages[message_id][key] for key in ('id', 'session_id', 'message', 'timestamp')}
+                for message_id in self.session_messages.get(session_id, [])
+            ]
+            return {'session': dict(session), 'messages': messages, 'responses': self.get_session_responses(session_id)}
+
+    # Configuration
+
+    def get_all_config(self) -> Dict[str, str]:
+        return dict(self.config)
+
+    def get_config(self, config_key: str) -> Optional[str]:
+        return self.config.get(config_key)
+
+    def update_config(self, config_data: Dict[str, str]):
+        with self._lock:
+            self._apply('config', {'values': {key: str(value) for key, value in config_data.items()}})
+
+    # Whole-store operations
+
+    def clear_all_data(self) -> Dict[str, int]:
+        with self._lock:
+            cleared = {
+                'sessions': len(self.sessions),
+                'messages': len(self.messages),
+                'responses': len(self.responses)
+            }
+            self._apply('clear', {})
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM rate_limits")
+            conn.commit()
+        finally:
+            conn.close()
+        return cleared
+
+    def reset_database(self, archive: bool = False) -> Dict[str, Any]:
+        archive_path = None
+        if archive and self.persistence:
+            self.snapshot()
+            archive_path = f"{self.snapshot_path}.{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            os.link(self.snapshot_path, archive_path)
+        return {
+            'mode': 'swap',
+            'cleaned_data': self.clear_all_data(),
+            'estimated': False,
+            'archive_path': archive_path
+        }
+
+    def get_connection(self):
+        conn = sqlite3.connect(self._aux_uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def join_consumer_group(self, group: str, consumer: str) -> Assignment:
+        conn = self.get_connection()
+        try:
+            ensure_consumer_table(conn, self._aux_uri)
+            members = heartbeat(conn, group, consumer, float(Config.CONSUMER_TTL))
+            return Assignment(group, consumer, members)
+        finally:
+            conn.close()
+
+    def leave_consumer_group(self, group: str, consumer: str) -> bool:
+        conn = self.get_connection()
+        try:
+            ensure_consumer_table(conn, self._aux_uri)
+            return leave(conn, group, consumer)
+        finally:
+            conn.close()
+
+    def get_consumer_groups(self) -> Dict[str, List[Dict]]:
+        conn = self.get_connection()
+        try:
+            ensure_consumer_table(conn, self._aux_uri)
+            return group_members(conn, float(Config.CONSUMER_TTL))
+        finally:
+            conn.close()
+
+    def get_changes(self, after_seq: int = 0, limit: int = 100,
+                    entities: List[str] = None) -> Optional[Dict[str, Any]]:
+        return None
+
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self.sessions),
+                'messages': len(self.messages),
+                'pending_messages': len(self.pending),
+                'responses': len(self.responses),
+                'persistence': {
+                    'enabled': self.persistence,
+                    'snapshot_interval': self.snapshot_interval,
+                    'log_bytes': os.path.getsize(self.log_path) if self._log is not None else 0,
+                    'last_snapshot': self.last_snapshot
+                }
+            }
+
+
+_stores: Dict[str, MemoryStorage] = {}
+_stores_lock = threading.Lock()
+
+
+def get_memory_storage(db_path: str) -> MemoryStorage:
+    """The process-wide in-memory store for a database path, loaded from disk on first use"""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = MemoryStorage(
+                db_path,
+                str(Config.MEMORY_PERSISTENCE).lower() in ('1', 'true', 'yes'),
+                float(Config.MEMORY_SNAPSHOT_INTERVAL)
+            )
+            store.start()
+            _stores[db_path] = store
+        return store
+
+
+def close_memory_storage(db_path: str):
+    with _stores_lock:
+        store = _stores.pop(db_path, None)
+    if store is not None:
+        store.close()
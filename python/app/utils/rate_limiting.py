@@ -1,11 +1,34 @@
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional
+from config import Config
+from app.utils.rollups import request_counter
+
+# Last opportunistic purge per database path (monotonic seconds)
+_last_purge = {}
+_purge_lock = threading.Lock()
 
 class RateLimitManager:
     def __init__(self, db_manager):
         self.db_manager = db_manager
     
+    def should_purge(self) -> bool:
+        """Throttle expired-entry purges on the request path
+        
+        The retention scheduler does the bulk of the work; this only keeps
+        the table bounded when the scheduler is not running.
+        """
+        interval = float(Config.RATE_LIMIT_PURGE_INTERVAL)
+        now = time.monotonic()
+        with _purge_lock:
+            last = _last_purge.get(self.db_manager.db_path)
+            if last is not None and now - last < interval:
+                return False
+            _last_purge[self.db_manager.db_path] = now
+            return True
+    
     def check_rate_limit(self, ip_address: str, endpoint: str, limit: int) -> bool:
         """Check if request is within rate limit - IDENTICAL to PHP"""
         conn = self.db_manager.get_connection()
@@ -16,11 +39,12 @@ class RateLimitManager:
             window_start = datetime.now() - timedelta(hours=1)
             window_start_str = window_start.strftime('%Y-%m-%d %H:%M:%S')
             
-            # Clean up old rate limit entries - IDENTICAL to PHP
-            cursor.execute("""
-                DELETE FROM rate_limits 
-                WHERE window_start < ?
-            """, (window_start_str,))
+            # Clean up old rate limit entries - IDENTICAL to PHP (throttled)
+            if self.should_purge():
+                cursor.execute("""
+                    DELETE FROM rate_limits 
+                    WHERE window_start < ?
+                """, (window_start_str,))
             
             # Check current rate limit for this IP + endpoint - IDENTICAL to PHP
             cursor.execute("""
@@ -32,6 +56,7 @@ class RateLimitManager:
             current_count = result['count'] if result else 0
             
             if current_count >= limit:
+                request_counter.record(self.db_manager.db_path, endpoint, allowed=False)
                 return False  # Rate limit exceeded
             
             # Update or insert rate limit entry - IDENTICAL to PHP
@@ -48,6 +73,7 @@ class RateLimitManager:
                 """, (ip_address, endpoint, window_start_str))
             
             conn.commit()
+            request_counter.record(self.db_manager.db_path, endpoint)
             return True  # Within rate limit
             
         finally:
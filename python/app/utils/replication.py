@@ -0,0 +1,306 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from app.utils.change_feed import BODY_COLUMNS, CHANGE_SOURCES, DATABASE_ENTITY, change_log_exists, last_seq
+
+REPLICATION_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS replication_state (
+        source TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL,
+        updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )"""
+]
+
+# API actions that write on the primary; on a replica they are forwarded.
+# 'config' is only a write for POST.
+WRITE_ACTIONS = ('messages', 'inbox', 'outbox', 'cleanup', 'clear_data', 'cleanup_logs', 'activity')
+
+# Request headers passed through when forwarding to the primary
+FORWARDED_HEADERS = ('Authorization', 'Content-Type', 'Idempotency-Key', 'User-Agent')
+
+# Response headers passed back from the primary
+RETURNED_HEADERS = ('Content-Type', 'Idempotent-Replayed')
+
+# Lets the primary take the client address from X-Forwarded-For
+REPLICATION_KEY_HEADER = 'X-Replication-Key'
+
+
+class ReplicationError(Exception):
+    """The replica cannot continue from its position in the primary's change log"""
+    pass
+
+
+def is_write(action: str, method: str) -> bool:
+    return action in WRITE_ACTIONS or (action == 'config' and method == 'POST')
+
+
+def ensure_replication_state(conn):
+    for sql in REPLICATION_SCHEMA:
+        conn.execute(sql)
+    conn.commit()
+
+
+def get_position(conn, source: str) -> int:
+    """Last primary seq applied from a source
+
+    Without a recorded position the local change log's head is used: a
+    replica seeded from a copy of the primary's file resumes where the
+    copy was taken, and an empty one starts from the beginning.
+    """
+    row = conn.execute("SELECT last_seq FROM replication_state WHERE source = ?", (source,)).fetchone()
+    if row:
+        return row[0]
+    return last_seq(conn) if change_log_exists(conn) else 0
+
+
+def apply_changes(conn, source: str, changes: List[Dict], encode: Optional[Callable] = None) -> Dict:
+    """Apply change feed events in order and advance the position, in one transaction
+
+    Inserts and updates upsert the row state carried by the event; events
+    whose row is already gone on the primary are skipped (their delete
+    follows). Returns counts and the sessions deleted, for cache eviction.
+    """
+    applied = skipped = 0
+    deleted_sessions: Set[str] = set()
+    reset = False
+    try:
+        for change in changes:
+            entity, op, row = change['entity'], change['op'], change.get('row')
+            if entity == DATABASE_ENTITY:
+                if op == 'reset':
+                    for table, _, _ in CHANGE_SOURCES.values():
+                        conn.execute(f"DELETE FROM {table}")
+                    reset = True
+                    applied += 1
+                continue
+            table, key, columns = CHANGE_SOURCES[entity]
+            if op == 'delete':
+                conn.execute(f"DELETE FROM {table} WHERE {key} = ?", (change['entity_id'],))
+                if entity == 'session':
+                    deleted_sessions.add(change['entity_id'])
+            elif row is None:
+                skipped += 1
+                continue
+            else:
+                values = dict(row)
+                if encode and entity in BODY_COLUMNS:
+                    values[BODY_COLUMNS[entity]] = encode(values[BODY_COLUMNS[entity]])
+                updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != key)
+                conn.execute(f"""
+                    INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+                    ON CONFLICT({key}) DO UPDATE SET {updates}
+                """, [values.get(column) for column in columns])
+            applied += 1
+        if changes:
+            conn.execute("""
+                INSERT INTO replication_state (source, last_seq, updated_at) VALUES (?, ?, datetime('now'))
+                ON CONFLICT(source) DO UPDATE SET last_seq = excluded.last_seq, updated_at = excluded.updated_at
+            """, (source, changes[-1]['seq']))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {
+        'applied': applied,
+        'skipped': skipped,
+        'deleted_sessions': sorted(deleted_sessions),
+        'reset': reset
+    }
+
+
+def forward_request(primary_url: str, method: str, path: str, query_string: bytes, body: bytes,
+                    headers: Dict[str, str], timeout: float, http=None):
+    """Send a request on to the primary and return (body, status, headers) for Flask"""
+    if http is None:
+        import requests
+        http = requests
+    url = primary_url.rstrip('/') + path
+    if query_string:
+        url += '?' + (query_string.decode('latin1') if isinstance(query_string, bytes) else query_string)
+    response = http.request(method, url, data=body, headers=headers, timeout=timeout)
+    returned = {name: response.headers[name] for name in RETURNED_HEADERS if name in response.headers}
+    return response.content, response.status_code, returned
+
+
+class ReplicaFollower:
+    """Tails the primary's change feed into the local database on a background thread
+
+    Session activity seen by this node (widget polls served locally) is
+    collected with touch() and sent to the primary once per cycle, the
+    same coalescing the local activity buffer does.
+    """
+
+    def __init__(self, db_path: str, primary_url: str, api_key: str, interval: float = 1.0,
+                 batch_size: int = 500, timeout: float = 10, http=None):
+        self.db_path = db_path
+        self.primary_url = primary_url.rstrip('/')
+        self.api_key = api_key
+        self.interval = interval
+        self.batch_size = max(int(batch_size), 1)
+        self.timeout = timeout
+        self.http = http
+        self._touched: Set[str] = set()
+        self._touched_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_sync: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+        self.position = 0
+
+    def _http(self):
+        if self.http is None:
+            import requests
+            self.http = requests.Session()
+        return self.http
+
+    def _headers(self) -> Dict[str, str]:
+        return {'Authorization': f'Bearer {self.api_key}'}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='replica-follower', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def touch(self, session_id: str):
+        """Record session activity to report to the primary"""
+        with self._touched_lock:
+            self._touched.add(session_id)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+            except Exception:
+                # Recorded in last_error; retry on the next tick
+                pass
+            self._stop.wait(self.interval)
+
+    def sync_once(self) -> Dict:
+        """Forward pending activity, then apply changes until caught up"""
+        # Imported here: the database module imports the change feed
+        from app.utils.database import DatabaseManager, get_body_codec
+
+        with self._sync_lock:
+            started = time.perf_counter()
+            try:
+                self._send_activity()
+                db = DatabaseManager(self.db_path)
+                applied = skipped = pages = 0
+                conn = db.get_connection()
+                try:
+                    ensure_replication_state(conn)
+                    self.position = get_position(conn, self.primary_url)
+                    while True:
+                        page = self._fetch(self.position)
+                        changes = page['changes']
+                        # Retention purged events this replica never saw; a reset needs nothing before it
+                        if changes and changes[0]['seq'] > self.position + 1 \
+                                and changes[0]['entity'] != DATABASE_ENTITY:
+                            raise ReplicationError(
+                                f"Primary change log starts at {changes[0]['seq']}, after replica position "
+                                f"{self.position}; seed the replica from a copy of the primary"
+                            )
+                        result = apply_changes(conn, self.primary_url, changes, get_body_codec().encode)
+                        pages += 1
+                        applied += result['applied']
+                        skipped += result['skipped']
+                        if result['reset']:
+                            db.invalidate_session_directory(full=True)
+                        elif result['deleted_sessions']:
+                            db.invalidate_session_directory(result['deleted_sessions'])
+                        if changes:
+                            self.position = changes[-1]['seq']
+                        if not page['has_more']:
+                            break
+                finally:
+                    conn.close()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.last_sync = {
+                'finished_at': datetime.now().isoformat(),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'pages': pages,
+                'applied': applied,
+                'skipped': skipped,
+                'position': self.position
+            }
+            return self.last_sync
+
+    def _fetch(self, after_seq: int) -> Dict:
+        response = self._http().get(
+            f"{self.primary_url}/api/v1/",
+            params={'action': 'changes', 'after_seq': after_seq, 'limit': self.batch_size},
+            headers=self._headers(),
+            timeout=self.timeout
+        )
+        body = response.json()
+        if response.status_code != 200 or not body.get('success'):
+            raise ReplicationError(f"Change feed request failed ({response.status_code}): {body.get('error')}")
+        return body['data']
+
+    def _send_activity(self):
+        with self._touched_lock:
+            touched, self._touched = self._touched, set()
+        if not touched:
+            return
+        try:
+            response = self._http().post(
+                f"{self.primary_url}/api/v1/",
+                params={'action': 'activity'},
+                json={'session_ids': sorted(touched)},
+                headers=self._headers(),
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                raise ReplicationError(f"Activity forwarding failed ({response.status_code})")
+        except Exception:
+            self._requeue(touched)
+            raise
+
+    def _requeue(self, session_ids: Iterable[str]):
+        with self._touched_lock:
+            self._touched.update(session_ids)
+
+    def status(self) -> Dict:
+        with self._touched_lock:
+            pending = len(self._touched)
+        return {
+            'primary': self.primary_url,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'position': self.position,
+            'pending_activity': pending,
+            'last_sync': self.last_sync,
+            'last_error': self.last_error
+        }
+
+
+_followers: Dict[str, ReplicaFollower] = {}
+_followers_lock = threading.Lock()
+
+
+def get_follower(db_path: str) -> Optional[ReplicaFollower]:
+    with _followers_lock:
+        return _followers.get(db_path)
+
+
+def start_follower(db_path: str, primary_url: str, api_key: str, interval: float = 1.0,
+                   batch_size: int = 500, timeout: float = 10) -> ReplicaFollower:
+    """Start the process-wide follower for a database"""
+    with _followers_lock:
+        follower = _followers.get(db_path)
+        if follower is None:
+            follower = ReplicaFollower(db_path, primary_url, api_key, interval, batch_size, timeout)
+            _followers[db_path] = follower
+    follower.start()
+    return follower
@@ -0,0 +1,320 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class RetentionPolicy:
+    """A TTL rule for one table.
+
+    ``where`` selects expired rows and may use ``?`` placeholders filled
+    from ``params``. Session policies with ``cascade`` also delete the
+    sessions' messages and responses in the same transaction as each batch.
+    """
+
+    def __init__(self, name: str, table: str, where: str, params: Sequence = (), cascade: bool = False):
+        self.name = name
+        self.table = table
+        self.where = where
+        self.params = tuple(params)
+        self.cascade = cascade
+
+    def describe(self) -> Dict:
+        return {'name': self.name, 'table': self.table, 'cascade': self.cascade}
+
+
+def build_policies(session_ttl: int, message_ttl: int = 0, response_ttl: int = 0,
+                   rate_limit_ttl: int = 3600, idempotency_ttl: int = 0,
+                   change_log_ttl: int = 0, cascade: bool = False) -> List[RetentionPolicy]:
+    """Build the standard retention policies from TTLs in seconds (0 keeps rows forever)
+
+    Without ``cascade`` deleting a session keeps its messages and
+    responses, as the PHP bridge does; with it they are deleted too, along
+    with any left behind by sessions deleted earlier.
+    """
+    policies = []
+    if session_ttl > 0:
+        policies.append(RetentionPolicy(
+            'inactive_sessions', 'web_chat_sessions',
+            "last_active < datetime('now', ?)", (f'-{int(session_ttl)} seconds',), cascade=cascade
+        ))
+    if cascade:
+        # Children of sessions deleted without cascading (or by the PHP bridge)
+        policies.append(RetentionPolicy(
+            'orphaned_messages', 'web_chat_messages',
+            "NOT EXISTS (SELECT 1 FROM web_chat_sessions s WHERE s.id = web_chat_messages.session_id)"
+        ))
+        policies.append(RetentionPolicy(
+            'orphaned_responses', 'web_chat_responses',
+            "NOT EXISTS (SELECT 1 FROM web_chat_sessions s WHERE s.id = web_chat_responses.session_id)"
+        ))
+    if message_ttl > 0:
+        policies.append(RetentionPolicy(
+            'processed_messages', 'web_chat_messages',
+            "processed = 1 AND timestamp < datetime('now', ?)", (f'-{int(message_ttl)} seconds',)
+        ))
+    if response_ttl > 0:
+        policies.append(RetentionPolicy(
+            'old_responses', 'web_chat_responses',
+            "timestamp < datetime('now', ?)", (f'-{int(response_ttl)} seconds',)
+        ))
+    if rate_limit_ttl > 0:
+        # rate_limits.window_start is written in local time by RateLimitManager
+        cutoff = (datetime.now() - timedelta(seconds=int(rate_limit_ttl))).strftime('%Y-%m-%d %H:%M:%S')
+        policies.append(RetentionPolicy(
+            'expired_rate_limits', 'rate_limits', "window_start < ?", (cutoff,)
+        ))
+    if idempotency_ttl > 0:
+        policies.append(RetentionPolicy(
+            'expired_idempotency_keys', 'idempotency_keys',
+            "created_at < datetime('now', ?)", (f'-{int(idempotency_ttl)} seconds',)
+        ))
+    if change_log_ttl > 0:
+        # change_log.created_at is epoch milliseconds
+        cutoff = int((time.time() - int(change_log_ttl)) * 1000)
+        policies.append(RetentionPolicy(
+            'expired_change_log', 'change_log', "created_at < ?", (cutoff,)
+        ))
+    return policies
+
+
+class RetentionManager:
+    """Deletes expired rows in small batches so writers are never stalled for long"""
+
+    def __init__(self, db_manager, batch_size: int = 500, pause: float = 0.05):
+        self.db_manager = db_manager
+        self.batch_size = max(int(batch_size), 1)
+        self.pause = pause
+
+    def purge(self, policy: RetentionPolicy, progress: Callable[[int], None] = None) -> Dict:
+        """Apply one policy batch by batch, yielding between transactions"""
+        started = time.perf_counter()
+        deleted = 0
+        batches = 0
+        while True:
+            if policy.table == 'web_chat_sessions':
+                count = self._delete_session_batch(policy)
+            else:
+                count = self._delete_batch(policy)
+            if count == 0:
+                break
+            deleted += count
+            batches += 1
+            if progress:
+                progress(deleted)
+            if count < self.batch_size:
+                break
+            if self.pause:
+                time.sleep(self.pause)
+        return {
+            'policy': policy.name,
+            'table': policy.table,
+            'deleted': deleted,
+            'batches': batches,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def _delete_batch(self, policy: RetentionPolicy) -> int:
+        conn = self.db_manager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                DELETE FROM {policy.table}
+                WHERE rowid IN (
+                    SELECT rowid FROM {policy.table} WHERE {policy.where} LIMIT ?
+                )
+            """, policy.params + (self.batch_size,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def _delete_session_batch(self, policy: RetentionPolicy) -> int:
+        conn = self.db_manager.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT id FROM {policy.table} WHERE {policy.where} LIMIT ?",
+                policy.params + (self.batch_size,)
+            )
+            session_ids = [row[0] for row in cursor.fetchall()]
+            if not session_ids:
+                return 0
+
+            placeholders = ','.join('?' for _ in session_ids)
+            if policy.cascade:
+                cursor.execute(f"DELETE FROM web_chat_responses WHERE session_id IN ({placeholders})", session_ids)
+                cursor.execute(f"DELETE FROM web_chat_messages WHERE session_id IN ({placeholders})", session_ids)
+            cursor.execute(f"DELETE FROM web_chat_sessions WHERE id IN ({placeholders})", session_ids)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.db_manager.invalidate_session_directory(session_ids)
+        return len(session_ids)
+
+    def incremental_vacuum(self, pages: int = 1000) -> Dict:
+        """Return free pages to the filesystem when auto_vacuum is INCREMENTAL"""
+        conn = self.db_manager.get_connection()
+        try:
+            cursor = conn.cursor()
+            auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+            freelist_before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            if auto_vacuum != 2:
+                return {'auto_vacuum': auto_vacuum, 'freelist_pages': freelist_before, 'pages_freed': 0}
+            cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            conn.commit()
+            freelist_after = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            return {
+                'auto_vacuum': auto_vacuum,
+                'freelist_pages': freelist_after,
+                'pages_freed': freelist_before - freelist_after
+            }
+        finally:
+            conn.close()
+
+
+class RetentionScheduler:
+    """Runs the retention policies for one database on a background thread"""
+
+    def __init__(self, db_path: str, interval: float = 300):
+        self.db_path = db_path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running = False
+        self.current_policy: Optional[str] = None
+        self.current_deleted = 0
+        self.last_run: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+
+    def start(self):
+        """Start periodic runs"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='retention-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self, wait: bool = False) -> bool:
+        """Request a run now; returns False if one is already in progress"""
+        if self.running:
+            return False
+        if wait:
+            self.run_once()
+            return True
+        if self._thread is not None and self._thread.is_alive():
+            self._wake.set()
+        else:
+            threading.Thread(target=self.run_once, name='retention-run', daemon=True).start()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
+
+    def run_once(self) -> Optional[Dict]:
+        """Update rollups, apply every policy, move old rows to the archive and run an incremental vacuum"""
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+            self.current_deleted = 0
+
+        # Imported here: the database module imports this one
+        from config import Config
+        from app.utils.database import DatabaseManager
+
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        results = []
+        rollup = archive = None
+        try:
+            db = DatabaseManager(self.db_path)
+            db.flush_session_activity()
+            # Rollups must see rows before the policies below delete them
+            self.current_policy = 'rollup'
+            rollup = db.run_rollups()
+            manager = RetentionManager(db, int(Config.RETENTION_BATCH_SIZE), float(Config.RETENTION_BATCH_PAUSE))
+            for policy in db.get_retention_policies():
+                self.current_policy = policy.name
+                self.current_deleted = 0
+                results.append(manager.purge(policy, self._progress))
+            # A replica's rows move to the archive when the primary's do
+            # (the move reaches it as deletes)
+            if not Config.REPLICA_OF:
+                self.current_policy = 'archive'
+                archive = db.run_archive()
+            self.current_policy = 'incremental_vacuum'
+            vacuum = manager.incremental_vacuum(int(Config.RETENTION_VACUUM_PAGES))
+            self.last_error = None
+        except Exception as e:
+            vacuum = None
+            self.last_error = str(e)
+        finally:
+            self.current_policy = None
+            self.running = False
+
+        self.runs += 1
+        self.last_run = {
+            'started_at': started_at,
+            'finished_at': datetime.now().isoformat(),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            'deleted': sum(result['deleted'] for result in results),
+            'policies': results,
+            'rollup': rollup,
+            'archive': archive,
+            'vacuum': vacuum,
+            'error': self.last_error
+        }
+        return self.last_run
+
+    def _progress(self, deleted: int):
+        self.current_deleted = deleted
+
+    def status(self) -> Dict:
+        return {
+            'scheduled': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'running': self.running,
+            'progress': {
+                'policy': self.current_policy,
+                'deleted': self.current_deleted
+            } if self.running else None,
+            'runs': self.runs,
+            'last_run': self.last_run
+        }
+
+
+_schedulers: Dict[str, RetentionScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_retention_scheduler(db_path: str, interval: float = 300) -> RetentionScheduler:
+    """Get the process-wide retention scheduler for a database (not started)"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(db_path)
+        if scheduler is None:
+            scheduler = RetentionScheduler(db_path, interval)
+            _schedulers[db_path] = scheduler
+        return scheduler
+
+
+def start_retention_scheduler(db_path: str, interval: float) -> RetentionScheduler:
+    """Start periodic retention runs for a database"""
+    scheduler = get_retention_scheduler(db_path, interval)
+    scheduler.interval = interval
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+ROLLUP_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS stats_hourly (
+        hour TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        value INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, metric)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS stats_watermarks (
+        name TEXT PRIMARY KEY,
+        position NOT NULL
+    )"""
+]
+
+# Hour buckets use the same UTC text format as the timestamps they count
+HOUR_FORMAT = '%Y-%m-%d %H:00:00'
+
+# Metrics rolled up from AUTOINCREMENT tables, tracked by last processed id
+ID_SOURCES = {
+    'messages': ('web_chat_messages', 'timestamp'),
+    'responses': ('web_chat_responses', 'timestamp')
+}
+
+# Sessions are keyed by text, so they are counted as they are inserted
+SESSION_TRIGGER_NAME = 'web_chat_sessions_rollup'
+SESSION_TRIGGER = f"""CREATE TRIGGER IF NOT EXISTS {SESSION_TRIGGER_NAME} AFTER INSERT ON web_chat_sessions BEGIN
+    INSERT INTO stats_hourly (hour, metric, value)
+    VALUES (strftime('{HOUR_FORMAT}', COALESCE(new.created_at, CURRENT_TIMESTAMP)), 'sessions', 1)
+    ON CONFLICT (hour, metric) DO UPDATE SET value = value + 1;
+END"""
+
+UPSERT = """
+    INSERT INTO stats_hourly (hour, metric, value) {source}
+    ON CONFLICT (hour, metric) DO UPDATE SET value = value + excluded.value
+"""
+
+
+def current_hour() -> str:
+    return datetime.now(timezone.utc).strftime(HOUR_FORMAT)
+
+
+class RequestCounter:
+    """Per-process request counts per endpoint, flushed into stats_hourly by each rollup run"""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[Tuple[str, str], int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, db_path: str, endpoint: str, allowed: bool = True):
+        metric = f"{'requests' if allowed else 'rejected'}:{endpoint}"
+        with self._lock:
+            self._counts[db_path][(current_hour(), metric)] += 1
+
+    def drain(self, db_path: str) -> Dict[Tuple[str, str], int]:
+        with self._lock:
+            return dict(self._counts.pop(db_path, {}))
+
+    def restore(self, db_path: str, counts: Dict[Tuple[str, str], int]):
+        """Put drained counts back after a failed flush"""
+        with self._lock:
+            for key, value in counts.items():
+                self._counts[db_path][key] += value
+
+    def pending(self, db_path: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(db_path, {}).values())
+
+
+request_counter = RequestCounter()
+
+
+class RollupManager:
+    """Keeps stats_hourly up to date by processing only rows added since the last run.
+
+    Messages and responses are tracked by their AUTOINCREMENT id. Each
+    step reads its watermark, adds counts and moves the watermark in one
+    IMMEDIATE transaction, so concurrent runs from several workers never
+    count a row twice. Sessions are counted by a trigger as they are
+    inserted, so deleting one (retention, cleanup) never loses its count.
+    """
+
+    def __init__(self, db_manager, batch_size: int = 50000):
+        self.db_manager = db_manager
+        self.batch_size = max(int(batch_size), 1)
+
+    def ensure_tables(self, conn):
+        for sql in ROLLUP_SCHEMA:
+            conn.execute(sql)
+        conn.commit()
+
+    def _watermark(self, conn, name: str, default):
+        row = conn.execute("SELECT position FROM stats_watermarks WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _set_watermark(self, conn, name: str, position):
+        conn.execute(
+            "INSERT INTO stats_watermarks (name, position) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET position = excluded.position",
+            (name, position)
+        )
+
+    def rollup_ids(self, conn, metric: str) -> int:
+        """Count new rows of an id-tracked table into their hours, batch by batch
+
+        Each batch is the next batch_size rows after the watermark rather
+        than the next batch_size ids, so gaps in the ids (a shard's range
+        starting at shard << SHARD_ID_BITS, deleted rows) cost nothing.
+        """
+        table, time_column = ID_SOURCES[metric]
+        processed = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                last_id = self._watermark(conn, metric, 0)
+                rows, upto = conn.execute(
+                    f"SELECT COUNT(*), MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)",
+                    (last_id, self.batch_size)
+                ).fetchone()
+                if not rows:
+                    conn.rollback()
+                    return processed
+                conn.execute(UPSERT.format(source=f"""
+                    SELECT strftime('{HOUR_FORMAT}', {time_column}), '{metric}', COUNT(*)
+                    FROM {table}
+                    WHERE id > ? AND id <= ? AND {time_column} IS NOT NULL
+                    GROUP BY 1
+                """), (last_id, upto))
+                self._set_watermark(conn, metric, upto)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            processed += rows
+            if rows < self.batch_size:
+                return processed
+
+    def rollup_sessions(self, conn) -> int:
+        """Install the session counting trigger; returns the stored sessions counted on install
+
+        Sessions already stored are counted into their hours, except those
+        in hours a run before the trigger existed has counted already.
+        """
+        installed = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?"
+        if conn.execute(installed, (SESSION_TRIGGER_NAME,)).fetchone():
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(installed, (SESSION_TRIGGER_NAME,)).fetchone():
+                conn.rollback()
+                return 0
+            since = self._watermark(conn, 'sessions', '')
+            counted = conn.execute(
+                "SELECT COUNT(*) FROM web_chat_sessions WHERE created_at >= ?", (since,)
+            ).fetchone()[0]
+            conn.execute(UPSERT.format(source=f"""
+                SELECT strftime('{HOUR_FORMAT}', created_at), 'sessions', COUNT(*)
+                FROM web_chat_sessions
+                WHERE created_at >= ?
+                GROUP BY 1
+            """), (since,))
+            conn.execute(SESSION_TRIGGER)
+            conn.execute("DELETE FROM stats_watermarks WHERE name = 'sessions'")
+            conn.commit()
+            return counted
+        except Exception:
+            conn.rollback()
+            raise
+
+    def flush_requests(self, conn) -> int:
+        """Add this process's buffered request counts"""
+        counts = request_counter.drain(self.db_manager.db_path)
+        if not counts:
+            return 0
+        try:
+            conn.executemany(
+                UPSERT.format(source="VALUES (?, ?, ?)"),
+                [(hour, metric, value) for (hour, metric), value in counts.items()]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            request_counter.restore(self.db_manager.db_path, counts)
+            raise
+        return sum(counts.values())
+
+    def run(self) -> Dict:
+        """Bring stats_hourly up to date
+
+        Reports the rows counted per table, the sessions counted when the
+        session trigger was installed and the number of buffered requests
+        flushed.
+        """
+        started = time.perf_counter()
+        conn = self.db_manager.get_connection()
+        try:
+            self.ensure_tables(conn)
+            result = {metric: self.rollup_ids(conn, metric) for metric in ID_SOURCES}
+            result['sessions'] = self.rollup_sessions(conn)
+            result['requests'] = self.flush_requests(conn)
+        finally:
+            conn.close()
+        result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+
+def query_rollups(conn, start: Optional[str] = None, end: Optional[str] = None,
+                  metrics: Optional[List[str]] = None) -> List[Dict]:
+    """Rollup rows for hours in [start, end), optionally limited to metrics (a trailing ':' matches a prefix)"""
+    where = []
+    params = []
+    if start:
+        where.append("hour >= ?")
+        params.append(start)
+    if end:
+        where.append("hour < ?")
+        params.append(end)
+    if metrics:
+        conditions = []
+        for metric in metrics:
+            if metric.endswith(':'):
+                conditions.append("substr(metric, 1, ?) = ?")
+                params.extend([len(metric), metric])
+            else:
+                conditions.append("metric = ?")
+                params.append(metric)
+        where.append(f"({' OR '.join(conditions)})")
+    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    rows = conn.execute(
+        f"SELECT hour, metric, value FROM stats_hourly {where_clause} ORDER BY hour, metric", params
+    ).fetchall()
+    return [{'hour': row[0], 'metric': row[1], 'value': row[2]} for row in rows]
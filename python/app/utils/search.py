@@ -0,0 +1,327 @@
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+# One FTS5 table covers both messages and responses. Its rowid encodes the
+# source row: id * 2 for messages, id * 2 + 1 for responses, so triggers
+# can keep it in sync without a mapping table.
+SEARCH_TABLE = 'conversation_search'
+
+SEARCH_SOURCES = {
+    'message': ('web_chat_messages', 'message', 0),
+    'response': ('web_chat_responses', 'response', 1)
+}
+
+SEARCH_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        body, session_id UNINDEXED, timestamp UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+    )"""
+]
+for _kind, (_table, _column, _offset) in SEARCH_SOURCES.items():
+    # Compressed (BLOB) bodies are indexed from Python after decoding
+    SEARCH_SCHEMA.extend([
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_search_insert AFTER INSERT ON {_table}
+            WHEN typeof(new.{_column}) = 'text' BEGIN
+            INSERT INTO {SEARCH_TABLE} (rowid, body, session_id, timestamp)
+            VALUES (new.id * 2 + {_offset}, new.{_column}, new.session_id, new.timestamp);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_search_delete AFTER DELETE ON {_table} BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + {_offset};
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_search_update AFTER UPDATE OF {_column}, session_id ON {_table} BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + {_offset};
+            INSERT INTO {SEARCH_TABLE} (rowid, body, session_id, timestamp)
+            SELECT new.id * 2 + {_offset}, new.{_column}, new.session_id, new.timestamp
+            WHERE typeof(new.{_column}) = 'text';
+        END"""
+    ])
+
+_ready: Set[str] = set()
+_ready_lock = threading.Lock()
+
+
+class SearchQueryError(ValueError):
+    """Raised for a search query FTS5 cannot parse"""
+    pass
+
+
+def fts5_available() -> bool:
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE probe USING fts5(body)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def is_search_index_ready(db_path: str) -> bool:
+    return db_path in _ready
+
+
+def search_index_exists(conn, db_path: str) -> bool:
+    """Whether the search table has been built in a database (remembered once seen)"""
+    if db_path in _ready:
+        return True
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+    ).fetchone()
+    if exists:
+        with _ready_lock:
+            _ready.add(db_path)
+    return exists is not None
+
+
+def create_search_index(conn) -> bool:
+    """Create the search table and its triggers; False when SQLite was built without FTS5"""
+    try:
+        for sql in SEARCH_SCHEMA:
+            conn.execute(sql)
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        if 'fts5' in str(e):
+            return False
+        raise
+    conn.commit()
+    return True
+
+
+def reset_search_index(db_path: str):
+    """Forget that the index was checked for a database, e.g. after it was recreated"""
+    with _ready_lock:
+        _ready.discard(db_path)
+
+
+def backfill_search_index(conn, decode=None, batch_size: int = 5000, pause: float = 0.0) -> int:
+    """Index the existing messages and responses, batch_size rows per transaction
+
+    The triggers must already exist: rows written during the backfill
+    index themselves, and each batch is read and indexed under one write
+    lock so a concurrent update or delete cannot be overwritten with a
+    stale body. ``decode`` turns compressed bodies back into text; without
+    it they are skipped.
+    """
+    indexed = 0
+    for table, column, offset in SEARCH_SOURCES.values():
+        last_id = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    f"SELECT id, {column}, session_id, timestamp FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, int(batch_size))
+                ).fetchall()
+                entries = []
+                for row in rows:
+                    body = row[1]
+                    if isinstance(body, bytes):
+                        if decode is None:
+                            continue
+                        body = decode(body)
+                    entries.append((row[0] * 2 + offset, body, row[2], row[3]))
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, body, session_id, timestamp) VALUES (?, ?, ?, ?)",
+                    entries
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            indexed += len(entries)
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1][0]
+            if pause:
+                time.sleep(pause)
+    return indexed
+
+
+def index_body(conn, kind: str, source_id: int, session_id: str, body: str, timestamp: str = None):
+    """Index a body the triggers skipped because it is stored compressed"""
+    offset = SEARCH_SOURCES[kind][2]
+    conn.execute(
+        f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, body, session_id, timestamp) "
+        f"VALUES (?, ?, ?, COALESCE(?, datetime('now')))",
+        (source_id * 2 + offset, body, session_id, timestamp)
+    )
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query matching every term (prefix match with a trailing *)"""
+    terms = []
+    for term in re.findall(r'[^\s"]+', query):
+        prefix = term.endswith('*') and len(term) > 1
+        term = term.rstrip('*')
+        if term:
+            terms.append('"{}"{}'.format(term, '*' if prefix else ''))
+    if not terms:
+        raise SearchQueryError('Empty search query')
+    return ' '.join(terms)
+
+
+def encode_cursor(order: str, row) -> str:
+    if order == 'recent':
+        return f"{row['timestamp']}|{row['rowid']}"
+    return f"{row['rank']!r}|{row['rowid']}"
+
+
+def decode_cursor(order: str, cursor: str) -> Tuple:
+    try:
+        key, rowid = cursor.rsplit('|', 1)
+        return (key if order == 'recent' else float(key)), int(rowid)
+    except ValueError:
+        raise SearchQueryError('Invalid cursor')
+
+
+def search_rows(conn, query: str, limit: int = 20, cursor: Optional[str] = None, session_id: Optional[str] = None,
+                order: str = 'rank', raw: bool = False, snippet_tokens: int = 12) -> List:
+    """The first limit + 1 index rows after cursor, in page order (see search)"""
+    if order not in ('rank', 'recent'):
+        raise SearchQueryError('order must be rank or recent')
+    match = query if raw else build_match_query(query)
+    where = [f"{SEARCH_TABLE} MATCH ?"]
+    params: List = [int(snippet_tokens), match]
+    if session_id:
+        where.append("session_id = ?")
+        params.append(session_id)
+    if cursor:
+        key, rowid = decode_cursor(order, cursor)
+        if order == 'recent':
+            where.append("(timestamp < ? OR (timestamp = ? AND rowid < ?))")
+        else:
+            where.append("(rank > ? OR (rank = ? AND rowid > ?))")
+        params.extend([key, key, rowid])
+    order_by = "timestamp DESC, rowid DESC" if order == 'recent' else "rank, rowid"
+    params.append(int(limit) + 1)
+
+    try:
+        return conn.execute(f"""
+            SELECT rowid, session_id, timestamp, rank,
+                   snippet({SEARCH_TABLE}, 0, '[', ']', '...', ?) AS snippet
+            FROM {SEARCH_TABLE}
+            WHERE {' AND '.join(where)}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, params).fetchall()
+    except sqlite3.OperationalError as e:
+        if 'fts5' in str(e) or 'syntax' in str(e) or 'no such column' in str(e):
+            raise SearchQueryError(str(e))
+        raise
+
+
+def row_order(order: str):
+    """Sort key of search_rows rows, for merging pages (recent pages are descending)"""
+    if order == 'recent':
+        return lambda row: (row['timestamp'], row['rowid'])
+    return lambda row: (row['rank'], row['rowid'])
+
+
+def search_page(rows: List, order: str, limit: int) -> Dict:
+    """One page of results from up to limit + 1 rows in page order"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    results = [{
+        'type': 'response' if row['rowid'] % 2 else 'message',
+        'id': row['rowid'] // 2,
+        'session_id': row['session_id'],
+        'timestamp': row['timestamp'],
+        'score': round(-row['rank'], 6),
+        'snippet': row['snippet']
+    } for row in rows]
+    return {
+        'results': results,
+        'next_cursor': encode_cursor(order, rows[-1]) if has_more and rows else None
+    }
+
+
+def search(conn, query: str, limit: int = 20, cursor: Optional[str] = None, session_id: Optional[str] = None,
+           order: str = 'rank', raw: bool = False, snippet_tokens: int = 12) -> Dict:
+    """Ranked full-text search with snippets and keyset pagination
+
+    ``order`` is 'rank' (bm25, best first) or 'recent' (newest first).
+    ``cursor`` is the ``next_cursor`` of the previous page. With ``raw``
+    the query is passed to FTS5 unchanged, allowing its full syntax.
+    """
+    rows = search_rows(conn, query, limit, cursor, session_id, order, raw, snippet_tokens)
+    return search_page(rows, order, limit)
+
+
+class SearchIndexBuilder:
+    """Builds one database's search index on a background thread, off the request path"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.running = False
+        self.rebuilding = False
+        self.last_run: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+
+    def trigger(self, rebuild: bool = False, wait: bool = False) -> bool:
+        """Build the index (or rebuild it from scratch); returns False if a build is in progress"""
+        if self.running:
+            return False
+        if wait:
+            self.run_once(rebuild)
+        else:
+            threading.Thread(target=self.run_once, args=(rebuild,), name='search-index', daemon=True).start()
+        return True
+
+    def run_once(self, rebuild: bool = False) -> Optional[Dict]:
+        with self._lock:
+            if self.running:
+                return None
+            self.running = True
+            self.rebuilding = rebuild
+
+        # Imported here: the database module imports this one
+        from app.utils.storage import open_database
+
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        indexed = 0
+        try:
+            indexed = open_database(self.db_path).build_search_index(rebuild)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+        finally:
+            self.running = False
+
+        self.runs += 1
+        self.last_run = {
+            'started_at': started_at,
+            'finished_at': datetime.now().isoformat(),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            'rebuild': rebuild,
+            'indexed': indexed,
+            'error': self.last_error
+        }
+        return self.last_run
+
+    def status(self) -> Dict:
+        return {
+            'running': self.running,
+            'progress': {'rebuild': self.rebuilding} if self.running else None,
+            'runs': self.runs,
+            'last_run': self.last_run
+        }
+
+
+_builders: Dict[str, SearchIndexBuilder] = {}
+_builders_lock = threading.Lock()
+
+
+def get_search_index_builder(db_path: str) -> SearchIndexBuilder:
+    """Get the process-wide search index builder for a database"""
+    with _builders_lock:
+        builder = _builders.get(db_path)
+        if builder is None:
+            builder = SearchIndexBuilder(db_path)
+            _builders[db_path] = builder
+        return builder
@@ -0,0 +1,168 @@
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01):
+        capacity = max(int(capacity), 1)
+        error_rate = min(max(float(error_rate), 1e-9), 0.5)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: two 64-bit halves of one digest give k positions
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+
+class SessionDirectory:
+    """In-process directory of known sessions.
+
+    An LRU maps session_id to uid so "exists?" and "uid?" can be answered
+    without SQL. A Bloom filter records every session ID seen; when the
+    directory is authoritative (a single process owns all writes) a Bloom
+    miss proves the session does not exist.
+    """
+
+    def __init__(self, capacity: int = 10000, bloom_capacity: int = 100000,
+                 bloom_error_rate: float = 0.01, authoritative: bool = False):
+        self.capacity = capacity
+        self.authoritative = authoritative
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+        self.warmed = False
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_uid(self, session_id: str) -> Optional[str]:
+        """Return the cached uid for a session, or None on a miss"""
+        with self._lock:
+            uid = self._entries.get(session_id)
+            if uid is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return uid
+
+    def peek(self, session_id: str) -> Optional[str]:
+        """The cached uid without counting a lookup or touching the LRU order"""
+        with self._lock:
+            return self._entries.get(session_id)
+
+    def known_absent(self, session_id: str) -> bool:
+        """True when the session is proven not to exist without asking the database"""
+        if not (self.authoritative and self.warmed):
+            return False
+        with self._lock:
+            if session_id in self.bloom:
+                return False
+            self.negative_hits += 1
+            return True
+
+    def add(self, session_id: str, uid: str):
+        """Remember a session and its uid"""
+        with self._lock:
+            self.bloom.add(session_id)
+            self._entries[session_id] = uid
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def warm(self, session_ids: Iterable[str]):
+        """Seed the Bloom filter with every session ID in the database"""
+        with self._lock:
+            for session_id in session_ids:
+                self.bloom.add(session_id)
+            self.warmed = True
+
+    def invalidate(self, session_ids: Iterable[str] = None):
+        """Drop cached entries; the Bloom filter keeps its bits (false positives only cost a query)"""
+        with self._lock:
+            if session_ids is None:
+                self._entries.clear()
+            else:
+                for session_id in session_ids:
+                    self._entries.pop(session_id, None)
+            self.invalidations += 1
+
+    def clear(self):
+        """Forget everything, including the Bloom filter"""
+        with self._lock:
+            self._entries.clear()
+            self.bloom.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'negative_hits': self.negative_hits,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'authoritative': self.authoritative,
+                'bloom_items': self.bloom.count,
+                'bloom_bits': self.bloom.size,
+                'bloom_hashes': self.bloom.hash_count
+            }
+
+
+_directories: Dict[str, SessionDirectory] = {}
+_directories_lock = threading.Lock()
+
+
+def get_session_directory(db_path: str, capacity: int = 10000, bloom_capacity: int = 100000,
+                          bloom_error_rate: float = 0.01, authoritative: bool = False) -> SessionDirectory:
+    """Get the process-wide session directory for a database"""
+    with _directories_lock:
+        directory = _directories.get(db_path)
+        if directory is None:
+            directory = SessionDirectory(capacity, bloom_capacity, bloom_error_rate, authoritative)
+            _directories[db_path] = directory
+        else:
+            directory.capacity = capacity
+            directory.authoritative = authoritative
+        return directory
+
+
+def reset_session_directory(db_path: str):
+    """Forget a database's directory entirely (e.g. after the file was recreated)"""
+    with _directories_lock:
+        directory = _directories.get(db_path)
+    if directory is not None:
+        directory.clear()
+        directory.warmed = False
@@ -0,0 +1,107 @@
+import re
+from typing import Dict, List, Tuple
+
+# system_config key listing the metadata keys to expose, comma separated
+CONFIG_KEY = 'session_metadata_columns'
+
+COLUMN_PREFIX = 'meta_'
+
+# Keys become column and index names, so only plain identifiers are accepted
+KEY_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,31}$')
+
+MAX_COLUMNS = 16
+
+
+class MetadataColumnError(ValueError):
+    """An invalid metadata key in the configuration or a filter"""
+
+
+def parse_keys(value: str) -> List[str]:
+    """Metadata keys from the comma-separated config value, in order and without duplicates"""
+    keys = []
+    for key in (value or '').split(','):
+        key = key.strip()
+        if not key or key in keys:
+            continue
+        if not KEY_PATTERN.match(key):
+            raise MetadataColumnError(f'Invalid metadata key: {key}')
+        keys.append(key)
+    if len(keys) > MAX_COLUMNS:
+        raise MetadataColumnError(f'At most {MAX_COLUMNS} metadata columns can be indexed')
+    return keys
+
+
+def column_name(key: str) -> str:
+    return f'{COLUMN_PREFIX}{key}'
+
+
+def index_name(key: str) -> str:
+    return f'idx_sessions_{COLUMN_PREFIX}{key}'
+
+
+def extract(column: str, key: str) -> str:
+    # Malformed metadata reads as NULL instead of failing the statement
+    return f"CASE WHEN json_valid({column}) THEN json_extract({column}, '$.{key}') END"
+
+
+def indexed_keys(conn) -> List[str]:
+    """Metadata keys that currently have a generated column on web_chat_sessions"""
+    # table_xinfo marks virtual generated columns with hidden = 2
+    rows = conn.execute("PRAGMA table_xinfo(web_chat_sessions)").fetchall()
+    return [
+        row[1][len(COLUMN_PREFIX):] for row in rows
+        if row[6] == 2 and row[1].startswith(COLUMN_PREFIX)
+    ]
+
+
+def sync_columns(conn, keys: List[str]) -> Dict[str, List[str]]:
+    """Add generated columns and indexes for keys, and drop the ones no longer configured
+
+    Virtual columns take no space in the table; only their indexes are
+    stored, and SQLite maintains them on every session write.
+    """
+    existing = indexed_keys(conn)
+    added = [key for key in keys if key not in existing]
+    removed = [key for key in existing if key not in keys]
+    for key in removed:
+        conn.execute(f"DROP INDEX IF EXISTS {index_name(key)}")
+        conn.execute(f"ALTER TABLE web_chat_sessions DROP COLUMN {column_name(key)}")
+    for key in added:
+        conn.execute(
+            f"ALTER TABLE web_chat_sessions ADD COLUMN {column_name(key)} TEXT "
+            f"GENERATED ALWAYS AS ({extract('metadata', key)}) VIRTUAL"
+        )
+    for key in keys:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name(key)} ON web_chat_sessions({column_name(key)})")
+    conn.commit()
+    return {'columns': keys, 'added': added, 'removed': removed}
+
+
+def parse_filters(args) -> Dict[str, str]:
+    """meta.<key>=<value> query arguments as {key: value}"""
+    filters = {}
+    for name, value in args.items():
+        if not name.startswith('meta.'):
+            continue
+        key = name[len('meta.'):]
+        if not KEY_PATTERN.match(key):
+            raise MetadataColumnError(f'Invalid metadata key: {key}')
+        filters[key] = value
+    return filters
+
+
+def filter_clause(filters: Dict[str, str], indexed: List[str], alias: str = 's') -> Tuple[List[str], List[str]]:
+    """SQL conditions and parameters for metadata filters
+
+    Keys with a generated column compare against it and can use its
+    index; other keys fall back to json_extract on every row.
+    """
+    conditions = []
+    params = []
+    for key, value in filters.items():
+        if key in indexed:
+            conditions.append(f"{alias}.{column_name(key)} = ?")
+        else:
+            conditions.append(f"CAST({extract(f'{alias}.metadata', key)} AS TEXT) = ?")
+        params.append(value)
+    return conditions, params
@@ -0,0 +1,261 @@
+import hashlib
+import heapq
+import os
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List
+
+from app.utils.consumer_groups import Assignment
+from app.utils.database import DatabaseManager, get_body_codec
+from app.utils.export import EXPORT_TABLES
+from app.utils.search import row_order, search_page, search_rows
+from config import Config
+
+# Tables whose ids must be unique across shards: each shard's AUTOINCREMENT
+# counter starts at shard_index << SHARD_ID_BITS, so an id names its shard
+# and stays below 2**53 (exact in JavaScript) for up to MAX_SHARDS shards.
+SHARDED_TABLES = ('web_chat_messages', 'web_chat_responses')
+SHARD_ID_BITS = 40
+MAX_SHARDS = 64
+
+
+def shard_count() -> int:
+    return max(1, min(int(Config.STORAGE_SHARDS), MAX_SHARDS))
+
+
+def shard_index(session_id: str, shards: int) -> int:
+    """Shard of a session: a stable hash of session_id"""
+    digest = hashlib.blake2b(session_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def shard_paths(db_path: str, shards: int = None) -> List[str]:
+    """Database files of a sharded store; shard 0 is db_path itself"""
+    shards = shard_count() if shards is None else shards
+    base, ext = os.path.splitext(db_path)
+    return [db_path] + [f"{base}.shard{index}{ext or '.db'}" for index in range(1, shards)]
+
+
+def shard_of_id(row_id: int) -> int:
+    return int(row_id) >> SHARD_ID_BITS
+
+
+def seed_id_ranges(conn, index: int):
+    """Start a shard's message and response ids in its own range
+
+    Checked with a read each time so a shard file recreated under a
+    running process is seeded again; the write happens once per file.
+    """
+    placeholders = ','.join('?' for _ in SHARDED_TABLES)
+    seeded = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_sequence WHERE name IN ({placeholders})", SHARDED_TABLES
+    ).fetchone()[0]
+    if seeded == len(SHARDED_TABLES):
+        return
+    for table in SHARDED_TABLES:
+        conn.execute("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+        """, (table, index << SHARD_ID_BITS, table))
+    conn.commit()
+
+
+def merge_pages(pages: Iterable[List[Dict]], key: Callable, offset: int, limit: int,
+                reverse: bool = False) -> List[Dict]:
+    """k-way merge of per-shard pages, each already sorted by key, then one page of the result"""
+    return list(islice(heapq.merge(*pages, key=key, reverse=reverse), offset, offset + limit))
+
+
+def open_sharded_database(db_path: str) -> DatabaseManager:
+    """The SQLite database manager for db_path: sharded when Config.STORAGE_SHARDS > 1"""
+    shards = shard_count()
+    if shards > 1:
+        return ShardedDatabaseManager(db_path, shards)
+    return DatabaseManager(db_path)
+
+
+class ShardedDatabaseManager(DatabaseManager):
+    """Sessions, messages and responses spread over several database files
+
+    Calls about one session go to that session's shard. Inbox pages,
+    session listings, exports, search and rollups read every shard and
+    merge the results. Everything else (config, rate limits, consumer
+    groups, admin tools) stays in the main file, which is also shard 0;
+    analytics and columnar exports, which cannot be merged from
+    per-shard results, are not supported.
+    """
+
+    FEATURES = DatabaseManager.FEATURES - {'analytics', 'columnar'}
+
+    def __init__(self, db_path: str = None, shards: int = 2):
+        super().__init__(db_path)
+        self.shards = max(1, min(int(shards), MAX_SHARDS))
+        self._shard_managers: Dict[int, DatabaseManager] = {}
+
+    def shard(self, index: int) -> DatabaseManager:
+        manager = self._shard_managers.get(index)
+        if manager is None:
+            path = shard_paths(self.db_path, self.shards)[index]
+            manager = DatabaseManager(path)
+            conn = manager.get_connection()
+            try:
+                seed_id_ranges(conn, index)
+            finally:
+                conn.close()
+            self._shard_managers[index] = manager
+        return manager
+
+    def shard_for(self, session_id: str) -> DatabaseManager:
+        return self.shard(shard_index(session_id, self.shards))
+
+    def shard_databases(self) -> List[DatabaseManager]:
+        return [self.shard(index) for index in range(self.shards)]
+
+    def session_exists(self, session_id: str) -> bool:
+        return self.shard_for(session_id).session_exists(session_id)
+
+    def create_session(self, session_id: str, ip_address: str = None, user_agent: str = None):
+        return self.shard_for(session_id).create_session(session_id, ip_address, user_agent)
+
+    def get_or_create_uid(self, session_id: str, ip_address: str = None) -> Dict[str, Any]:
+        return self.shard_for(session_id).get_or_create_uid(session_id, ip_address)
+
+    def update_session_activity(self, session_id: str):
+        self.shard_for(session_id).update_session_activity(session_id)
+
+    def create_message(self, session_id: str, message: str, message_type: str = 'user',
+                       idempotency_key: str = None, response: Dict = None) -> int:
+        return self.shard_for(session_id).create_message(session_id, message, message_type, idempotency_key, response)
+
+    def create_response(self, session_id: str, response: str, message_id: int = None,
+                        idempotency_key: str = None, result: Dict = None) -> int:
+        return self.shard_for(session_id).create_response(session_id, response, message_id, idempotency_key, result)
+
+    def find_idempotent_response(self, scope: str, session_id: str, key: str):
+        return self.shard_for(session_id).find_idempotent_response(scope, session_id, key)
+
+    def get_session_responses(self, session_id: str, since: str = None) -> List[Dict]:
+        return self.shard_for(session_id).get_session_responses(session_id, since)
+
+    def get_session_messages(self, session_id: str):
+        return self.shard_for(session_id).get_session_messages(session_id)
+
+    def get_session_timeline(self, session_id: str, limit: int = 100, cursor: str = None) -> Dict[str, Any]:
+        return self.shard_for(session_id).get_session_timeline(session_id, limit, cursor)
+
+    def get_unprocessed_messages(self, limit: int, offset: int, since: str = None,
+                                 mode: str = 'fifo', per_session: int = 0,
+                                 assignment: Assignment = None) -> List[Dict]:
+        """Merge each shard's first limit + offset messages into one page
+
+        fifo pages merge on timestamp. fair pages merge on (round,
+        timestamp): a session lives in one shard, so its rounds there are
+        its rounds overall.
+        """
+        if mode == 'fair':
+            pages = [self._fair_page(shard, limit + offset, since, int(per_session or 0), assignment)
+                     for shard in self.shard_databases()]
+            messages = merge_pages(pages, lambda m: (m['inbox_round'], m['timestamp']), offset, limit)
+            for message in messages:
+                del message['inbox_round']
+            return messages
+        pages = [shard.get_unprocessed_messages(limit + offset, 0, since, mode, per_session, assignment)
+                 for shard in self.shard_databases()]
+        return merge_pages(pages, lambda m: m['timestamp'], offset, limit)
+
+    def _fair_page(self, shard: DatabaseManager, limit: int, since: str, per_session: int,
+                   assignment: Assignment = None) -> List[Dict]:
+        conn = shard.get_connection()
+        try:
+            if assignment:
+                assignment.register(conn)
+            rows = shard._fair_unprocessed_messages(conn, limit, 0, since, per_session, assignment)
+        finally:
+            conn.close()
+        codec = get_body_codec()
+        return [dict(dict(row), message=codec.decode(row['message'])) for row in rows]
+
+    def get_unprocessed_message_count(self, since: str = None, assignment: Assignment = None) -> int:
+        return sum(shard.get_unprocessed_message_count(since, assignment) for shard in self.shard_databases())
+
+    def mark_messages_processed(self, message_ids: List[int]):
+        """Mark messages processed in the shards their ids belong to"""
+        by_shard: Dict[int, List[int]] = {}
+        for message_id in message_ids:
+            by_shard.setdefault(shard_of_id(message_id), []).append(message_id)
+        for index, ids in by_shard.items():
+            if index < self.shards:
+                self.shard(index).mark_messages_processed(ids)
+
+    def get_active_sessions(self, limit: int, offset: int, active: bool = True,
+                            metadata: Dict[str, str] = None) -> List[Dict]:
+        pages = [shard.get_active_sessions(limit + offset, 0, active, metadata) for shard in self.shard_databases()]
+        return merge_pages(pages, lambda s: s['last_active'], offset, limit, reverse=True)
+
+    def get_session_count(self, active: bool = True, metadata: Dict[str, str] = None) -> int:
+        return sum(shard.get_session_count(active, metadata) for shard in self.shard_databases())
+
+    def flush_session_activity(self) -> int:
+        return sum(shard.flush_session_activity() for shard in self.shard_databases())
+
+    def cleanup_inactive_sessions(self) -> int:
+        return sum(shard.cleanup_inactive_sessions() for shard in self.shard_databases())
+
+    def clear_all_data(self) -> Dict[str, int]:
+        """Delete the rows of every shard; counts are summed across shards"""
+        results = [shard.clear_all_data() for shard in self.shard_databases()]
+        return {name: sum(result[name] for result in results) for name in results[0]}
+
+    def reset_database(self, archive: bool = False) -> Dict[str, Any]:
+        """Swap every shard for an empty file; counts are summed across shards"""
+        results = [shard.reset_database(archive) for shard in self.shard_databases()]
+        cleaned = {table: sum(result['cleaned_data'][table] for result in results)
+                   for table in results[0]['cleaned_data']}
+        return dict(results[0], cleaned_data=cleaned,
+                    shard_archive_paths=[result['archive_path'] for result in results])
+
+    def export_rows(self, tables: List[str], start: str = None, end: str = None, chunk_size: int = None):
+        """Each table's rows from every shard, merged on (time, id) as one file orders them"""
+        for name in tables:
+            time_column = EXPORT_TABLES[name][2]
+            streams = [shard.export_rows([name], start, end, chunk_size) for shard in self.shard_databases()]
+            try:
+                yield from heapq.merge(*streams, key=lambda row: (row[time_column], row['id']))
+            finally:
+                for stream in streams:
+                    stream.close()
+
+    def ensure_search_index(self) -> bool:
+        return all(shard.ensure_search_index() for shard in self.shard_databases())
+
+    def build_search_index(self, rebuild: bool = False) -> int:
+        return sum(shard.build_search_index(rebuild) for shard in self.shard_databases())
+
+    def search_conversations(self, query: str, limit: int = 20, cursor: str = None, session_id: str = None,
+                             order: str = 'rank', raw: bool = False):
+        """Search every shard and merge the pages; bm25 ranks are each shard's own"""
+        if session_id:
+            return self.shard_for(session_id).search_conversations(query, limit, cursor, session_id, order, raw)
+        if not self.ensure_search_index():
+            return None
+        pages = []
+        for shard in self.shard_databases():
+            conn = shard.get_read_connection()
+            try:
+                pages.append(search_rows(conn, query, limit, cursor, None, order, raw))
+            finally:
+                conn.close()
+        return search_page(merge_pages(pages, row_order(order), 0, limit + 1, reverse=order == 'recent'),
+                           order, limit)
+
+    def run_rollups(self) -> Dict[str, Any]:
+        results = [shard.run_rollups() for shard in self.shard_databases()]
+        return {name: sum(result[name] for result in results) for name in results[0]}
+
+    def get_rollups(self, start: str = None, end: str = None, metrics: List[str] = None) -> List[Dict]:
+        """Each shard's hourly counts, summed per hour and metric"""
+        totals: Dict = {}
+        for shard in self.shard_databases():
+            for row in shard.get_rollups(start, end, metrics):
+                key = (row['hour'], row['metric'])
+                totals[key] = totals.get(key, 0) + row['value']
+        return [{'hour': hour, 'metric': metric, 'value': value} for (hour, metric), value in sorted(totals.items())]
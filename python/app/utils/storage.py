@@ -0,0 +1,161 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+STORAGE_BACKENDS = ('sqlite', 'memory')
+
+
+def storage_backend() -> str:
+    backend = str(Config.STORAGE_BACKEND).lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND must be one of {', '.join(STORAGE_BACKENDS)}")
+    return backend
+
+
+def open_database(db_path: str):
+    """The storage for db_path: the configured backend, sharded when Config.STORAGE_SHARDS > 1"""
+    # Imported here: both modules build on the classes that import this one
+    if storage_backend() == 'memory':
+        from app.utils.memory_storage import get_memory_storage
+        return get_memory_storage(db_path)
+    from app.utils.sharding import open_sharded_database
+    return open_sharded_database(db_path)
+
+
+class StorageBackend(ABC):
+    """The chat storage contract the API and admin routes rely on
+
+    DatabaseManager (SQLite) and MemoryStorage implement it, and the
+    contract tests in tests/unit/test_storage_contract.py run against
+    both. Timestamps are UTC 'YYYY-MM-DD HH:MM:SS' strings. SQLite-only
+    maintenance (archive, search index, compression, rollups, exports)
+    stays on DatabaseManager; routes ask supports() before using it.
+    """
+
+    # Optional features beyond this contract, by the names routes check
+    FEATURES = frozenset()
+
+    def supports(self, feature: str) -> bool:
+        return feature in self.FEATURES
+
+    @abstractmethod
+    def session_exists(self, session_id: str) -> bool:
+        """True if the session has been created"""
+
+    @abstractmethod
+    def create_session(self, session_id: str, ip_address: str = None, user_agent: str = None) -> str:
+        """Create a session and return its new uid"""
+
+    @abstractmethod
+    def get_or_create_uid(self, session_id: str, ip_address: str = None) -> Dict[str, Any]:
+        """{'uid': ..., 'is_new': bool}, creating the session if needed"""
+
+    @abstractmethod
+    def create_message(self, session_id: str, message: str, message_type: str = 'user',
+                       idempotency_key: str = None, response: Dict = None) -> int:
+        """Store a visitor message; a repeated idempotency_key raises DuplicateRequest"""
+
+    @abstractmethod
+    def get_unprocessed_messages(self, limit: int, offset: int, since: str = None,
+                                 mode: str = 'fifo', per_session: int = 0, assignment=None) -> List[Dict]:
+        """One inbox page: id, session_id, message, timestamp and uid of pending messages"""
+
+    @abstractmethod
+    def get_unprocessed_message_count(self, since: str = None, assignment=None) -> int:
+        """Number of pending messages"""
+
+    @abstractmethod
+    def mark_messages_processed(self, message_ids: List[int]):
+        """Take messages out of the inbox"""
+
+    @abstractmethod
+    def create_response(self, session_id: str, response: str, message_id: int = None,
+                        idempotency_key: str = None, result: Dict = None) -> int:
+        """Store an agent response; idempotency_key works as in create_message"""
+
+    def create_response_with_message_id(self, session_id: str, response: str, message_id: int = None,
+                                        idempotency_key: str = None, result: Dict = None) -> int:
+        return self.create_response(session_id, response, message_id, idempotency_key, result)
+
+    @abstractmethod
+    def find_idempotent_response(self, scope: str, session_id: str, key: str) -> Optional[Dict]:
+        """The response data stored with an earlier write under the same key, if any"""
+
+    @abstractmethod
+    def get_session_responses(self, session_id: str, since: str = None) -> List[Dict]:
+        """A session's responses (id, response, timestamp, message_id), oldest first"""
+
+    @abstractmethod
+    def get_session_messages(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """{'session', 'messages', 'responses'} with a session's whole history, oldest first; None if unknown"""
+
+    @abstractmethod
+    def get_active_sessions(self, limit: int, offset: int, active: bool = True,
+                            metadata: Dict[str, str] = None) -> List[Dict]:
+        """Sessions active in the last day, most recent first, with message and response counts"""
+
+    @abstractmethod
+    def get_session_count(self, active: bool = True, metadata: Dict[str, str] = None) -> int:
+        """Number of sessions (active in the last day unless active is False)"""
+
+    @abstractmethod
+    def update_session_activity(self, session_id: str):
+        """Set a session's last_active to now"""
+
+    @abstractmethod
+    def flush_session_activity(self) -> int:
+        """Write buffered activity updates; returns the number written"""
+
+    @abstractmethod
+    def cleanup_inactive_sessions(self) -> int:
+        """Delete sessions idle longer than Config.SESSION_TIMEOUT (with their rows if RETENTION_CASCADE)"""
+
+    def cleanup_expired_sessions(self) -> int:
+        """Clean up expired sessions (alias for cleanup_inactive_sessions)"""
+        return self.cleanup_inactive_sessions()
+
+    @abstractmethod
+    def get_all_config(self) -> Dict[str, str]:
+        """All system_config values"""
+
+    @abstractmethod
+    def get_config(self, config_key: str) -> Optional[str]:
+        """One system_config value"""
+
+    @abstractmethod
+    def update_config(self, config_data: Dict[str, str]):
+        """Set system_config values"""
+
+    @abstractmethod
+    def clear_all_data(self) -> Dict[str, int]:
+        """Delete all sessions, messages, responses and rate limits; returns the counts deleted"""
+
+    @abstractmethod
+    def reset_database(self, archive: bool = False) -> Dict[str, Any]:
+        """Clear all data at once: {'mode', 'cleaned_data', 'estimated', 'archive_path'}"""
+
+    @abstractmethod
+    def join_consumer_group(self, group: str, consumer: str):
+        """Heartbeat an inbox consumer and return its Assignment"""
+
+    @abstractmethod
+    def leave_consumer_group(self, group: str, consumer: str) -> bool:
+        """Remove a consumer from its group"""
+
+    @abstractmethod
+    def get_consumer_groups(self) -> Dict[str, List[Dict]]:
+        """Live members of every consumer group"""
+
+    @abstractmethod
+    def get_changes(self, after_seq: int = 0, limit: int = 100,
+                    entities: List[str] = None) -> Optional[Dict[str, Any]]:
+        """Change feed page; None when the backend has no change feed"""
+
+    @abstractmethod
+    def get_connection(self):
+        """sqlite3 connection holding rate_limits and inbox_consumers"""
+
+    @abstractmethod
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """Statistics for the backend's in-process state"""
@@ -0,0 +1,234 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# PRAGMA user_version once integer keys and timestamps are fully populated
+STORAGE_FORMAT_VERSION = 2
+
+
+def epoch_ms(expr: str) -> str:
+    """SQL for the epoch-millisecond value of a SQLite datetime expression"""
+    return f"CAST(ROUND((julianday({expr}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def to_epoch_ms(value: Optional[str]) -> Optional[int]:
+    """Epoch milliseconds for a SQLite or ISO 8601 timestamp (naive values are UTC), None if unparseable"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return round(parsed.timestamp() * 1000)
+
+
+# Integer columns added next to the text ones. The text session_id and
+# timestamp columns stay on every table, because the PHP bridge and
+# existing clients read and write them; triggers keep the integer columns
+# in step. That makes the format an opt-in trade: each row and write gets
+# a little bigger in exchange for integer joins and range scans on the
+# per-session read paths. Sessions keep filtering on the text last_active
+# index, so nothing is added to the activity update path.
+COLUMNS = [
+    ('web_chat_sessions', 'session_key', 'INTEGER'),
+    ('web_chat_messages', 'session_key', 'INTEGER'),
+    ('web_chat_messages', 'ts', 'INTEGER'),
+    ('web_chat_responses', 'session_key', 'INTEGER'),
+    ('web_chat_responses', 'ts', 'INTEGER')
+]
+
+# Only indexes a query reads: the inbox join, session counts, the
+# responses poll and the timeline
+INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_key ON web_chat_sessions(session_key)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_key_ts ON web_chat_messages(session_key, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_responses_key_ts ON web_chat_responses(session_key, ts)"
+]
+
+# Objects earlier versions of the migration created that no query used
+OBSOLETE = [
+    "DROP TRIGGER IF EXISTS web_chat_sessions_keys_activity",
+    "DROP TRIGGER IF EXISTS web_chat_sessions_keys_insert",
+    "DROP INDEX IF EXISTS idx_sessions_last_active_ms",
+    "DROP INDEX IF EXISTS idx_messages_pending_ts"
+]
+OBSOLETE_COLUMNS = [('web_chat_sessions', 'last_active_ms')]
+
+CHILD_TABLES = ('web_chat_messages', 'web_chat_responses')
+
+TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS web_chat_sessions_key_insert AFTER INSERT ON web_chat_sessions BEGIN
+        UPDATE web_chat_sessions SET
+            session_key = COALESCE(new.session_key, (SELECT COALESCE(MAX(session_key), 0) + 1 FROM web_chat_sessions))
+        WHERE rowid = new.rowid;
+        UPDATE web_chat_messages SET session_key = (SELECT session_key FROM web_chat_sessions WHERE rowid = new.rowid)
+        WHERE session_id = new.id AND session_key IS NOT (SELECT session_key FROM web_chat_sessions WHERE rowid = new.rowid);
+        UPDATE web_chat_responses SET session_key = (SELECT session_key FROM web_chat_sessions WHERE rowid = new.rowid)
+        WHERE session_id = new.id AND session_key IS NOT (SELECT session_key FROM web_chat_sessions WHERE rowid = new.rowid);
+    END"""
+]
+for _table in CHILD_TABLES:
+    TRIGGERS.extend([
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_keys_insert AFTER INSERT ON {_table}
+            WHEN new.session_key IS NULL OR new.ts IS NULL BEGIN
+            UPDATE {_table} SET
+                session_key = COALESCE(new.session_key, (SELECT session_key FROM web_chat_sessions WHERE id = new.session_id)),
+                ts = COALESCE(new.ts, {epoch_ms('new.timestamp')})
+            WHERE id = new.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {_table}_keys_update AFTER UPDATE OF timestamp, session_id ON {_table} BEGIN
+            UPDATE {_table} SET
+                session_key = (SELECT session_key FROM web_chat_sessions WHERE id = new.session_id),
+                ts = {epoch_ms('new.timestamp')}
+            WHERE id = new.id;
+        END"""
+    ])
+
+# Columns the migration reads; other schemas (e.g. the fallback basic schema) are left alone
+REQUIRED_COLUMNS = {
+    'web_chat_sessions': {'id', 'last_active'},
+    'web_chat_messages': {'id', 'session_id', 'timestamp'},
+    'web_chat_responses': {'id', 'session_id', 'timestamp'}
+}
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def get_storage_version(conn, db_path: str) -> int:
+    """PRAGMA user_version of a database, read once per process"""
+    version = _versions.get(db_path)
+    if version is None:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        with _versions_lock:
+            _versions[db_path] = version
+    return version
+
+
+def set_storage_version(db_path: str, version: int):
+    with _versions_lock:
+        _versions[db_path] = version
+
+
+def reset_storage_version(db_path: str):
+    with _versions_lock:
+        _versions.pop(db_path, None)
+
+
+def table_columns(conn, table: str):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def can_migrate(conn) -> bool:
+    return all(required <= table_columns(conn, table) for table, required in REQUIRED_COLUMNS.items())
+
+
+class StorageFormatMigration:
+    """Adds integer session keys and epoch-millisecond timestamps, then backfills them in batches.
+
+    Columns, indexes and triggers go in first so rows written during the
+    backfill are covered; user_version is only bumped once every existing
+    row has been filled, which is what switches reads to the integer path.
+    """
+
+    def __init__(self, db_manager, batch_size: int = 5000, pause: float = 0.0):
+        self.db_manager = db_manager
+        self.batch_size = max(int(batch_size), 1)
+        self.pause = pause
+
+    def prepare(self, conn):
+        for sql in OBSOLETE:
+            conn.execute(sql)
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            for table, column in OBSOLETE_COLUMNS:
+                if column in table_columns(conn, table):
+                    conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        for table, column, declared in COLUMNS:
+            if column not in table_columns(conn, table):
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declared}")
+        for sql in INDEXES + TRIGGERS:
+            conn.execute(sql)
+        conn.commit()
+
+    def backfill_sessions(self, conn) -> int:
+        filled = 0
+        while True:
+            rowids = [row[0] for row in conn.execute(
+                "SELECT rowid FROM web_chat_sessions WHERE session_key IS NULL ORDER BY rowid LIMIT ?",
+                (self.batch_size,)
+            ).fetchall()]
+            if not rowids:
+                break
+            next_key = conn.execute("SELECT COALESCE(MAX(session_key), 0) + 1 FROM web_chat_sessions").fetchone()[0]
+            conn.executemany(
+                "UPDATE web_chat_sessions SET session_key = ? WHERE rowid = ?",
+                [(next_key + offset, rowid) for offset, rowid in enumerate(rowids)]
+            )
+            conn.commit()
+            filled += len(rowids)
+            self._yield()
+        return filled
+
+    def backfill_children(self, conn, table: str) -> int:
+        bounds = conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+        if bounds[0] is None:
+            return 0
+        filled = 0
+        low = bounds[0] - 1
+        while low < bounds[1]:
+            high = low + self.batch_size
+            cursor = conn.execute(f"""
+                UPDATE {table} SET
+                    session_key = (SELECT s.session_key FROM web_chat_sessions s WHERE s.id = {table}.session_id),
+                    ts = {epoch_ms('timestamp')}
+                WHERE id > ? AND id <= ? AND (ts IS NULL OR session_key IS NULL)
+            """, (low, high))
+            conn.commit()
+            filled += max(cursor.rowcount, 0)
+            low = high
+            self._yield()
+        return filled
+
+    def _yield(self):
+        if self.pause:
+            time.sleep(self.pause)
+
+    def run(self) -> Dict:
+        started = time.perf_counter()
+        conn = self.db_manager.get_connection()
+        try:
+            if not can_migrate(conn):
+                return {'migrated': False, 'reason': 'unsupported schema'}
+            self.prepare(conn)
+            result = {
+                'sessions': self.backfill_sessions(conn),
+                'messages': self.backfill_children(conn, 'web_chat_messages'),
+                'responses': self.backfill_children(conn, 'web_chat_responses')
+            }
+            conn.execute(f"PRAGMA user_version = {STORAGE_FORMAT_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+        set_storage_version(self.db_manager.db_path, STORAGE_FORMAT_VERSION)
+        result['migrated'] = True
+        result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+
+def storage_status(conn) -> Dict:
+    """Current format version and rows still waiting for integer columns"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    status = {'version': version, 'target_version': STORAGE_FORMAT_VERSION, 'pending': {}}
+    for table in ('web_chat_sessions',) + CHILD_TABLES:
+        columns = table_columns(conn, table)
+        if 'session_key' not in columns:
+            status['pending'][table] = None
+            continue
+        status['pending'][table] = conn.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE session_key IS NULL"
+        ).fetchone()[0]
+    return status
@@ -0,0 +1,198 @@
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+TENANT_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS tenants (
+        id TEXT PRIMARY KEY,
+        api_key TEXT UNIQUE NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    )"""
+]
+
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+# Directory next to the global database that holds one file per tenant
+TENANT_DIRECTORY = 'tenants'
+
+
+class TenantError(ValueError):
+    """Invalid tenant id or key"""
+    pass
+
+
+def validate_tenant_id(tenant_id: str) -> str:
+    if not isinstance(tenant_id, str) or not TENANT_ID_PATTERN.match(tenant_id):
+        raise TenantError('Tenant id must be 1-64 lowercase letters, digits, _ or -, starting with a letter or digit')
+    return tenant_id
+
+
+def tenant_db_path(base_path: str, tenant_id: str) -> str:
+    """The database file of a tenant, in a directory next to the global database"""
+    return os.path.join(os.path.dirname(base_path), TENANT_DIRECTORY, f'{validate_tenant_id(tenant_id)}.db')
+
+
+def request_db_path(default: str = 'web_chat_bridge.db') -> str:
+    """Database of the current request: the tenant's file in tenant mode, else DATABASE_PATH"""
+    from flask import current_app, g, has_app_context
+    if has_app_context() and g.get('db_path'):
+        return g.db_path
+    return current_app.config.get('DATABASE_PATH', default)
+
+
+class TenantRegistry:
+    """Tenant ids and API keys, stored in the global database
+
+    Lookups use an in-process snapshot of the table, refreshed every
+    ``ttl`` seconds and after local changes, so routing a request costs a
+    dict lookup. Tenants added by another process are seen after ``ttl``.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 30):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._by_id: Dict[str, Dict] = {}
+        self._by_key: Dict[str, Dict] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        for sql in TENANT_SCHEMA:
+            conn.execute(sql)
+        return conn
+
+    def _snapshot(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            conn = self._connect()
+            try:
+                rows = [dict(row) for row in conn.execute("SELECT id, api_key, created_at FROM tenants").fetchall()]
+            finally:
+                conn.close()
+            self._by_id = {row['id']: row for row in rows}
+            self._by_key = {row['api_key']: row for row in rows}
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def get(self, tenant_id: str) -> Optional[Dict]:
+        self._snapshot()
+        return self._by_id.get(tenant_id)
+
+    def by_key(self, api_key: str) -> Optional[Dict]:
+        self._snapshot()
+        return self._by_key.get(api_key)
+
+    def list(self) -> List[Dict]:
+        self._snapshot()
+        return sorted(self._by_id.values(), key=lambda tenant: tenant['id'])
+
+    def save(self, tenant_id: str, api_key: Optional[str] = None) -> Dict:
+        """Register a tenant or rotate its key; returns the stored row"""
+        validate_tenant_id(tenant_id)
+        api_key = api_key or secrets.token_urlsafe(24)
+        if len(api_key) < 8 or not api_key.isprintable():
+            raise TenantError('API key must be at least 8 printable characters')
+        conn = self._connect()
+        try:
+            try:
+                conn.execute("""
+                    INSERT INTO tenants (id, api_key) VALUES (?, ?)
+                    ON CONFLICT(id) DO UPDATE SET api_key = excluded.api_key
+                """, (tenant_id, api_key))
+                conn.commit()
+            except sqlite3.IntegrityError:
+                raise TenantError('API key is already used by another tenant')
+            row = dict(conn.execute("SELECT id, api_key, created_at FROM tenants WHERE id = ?", (tenant_id,)).fetchone())
+        finally:
+            conn.close()
+        self.invalidate()
+        return row
+
+    def remove(self, tenant_id: str) -> bool:
+        conn = self._connect()
+        try:
+            deleted = conn.execute("DELETE FROM tenants WHERE id = ?", (tenant_id,)).rowcount > 0
+            conn.commit()
+        finally:
+            conn.close()
+        self.invalidate()
+        return deleted
+
+
+_registries: Dict[str, TenantRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(db_path: str, ttl: float = 30) -> TenantRegistry:
+    """The process-wide tenant registry kept in a global database"""
+    with _registries_lock:
+        registry = _registries.get(db_path)
+        if registry is None:
+            registry = TenantRegistry(db_path, ttl)
+            _registries[db_path] = registry
+        return registry
+
+
+def reset_tenants(db_path: str):
+    with _registries_lock:
+        registry = _registries.get(db_path)
+    if registry is not None:
+        registry.invalidate()
+
+
+# Tenant databases whose background jobs this process has started
+_started: Set[str] = set()
+_started_lock = threading.Lock()
+
+
+def start_tenant_jobs(db_path: str, retention_interval: float = 0, backup_interval: float = 0):
+    """Start a tenant database's retention runs and backups once per process
+
+    Called for every request routed to the tenant, so after the first
+    call this is a set lookup. The change log triggers of the tenant's
+    files are brought in line with the feed setting at the same time.
+    """
+    if db_path in _started:
+        return
+    with _started_lock:
+        if db_path in _started:
+            return
+        _started.add(db_path)
+
+    # Imported here: these modules import the database module, which imports this one
+    from app.utils.backup import start_backup_scheduler
+    from app.utils.database import DatabaseManager, change_feed_enabled
+    from app.utils.retention import start_retention_scheduler
+    from app.utils.sharding import shard_paths
+
+    enabled = change_feed_enabled()
+    for path in shard_paths(db_path):
+        if enabled or os.path.exists(path):
+            DatabaseManager(path).sync_change_feed()
+        if retention_interval > 0:
+            start_retention_scheduler(path, retention_interval)
+    if backup_interval > 0:
+        start_backup_scheduler(db_path, backup_interval)
+
+
+def stop_tenant_jobs(db_path: str):
+    """Stop a removed tenant's retention runs and backups"""
+    from app.utils.backup import get_backup_scheduler
+    from app.utils.retention import get_retention_scheduler
+    from app.utils.sharding import shard_paths
+
+    with _started_lock:
+        _started.discard(db_path)
+    for path in shard_paths(db_path):
+        get_retention_scheduler(path).stop()
+    get_backup_scheduler(db_path).stop()
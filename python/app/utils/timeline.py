@@ -0,0 +1,100 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.utils.archive import unified_source
+
+# Kind -> (table, body column, order among rows with the same timestamp)
+TIMELINE_SOURCES = {
+    'message': ('web_chat_messages', 'message', 0),
+    'response': ('web_chat_responses', 'response', 1)
+}
+
+
+class TimelineError(ValueError):
+    """Raised for an invalid timeline cursor"""
+    pass
+
+
+def encode_cursor(row) -> str:
+    return f"{row['sort_key']}|{row['kind']}|{row['id']}"
+
+
+def decode_cursor(cursor: str, integer_keys: bool) -> Tuple:
+    try:
+        key, kind, row_id = cursor.rsplit('|', 2)
+        return (int(key) if integer_keys else key), int(kind), int(row_id)
+    except ValueError:
+        raise TimelineError('Invalid cursor')
+
+
+def after_cursor(order: int, key_column: str, cursor: Optional[Tuple]) -> Tuple[str, List]:
+    """Condition selecting rows of one kind that sort after the cursor
+
+    Each arm of the union gets a plain range on (key, id), which its
+    (session, key) index can satisfy, instead of one row-value
+    comparison over the merged result.
+    """
+    if cursor is None:
+        return '', []
+    key, kind, row_id = cursor
+    if order > kind:
+        return f" AND {key_column} >= ?", [key]
+    if order < kind:
+        return f" AND {key_column} > ?", [key]
+    return f" AND ({key_column}, id) > (?, ?)", [key, row_id]
+
+
+def timeline_page(conn, session_id: str, limit: int, cursor: Optional[str] = None,
+                  integer_keys: bool = False, archived: bool = False,
+                  decode: Optional[Callable] = None) -> Dict:
+    """One page of a session's messages and responses merged in time order
+
+    Rows are ordered by (timestamp, kind, id) with messages before
+    responses stamped in the same instant. ``integer_keys`` sorts and
+    filters on the integer session_key and ts columns; otherwise (and
+    when ``archived`` rows are merged in) on session_id and timestamp.
+    """
+    position = decode_cursor(cursor, integer_keys) if cursor else None
+    arms = []
+    params: List = []
+    for kind, (table, column, order) in TIMELINE_SOURCES.items():
+        message_id = 'message_id' if kind == 'response' else 'NULL'
+        if integer_keys:
+            source = table
+            where = "session_key = (SELECT session_key FROM web_chat_sessions WHERE id = ?)"
+            key_column = 'ts'
+        else:
+            extra = ', message_id' if kind == 'response' else ''
+            source = unified_source(table, f"id, session_id, timestamp, {column}{extra}", archived)
+            where = "session_id = ?"
+            key_column = 'timestamp'
+        condition, condition_params = after_cursor(order, key_column, position)
+        arms.append(f"""
+            SELECT {order} AS kind, id, timestamp, {key_column} AS sort_key, {column} AS body, {message_id} AS message_id
+            FROM {source} WHERE {where}{condition}
+        """)
+        params.extend([session_id] + condition_params)
+    params.append(int(limit) + 1)
+
+    rows = conn.execute(
+        f"{' UNION ALL '.join(arms)} ORDER BY sort_key, kind, id LIMIT ?", params
+    ).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    kinds = {order: kind for kind, (_, _, order) in TIMELINE_SOURCES.items()}
+    items = []
+    for row in rows:
+        item = {
+            'type': kinds[row['kind']],
+            'id': row['id'],
+            'content': decode(row['body']) if decode else row['body'],
+            'timestamp': row['timestamp']
+        }
+        if item['type'] == 'response':
+            item['message_id'] = row['message_id']
+        items.append(item)
+    return {
+        'items': items,
+        'next_cursor': encode_cursor(rows[-1]) if has_more and rows else None,
+        'has_more': has_more
+    }
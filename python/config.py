@@ -20,6 +20,191 @@ class Config:
     MAX_SESSION_ID_LENGTH = 64
     MIN_MESSAGE_LENGTH = 1
     
+    # Write-behind buffering of session last_active updates (seconds).
+    # The default of 0 writes every activity update straight through; a
+    # positive interval delays last_active by up to that long per process and
+    # loses buffered activity if the process crashes.
+    ACTIVITY_FLUSH_INTERVAL = 0
+    ACTIVITY_MAX_STALENESS = 60
+    
+    # In-process session directory (LRU of session_id -> uid, 0 disables).
+    # Only enable the authoritative mode when a single process owns all
+    # session writes; it lets Bloom filter misses skip the database.
+    SESSION_DIRECTORY_SIZE = 10000
+    SESSION_BLOOM_CAPACITY = 100000
+    SESSION_BLOOM_ERROR_RATE = 0.01
+    SESSION_DIRECTORY_AUTHORITATIVE = False
+    
+    # Read-only connection pool for admin and reporting queries (0 disables).
+    # DATABASE_JOURNAL_MODE = 'WAL' switches the database file to WAL on
+    # first use, so those reads run against a snapshot without blocking
+    # writers. The change is persistent and affects every program sharing
+    # the file (the PHP bridge, backup tools that copy only the .db file,
+    # network filesystems without shared memory), so the default (None)
+    # leaves the journal mode as it is; the pool works in either mode.
+    READ_POOL_SIZE = 4
+    DATABASE_JOURNAL_MODE = None
+    
+    # Retention: TTLs in seconds (0 keeps rows forever). Expired rows are
+    # deleted RETENTION_BATCH_SIZE at a time by a background scheduler that
+    # runs every RETENTION_INTERVAL seconds (0, the default, disables it).
+    # Only bookkeeping rows (rate_limits, idempotency keys, change_log)
+    # expire by default. Deleting conversations is opt-in: sessions idle for
+    # RETENTION_SESSION_TTL are removed, and only with RETENTION_CASCADE do
+    # their messages and responses (and orphaned ones) go with them. The
+    # same cascade setting applies to the admin cleanup of sessions idle
+    # for SESSION_TIMEOUT.
+    SESSION_TIMEOUT = 1800
+    RETENTION_SESSION_TTL = 0
+    RETENTION_CASCADE = False
+    RETENTION_MESSAGE_TTL = 0
+    RETENTION_RESPONSE_TTL = 0
+    RETENTION_RATE_LIMIT_TTL = 3600
+    RETENTION_INTERVAL = 0
+    RETENTION_BATCH_SIZE = 500
+    RETENTION_BATCH_PAUSE = 0.05
+    RETENTION_VACUUM_PAGES = 1000
+    
+    # Online backups with the SQLite backup API: every BACKUP_INTERVAL
+    # seconds (0 disables the scheduler) the database and its shard files
+    # are copied BACKUP_PAGES_PER_STEP pages at a time, pausing
+    # BACKUP_STEP_PAUSE seconds between steps, into BACKUP_DIR (default:
+    # backups/ next to the database). The newest BACKUP_KEEP copies of each
+    # file are kept. POST /admin/api/backup runs one now. The scheduler
+    # runs in every process that creates the app, so with several workers
+    # enable it in one of them only.
+    BACKUP_INTERVAL = 0
+    BACKUP_DIR = os.environ.get('BACKUP_DIR') or ''
+    BACKUP_PAGES_PER_STEP = 100
+    BACKUP_STEP_PAUSE = 0.01
+    BACKUP_KEEP = 7
+    
+    # Hot/cold archive: processed messages and responses older than these
+    # ages (seconds, 0 disables) are moved into ARCHIVE_DATABASE_PATH
+    # (default: <database>_archive.db) on each retention run. In tenant
+    # mode every database uses the default, so ARCHIVE_DATABASE_PATH must
+    # be left empty.
+    ARCHIVE_DATABASE_PATH = ''
+    ARCHIVE_MESSAGE_AGE = 0
+    ARCHIVE_RESPONSE_AGE = 0
+    
+    # Transparent compression of message/response bodies of at least
+    # COMPRESSION_THRESHOLD bytes (0 disables). Compressed rows are BLOBs the
+    # PHP bridge cannot read, so only enable it once Python serves all reads.
+    # COMPRESSION_ALGORITHM is 'zlib' or 'zstd' (needs the zstandard package);
+    # COMPRESSION_DICTIONARY_PATH optionally points at a trained dictionary.
+    COMPRESSION_ALGORITHM = 'zlib'
+    COMPRESSION_THRESHOLD = 0
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_DICTIONARY_PATH = ''
+    
+    # FTS5 index over message and response bodies behind /admin/api/search,
+    # kept in sync by triggers. Archived and purged rows leave the index.
+    # Off by default, since every insert then also writes the index. Once
+    # enabled, the index is built in the background at startup (or with
+    # POST /admin/api/search_index), SEARCH_INDEX_BATCH_SIZE rows per
+    # transaction.
+    SEARCH_INDEX_ENABLED = False
+    SEARCH_INDEX_BATCH_SIZE = 5000
+    
+    # ?action=inbox scheduling: 'fifo' (oldest first, as the PHP bridge) or
+    # 'fair' (round-robin across sessions). The cap limits messages per
+    # session per page in fair mode (0 = no cap). Both can be overridden
+    # per request with ?mode= and ?per_session=.
+    INBOX_MODE = 'fifo'
+    INBOX_SESSION_CAP = 0
+    
+    # Seconds after its last inbox poll before a consumer-group member is
+    # considered gone and its sessions are handed to the other members
+    CONSUMER_TTL = 30
+    
+    # Items per page of /admin/api/session_timeline (default and cap)
+    TIMELINE_PAGE_SIZE = 100
+    TIMELINE_MAX_PAGE_SIZE = 500
+    
+    # Rows fetched per round trip by /admin/api/export (NDJSON and columnar)
+    EXPORT_CHUNK_SIZE = 1000
+    COLUMNAR_CHUNK_SIZE = 50000
+    
+    # Ids processed per transaction when catching up stats_hourly rollups
+    ROLLUP_BATCH_SIZE = 50000
+    
+    # Seconds an Idempotency-Key (or client_msg_id) is remembered for
+    # ?action=messages and ?action=outbox retries
+    IDEMPOTENCY_TTL = 24 * 3600
+    # Minimum seconds between opportunistic purges of expired keys on the write path
+    IDEMPOTENCY_PURGE_INTERVAL = 60
+    
+    # ?action=changes: every write is recorded in change_log by triggers,
+    # so the feed is off unless enabled here; a primary with
+    # REPLICATION_KEY set records changes for its replicas regardless.
+    # Events per page (default and cap) and how long change_log entries
+    # are kept, in seconds (0 keeps them forever)
+    CHANGE_FEED_ENABLED = False
+    CHANGE_FEED_PAGE_SIZE = 100
+    CHANGE_FEED_MAX_PAGE_SIZE = 1000
+    CHANGE_LOG_TTL = 7 * 24 * 3600
+    
+    # Read replica mode: when REPLICA_OF is the primary's base URL, this node
+    # applies the primary's ?action=changes feed to its own database, serves
+    # ?action=responses and admin reads locally and forwards writes. Requests
+    # carrying REPLICATION_KEY (set on both sides) are trusted for their
+    # X-Forwarded-For client address.
+    REPLICA_OF = os.environ.get('REPLICA_OF') or ''
+    REPLICA_API_KEY = os.environ.get('REPLICA_API_KEY') or DEFAULT_API_KEY
+    REPLICATION_KEY = os.environ.get('REPLICATION_KEY') or ''
+    REPLICA_POLL_INTERVAL = 1.0
+    REPLICA_BATCH_SIZE = 500
+    REPLICA_FORWARD_TIMEOUT = 10
+    
+    # Tenant mode: each tenant registered with POST /admin/api/tenants has
+    # its own database file under tenants/ next to DATABASE_PATH, chosen by
+    # the request's API key (or ?tenant= / X-Tenant-Id for the admin API).
+    # Keys that match no tenant use the global database. The tenant list is
+    # cached for TENANT_CACHE_TTL seconds. Not available on a replica
+    # (REPLICA_OF), which follows the primary's global database only.
+    TENANT_MODE = False
+    TENANT_CACHE_TTL = 30
+    
+    # Sharded storage: with STORAGE_SHARDS > 1 (up to 64), sessions and
+    # their messages and responses are spread over that many files by a hash
+    # of session_id. DATABASE_PATH is shard 0; the others are
+    # <name>.shard<N>.db next to it. Calls about one session use one file;
+    # the inbox and session lists merge all shards. Choose the count before
+    # storing data, since changing it moves sessions to other files. Search,
+    # exports, analytics and the change feed cover shard 0 only, so
+    # sharding cannot be combined with replication.
+    STORAGE_SHARDS = 1
+    
+    # Storage engine for sessions, messages and responses: 'sqlite' or
+    # 'memory'. The memory engine keeps everything in process (one worker
+    # process only), appends each change to <name>.aof next to
+    # DATABASE_PATH and every MEMORY_SNAPSHOT_INTERVAL seconds writes
+    # <name>.snapshot.json and starts a new log; on start it loads the
+    # snapshot and replays the log. SQLite-only features (search, exports,
+    # analytics, archive, the change feed) are unavailable with it.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'sqlite'
+    MEMORY_PERSISTENCE = True
+    MEMORY_SNAPSHOT_INTERVAL = 60
+    
+    # Rows backfilled per transaction when migrating to integer session keys
+    # and epoch-millisecond timestamps (POST /admin/api/storage_format). The
+    # migration is opt-in: the text session_id and timestamp columns stay
+    # for the PHP bridge, so it adds columns rather than replacing them.
+    STORAGE_MIGRATION_BATCH_SIZE = 5000
+    
+    # Longest range /admin/api/analytics accepts, in hours
+    ANALYTICS_MAX_HOURS = 24 * 31
+    
+    # ASGI serving (asgi.py, e.g. uvicorn asgi:app): request handlers run on
+    # ASGI_WORKER_THREADS threads while connections wait on the event loop.
+    # Request bodies over ASGI_MAX_BODY_SIZE bytes are refused with a 413.
+    ASGI_WORKER_THREADS = 32
+    ASGI_MAX_BODY_SIZE = 16 * 1024 * 1024
+    
+    # Minimum seconds between opportunistic rate_limits purges on the request path
+    RATE_LIMIT_PURGE_INTERVAL = 60
+    
     # Endpoint rate limits (can be overridden via database)
     ENDPOINT_RATE_LIMITS = {
         '/api/messages': 50,
@@ -13,6 +13,17 @@ from flask import Flask
 from app import create_app
 from app.utils.database import DatabaseManager
 from app.utils.rate_limiting import RateLimitManager
+from app.utils.connection_pool import close_all_pools
+from app.utils.archive import default_archive_path
+
+def remove_sidecar_files(db_path):
+    """Remove WAL, shared-memory and archive files left next to a test database"""
+    archive_path = default_archive_path(db_path)
+    for path in (db_path + '-wal', db_path + '-shm', archive_path, archive_path + '-wal', archive_path + '-shm'):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 @pytest.fixture(scope="session")
 def test_config():
@@ -54,6 +65,11 @@ def test_db():
     """Create test database with sample data"""
     db_path = 'test_web_chat_bridge.db'
     
+    # Pooled read connections must be closed before the file is replaced,
+    # and stale WAL sidecar files must not be applied to the new database
+    close_all_pools()
+    remove_sidecar_files(db_path)
+    
     # Clean up any existing test database with retry logic for Windows
     if os.path.exists(db_path):
         for attempt in range(3):
@@ -130,6 +146,8 @@ def test_db():
     import time
     time.sleep(0.5)  # Longer delay to ensure SQLite connections are fully closed
     
+    close_all_pools()
+    
     # Try to remove the file multiple times with increasing delays
     for attempt in range(3):
         try:
@@ -145,6 +163,7 @@ def test_db():
         except OSError:
             # Other OS errors, that's okay for tests
             pass
+    remove_sidecar_files(db_path)
 
 @pytest.fixture(scope="function")
 def db_manager(test_db):
@@ -132,6 +132,26 @@ class TestAdminIntegration:
         assert 'messages' in data['data']['cleaned_data']
         assert 'responses' in data['data']['cleaned_data']
     
+    def test_admin_clear_all_data_swap(self, client, auth_headers, app_context):
+        """Test fast clear_data by database file swap"""
+        client.post('/api/v1/', query_string={'action': 'messages'},
+                    json={'session_id': 'session_swap_test', 'message': 'Hello'})
+        
+        response = client.post('/admin/api/clear_data?mode=swap', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['success'] is True
+        assert data['data']['mode'] == 'swap'
+        assert data['data']['cleaned_data']['messages'] >= 1
+        
+        response = client.get('/admin/api/session_messages?session_id=session_swap_test',
+                              headers=auth_headers['admin_key'])
+        assert response.status_code == 404
+        
+        # Config rows survive the swap
+        response = client.get('/admin/api/config', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+    
     def test_admin_cleanup_logs(self, client, auth_headers, app_context):
         """Test admin cleanup logs"""
         response = client.post('/admin/api/cleanup_logs', headers=auth_headers['admin_key'])
@@ -144,6 +164,263 @@ class TestAdminIntegration:
         assert 'retention_days' in data['data']
         assert 'max_size_mb' in data['data']
     
+    def test_admin_stats(self, client, auth_headers, app_context):
+        """Test admin runtime stats expose session directory metrics"""
+        client.post('/api/v1/', query_string={'action': 'messages'},
+                    json={'session_id': 'session_stats_test', 'message': 'Hello'})
+        client.get('/api/v1/', query_string={'action': 'responses', 'session_id': 'session_stats_test'})
+        
+        response = client.get('/admin/api/stats', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['success'] is True
+        assert data['data']['session_directory']['hits'] >= 1
+        assert data['data']['activity_buffer'] == {'enabled': False}
+    
+    def test_admin_retention_run(self, client, auth_headers, app_context):
+        """Test triggering a retention run and reading its timings"""
+        response = client.post('/admin/api/retention?wait=true', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['success'] is True
+        assert data['data']['last_run'] is not None
+        assert data['data']['running'] is False
+        assert any(p['name'] == 'expired_rate_limits' for p in data['data']['policies'])
+        assert not any(p['table'] == 'web_chat_messages' for p in data['data']['policies'])
+        
+        response = client.get('/admin/api/retention', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        assert response.get_json()['data']['runs'] >= 1
+    
+    def test_admin_archive_run(self, client, auth_headers, app_context):
+        """Test archived rows stay visible in the admin session view"""
+        from unittest.mock import patch
+        from config import Config
+        
+        client.post('/api/v1/', query_string={'action': 'messages'},
+                    json={'session_id': 'session_archive_test', 'message': 'Old message'})
+        
+        with patch.object(Config, 'ARCHIVE_RESPONSE_AGE', 0), patch.object(Config, 'ARCHIVE_MESSAGE_AGE', 1):
+            from app.utils.database import DatabaseManager
+            db = DatabaseManager(app_context.config['DATABASE_PATH'])
+            conn = db.get_connection()
+            conn.execute("UPDATE web_chat_messages SET processed = 1, timestamp = datetime('now', '-1 hour') "
+                         "WHERE session_id = 'session_archive_test'")
+            conn.commit()
+            conn.close()
+            
+            response = client.post('/admin/api/archive', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['exists'] is True
+        assert data['results'][0]['moved'] >= 1
+        
+        response = client.get('/admin/api/session_messages?session_id=session_archive_test',
+                              headers=auth_headers['admin_key'])
+        messages = response.get_json()['data']['messages']
+        assert [m['message'] for m in messages] == ['Old message']
+    
+    def test_admin_search(self, client, auth_headers, app_context):
+        """Test searching transcripts by keyword once the index is built"""
+        from unittest.mock import patch
+        from config import Config
+        
+        client.post('/api/v1/', query_string={'action': 'messages'},
+                    json={'session_id': 'session_search_test', 'message': 'Where is my parcel?'})
+        
+        response = client.get('/admin/api/search?q=parcel', headers=auth_headers['admin_key'])
+        assert response.status_code == 503
+        response = client.post('/admin/api/search_index?wait=true', headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+        
+        with patch.object(Config, 'SEARCH_INDEX_ENABLED', True):
+            response = client.post('/admin/api/search_index?wait=true', headers=auth_headers['admin_key'])
+            assert response.status_code == 200
+            data = response.get_json()['data']
+            assert data['ready'] is True
+            assert data['last_run']['indexed'] >= 1
+            response = client.get('/admin/api/search?q=parcel', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['results'][0]['session_id'] == 'session_search_test'
+        assert '[parcel]' in data['results'][0]['snippet']
+        
+        with patch.object(Config, 'SEARCH_INDEX_ENABLED', True):
+            response = client.get('/admin/api/search', headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_export_ndjson(self, client, auth_headers, app_context):
+        """Test exporting messages as NDJSON, plain and gzipped"""
+        import gzip
+        client.post('/api/v1/', query_string={'action': 'messages'},
+                    json={'session_id': 'session_export_test', 'message': 'Export me'})
+        
+        response = client.get('/admin/api/export?tables=messages', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        rows = [json.loads(line) for line in response.get_data().splitlines()]
+        assert any(row['message'] == 'Export me' for row in rows)
+        assert all(row['table'] == 'messages' for row in rows)
+        
+        response = client.get('/admin/api/export?tables=messages&gzip=true', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        assert b'Export me' in gzip.decompress(response.get_data())
+        
+        response = client.get('/admin/api/export?tables=nope', headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_export_columnar(self, client, auth_headers, app_context):
+        """Test columnar exports are sent as files"""
+        response = client.get('/admin/api/export?format=npz', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        assert json.loads(response.headers['X-Export-Rows']) == {'messages': 0, 'responses': 0}
+        response.close()
+        
+        response = client.get('/admin/api/export?format=npz&tables=sessions', headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_analytics(self, client, auth_headers, app_context):
+        """Test the analytics endpoint and its range validation"""
+        response = client.get('/admin/api/analytics', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert len(data['hourly']) in (24, 25)
+        assert 'p90' in data['latency_seconds']
+        assert 'duration_histogram' in data['sessions']
+        
+        response = client.get('/admin/api/analytics?from=2024-02-01T00:00:00&to=2024-01-01T00:00:00',
+                              headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_rollups(self, client, auth_headers, app_context):
+        """Test hourly rollups are caught up when read"""
+        client.post('/api/v1/', query_string={'action': 'messages'},
+                    json={'session_id': 'session_rollup_test', 'message': 'Count me'})
+        
+        response = client.get('/admin/api/rollups?metrics=messages', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['totals']['messages'] >= 1
+        assert all(row['metric'] == 'messages' for row in data['rows'])
+    
+    def test_admin_storage_format(self, client, auth_headers, app_context):
+        """Test the storage format status and an opt-in migration"""
+        response = client.get('/admin/api/storage_format', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['version'] < data['target_version']
+        
+        response = client.post('/admin/api/storage_format', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['results']['migrated'] is True
+        assert data['version'] == data['target_version']
+        assert data['pending'] == {'web_chat_sessions': 0, 'web_chat_messages': 0, 'web_chat_responses': 0}
+    
+    def test_admin_sessions_metadata_filter(self, client, auth_headers, app_context):
+        """Test filtering sessions by an indexed metadata key"""
+        response = client.post('/admin/api/config', json={'session_metadata_columns': 'site'},
+                               headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        
+        response = client.get('/admin/api/sessions?meta.site=nowhere', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['sessions'] == []
+        assert data['pagination']['total'] == 0
+        
+        response = client.get('/admin/api/sessions?meta.bad%20key=x', headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+        
+        response = client.post('/admin/api/config', json={'session_metadata_columns': 'bad-key'},
+                               headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_session_timeline(self, client, auth_headers, app_context):
+        """Test paging through a session's merged timeline"""
+        for text in ('one', 'two', 'three'):
+            client.post('/api/v1/', query_string={'action': 'messages'},
+                        json={'session_id': 'session_timeline_test', 'message': text})
+        
+        response = client.get('/admin/api/session_timeline?session_id=session_timeline_test&limit=2',
+                              headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert [item['content'] for item in data['items']] == ['one', 'two']
+        assert data['has_more'] is True
+        
+        response = client.get('/admin/api/session_timeline',
+                              query_string={'session_id': 'session_timeline_test', 'cursor': data['next_cursor']},
+                              headers=auth_headers['admin_key'])
+        assert [item['content'] for item in response.get_json()['data']['items']] == ['three']
+        
+        response = client.get('/admin/api/session_timeline?session_id=session_missing',
+                              headers=auth_headers['admin_key'])
+        assert response.status_code == 404
+        response = client.get('/admin/api/session_timeline?session_id=session_timeline_test&cursor=bad',
+                              headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_consumer_groups(self, client, auth_headers, app_context):
+        """Test listing the live members of inbox consumer groups"""
+        client.get('/api/v1/', query_string={'action': 'inbox', 'group': 'agents', 'consumer': 'worker-1'},
+                   headers=auth_headers['api_key'])
+        
+        response = client.get('/admin/api/consumer_groups', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert [member['consumer'] for member in data['groups']['agents']] == ['worker-1']
+        assert data['ttl'] > 0
+    
+    def test_admin_replication_status(self, client, auth_headers, app_context):
+        """Test the replication status of a primary"""
+        from unittest.mock import patch
+        from config import Config
+        
+        response = client.get('/admin/api/replication', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        assert response.get_json()['data']['last_seq'] is None
+        
+        with patch.object(Config, 'REPLICATION_KEY', 'test_replication_key'):
+            response = client.get('/admin/api/replication', headers=auth_headers['admin_key'])
+            assert response.get_json()['data']['last_seq'] == 0
+            client.post('/api/v1/', query_string={'action': 'messages'},
+                        json={'session_id': 'session_replication_test', 'message': 'hello'})
+            
+            response = client.get('/admin/api/replication', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['role'] == 'primary'
+        assert data['last_seq'] >= 2
+        assert data['follower'] is None
+    
+    def test_admin_tenants(self, client, auth_headers, app_context):
+        """Test listing tenants and rejecting invalid tenant ids"""
+        response = client.get('/admin/api/tenants', headers=auth_headers['admin_key'])
+        assert response.status_code == 200
+        data = response.get_json()['data']
+        assert data['tenant_mode'] is False
+        assert data['tenants'] == []
+        
+        response = client.post('/admin/api/tenants', json={'tenant_id': '../escape'}, headers=auth_headers['admin_key'])
+        assert response.status_code == 400
+    
+    def test_admin_backup_run(self, client, auth_headers, app_context, tmp_path):
+        """Test triggering an online backup and listing the kept copies"""
+        from unittest.mock import patch
+        from config import Config
+        
+        with patch.object(Config, 'BACKUP_DIR', str(tmp_path)):
+            response = client.post('/admin/api/backup?wait=true', headers=auth_headers['admin_key'])
+            assert response.status_code == 200
+            data = response.get_json()['data']
+            assert data['last_run']['error'] is None
+            assert data['last_run']['files'][0]['duration_ms'] >= 0
+            assert len(data['backups']) == 1
+            
+            response = client.get('/admin/api/backup', headers=auth_headers['admin_key'])
+            assert response.get_json()['data']['runs'] >= 1
+    
     def test_admin_unauthorized_access(self, client, app_context):
         """Test admin endpoints without authentication"""
         # Test GET endpoints
@@ -6,7 +6,9 @@ Tests complete API workflows with real database interactions
 import pytest
 import json
 import time
+from unittest.mock import patch
 from app import create_app
+from config import Config
 
 class TestAPIIntegration:
     """Test complete API workflows"""
@@ -383,3 +385,107 @@ class TestAPIIntegration:
         data = json.loads(response.get_data(as_text=True))
         assert data['success'] is True
         assert len(data['data']['responses']) > 0
+    
+    def test_idempotent_retries(self, client, test_db):
+        """Test retried writes with the same key are stored once"""
+        message_data = {
+            'session_id': 'session_idempotent_test',
+            'message': 'Sent twice',
+            'client_msg_id': 'msg-1'
+        }
+        
+        first = client.post('/api/v1/', query_string={'action': 'messages'}, json=message_data)
+        retry = client.post('/api/v1/', query_string={'action': 'messages'}, json=message_data)
+        
+        assert first.status_code == 200
+        assert retry.status_code == 200
+        assert retry.headers.get('Idempotent-Replayed') == 'true'
+        assert retry.get_json()['data'] == first.get_json()['data']
+        assert retry.get_json()['data']['is_new_user'] is True
+        
+        headers = {'Authorization': 'Bearer test_api_key_123', 'Idempotency-Key': 'reply-1'}
+        response_data = {'session_id': 'session_idempotent_test', 'response': 'Only once'}
+        first = client.post('/api/v1/', query_string={'action': 'outbox'}, json=response_data, headers=headers)
+        retry = client.post('/api/v1/', query_string={'action': 'outbox'}, json=response_data, headers=headers)
+        assert retry.get_json()['data']['response_id'] == first.get_json()['data']['response_id']
+        
+        response = client.get('/api/v1/', query_string={'action': 'inbox'},
+                              headers={'Authorization': 'Bearer test_api_key_123'})
+        messages = [m for m in response.get_json()['data']['messages'] if m['session_id'] == 'session_idempotent_test']
+        assert len(messages) == 1
+        
+        response = client.get('/api/v1/', query_string={'action': 'responses', 'session_id': 'session_idempotent_test'})
+        assert len(response.get_json()['data']['responses']) == 1
+    
+    def test_fair_inbox(self, client, test_db):
+        """Test the inbox can be scheduled round-robin across sessions"""
+        for session_id, count in (('session_fair_chatty', 3), ('session_fair_quiet', 1)):
+            for n in range(count):
+                client.post('/api/v1/', query_string={'action': 'messages'},
+                            json={'session_id': session_id, 'message': f'{session_id} {n}'})
+        
+        headers = {'Authorization': 'Bearer test_api_key_123'}
+        response = client.get('/api/v1/', query_string={'action': 'inbox', 'mode': 'fair', 'per_session': 2},
+                              headers=headers)
+        assert response.status_code == 200
+        sessions = [m['session_id'] for m in response.get_json()['data']['messages']
+                    if m['session_id'].startswith('session_fair_')]
+        assert sessions == ['session_fair_chatty', 'session_fair_quiet', 'session_fair_chatty']
+        
+        response = client.get('/api/v1/', query_string={'action': 'inbox', 'mode': 'random'}, headers=headers)
+        assert response.status_code == 400
+    
+    def test_consumer_group_inbox(self, client, test_db):
+        """Test consumers in a group receive disjoint sessions"""
+        for n in range(6):
+            client.post('/api/v1/', query_string={'action': 'messages'},
+                        json={'session_id': f'session_group_{n}', 'message': f'hello {n}'})
+        
+        headers = {'Authorization': 'Bearer test_api_key_123'}
+        query = {'action': 'inbox', 'group': 'agents'}
+        client.get('/api/v1/', query_string=dict(query, consumer='a', limit=0), headers=headers)
+        client.get('/api/v1/', query_string=dict(query, consumer='b', limit=0), headers=headers)
+        
+        received = {}
+        for consumer in ('a', 'b'):
+            response = client.get('/api/v1/', query_string=dict(query, consumer=consumer), headers=headers)
+            assert response.status_code == 200
+            data = response.get_json()['data']
+            assert data['assignment'] == {'group': 'agents', 'consumer': consumer, 'members': 2}
+            received[consumer] = {m['session_id'] for m in data['messages']}
+        assert not received['a'] & received['b']
+        assert len(received['a'] | received['b']) == 6
+        
+        response = client.get('/api/v1/', query_string=dict(query, consumer='b', leave='1'), headers=headers)
+        assert response.get_json()['data'] == {'left': True}
+        
+        response = client.get('/api/v1/', query_string={'action': 'inbox', 'group': 'agents'}, headers=headers)
+        assert response.status_code == 400
+    
+    def test_change_feed(self, client, test_db):
+        """Test tailing the change log with after_seq"""
+        headers = {'Authorization': 'Bearer test_api_key_123'}
+        response = client.get('/api/v1/', query_string={'action': 'changes'}, headers=headers)
+        assert response.status_code == 503
+        
+        with patch.object(Config, 'CHANGE_FEED_ENABLED', True):
+            response = client.get('/api/v1/', query_string={'action': 'changes', 'entity': 'message'}, headers=headers)
+            assert response.status_code == 200
+            start = response.get_json()['data']['last_seq']
+            
+            client.post('/api/v1/', query_string={'action': 'messages'},
+                        json={'session_id': 'session_change_feed', 'message': 'tail me'})
+            
+            response = client.get('/api/v1/', query_string={'action': 'changes', 'after_seq': start, 'entity': 'message'},
+                                  headers=headers)
+            data = response.get_json()['data']
+            assert [(c['op'], c['row']['message']) for c in data['changes']] == [('insert', 'tail me')]
+            
+            response = client.get('/api/v1/', query_string={'action': 'changes', 'after_seq': data['last_seq']},
+                                  headers=headers)
+            assert response.get_json()['data']['changes'] == []
+            
+            response = client.get('/api/v1/', query_string={'action': 'changes', 'after_seq': 'x'}, headers=headers)
+            assert response.status_code == 400
+            response = client.get('/api/v1/', query_string={'action': 'changes'})
+            assert response.status_code == 401
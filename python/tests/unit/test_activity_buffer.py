@@ -0,0 +1,193 @@
+"""
+Unit tests for the write-behind session activity buffer
+"""
+
+import pytest
+import sqlite3
+import threading
+from datetime import datetime
+from unittest.mock import patch
+from app.utils.activity_buffer import ActivityBuffer, get_activity_buffer
+from app.utils.database import DatabaseManager
+from config import Config
+
+
+@pytest.fixture
+def sessions_db(tmp_path):
+    """Database with a couple of sessions and an old last_active"""
+    db_path = str(tmp_path / 'activity.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE web_chat_sessions (id TEXT PRIMARY KEY, uid TEXT, last_active TEXT)")
+    conn.executemany(
+        "INSERT INTO web_chat_sessions (id, uid, last_active) VALUES (?, ?, '2020-01-01 00:00:00')",
+        [('session_a', 'uid_a'), ('session_b', 'uid_b')]
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def read_last_active(db_path, session_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT last_active FROM web_chat_sessions WHERE id = ?", (session_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestActivityBuffer:
+    """Test ActivityBuffer coalescing and flushing"""
+
+    def test_record_does_not_write_until_flush(self, sessions_db):
+        """Test activity stays in memory until flushed"""
+        buffer = ActivityBuffer(sessions_db, flush_interval=3600, max_staleness=3600)
+        buffer.record('session_a', datetime(2025, 1, 1, 12, 0, 0))
+
+        assert buffer.pending_count() == 1
+        assert read_last_active(sessions_db, 'session_a') == '2020-01-01 00:00:00'
+
+        assert buffer.flush() == 1
+        assert buffer.pending_count() == 0
+        assert read_last_active(sessions_db, 'session_a') == '2025-01-01 12:00:00'
+        buffer.stop()
+
+    def test_coalesces_to_latest_timestamp(self, sessions_db):
+        """Test repeated activity for one session becomes a single row update"""
+        buffer = ActivityBuffer(sessions_db, flush_interval=3600, max_staleness=3600)
+        buffer.record('session_a', datetime(2025, 1, 1, 12, 0, 5))
+        buffer.record('session_a', datetime(2025, 1, 1, 12, 0, 1))
+        buffer.record('session_b', datetime(2025, 1, 1, 12, 0, 2))
+
+        assert buffer.pending_count() == 2
+        assert buffer.flush() == 2
+        assert buffer.flush_count == 1
+        assert read_last_active(sessions_db, 'session_a') == '2025-01-01 12:00:05'
+        assert read_last_active(sessions_db, 'session_b') == '2025-01-01 12:00:02'
+        buffer.stop()
+
+    def test_flush_never_moves_last_active_backwards(self, sessions_db):
+        """Test a newer direct write is not overwritten by buffered activity"""
+        conn = sqlite3.connect(sessions_db)
+        conn.execute("UPDATE web_chat_sessions SET last_active = '2030-01-01 00:00:00' WHERE id = 'session_a'")
+        conn.commit()
+        conn.close()
+
+        buffer = ActivityBuffer(sessions_db, flush_interval=3600, max_staleness=3600)
+        buffer.record('session_a', datetime(2025, 1, 1, 12, 0, 0))
+        buffer.flush()
+
+        assert read_last_active(sessions_db, 'session_a') == '2030-01-01 00:00:00'
+        buffer.stop()
+
+    def test_staleness_bound_forces_inline_flush(self, sessions_db):
+        """Test record flushes immediately once the staleness bound is reached"""
+        buffer = ActivityBuffer(sessions_db, flush_interval=3600, max_staleness=0)
+        buffer.record('session_a', datetime(2025, 1, 1, 12, 0, 0))
+
+        assert buffer.pending_count() == 0
+        assert read_last_active(sessions_db, 'session_a') == '2025-01-01 12:00:00'
+        buffer.stop()
+
+    def test_failed_flush_requeues_entries(self, tmp_path):
+        """Test entries survive a failed flush"""
+        buffer = ActivityBuffer(str(tmp_path / 'missing.db'), flush_interval=3600, max_staleness=3600)
+        buffer.record('session_a', datetime(2025, 1, 1, 12, 0, 0))
+
+        with pytest.raises(sqlite3.OperationalError):
+            buffer.flush()
+
+        assert buffer.pending_count() == 1
+        buffer.discard()
+        buffer.stop()
+
+    def test_discard_specific_sessions(self, sessions_db):
+        """Test discarding pending activity for selected sessions"""
+        buffer = ActivityBuffer(sessions_db, flush_interval=3600, max_staleness=3600)
+        buffer.record('session_a')
+        buffer.record('session_b')
+        buffer.discard(['session_a'])
+
+        assert buffer.pending_count() == 1
+        buffer.stop()
+
+    def test_concurrent_flush_counters(self, sessions_db):
+        """Test counters add up when the flusher and request-path flushes overlap"""
+        buffer = ActivityBuffer(sessions_db, flush_interval=3600, max_staleness=3600)
+        written = []
+
+        def work():
+            for n in range(50):
+                buffer.record('session_a' if n % 2 else 'session_b')
+                written.append(buffer.flush())
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = buffer.stats()
+        assert stats['rows_written'] == sum(written)
+        assert stats['flushes'] == sum(1 for rows in written if rows)
+        buffer.stop()
+
+    def test_get_activity_buffer_is_shared_per_path(self, sessions_db):
+        """Test the registry returns one buffer per database path"""
+        first = get_activity_buffer(sessions_db, 30, 60)
+        second = get_activity_buffer(sessions_db, 10, 20)
+
+        assert first is second
+        assert second.flush_interval == 10
+        assert second.max_staleness == 20
+
+
+class TestDatabaseManagerActivity:
+    """Test DatabaseManager integration with the activity buffer"""
+
+    def test_update_session_activity_is_buffered(self, db_manager):
+        """Test update_session_activity does not touch the database immediately"""
+        db_manager.create_session('session_buffered', '127.0.0.1')
+        with patch.object(Config, 'ACTIVITY_FLUSH_INTERVAL', 30):
+            with patch.object(db_manager, 'get_connection') as mock_get_conn:
+                db_manager.update_session_activity('session_buffered')
+                mock_get_conn.assert_not_called()
+
+            assert db_manager.get_activity_buffer().pending_count() >= 1
+            assert db_manager.flush_session_activity() >= 1
+
+    def test_write_through_by_default(self, db_manager):
+        """Test activity updates are not buffered unless an interval is configured"""
+        assert db_manager.get_activity_buffer() is None
+
+    def test_update_session_activity_write_through_when_disabled(self, db_manager):
+        """Test a zero flush interval restores direct writes"""
+        db_manager.create_session('session_direct', '127.0.0.1')
+        with patch.object(Config, 'ACTIVITY_FLUSH_INTERVAL', 0):
+            assert db_manager.get_activity_buffer() is None
+            assert db_manager.flush_session_activity() == 0
+
+            conn = db_manager.get_connection()
+            conn.execute("UPDATE web_chat_sessions SET last_active = '2020-01-01 00:00:00' WHERE id = 'session_direct'")
+            conn.commit()
+            conn.close()
+
+            db_manager.update_session_activity('session_direct')
+
+        conn = db_manager.get_connection()
+        last_active = conn.execute("SELECT last_active FROM web_chat_sessions WHERE id = 'session_direct'").fetchone()[0]
+        conn.close()
+        assert last_active > '2020-01-01 00:00:00'
+
+    def test_cleanup_flushes_pending_activity_first(self, db_manager):
+        """Test cleanup does not delete sessions whose activity is still buffered"""
+        db_manager.create_session('session_live', '127.0.0.1')
+        conn = db_manager.get_connection()
+        conn.execute("UPDATE web_chat_sessions SET last_active = datetime('now', '-2 hours') WHERE id = 'session_live'")
+        conn.commit()
+        conn.close()
+
+        with patch.object(Config, 'ACTIVITY_FLUSH_INTERVAL', 30):
+            db_manager.update_session_activity('session_live')
+            db_manager.cleanup_inactive_sessions()
+
+        assert db_manager.session_exists('session_live')
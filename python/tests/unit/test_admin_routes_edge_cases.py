@@ -27,7 +27,7 @@ class TestAdminRoutesEdgeCases:
     @patch('app.admin.routes.get_db')
     def test_get_session_messages_database_error(self, mock_get_db, app):
         """Test session_messages endpoint with database error"""
-        mock_get_db.return_value.get_connection.side_effect = Exception("Database error")
+        mock_get_db.return_value.get_session_messages.side_effect = Exception("Database error")
         
         with app.test_client() as client:
             response = client.get('/admin/api/session_messages?session_id=session_test', 
@@ -39,11 +39,7 @@ class TestAdminRoutesEdgeCases:
     @patch('app.admin.routes.get_db')
     def test_get_session_messages_session_not_found(self, mock_get_db, app):
         """Test session_messages endpoint with non-existent session"""
-        mock_conn = Mock()
-        mock_cursor = Mock()
-        mock_cursor.fetchone.return_value = None
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_db.return_value.get_connection.return_value = mock_conn
+        mock_get_db.return_value.get_session_messages.return_value = None
         
         with app.test_client() as client:
             response = client.get('/admin/api/session_messages?session_id=session_nonexistent', 
@@ -55,11 +51,7 @@ class TestAdminRoutesEdgeCases:
     @patch('app.admin.routes.get_db')
     def test_get_session_messages_cursor_error(self, mock_get_db, app):
         """Test session_messages endpoint with cursor execution error"""
-        mock_conn = Mock()
-        mock_cursor = Mock()
-        mock_cursor.execute.side_effect = Exception("SQL error")
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_db.return_value.get_connection.return_value = mock_conn
+        mock_get_db.return_value.get_session_messages.side_effect = Exception("SQL error")
         
         with app.test_client() as client:
             response = client.get('/admin/api/session_messages?session_id=session_test', 
@@ -108,7 +100,7 @@ class TestAdminRoutesEdgeCases:
     @patch('app.admin.routes.get_db')
     def test_clear_data_database_error(self, mock_get_db, app):
         """Test clear_data endpoint with database error"""
-        mock_get_db.return_value.get_connection.side_effect = Exception("Database error")
+        mock_get_db.return_value.clear_all_data.side_effect = Exception("Database error")
         
         with app.test_client() as client:
             response = client.post('/admin/api/clear_data', 
@@ -120,11 +112,7 @@ class TestAdminRoutesEdgeCases:
     @patch('app.admin.routes.get_db')
     def test_clear_data_cursor_error(self, mock_get_db, app):
         """Test clear_data endpoint with cursor execution error"""
-        mock_conn = Mock()
-        mock_cursor = Mock()
-        mock_cursor.execute.side_effect = Exception("SQL error")
-        mock_conn.cursor.return_value = mock_cursor
-        mock_get_db.return_value.get_connection.return_value = mock_conn
+        mock_get_db.return_value.clear_all_data.side_effect = Exception("SQL error")
         
         with app.test_client() as client:
             response = client.post('/admin/api/clear_data', 
@@ -163,23 +151,13 @@ class TestAdminRoutesEdgeCases:
     
     @patch('app.admin.routes.get_db')
     def test_get_session_messages_database_operations_coverage(self, mock_get_db, app):
-        """Test get_session_messages database operations to cover lines 74-96"""
-        mock_conn = Mock()
-        mock_cursor = Mock()
-        mock_db = Mock()
-        
-        # Mock session data
-        mock_session = {'id': 'test_session', 'last_active': '2023-01-01'}
-        mock_cursor.fetchone.return_value = mock_session
-        
-        # Mock messages and responses data
-        mock_messages = [{'id': 1, 'session_id': 'test_session', 'message': 'test', 'timestamp': '2023-01-01'}]
-        mock_responses = [{'id': 1, 'response': 'test', 'message_id': 1, 'timestamp': '2023-01-01'}]
-        mock_cursor.fetchall.side_effect = [mock_messages, mock_responses]
-        
-        mock_conn.cursor.return_value = mock_cursor
-        mock_db.get_connection.return_value = mock_conn
-        mock_get_db.return_value = mock_db
+        """Test get_session_messages returns the session with its messages and responses"""
+        history = {
+            'session': {'id': 'test_session', 'last_active': '2023-01-01'},
+            'messages': [{'id': 1, 'session_id': 'test_session', 'message': 'test', 'timestamp': '2023-01-01'}],
+            'responses': [{'id': 1, 'response': 'test', 'message_id': 1, 'timestamp': '2023-01-01'}]
+        }
+        mock_get_db.return_value.get_session_messages.return_value = history
         
         with app.test_client() as client:
             response = client.get('/admin/api/session_messages?session_id=test_session', 
@@ -187,7 +165,8 @@ class TestAdminRoutesEdgeCases:
             assert response.status_code == 200
             data = response.get_json()
             assert data['success'] is True
-            mock_conn.close.assert_called_once()
+            assert data['data'] == history
+            mock_get_db.return_value.get_session_messages.assert_called_once_with('test_session')
     
     @patch('app.admin.routes.get_db')
     def test_handle_config_get_exception_coverage(self, mock_get_db, app):
@@ -250,14 +229,8 @@ class TestAdminRoutesEdgeCases:
     @patch('app.admin.routes.get_db')
     def test_clear_all_data_database_operations_coverage(self, mock_get_db, app):
         """Test clear_all_data database operations to cover lines 178-193"""
-        mock_conn = Mock()
-        mock_cursor = Mock()
         mock_db = Mock()
-        
-        # Mock count results
-        mock_cursor.fetchone.side_effect = [('5',), ('10',), ('15',)]
-        mock_conn.cursor.return_value = mock_cursor
-        mock_db.get_connection.return_value = mock_conn
+        mock_db.clear_all_data.return_value = {'responses': 15, 'messages': 10, 'sessions': 5}
         mock_get_db.return_value = mock_db
         
         with app.test_client() as client:
@@ -266,13 +239,13 @@ class TestAdminRoutesEdgeCases:
             assert response.status_code == 200
             data = response.get_json()
             assert data['success'] is True
-            mock_conn.commit.assert_called_once()
-            mock_conn.close.assert_called_once()
+            assert data['data']['cleaned_data'] == {'responses': 15, 'messages': 10, 'sessions': 5}
+            mock_db.clear_all_data.assert_called_once()
     
     @patch('app.admin.routes.get_db')
     def test_clear_all_data_exception_coverage(self, mock_get_db, app):
         """Test clear_all_data exception handling to cover line 214"""
-        mock_get_db.return_value.get_connection.side_effect = Exception("Connection error")
+        mock_get_db.return_value.clear_all_data.side_effect = Exception("Connection error")
         
         with app.test_client() as client:
             response = client.post('/admin/api/clear_data', 
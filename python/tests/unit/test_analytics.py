@@ -0,0 +1,117 @@
+"""
+Unit tests for response latency and traffic analytics
+"""
+
+import time
+import pytest
+from app.utils import columnar
+from app.utils.analytics import HOUR, compute_traffic, reset_analytics_cache, to_epoch
+
+
+def insert_exchange(conn, session_id, asked_at, wait_seconds):
+    cursor = conn.execute(
+        "INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES (?, 'q', datetime(?, 'unixepoch'))",
+        (session_id, asked_at)
+    )
+    conn.execute(
+        "INSERT INTO web_chat_responses (session_id, response, message_id, timestamp) "
+        "VALUES (?, 'a', ?, datetime(?, 'unixepoch'))",
+        (session_id, cursor.lastrowid, asked_at + wait_seconds)
+    )
+
+
+@pytest.fixture
+def history(db_manager):
+    """Ten exchanges two hours ago and one in the current hour"""
+    reset_analytics_cache()
+    now = int(time.time())
+    two_hours_ago = now - now % HOUR - 2 * HOUR
+    conn = db_manager.get_connection()
+    for wait in range(1, 11):
+        insert_exchange(conn, 'session_analytics', two_hours_ago + 60, wait)
+    insert_exchange(conn, 'session_analytics', now - now % HOUR, 100)
+    conn.commit()
+    conn.close()
+    yield db_manager, two_hours_ago
+    reset_analytics_cache()
+
+
+class TestTraffic:
+    """Test latency percentiles and hourly counts"""
+
+    def test_percentiles_and_hourly_counts(self, history):
+        """Test wait times are joined through message_id"""
+        db_manager, two_hours_ago = history
+        data = db_manager.get_analytics(two_hours_ago, two_hours_ago + HOUR)
+
+        assert data['latency_seconds']['count'] == 10
+        assert data['latency_seconds']['p50'] == 5.5
+        assert data['latency_seconds']['max'] == 10.0
+        assert data['hourly'] == [{'hour': data['from'], 'messages': 10, 'responses': 10}]
+
+    def test_range_is_widened_to_whole_hours(self, history):
+        """Test partial hours are included whole"""
+        db_manager, two_hours_ago = history
+        data = db_manager.get_analytics(two_hours_ago + 600, two_hours_ago + 2 * HOUR + 1)
+        assert len(data['hourly']) == 3
+        assert data['totals']['messages'] == 11
+
+    def test_closed_hours_are_cached(self, history):
+        """Test a second query reuses closed buckets but recomputes the open hour"""
+        db_manager, two_hours_ago = history
+        end = int(time.time())
+        db_manager.get_analytics(two_hours_ago, end)
+        before = db_manager.get_analytics(two_hours_ago, end)['cache']
+
+        conn = db_manager.get_connection()
+        insert_exchange(conn, 'session_analytics', end - end % HOUR, 1)
+        conn.commit()
+        conn.close()
+        data = db_manager.get_analytics(two_hours_ago, end)
+
+        assert data['cache']['hits'] > before['hits']
+        assert data['hourly'][-1]['messages'] == 2
+
+    def test_unanswered_responses_have_no_latency(self, db_manager):
+        """Test responses without a message are counted but not timed"""
+        reset_analytics_cache()
+        db_manager.create_response('session_analytics', 'pushed')
+        now = int(time.time())
+        data = db_manager.get_analytics(now - HOUR, now)
+        assert data['totals']['responses'] == 1
+        assert data['latency_seconds']['count'] == 0
+        assert data['latency_seconds']['p99'] is None
+
+    def test_requires_numpy(self, db_manager):
+        """Test a clear error when numpy is missing"""
+        from unittest.mock import patch
+        with patch.object(columnar, 'np', None):
+            with pytest.raises(columnar.ColumnarUnavailable):
+                compute_traffic(None, db_manager.db_path, 0, HOUR)
+
+
+class TestSessions:
+    """Test session distributions"""
+
+    def test_session_durations(self, db_manager):
+        """Test durations and message counts per session"""
+        db_manager.create_session('session_short', '127.0.0.1')
+        db_manager.create_message('session_short', 'hi')
+        db_manager.create_message('session_short', 'bye')
+        now = int(time.time())
+
+        sessions = db_manager.get_analytics(now - HOUR, now + HOUR)['sessions']
+
+        assert sessions['count'] >= 1
+        assert sessions['messages_per_session']['max'] == 2
+        assert sum(bucket['count'] for bucket in sessions['duration_histogram']) == sessions['count']
+
+
+class TestEpochParsing:
+    """Test query parameter parsing"""
+
+    def test_naive_timestamps_are_utc(self):
+        """Test naive ISO timestamps match SQLite's UTC datetime('now')"""
+        assert to_epoch('1970-01-01T01:00:00') == 3600
+        assert to_epoch('1970-01-01T01:00:00Z') == 3600
+        assert to_epoch('') is None
@@ -76,11 +76,11 @@ class TestAPIAuthentication:
     
     def test_require_auth_internal_valid(self, app_context, request_context, db_manager):
         """Test valid API key authentication"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.headers = {'Authorization': 'Bearer test_api_key_123'}
             
-            with patch('app.api.routes.DatabaseManager') as mock_db_class:
-                mock_db_class.return_value = db_manager
+            with patch('app.api.routes.get_db') as mock_get_db:
+                mock_get_db.return_value = db_manager
                 with patch('app.api.routes.current_app') as mock_app:
                     mock_app.config = {'DEFAULT_API_KEY': 'test_api_key_123', 'DEFAULT_ADMIN_KEY': 'test_admin_key_456'}
                     
@@ -89,11 +89,11 @@ class TestAPIAuthentication:
     
     def test_require_auth_internal_invalid_key(self, app_context, request_context, db_manager):
         """Test invalid API key authentication"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.headers = {'Authorization': 'Bearer invalid_key'}
             
-            with patch('app.api.routes.DatabaseManager') as mock_db_class:
-                mock_db_class.return_value = db_manager
+            with patch('app.api.routes.get_db') as mock_get_db:
+                mock_get_db.return_value = db_manager
                 with patch('app.api.routes.current_app') as mock_app:
                     mock_app.config = {'DEFAULT_API_KEY': 'test_api_key_123', 'DEFAULT_ADMIN_KEY': 'test_admin_key_456'}
                     
@@ -103,7 +103,7 @@ class TestAPIAuthentication:
     
     def test_require_auth_internal_missing_header(self, app_context, request_context, db_manager):
         """Test missing authorization header"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.headers = {}
             
             result = require_auth_internal()
@@ -112,7 +112,7 @@ class TestAPIAuthentication:
     
     def test_require_auth_internal_malformed_header(self, app_context, request_context, db_manager):
         """Test malformed authorization header"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.headers = {'Authorization': 'InvalidFormat'}
             
             result = require_auth_internal()
@@ -121,11 +121,11 @@ class TestAPIAuthentication:
     
     def test_require_admin_auth_internal_valid(self, app_context, request_context, db_manager):
         """Test valid admin key authentication"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.headers = {'Authorization': 'Bearer test_admin_key_456'}
             
-            with patch('app.api.routes.DatabaseManager') as mock_db_class:
-                mock_db_class.return_value = db_manager
+            with patch('app.api.routes.get_admin_auth_db') as mock_get_db:
+                mock_get_db.return_value = db_manager
                 with patch('app.api.routes.current_app') as mock_app:
                     mock_app.config = {'DEFAULT_ADMIN_KEY': 'test_admin_key_456'}
                     
@@ -174,7 +174,7 @@ class TestAPIMessageHandling:
     
     def test_handle_messages_rate_limit_exceeded(self, app_context, request_context, db_manager):
         """Test message handling when rate limit is exceeded"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'POST'
             mock_request.get_json.return_value = {
                 'session_id': 'session_test_123',
@@ -182,8 +182,8 @@ class TestAPIMessageHandling:
             }
             mock_request.remote_addr = '127.0.0.1'
             
-            with patch('app.api.routes.DatabaseManager') as mock_db_class:
-                mock_db_class.return_value = db_manager
+            with patch('app.api.routes.get_db') as mock_get_db:
+                mock_get_db.return_value = db_manager
                 with patch('app.api.routes.RateLimitManager') as mock_rate_limiter_class:
                     mock_rate_limiter = Mock()
                     mock_rate_limiter.check_rate_limit.return_value = False
@@ -249,7 +249,7 @@ class TestAPIInboxHandling:
     
     def test_handle_inbox_success(self, app_context, request_context, db_manager):
         """Test successful inbox retrieval"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'GET'
             mock_request.args = {}
             mock_request.headers = {'Authorization': 'Bearer test_api_key_123'}
@@ -277,7 +277,7 @@ class TestAPIInboxHandling:
     
     def test_handle_inbox_unauthorized(self, app_context, request_context, db_manager):
         """Test inbox retrieval without authentication"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'GET'
             mock_request.args = {}
             mock_request.headers = {}  # No authorization header
@@ -363,7 +363,7 @@ class TestAPIResponseHandling:
     
     def test_handle_responses_success(self, app_context, request_context, db_manager):
         """Test successful response retrieval"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'GET'
             mock_request.args = {'session_id': 'session_test_123'}
             mock_request.remote_addr = '127.0.0.1'
@@ -394,7 +394,7 @@ class TestAPIAdminHandling:
     
     def test_handle_sessions_success(self, app_context, request_context, db_manager):
         """Test successful sessions retrieval"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'GET'
             mock_request.args = {}
             mock_request.headers = {'Authorization': 'Bearer test_admin_key_456'}
@@ -421,7 +421,7 @@ class TestAPIAdminHandling:
     
     def test_handle_config_get_success(self, app_context, request_context, db_manager):
         """Test successful config retrieval"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'GET'
             mock_request.args = {}
             mock_request.headers = {'Authorization': 'Bearer test_admin_key_456'}
@@ -446,7 +446,7 @@ class TestAPIAdminHandling:
     
     def test_handle_config_update_success(self, app_context, request_context, db_manager):
         """Test successful config update"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'POST'
             mock_request.get_json.return_value = {'api_key': 'new_key'}
             mock_request.headers = {'Authorization': 'Bearer test_admin_key_456'}
@@ -474,7 +474,7 @@ class TestAPICleanupHandling:
     
     def test_handle_cleanup_success(self, app_context, request_context, db_manager):
         """Test successful cleanup operation"""
-        with patch('app.api.routes.request') as mock_request:
+        with patch('app.api.routes.request', new_callable=MagicMock) as mock_request:
             mock_request.method = 'POST'
             mock_request.headers = {'Authorization': 'Bearer test_admin_key_456'}
             mock_request.remote_addr = '127.0.0.1'
@@ -621,6 +621,17 @@ class TestAPICleanupHandling:
             data = response.get_json()
             assert data['success'] is True
     
+    def test_handle_clear_data_swap_mode(self, app):
+        """Test clear_data with the fast file-swap mode"""
+        with app.test_client() as client:
+            response = client.post('/api/v1/?action=clear_data&mode=swap', 
+                                headers={'Authorization': 'Bearer test_admin_key_456'})
+            assert response.status_code == 200
+            data = response.get_json()
+            assert data['success'] is True
+            assert data['data']['mode'] == 'swap'
+            assert data['data']['remaining_data']['messages'] == 0
+    
     def test_handle_cleanup_logs_direct_route(self, app):
         """Test direct route for cleanup_logs to cover line 108"""
         with app.test_client() as client:
@@ -16,9 +16,9 @@ class TestAPIAdminErrorConditions:
             # Mock authentication to return None (success)
             mock_require_auth.return_value = None
             
-            # Mock database to raise exception during get_connection
+            # Mock database to raise exception while clearing
             mock_db = MagicMock()
-            mock_db.get_connection.side_effect = Exception("Database connection error")
+            mock_db.clear_all_data.side_effect = Exception("Database connection error")
             mock_get_db.return_value = mock_db
             
             result = handle_clear_data()
@@ -37,15 +37,9 @@ class TestAPIAdminErrorConditions:
             # Mock authentication to return None (success)
             mock_require_auth.return_value = None
             
-            # Mock database and connection
+            # Mock database to raise exception during execute
             mock_db = MagicMock()
-            mock_conn = MagicMock()
-            mock_cursor = MagicMock()
-            mock_db.get_connection.return_value = mock_conn
-            mock_conn.cursor.return_value = mock_cursor
-            
-            # Mock cursor to raise exception during execute
-            mock_cursor.execute.side_effect = Exception("Cursor execution error")
+            mock_db.clear_all_data.side_effect = Exception("Cursor execution error")
             mock_get_db.return_value = mock_db
             
             result = handle_clear_data()
@@ -64,17 +58,9 @@ class TestAPIAdminErrorConditions:
             # Mock authentication to return None (success)
             mock_require_auth.return_value = None
             
-            # Mock database and connection
+            # Mock database to raise exception on commit
             mock_db = MagicMock()
-            mock_conn = MagicMock()
-            mock_cursor = MagicMock()
-            mock_db.get_connection.return_value = mock_conn
-            mock_conn.cursor.return_value = mock_cursor
-            
-            # Mock cursor operations to succeed but commit to fail
-            mock_cursor.fetchone.return_value = [0]  # Count queries succeed
-            mock_cursor.execute.return_value = None  # Delete queries succeed
-            mock_conn.commit.side_effect = Exception("Commit error")
+            mock_db.clear_all_data.side_effect = Exception("Commit error")
             mock_get_db.return_value = mock_db
             
             result = handle_clear_data()
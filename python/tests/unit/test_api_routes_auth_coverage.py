@@ -111,7 +111,7 @@ class TestAPIAuthenticationCoverage:
             assert result[1] == 401  # Unauthorized
             assert 'Authentication required' in result[0].json['error']
     
-    @patch('app.api.routes.get_db')
+    @patch('app.api.routes.get_admin_auth_db')
     def test_require_admin_auth_internal_invalid_key(self, mock_get_db):
         """Test invalid admin key"""
         from app.api.routes import require_admin_auth_internal
@@ -130,7 +130,7 @@ class TestAPIAuthenticationCoverage:
             assert result[1] == 401  # Unauthorized
             assert 'Invalid admin key' in result[0].json['error']
     
-    @patch('app.api.routes.get_db')
+    @patch('app.api.routes.get_admin_auth_db')
     def test_require_admin_auth_internal_valid_key(self, mock_get_db):
         """Test valid admin key"""
         from app.api.routes import require_admin_auth_internal
@@ -166,7 +166,7 @@ class TestAPIAuthenticationCoverage:
             
             assert "Database error" in str(exc_info.value)
     
-    @patch('app.api.routes.get_db')
+    @patch('app.api.routes.get_admin_auth_db')
     def test_require_admin_auth_internal_database_error(self, mock_get_db):
         """Test database error during admin authentication"""
         from app.api.routes import require_admin_auth_internal
@@ -0,0 +1,126 @@
+"""
+Unit tests for the hot/cold message archive
+"""
+
+import os
+import pytest
+import sqlite3
+from app.utils.archive import ArchiveManager, attach_archive, default_archive_path, unified_source
+
+
+def age_rows(db_manager, table, seconds, processed=None):
+    conn = db_manager.get_connection()
+    assignments = "timestamp = datetime('now', ?)"
+    if processed is not None:
+        assignments += f", processed = {int(processed)}"
+    conn.execute(f"UPDATE {table} SET {assignments}", (f'-{seconds} seconds',))
+    conn.commit()
+    conn.close()
+
+
+def count_rows(db_manager, table):
+    conn = db_manager.get_connection()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def archive_db(db_manager):
+    """Test database with an empty archive next to it"""
+    archive_path = db_manager.get_archive_path()
+    yield db_manager
+    for path in (archive_path, archive_path + '-wal', archive_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class TestArchiveHelpers:
+    """Test path and query helpers"""
+
+    def test_default_archive_path(self):
+        """Test the archive sits next to the hot database"""
+        assert default_archive_path('/data/web_chat_bridge.db') == '/data/web_chat_bridge_archive.db'
+
+    def test_unified_source(self):
+        """Test the unified source only unions when the archive is attached"""
+        assert unified_source('web_chat_messages', 'id', False) == 'main.web_chat_messages'
+        assert 'UNION ALL' in unified_source('web_chat_messages', 'id', True)
+
+    def test_attach_missing_archive(self, tmp_path):
+        """Test a missing archive is not created by readers"""
+        conn = sqlite3.connect(':memory:')
+        archive_path = str(tmp_path / 'missing_archive.db')
+        assert attach_archive(conn, archive_path) is False
+        assert not os.path.exists(archive_path)
+        conn.close()
+
+
+class TestArchiveManager:
+    """Test moving rows into the archive"""
+
+    def test_archive_moves_processed_messages(self, archive_db):
+        """Test only processed messages past the age are moved"""
+        archive_db.create_session('session_archive', '127.0.0.1')
+        for i in range(5):
+            archive_db.create_message('session_archive', f'old {i}')
+        age_rows(archive_db, 'web_chat_messages', 7200, processed=1)
+        archive_db.create_message('session_archive', 'fresh')
+
+        manager = ArchiveManager(archive_db, batch_size=2, pause=0)
+        result = manager.archive_table('web_chat_messages', 3600)
+
+        assert result['moved'] == 5
+        assert result['batches'] == 3
+        assert count_rows(archive_db, 'web_chat_messages') == 1
+        assert manager.stats()['estimated_rows']['web_chat_messages'] == 5
+
+    def test_unprocessed_messages_stay_hot(self, archive_db):
+        """Test messages the agent has not picked up are never archived"""
+        archive_db.create_message('session_archive', 'pending')
+        age_rows(archive_db, 'web_chat_messages', 7200, processed=0)
+
+        result = ArchiveManager(archive_db, pause=0).archive_table('web_chat_messages', 3600)
+
+        assert result['moved'] == 0
+        assert count_rows(archive_db, 'web_chat_messages') == 1
+
+    def test_archived_responses_are_read_back(self, archive_db):
+        """Test a full history load includes archived responses in order"""
+        archive_db.create_session('session_archive', '127.0.0.1')
+        archive_db.create_response('session_archive', 'first')
+        age_rows(archive_db, 'web_chat_responses', 7200)
+        archive_db.create_response('session_archive', 'second')
+
+        ArchiveManager(archive_db, pause=0).run(0, 3600)
+
+        responses = archive_db.get_session_responses('session_archive')
+        assert [r['response'] for r in responses] == ['first', 'second']
+        assert count_rows(archive_db, 'web_chat_responses') == 1
+
+    def test_archive_gains_new_columns(self, archive_db):
+        """Test columns added to the hot table are added to the archive"""
+        manager = ArchiveManager(archive_db, pause=0)
+        conn = archive_db.get_connection()
+        try:
+            manager.ensure_archive(conn)
+            conn.execute("ALTER TABLE main.web_chat_responses ADD COLUMN tokens INTEGER")
+            conn.commit()
+            manager.ensure_archive(conn)
+            columns = [row[1] for row in conn.execute("PRAGMA archive.table_info(web_chat_responses)")]
+        finally:
+            conn.close()
+        assert 'tokens' in columns
+
+    def test_clear_archive(self, archive_db):
+        """Test clearing data removes the archive file"""
+        archive_db.create_response('session_archive', 'old')
+        age_rows(archive_db, 'web_chat_responses', 7200)
+        ArchiveManager(archive_db, pause=0).run(0, 3600)
+        assert os.path.exists(archive_db.get_archive_path())
+
+        archive_db.clear_archive()
+
+        assert not os.path.exists(archive_db.get_archive_path())
+        assert ArchiveManager(archive_db).stats()['exists'] is False
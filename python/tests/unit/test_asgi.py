@@ -0,0 +1,197 @@
+"""
+Unit tests for ASGI serving on a bounded thread pool
+"""
+
+import asyncio
+import json
+import threading
+from urllib.parse import urlencode
+from app.asgi import AsgiApp, build_environ
+
+API_KEY = {'Authorization': 'Bearer test_api_key_123'}
+
+
+def scope(method, path, query=None, headers=None):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'root_path': '',
+        'query_string': urlencode(query or {}).encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 50000),
+        'scheme': 'http',
+        'http_version': '1.1'
+    }
+
+
+async def call(asgi, method, path, query=None, json_body=None, headers=None, receive=None):
+    """Run one request through the ASGI app; returns (status, headers, body)"""
+    body = json.dumps(json_body).encode() if json_body is not None else b''
+    headers = dict(headers or {})
+    if json_body is not None:
+        headers['Content-Type'] = 'application/json'
+    sent = []
+
+    async def receive_body():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi(scope(method, path, query, headers), receive or receive_body, send)
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+
+class TestAsgiApp:
+    """Test the Flask app served over ASGI"""
+
+    def test_same_json_contract(self, app):
+        """Test a message, inbox and responses round trip matches the WSGI app"""
+        asgi = AsgiApp(app, max_workers=2)
+        responses = {'action': 'responses', 'session_id': 'session_asgi'}
+
+        async def run():
+            status, headers, body = await call(asgi, 'POST', '/api/v1/', {'action': 'messages'},
+                                               {'session_id': 'session_asgi', 'message': 'hello'})
+            assert status == 200
+            assert headers[b'content-type'] == b'application/json'
+            assert json.loads(body)['success'] is True
+
+            status, _, body = await call(asgi, 'GET', '/api/v1/', {'action': 'inbox'}, headers=API_KEY)
+            assert status == 200
+            message = json.loads(body)['data']['messages'][0]
+            assert message['message'] == 'hello'
+            status, _, _ = await call(asgi, 'POST', '/api/v1/', {'action': 'outbox'}, headers=API_KEY,
+                                      json_body={'session_id': 'session_asgi', 'response': 'hi',
+                                                 'message_id': message['id']})
+            assert status == 200
+
+            status, _, body = await call(asgi, 'GET', '/api/v1/', responses)
+            return status, json.loads(body)
+
+        status, data = asyncio.run(run())
+        wsgi = app.test_client().get('/api/v1/', query_string=responses).get_json()
+        assert status == 200
+        assert data['data'] == wsgi['data']
+        assert [r['response'] for r in data['data']['responses']] == ['hi']
+
+    def test_errors_pass_through(self, app):
+        """Test auth failures keep their status code and JSON body"""
+        asgi = AsgiApp(app, max_workers=1)
+        status, _, body = asyncio.run(call(asgi, 'GET', '/api/v1/', {'action': 'inbox'}))
+        assert status == 401
+        assert json.loads(body)['success'] is False
+
+    def test_slow_clients_do_not_hold_threads(self, app):
+        """Test requests still waiting for their body leave the pool free"""
+        asgi = AsgiApp(app, max_workers=2)
+
+        async def run():
+            uploaded = asyncio.Event()
+
+            async def slow_receive():
+                await uploaded.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            sent = []
+            threads = threading.active_count()
+            slow = [asyncio.create_task(asgi(scope('GET', '/api/v1/'), slow_receive, send)) for _ in range(200)]
+            await asyncio.sleep(0)
+            status, _, _ = await call(asgi, 'GET', '/api/v1/', {'action': 'inbox'}, headers=API_KEY)
+            busy_threads = threading.active_count() - threads
+            uploaded.set()
+            await asyncio.gather(*slow)
+            return status, busy_threads, sent
+
+        status, busy_threads, sent = asyncio.run(run())
+        assert status == 200
+        assert busy_threads <= 2
+        # The slow clients disconnected, so nothing was dispatched or sent
+        assert sent == []
+
+    def test_disconnect_mid_upload(self, app, db_manager):
+        """Test a body cut short by a disconnect never reaches the app"""
+        asgi = AsgiApp(app, max_workers=1)
+        body = json.dumps({'session_id': 'session_asgi', 'message': 'hello'}).encode()
+        events = iter([{'type': 'http.request', 'body': body[:10], 'more_body': True}, {'type': 'http.disconnect'}])
+        sent = []
+
+        async def receive():
+            return next(events)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi(scope('POST', '/api/v1/', {'action': 'messages'}, {'Content-Type': 'application/json'}),
+                         receive, send))
+        assert sent == []
+        assert db_manager.get_unprocessed_message_count() == 0
+
+    def test_streamed_response(self):
+        """Test bodies without a Content-Length are sent in batches as they are produced"""
+        closed = []
+
+        class Chunks:
+            def __iter__(self):
+                return iter([b'x' * 40000] * 4)
+
+            def close(self):
+                closed.append(True)
+
+        def wsgi_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+            return Chunks()
+
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(AsgiApp(wsgi_app, max_workers=1)(scope('GET', '/export'), receive, send))
+        bodies = [m for m in sent if m['type'] == 'http.response.body']
+        assert len(bodies) > 1
+        assert bodies[0]['more_body'] is True
+        assert sum(len(m['body']) for m in bodies) == 160000
+        assert closed == [True]
+
+    def test_body_limit(self, app):
+        """Test bodies over the limit are refused before reaching Flask"""
+        asgi = AsgiApp(app, max_workers=1, max_body_size=10)
+        status, _, body = asyncio.run(call(asgi, 'POST', '/api/v1/', {'action': 'messages'},
+                                           {'session_id': 'session_asgi', 'message': 'too long'}))
+        assert status == 413
+        assert json.loads(body)['success'] is False
+
+    def test_lifespan(self, app):
+        """Test startup and shutdown are acknowledged"""
+        asgi = AsgiApp(app, max_workers=1)
+        events = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(events)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(asgi({'type': 'lifespan'}, receive, send))
+        assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+    def test_environ(self):
+        """Test headers, query strings and client addresses reach WSGI"""
+        environ = build_environ(scope('POST', '/api/v1/', {'action': 'messages'},
+                                      {'Content-Type': 'application/json', 'X-Tenant-Id': 'acme'}), b'{}')
+        assert environ['QUERY_STRING'] == 'action=messages'
+        assert environ['CONTENT_TYPE'] == 'application/json'
+        assert environ['CONTENT_LENGTH'] == '2'
+        assert environ['HTTP_X_TENANT_ID'] == 'acme'
+        assert environ['REMOTE_ADDR'] == '127.0.0.1'
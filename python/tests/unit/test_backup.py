@@ -0,0 +1,141 @@
+"""
+Unit tests for online backups with the SQLite backup API
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+import pytest
+from unittest.mock import patch
+from app.utils.backup import BackupRestarted, BackupScheduler, list_backups, online_backup, rotate_backups
+from app.utils.database import DatabaseManager
+from app.utils.sharding import ShardedDatabaseManager
+from config import Config
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'db', 'init_database.sql')
+
+
+@pytest.fixture
+def chat_db(tmp_path):
+    """A database with a few hundred messages"""
+    shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+    db = DatabaseManager(str(tmp_path / 'chat.db'))
+    for n in range(300):
+        db.create_message(f'session_{n % 10}', 'x' * 500)
+    return db
+
+
+def message_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM web_chat_messages").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestOnlineBackup:
+    """Test copying a live database"""
+
+    def test_copies_in_steps(self, chat_db, tmp_path):
+        """Test the copy is complete, checked and made a few pages at a time"""
+        target = str(tmp_path / 'copy.db')
+        result = online_backup(chat_db.db_path, target, pages=5, pause=0)
+        assert result['steps'] > 1
+        assert result['bytes'] == os.path.getsize(target)
+        assert result['duration_ms'] >= 0
+        assert message_count(target) == 300
+        assert not os.path.exists(target + '.tmp')
+
+    def test_consistent_while_writing(self, chat_db, tmp_path):
+        """Test a WAL copy finishes from one snapshot while another connection keeps writing"""
+        conn = sqlite3.connect(chat_db.db_path)
+        conn.execute("PRAGMA journal_mode=wal")
+        conn.close()
+        stop = threading.Event()
+
+        def write():
+            writer = DatabaseManager(chat_db.db_path)
+            while not stop.is_set():
+                writer.create_message('session_writer', 'during backup')
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        try:
+            result = online_backup(chat_db.db_path, str(tmp_path / 'copy.db'), pages=2, pause=0.001)
+        finally:
+            stop.set()
+            thread.join()
+        assert result['restarts'] == 0
+        conn = sqlite3.connect(result['path'])
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        conn.close()
+        assert message_count(result['path']) >= 300
+
+    def test_restarts_are_bounded(self, chat_db, tmp_path):
+        """Test a rollback-journal copy restarts on writes, then gives up instead of copying in one step"""
+        conn = sqlite3.connect(chat_db.db_path)
+        conn.execute("PRAGMA journal_mode=delete")
+        conn.close()
+        writes = []
+
+        def write_between_steps(seconds):
+            if len(writes) < limit:
+                writes.append(chat_db.create_message('session_writer', 'during backup'))
+
+        target = str(tmp_path / 'copy.db')
+        limit = 1
+        with patch('app.utils.backup.time.sleep', write_between_steps):
+            result = online_backup(chat_db.db_path, target, pages=5, pause=0.001)
+        assert result['restarts'] == 1
+        assert message_count(target) == 301
+
+        limit = 100
+        with patch('app.utils.backup.time.sleep', write_between_steps):
+            with pytest.raises(BackupRestarted):
+                online_backup(chat_db.db_path, str(tmp_path / 'busy.db'), pages=5, pause=0.001, max_restarts=2)
+        assert not os.path.exists(tmp_path / 'busy.db')
+        assert not os.path.exists(tmp_path / 'busy.db.tmp')
+
+    def test_rotation(self, tmp_path):
+        """Test only the newest copies of each file are kept"""
+        for name in ('chat-1.db', 'chat-2.db', 'chat-3.db', 'chat.shard1-1.db'):
+            (tmp_path / name).write_bytes(b'')
+        removed = rotate_backups('db/chat.db', str(tmp_path), 2)
+        assert [os.path.basename(path) for path in removed] == ['chat-1.db']
+        assert [os.path.basename(path) for path in list_backups('db/chat.db', str(tmp_path))] == ['chat-2.db', 'chat-3.db']
+
+
+class TestBackupScheduler:
+    """Test scheduled and triggered backup runs"""
+
+    def test_run_rotates_and_reports(self, chat_db, tmp_path):
+        """Test each run backs up the database and keeps BACKUP_KEEP copies"""
+        scheduler = BackupScheduler(chat_db.db_path)
+        with patch.object(Config, 'BACKUP_KEEP', 2), patch.object(Config, 'BACKUP_STEP_PAUSE', 0):
+            for _ in range(3):
+                run = scheduler.run_once()
+        assert run['error'] is None
+        assert run['duration_ms'] >= 0
+        assert len(run['removed']) == 1
+        status = scheduler.status()
+        assert status['runs'] == 3
+        assert len(status['backups']) == 2
+        assert run['directory'] == str(tmp_path / 'backups')
+
+    def test_backs_up_every_shard(self, tmp_path):
+        """Test shard files are backed up alongside the main file"""
+        shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+        sharded = ShardedDatabaseManager(str(tmp_path / 'chat.db'), 2)
+        for n in range(6):
+            sharded.create_message(f'session_{n}', 'hello')
+        with patch.object(Config, 'STORAGE_SHARDS', 2), patch.object(Config, 'BACKUP_DIR', str(tmp_path / 'copies')):
+            run = BackupScheduler(sharded.db_path).run_once()
+        assert sum(message_count(backup['path']) for backup in run['files']) == 6
+        assert sorted(os.listdir(tmp_path / 'copies'))[1].startswith('chat.shard1-')
+
+    def test_trigger_while_running(self, chat_db):
+        """Test a second trigger is refused while a backup runs"""
+        scheduler = BackupScheduler(chat_db.db_path)
+        scheduler.running = True
+        assert scheduler.trigger() is False
@@ -0,0 +1,157 @@
+"""
+Unit tests for the change log and ?action=changes feed
+"""
+
+import os
+import shutil
+import pytest
+from unittest.mock import patch
+from app.utils.change_feed import ChangeFeedError
+from app.utils.database import DatabaseManager, change_feed_enabled
+from app.utils.retention import RetentionManager, build_policies
+from config import Config
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'db', 'init_database.sql')
+
+
+@pytest.fixture(autouse=True)
+def feed_enabled():
+    with patch.object(Config, 'CHANGE_FEED_ENABLED', True):
+        yield
+
+
+def events(feed):
+    return [(change['entity'], change['op']) for change in feed['changes']]
+
+
+def change_triggers(db):
+    conn = db.get_connection()
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%_change_%'"
+        ).fetchall()]
+    finally:
+        conn.close()
+
+
+class TestChangeLog:
+    """Test triggers record every write in sequence order"""
+
+    def test_writes_are_recorded(self, db_manager):
+        """Test session, message and response writes each get an event"""
+        db_manager.create_session('session_feed', '127.0.0.1')
+        message_id = db_manager.create_message('session_feed', 'hello')
+        db_manager.mark_messages_processed([message_id])
+        db_manager.create_response('session_feed', 'hi', message_id)
+
+        feed = db_manager.get_changes(0, 100)
+        assert events(feed) == [
+            ('session', 'insert'), ('message', 'insert'), ('message', 'update'), ('response', 'insert')
+        ]
+        seqs = [change['seq'] for change in feed['changes']]
+        assert seqs == sorted(seqs) and len(set(seqs)) == len(seqs)
+        assert feed['changes'][1]['entity_id'] == message_id
+        assert feed['changes'][1]['row']['message'] == 'hello'
+        assert feed['changes'][1]['row']['processed'] == 1
+        assert feed['changes'][0]['row']['id'] == 'session_feed'
+        assert feed['last_seq'] == seqs[-1]
+
+    def test_resume_is_exact(self, db_manager):
+        """Test paging with after_seq sees every event once"""
+        for n in range(7):
+            db_manager.create_message('session_feed', f'message {n}')
+        seen = []
+        after = 0
+        while True:
+            feed = db_manager.get_changes(after, 3)
+            seen.extend(change['row']['message'] for change in feed['changes'])
+            after = feed['last_seq']
+            if not feed['has_more']:
+                break
+        assert seen == [f'message {n}' for n in range(7)]
+        assert db_manager.get_changes(after, 3)['changes'] == []
+
+    def test_entity_filter(self, db_manager):
+        """Test events can be limited to some entities"""
+        db_manager.create_session('session_feed', '127.0.0.1')
+        db_manager.create_message('session_feed', 'hello')
+        assert events(db_manager.get_changes(0, 10, ['message'])) == [('message', 'insert')]
+        with pytest.raises(ChangeFeedError):
+            db_manager.get_changes(0, 10, ['bogus'])
+
+    def test_deletes_and_reset(self, db_manager):
+        """Test deleted rows report no row, and a reset is announced without reusing seq"""
+        message_id = db_manager.create_message('session_feed', 'hello')
+        conn = db_manager.get_connection()
+        conn.execute("DELETE FROM web_chat_messages WHERE id = ?", (message_id,))
+        conn.commit()
+        conn.close()
+        before = db_manager.get_changes(0, 10)
+        assert events(before) == [('message', 'insert'), ('message', 'delete')]
+        assert before['changes'][1]['row'] is None
+
+        db_manager.reset_database()
+        after = db_manager.get_changes(before['last_seq'], 10)
+        assert events(after) == [('database', 'reset')]
+        assert after['changes'][0]['seq'] > before['last_seq']
+
+    def test_bookkeeping_updates_are_ignored(self, db_manager):
+        """Test trigger-maintained columns do not produce events"""
+        db_manager.migrate_storage_format()
+        message_id = db_manager.create_message('session_feed', 'hello')
+        conn = db_manager.get_connection()
+        conn.execute("UPDATE web_chat_messages SET ts = ts + 1 WHERE id = ?", (message_id,))
+        conn.commit()
+        conn.close()
+        assert events(db_manager.get_changes(0, 10)) == [('message', 'insert')]
+
+    def test_retention(self, db_manager):
+        """Test old events are purged by the retention policy"""
+        db_manager.create_message('session_feed', 'hello')
+        conn = db_manager.get_connection()
+        conn.execute("UPDATE change_log SET created_at = created_at - 3 * 86400000")
+        conn.commit()
+        conn.close()
+        db_manager.create_message('session_feed', 'again')
+        policy = [p for p in build_policies(0, change_log_ttl=86400) if p.name == 'expired_change_log'][0]
+        assert RetentionManager(db_manager).purge(policy)['deleted'] == 1
+        assert len(db_manager.get_changes(0, 10)['changes']) == 1
+
+
+class TestOptIn:
+    """Test writes only pay for the change log when the feed is enabled"""
+
+    @pytest.fixture
+    def chat_db_path(self, tmp_path):
+        shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+        return str(tmp_path / 'chat.db')
+
+    def test_off_by_default(self, chat_db_path):
+        """Test a new database gets no triggers and no feed"""
+        with patch.object(Config, 'CHANGE_FEED_ENABLED', False):
+            db = DatabaseManager(chat_db_path)
+            db.create_message('session_feed', 'hello')
+            assert change_triggers(db) == []
+            assert db.get_changes(0, 10) is None
+            assert db.get_change_log_head() is None
+
+    def test_sync_drops_triggers(self, chat_db_path):
+        """Test turning the feed off removes the triggers and keeps recorded events"""
+        db = DatabaseManager(chat_db_path)
+        db.create_message('session_feed', 'hello')
+        assert len(change_triggers(db)) == 9
+        with patch.object(Config, 'CHANGE_FEED_ENABLED', False):
+            assert db.sync_change_feed() is False
+            db.create_message('session_feed', 'unrecorded')
+        assert change_triggers(db) == []
+        assert db.sync_change_feed() is True
+        assert events(db.get_changes(0, 10)) == [('message', 'insert')]
+
+    def test_replication_settings(self):
+        """Test a primary with replicas records changes and a replica does not"""
+        with patch.object(Config, 'CHANGE_FEED_ENABLED', False):
+            assert change_feed_enabled() is False
+            with patch.object(Config, 'REPLICATION_KEY', 'secret'):
+                assert change_feed_enabled() is True
+                with patch.object(Config, 'REPLICA_OF', 'http://primary'):
+                    assert change_feed_enabled() is False
@@ -0,0 +1,117 @@
+"""
+Unit tests for the columnar (NumPy/Arrow) export
+"""
+
+import os
+import pytest
+from unittest.mock import patch
+from app.utils import columnar
+from app.utils.columnar import ColumnarUnavailable, check_format
+
+needs_pyarrow = pytest.mark.skipif(columnar.pa is None, reason='pyarrow not installed')
+
+
+@pytest.fixture
+def traffic(db_manager):
+    """Messages with responses one minute later"""
+    db_manager.create_session('session_columnar', '127.0.0.1')
+    conn = db_manager.get_connection()
+    for i in range(5):
+        cursor = conn.execute(
+            "INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES (?, ?, datetime('now', '-10 minutes'))",
+            ('session_columnar', 'x' * (i + 1))
+        )
+        conn.execute(
+            "INSERT INTO web_chat_responses (session_id, response, message_id, timestamp) "
+            "VALUES (?, ?, ?, datetime('now', '-9 minutes'))",
+            ('session_columnar', 'reply', cursor.lastrowid)
+        )
+    conn.execute(
+        "INSERT INTO web_chat_responses (session_id, response, timestamp) VALUES ('session_columnar', 'unprompted', datetime('now'))"
+    )
+    conn.commit()
+    conn.close()
+    return db_manager
+
+
+class TestCheckFormat:
+    """Test format validation"""
+
+    def test_unknown_format(self):
+        """Test unknown formats are rejected"""
+        with pytest.raises(ValueError):
+            check_format('csv')
+
+    def test_missing_numpy(self):
+        """Test a clear error when numpy is not installed"""
+        with patch.object(columnar, 'np', None):
+            with pytest.raises(ColumnarUnavailable):
+                check_format('npz')
+
+    def test_missing_pyarrow(self):
+        """Test a clear error when pyarrow is not installed"""
+        with patch.object(columnar, 'np', object()), patch.object(columnar, 'pa', None):
+            with pytest.raises(ColumnarUnavailable):
+                check_format('parquet')
+
+
+class TestNpzExport:
+    """Test .npz exports"""
+
+    def test_npz_columns(self, traffic):
+        """Test lengths, latencies and missing message ids"""
+        np = columnar.np
+        path, counts = traffic.export_columnar('npz', ['messages', 'responses'])
+        try:
+            assert counts == {'messages': 5, 'responses': 6}
+            with np.load(path) as data:
+                assert data['messages.length'].tolist() == [1, 2, 3, 4, 5]
+                assert data['messages.session_id'].dtype.kind == 'U'
+                latency = data['responses.latency_seconds']
+                assert latency[:5].tolist() == [60.0] * 5
+                assert np.isnan(latency[5])
+                assert data['responses.message_id'][5] == columnar.MISSING_ID
+        finally:
+            os.remove(path)
+
+    def test_chunked_passes(self, traffic):
+        """Test results do not depend on the chunk size"""
+        conn = traffic.get_connection()
+        try:
+            chunks = list(columnar.iter_chunks(conn, 'messages', chunk_size=2))
+        finally:
+            conn.close()
+        assert [len(chunk['id']) for chunk in chunks] == [2, 2, 1]
+
+    def test_arrow_requires_single_table(self, traffic):
+        """Test arrow and parquet exports take one table"""
+        if columnar.pa is None:
+            pytest.skip('pyarrow not installed')
+        with pytest.raises(ValueError):
+            traffic.export_columnar('arrow', ['messages', 'responses'])
+
+
+@needs_pyarrow
+class TestArrowExport:
+    """Test Arrow and Parquet exports"""
+
+    def test_arrow_file_memory_maps(self, traffic):
+        """Test the Arrow IPC file loads through a memory map"""
+        pa = columnar.pa
+        path, counts = traffic.export_columnar('arrow', ['responses'])
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            assert table.num_rows == counts['responses'] == 6
+            assert table.column('message_id').null_count == 1
+        finally:
+            os.remove(path)
+
+    def test_parquet(self, traffic):
+        """Test Parquet output round trips"""
+        path, counts = traffic.export_columnar('parquet', ['messages'], start='2000-01-01 00:00:00')
+        try:
+            table = columnar.pq.read_table(path)
+            assert table.column('length').to_pylist() == [1, 2, 3, 4, 5]
+        finally:
+            os.remove(path)
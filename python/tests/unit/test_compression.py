@@ -0,0 +1,110 @@
+"""
+Unit tests for transparent body compression
+"""
+
+import pytest
+from unittest.mock import patch
+from app.utils.compression import BodyCodec, CompressionError, build_dictionary, reset_codecs, zstandard
+from config import Config
+
+LONG_TEXT = 'The quick brown fox jumps over the lazy dog. ' * 100
+
+
+@pytest.fixture
+def compression_enabled():
+    """Enable compression for bodies of 256 bytes and more"""
+    reset_codecs()
+    with patch.object(Config, 'COMPRESSION_THRESHOLD', 256):
+        yield
+    reset_codecs()
+
+
+class TestBodyCodec:
+    """Test encoding and decoding of bodies"""
+
+    def test_disabled_codec_passes_through(self):
+        """Test a zero threshold stores plain text"""
+        codec = BodyCodec(threshold=0)
+        assert codec.encode(LONG_TEXT) == LONG_TEXT
+        assert codec.decode(LONG_TEXT) == LONG_TEXT
+
+    def test_short_bodies_stay_plain(self):
+        """Test bodies below the threshold are not compressed"""
+        codec = BodyCodec(threshold=256)
+        assert codec.encode('hello') == 'hello'
+        assert codec.stats()['skipped'] == 1
+
+    def test_round_trip(self):
+        """Test long bodies are compressed and restored"""
+        codec = BodyCodec(threshold=256)
+        stored = codec.encode(LONG_TEXT)
+
+        assert isinstance(stored, bytes)
+        assert len(stored) < len(LONG_TEXT)
+        assert codec.decode(stored) == LONG_TEXT
+        stats = codec.stats()
+        assert stats['compressed'] == 1
+        assert stats['decoded'] == 1
+        assert stats['ratio'] > 1
+
+    def test_round_trip_with_dictionary(self):
+        """Test a preset dictionary is used for both directions"""
+        dictionary = build_dictionary([LONG_TEXT] * 3, size=1024)
+        codec = BodyCodec(threshold=256, dictionary=dictionary)
+        stored = codec.encode(LONG_TEXT)
+        assert codec.decode(stored) == LONG_TEXT
+
+    def test_dictionary_mismatch_raises(self):
+        """Test rows compressed with another dictionary are rejected"""
+        stored = BodyCodec(threshold=256, dictionary=b'first dictionary').encode(LONG_TEXT)
+        with pytest.raises(CompressionError):
+            BodyCodec(threshold=256, dictionary=b'second dictionary').decode(stored)
+
+    def test_rows_without_dictionary_still_decode(self):
+        """Test adding a dictionary keeps earlier rows readable"""
+        stored = BodyCodec(threshold=256).encode(LONG_TEXT)
+        assert BodyCodec(threshold=256, dictionary=b'new dictionary').decode(stored) == LONG_TEXT
+
+    @pytest.mark.skipif(zstandard is None, reason='zstandard not installed')
+    def test_zstd_round_trip(self):
+        """Test zstd bodies are restored"""
+        codec = BodyCodec('zstd', threshold=256)
+        assert codec.decode(codec.encode(LONG_TEXT)) == LONG_TEXT
+
+    def test_unknown_algorithm(self):
+        """Test unknown algorithms are refused"""
+        with pytest.raises(ValueError):
+            BodyCodec('brotli')
+
+
+class TestDatabaseCompression:
+    """Test compression in DatabaseManager reads and writes"""
+
+    def test_messages_and_responses_round_trip(self, db_manager, compression_enabled):
+        """Test stored bodies are compressed and read back as text"""
+        db_manager.create_session('session_compress', '127.0.0.1')
+        db_manager.create_message('session_compress', LONG_TEXT)
+        db_manager.create_response('session_compress', LONG_TEXT)
+
+        messages = db_manager.get_unprocessed_messages(10, 0)
+        assert [m['message'] for m in messages if m['session_id'] == 'session_compress'] == [LONG_TEXT]
+        assert db_manager.get_session_responses('session_compress')[0]['response'] == LONG_TEXT
+
+        stored = db_manager.get_compression_stats()
+        assert stored['web_chat_messages']['compressed_rows'] == 1
+        assert stored['web_chat_responses']['compressed_bytes'] < len(LONG_TEXT)
+
+    def test_runtime_stats_report_compression(self, db_manager, compression_enabled):
+        """Test admin stats include ratio and CPU time"""
+        db_manager.create_response('session_compress', LONG_TEXT)
+        stats = db_manager.get_runtime_stats()['compression']
+        assert stats['enabled'] is True
+        assert stats['ratio'] > 1
+        assert 'compress_ms' in stats
+
+    def test_train_dictionary(self, db_manager, tmp_path):
+        """Test a dictionary file is built from stored bodies"""
+        db_manager.create_message('session_compress', LONG_TEXT)
+        result = db_manager.train_compression_dictionary(str(tmp_path / 'bodies.dict'), size=512)
+        assert result['bytes'] == 512
+        assert (tmp_path / 'bodies.dict').read_bytes()
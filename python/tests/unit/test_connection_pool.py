@@ -0,0 +1,140 @@
+"""
+Unit tests for the read-only connection pool
+"""
+
+import pytest
+import sqlite3
+from unittest.mock import patch
+from app.utils.connection_pool import ReadOnlyPool, PooledConnection, get_read_pool
+from config import Config
+
+
+@pytest.fixture
+def pool_db(tmp_path):
+    """Small database for pool tests"""
+    db_path = str(tmp_path / 'pool.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("INSERT INTO items (name) VALUES ('first')")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+class TestReadOnlyPool:
+    """Test ReadOnlyPool behaviour"""
+
+    def test_connections_are_read_only(self, pool_db):
+        """Test writes through a pooled connection are rejected"""
+        pool = ReadOnlyPool(pool_db, size=2)
+        conn = pool.acquire()
+        try:
+            assert conn.execute("SELECT name FROM items").fetchone()['name'] == 'first'
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO items (name) VALUES ('second')")
+        finally:
+            conn.close()
+        pool.close_all()
+
+    def test_close_returns_connection_to_pool(self, pool_db):
+        """Test closed connections are reused"""
+        pool = ReadOnlyPool(pool_db, size=2)
+        first = pool.acquire()
+        first.close()
+        second = pool.acquire()
+        second.close()
+
+        assert pool.stats()['opened'] == 1
+        assert pool.stats()['reused'] == 1
+        pool.close_all()
+
+    def test_pool_size_is_bounded(self, pool_db):
+        """Test connections beyond the pool size are closed on release"""
+        pool = ReadOnlyPool(pool_db, size=1)
+        conns = [pool.acquire() for _ in range(3)]
+        for conn in conns:
+            conn.close()
+
+        assert pool.stats()['idle'] == 1
+        pool.close_all()
+        assert pool.stats()['idle'] == 0
+
+    def test_closed_proxy_raises(self, pool_db):
+        """Test a released proxy cannot be used again"""
+        pool = ReadOnlyPool(pool_db, size=1)
+        conn = pool.acquire()
+        conn.close()
+        conn.close()
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.cursor()
+        pool.close_all()
+
+    def test_enables_wal(self, pool_db):
+        """Test the pool switches the database to the configured journal mode"""
+        pool = ReadOnlyPool(pool_db, size=1, journal_mode='WAL')
+        with pool.acquire() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        pool.close_all()
+
+    def test_keeps_journal_mode_by_default(self, pool_db):
+        """Test the pool leaves a rollback-journal database as it is and releases its reads"""
+        pool = ReadOnlyPool(pool_db, size=1)
+        reader = pool.acquire()
+        assert reader.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
+        reader.execute("SELECT * FROM items").fetchone()
+        reader.close()
+
+        writer = sqlite3.connect(pool_db, timeout=0.1)
+        writer.execute("INSERT INTO items (name) VALUES ('second')")
+        writer.commit()
+        writer.close()
+        with pool.acquire() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+        pool.close_all()
+
+    def test_snapshot_does_not_block_writer(self, pool_db):
+        """Test a long read transaction does not block a writer under WAL"""
+        pool = ReadOnlyPool(pool_db, size=1, journal_mode='WAL')
+        reader = pool.acquire()
+        cursor = reader.execute("SELECT * FROM items")
+        cursor.fetchone()
+
+        writer = sqlite3.connect(pool_db, timeout=0.1)
+        writer.execute("INSERT INTO items (name) VALUES ('second')")
+        writer.commit()
+        writer.close()
+
+        reader.close()
+        pool.close_all()
+
+
+class TestDatabaseManagerReadPool:
+    """Test DatabaseManager routing of reporting queries"""
+
+    def test_get_read_connection_uses_pool(self, db_manager):
+        """Test admin reads go through the read-only pool"""
+        conn = db_manager.get_read_connection()
+        assert isinstance(conn, PooledConnection)
+        conn.close()
+
+    def test_get_read_connection_fallback(self, db_manager):
+        """Test a zero pool size falls back to a regular connection"""
+        with patch.object(Config, 'READ_POOL_SIZE', 0):
+            conn = db_manager.get_read_connection()
+            assert isinstance(conn, sqlite3.Connection)
+            conn.close()
+
+    def test_reporting_queries_see_writes(self, db_manager):
+        """Test reports read committed data through the pool"""
+        db_manager.create_session('session_report', '127.0.0.1')
+        db_manager.create_message('session_report', 'hello')
+
+        sessions = db_manager.get_active_sessions(10, 0)
+        assert any(s['id'] == 'session_report' and s['message_count'] == 1 for s in sessions)
+        assert db_manager.get_session_count(active=False) >= 1
+
+    def test_registry_shares_pool(self, pool_db):
+        """Test the registry returns one pool per database path"""
+        assert get_read_pool(pool_db) is get_read_pool(pool_db)
+        get_read_pool(pool_db).close_all()
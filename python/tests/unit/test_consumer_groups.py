@@ -0,0 +1,90 @@
+"""
+Unit tests for inbox consumer groups
+"""
+
+import pytest
+from app.utils.consumer_groups import ConsumerGroupError, heartbeat, owner, parse_member
+
+
+@pytest.fixture
+def backlog(db_manager):
+    """Two pending messages in each of twenty sessions"""
+    for n in range(20):
+        for turn in range(2):
+            db_manager.create_message(f'session_{n:02d}', f'message {n} {turn}')
+    return db_manager
+
+
+def drain(db_manager, assignment, mode='fifo'):
+    messages = db_manager.get_unprocessed_messages(100, 0, mode=mode, assignment=assignment)
+    db_manager.mark_messages_processed([message['id'] for message in messages])
+    return messages
+
+
+class TestOwnership:
+    """Test rendezvous assignment of sessions"""
+
+    def test_parse_member(self):
+        """Test group and consumer must be given together and be simple names"""
+        assert parse_member(None, None) is None
+        assert parse_member('agents', 'a-1') == ('agents', 'a-1')
+        with pytest.raises(ConsumerGroupError):
+            parse_member('agents', None)
+        with pytest.raises(ConsumerGroupError):
+            parse_member('agents', 'bad name')
+
+    def test_join_moves_few_sessions(self):
+        """Test a new consumer only takes sessions over from others"""
+        sessions = [f'session_{n}' for n in range(200)]
+        before = {s: owner(s, ['a', 'b', 'c']) for s in sessions}
+        after = {s: owner(s, ['a', 'b', 'c', 'd']) for s in sessions}
+        moved = [s for s in sessions if before[s] != after[s]]
+        assert all(after[s] == 'd' for s in moved)
+        assert 20 < len(moved) < 80
+
+    def test_expired_members_are_dropped(self, db_manager):
+        """Test consumers that stop polling leave the group"""
+        conn = db_manager.get_connection()
+        try:
+            db_manager.join_consumer_group('agents', 'a')
+            assert heartbeat(conn, 'agents', 'b', ttl=30) == ['a', 'b']
+            assert heartbeat(conn, 'agents', 'b', ttl=30, now=10 ** 10) == ['b']
+        finally:
+            conn.close()
+
+
+class TestPartitionedInbox:
+    """Test consumers split the inbox by session"""
+
+    @pytest.mark.parametrize('mode', ['fifo', 'fair'])
+    def test_consumers_split_sessions(self, backlog, mode):
+        """Test every message goes to exactly one consumer, whole sessions at a time"""
+        backlog.join_consumer_group('agents', 'a')
+        first = backlog.join_consumer_group('agents', 'b')
+        second = backlog.join_consumer_group('agents', 'a')
+        assert first.consumers == second.consumers == ('a', 'b')
+
+        assert backlog.get_unprocessed_message_count(assignment=first) + \
+            backlog.get_unprocessed_message_count(assignment=second) == 40
+
+        got_b = drain(backlog, first, mode)
+        got_a = drain(backlog, second, mode)
+        assert len(got_a) + len(got_b) == 40
+        sessions_a = {m['session_id'] for m in got_a}
+        sessions_b = {m['session_id'] for m in got_b}
+        assert sessions_a and sessions_b and not sessions_a & sessions_b
+        for messages in (got_a, got_b):
+            for session_id in sessions_a | sessions_b:
+                turns = [m['message'] for m in messages if m['session_id'] == session_id]
+                assert turns == sorted(turns)
+
+    def test_leave_rebalances(self, backlog):
+        """Test the remaining consumer takes over a departed consumer's sessions"""
+        backlog.join_consumer_group('agents', 'a')
+        backlog.join_consumer_group('agents', 'b')
+        assert backlog.leave_consumer_group('agents', 'b') is True
+        alone = backlog.join_consumer_group('agents', 'a')
+        assert len(drain(backlog, alone)) == 40
+        assert backlog.get_consumer_groups() == {
+            'agents': [{'consumer': 'a', 'idle_seconds': pytest.approx(0, abs=1)}]
+        }
@@ -53,7 +53,7 @@ class TestDatabaseManager:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_conn.cursor.return_value = mock_cursor
-            mock_cursor.fetchone.return_value = {'id': 1}
+            mock_cursor.fetchone.return_value = {'id': 'session_test_1', 'uid': 'test_uid_123'}
             mock_get_conn.return_value = mock_conn
             
             result = db_manager.session_exists('session_test_1')
@@ -257,7 +257,7 @@ class TestDatabaseManager:
     
     def test_get_active_sessions(self, db_manager):
         """Test getting active sessions"""
-        with patch.object(db_manager, 'get_connection') as mock_get_conn:
+        with patch.object(db_manager, 'get_read_connection') as mock_get_conn:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_conn.cursor.return_value = mock_cursor
@@ -288,7 +288,7 @@ class TestDatabaseManager:
     
     def test_get_session_count(self, db_manager):
         """Test getting session count"""
-        with patch.object(db_manager, 'get_connection') as mock_get_conn:
+        with patch.object(db_manager, 'get_read_connection') as mock_get_conn:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_conn.cursor.return_value = mock_cursor
@@ -305,13 +305,14 @@ class TestDatabaseManager:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_conn.cursor.return_value = mock_cursor
-            mock_cursor.rowcount = 2
+            mock_cursor.fetchall.side_effect = [[('session_a',), ('session_b',)], []]
             mock_get_conn.return_value = mock_conn
             
             cleaned_count = db_manager.cleanup_inactive_sessions()
             
             assert cleaned_count == 2
-            mock_cursor.execute.assert_called_once()
+            # SELECT batch + sessions delete; child rows are kept without RETENTION_CASCADE
+            assert mock_cursor.execute.call_count == 2
             mock_conn.commit.assert_called_once()
     
     def test_get_all_config(self, db_manager):
@@ -367,7 +368,7 @@ class TestDatabaseManager:
             mock_conn = Mock()
             mock_cursor = Mock()
             mock_conn.cursor.return_value = mock_cursor
-            mock_cursor.fetchone.return_value = [1]
+            mock_cursor.fetchone.return_value = {'id': 'session_test_1', 'uid': 'test_uid_123'}
             mock_get_conn.return_value = mock_conn
             
             db_manager.session_exists('session_test_1')
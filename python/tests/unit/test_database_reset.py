@@ -0,0 +1,121 @@
+"""
+Unit tests for the fast database reset (file swap)
+"""
+
+import os
+import pytest
+import sqlite3
+from app.utils.database import DatabaseManager
+
+
+@pytest.fixture
+def populated_db(tmp_path):
+    """Database with sessions, messages and responses"""
+    db_manager = DatabaseManager(str(tmp_path / 'reset.db'))
+    conn = db_manager.get_connection()
+    conn.executescript("""
+        DROP TABLE IF EXISTS web_chat_sessions;
+        DROP TABLE IF EXISTS web_chat_messages;
+        DROP TABLE IF EXISTS web_chat_responses;
+        DROP VIEW IF EXISTS active_sessions_view;
+        CREATE TABLE web_chat_sessions (id TEXT PRIMARY KEY, uid TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_active TEXT DEFAULT CURRENT_TIMESTAMP, ip_address TEXT, metadata TEXT);
+        CREATE TABLE web_chat_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, message TEXT,
+            timestamp TEXT, processed INTEGER DEFAULT 0);
+        CREATE TABLE web_chat_responses (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, response TEXT,
+            timestamp TEXT, message_id INTEGER);
+        CREATE INDEX idx_messages_session ON web_chat_messages(session_id);
+    """)
+    conn.commit()
+    conn.close()
+
+    for i in range(3):
+        session_id = f'session_reset_{i}'
+        db_manager.create_session(session_id, '127.0.0.1')
+        message_id = db_manager.create_message(session_id, 'hello')
+        db_manager.create_response(session_id, 'hi', message_id)
+    db_manager.update_config({'api_key': 'kept_key'})
+    return db_manager
+
+
+class TestEstimateRowCount:
+    """Test cheap row count estimates"""
+
+    def test_rowid_range_estimate(self, populated_db):
+        """Test the estimate falls back to the rowid range"""
+        conn = populated_db.get_connection()
+        try:
+            assert populated_db.estimate_row_count(conn, 'web_chat_messages') == 3
+        finally:
+            conn.close()
+
+    def test_sqlite_stat1_estimate(self, populated_db):
+        """Test ANALYZE statistics are preferred when present"""
+        conn = populated_db.get_connection()
+        try:
+            conn.execute("ANALYZE")
+            assert populated_db.estimate_row_count(conn, 'web_chat_messages') == 3
+        finally:
+            conn.close()
+
+
+class TestResetDatabase:
+    """Test reset_database swaps in an empty file"""
+
+    def test_reset_clears_data_and_keeps_schema(self, populated_db):
+        """Test data is gone while tables, indexes and config survive"""
+        result = populated_db.reset_database()
+
+        assert result['mode'] == 'swap'
+        assert result['cleaned_data'] == {'sessions': 3, 'messages': 3, 'responses': 3}
+        assert result['archive_path'] is None
+
+        conn = populated_db.get_connection()
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM web_chat_messages").fetchone()[0] == 0
+            assert conn.execute("SELECT COUNT(*) FROM web_chat_sessions").fetchone()[0] == 0
+            indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+            assert 'idx_messages_session' in indexes
+        finally:
+            conn.close()
+        assert populated_db.get_config('api_key') == 'kept_key'
+
+    def test_reset_keeps_ids_monotonic(self, populated_db):
+        """Test AUTOINCREMENT counters carry over so ids are never reused"""
+        populated_db.reset_database()
+        populated_db.create_session('session_after', '127.0.0.1')
+        assert populated_db.create_message('session_after', 'new') == 4
+
+    def test_reset_invalidates_session_directory(self, populated_db):
+        """Test cached sessions are forgotten after the swap"""
+        assert populated_db.session_exists('session_reset_0') is True
+        populated_db.reset_database()
+        assert populated_db.session_exists('session_reset_0') is False
+
+    def test_reset_with_archive(self, populated_db):
+        """Test the old file is kept when archiving"""
+        result = populated_db.reset_database(archive=True)
+
+        assert result['archive_path'] is not None
+        assert os.path.exists(result['archive_path'])
+        conn = sqlite3.connect(result['archive_path'])
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM web_chat_messages").fetchone()[0] == 3
+        finally:
+            conn.close()
+
+    def test_reset_skips_virtual_table_shadows(self, populated_db):
+        """Test FTS5 shadow tables are recreated by the virtual table, not copied"""
+        conn = populated_db.get_connection()
+        conn.execute("CREATE VIRTUAL TABLE search_index USING fts5(body)")
+        conn.execute("INSERT INTO search_index (body) VALUES ('hello world')")
+        conn.commit()
+        conn.close()
+
+        populated_db.reset_database()
+
+        conn = populated_db.get_connection()
+        try:
+            assert conn.execute("SELECT COUNT(*) FROM search_index").fetchone()[0] == 0
+        finally:
+            conn.close()
@@ -0,0 +1,67 @@
+"""
+Unit tests for the streaming NDJSON export
+"""
+
+import gzip
+import json
+import pytest
+from app.utils.connection_pool import get_read_pool
+from app.utils.export import ExportError, gzip_stream, ndjson, normalize_timestamp, parse_tables
+
+
+class TestExportHelpers:
+    """Test parameter parsing and encoders"""
+
+    def test_parse_tables_defaults_to_all(self):
+        """Test an empty tables parameter exports everything"""
+        assert parse_tables('') == ['sessions', 'messages', 'responses']
+
+    def test_parse_tables_rejects_unknown(self):
+        """Test unknown table names are refused"""
+        with pytest.raises(ExportError):
+            parse_tables('messages,rate_limits')
+
+    def test_normalize_timestamp(self):
+        """Test ISO 8601 input compares against SQLite timestamps"""
+        assert normalize_timestamp('2024-01-02T03:04:05Z') == '2024-01-02 03:04:05'
+        assert normalize_timestamp(None) is None
+
+    def test_ndjson_lines(self):
+        """Test one JSON document per line"""
+        body = b''.join(ndjson([{'id': 1}, {'id': 2}]))
+        assert [json.loads(line) for line in body.splitlines()] == [{'id': 1}, {'id': 2}]
+
+    def test_gzip_stream(self):
+        """Test the gzip stream decompresses to the input"""
+        chunks = [b'{"id": 1}\n', b'{"id": 2}\n']
+        assert gzip.decompress(b''.join(gzip_stream(chunks))) == b''.join(chunks)
+
+
+class TestExportRows:
+    """Test DatabaseManager.export_rows"""
+
+    def test_export_rows_in_chunks(self, db_manager):
+        """Test rows are streamed table by table"""
+        db_manager.create_session('session_export', '127.0.0.1')
+        for i in range(5):
+            db_manager.create_message('session_export', f'message {i}')
+        db_manager.create_response('session_export', 'reply')
+
+        rows = list(db_manager.export_rows(['messages', 'responses'], chunk_size=2))
+        messages = [row for row in rows if row['table'] == 'messages' and row['session_id'] == 'session_export']
+        assert [row['message'] for row in messages] == [f'message {i}' for i in range(5)]
+        assert rows[-1]['table'] == 'responses'
+
+    def test_export_time_window(self, db_manager):
+        """Test from/to bound the exported rows"""
+        db_manager.create_message('session_export', 'in window')
+        assert list(db_manager.export_rows(['messages'], start='2999-01-01 00:00:00')) == []
+        assert len(list(db_manager.export_rows(['messages'], end='2999-01-01 00:00:00'))) >= 1
+
+    def test_closing_the_stream_releases_the_connection(self, db_manager):
+        """Test an abandoned export returns its pooled connection"""
+        db_manager.create_message('session_export', 'hello')
+        rows = db_manager.export_rows(['messages'])
+        next(rows)
+        rows.close()
+        assert get_read_pool(db_manager.db_path).stats()['idle'] == 1
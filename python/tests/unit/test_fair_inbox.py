@@ -0,0 +1,106 @@
+"""
+Unit tests for fair per-session inbox scheduling
+"""
+
+import json
+import pytest
+from app.utils.fair_inbox import fair_params, fair_query, parse_mode
+
+
+@pytest.fixture
+def backlog(db_manager):
+    """A chatty session with five pending messages and two quiet ones"""
+    db_manager.migrate_storage_format()
+    conn = db_manager.get_connection()
+    for session_id in ('session_chatty', 'session_a', 'session_b'):
+        conn.execute("INSERT INTO web_chat_sessions (id, uid) VALUES (?, ?)", (session_id, f'uid_{session_id}'))
+    rows = [('session_chatty', f'chatty {n}', f'2024-01-01 10:00:0{n}') for n in range(5)]
+    rows += [('session_a', 'a 0', '2024-01-01 10:00:06'), ('session_b', 'b 0', '2024-01-01 10:00:07'),
+             ('session_a', 'a 1', '2024-01-01 10:00:08')]
+    for session_id, message, timestamp in rows:
+        conn.execute(
+            "INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES (?, ?, ?)",
+            (session_id, message, timestamp)
+        )
+    conn.commit()
+    conn.close()
+    return db_manager
+
+
+def bodies(messages):
+    return [message['message'] for message in messages]
+
+
+class TestFairInbox:
+    """Test round-robin ordering, caps and weights"""
+
+    def test_fifo_is_unchanged(self, backlog):
+        """Test the default mode still drains the oldest messages first"""
+        assert bodies(backlog.get_unprocessed_messages(3, 0)) == ['chatty 0', 'chatty 1', 'chatty 2']
+
+    def test_round_robin(self, backlog):
+        """Test every session gets a turn before any gets a second"""
+        messages = backlog.get_unprocessed_messages(5, 0, mode='fair')
+        assert bodies(messages) == ['chatty 0', 'a 0', 'b 0', 'chatty 1', 'a 1']
+        assert messages[1]['uid'] == 'uid_session_a'
+
+    def test_pages_follow_schedule(self, backlog):
+        """Test offset pages continue the same schedule"""
+        first = backlog.get_unprocessed_messages(4, 0, mode='fair')
+        second = backlog.get_unprocessed_messages(4, 4, mode='fair')
+        assert bodies(first + second) == bodies(backlog.get_unprocessed_messages(8, 0, mode='fair'))
+        assert len(first + second) == 8
+
+    def test_per_session_cap(self, backlog):
+        """Test no session places more than the cap on a page"""
+        messages = backlog.get_unprocessed_messages(10, 0, mode='fair', per_session=2)
+        assert bodies(messages) == ['chatty 0', 'a 0', 'b 0', 'chatty 1', 'a 1']
+
+    def test_weight(self, backlog):
+        """Test inbox_weight metadata gives a session more turns per round"""
+        conn = backlog.get_connection()
+        conn.execute("UPDATE web_chat_sessions SET metadata = ? WHERE id = 'session_chatty'",
+                     (json.dumps({'inbox_weight': 2}),))
+        conn.commit()
+        conn.close()
+        messages = backlog.get_unprocessed_messages(6, 0, mode='fair')
+        assert bodies(messages) == ['chatty 0', 'chatty 1', 'a 0', 'b 0', 'chatty 2', 'chatty 3']
+
+    def test_since(self, backlog):
+        """Test since filters before scheduling"""
+        messages = backlog.get_unprocessed_messages(10, 0, since='2024-01-01 10:00:03', mode='fair')
+        assert bodies(messages) == ['chatty 4', 'a 0', 'b 0', 'a 1']
+
+    def test_text_columns(self, backlog):
+        """Test the same schedule on databases without the integer columns"""
+        conn = backlog.get_connection()
+        try:
+            rows = conn.execute(fair_query(False, False), fair_params(None, 0, 5, 0)).fetchall()
+        finally:
+            conn.close()
+        assert [row['message'] for row in rows] == ['chatty 0', 'a 0', 'b 0', 'chatty 1', 'a 1']
+
+    def test_queues_use_pending_index(self, backlog):
+        """Test each session's queue head is read through the per-session index"""
+        backlog.get_unprocessed_messages(1, 0, mode='fair')
+        conn = backlog.get_connection()
+        plan = ' '.join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN " + fair_query(True, False), fair_params(None, 0, 5, 0)
+        ))
+        conn.close()
+        assert 'idx_messages_pending_session_ts' in plan
+
+    def test_parse_mode(self):
+        """Test unknown modes are rejected"""
+        assert parse_mode(None, 'fifo') == 'fifo'
+        assert parse_mode('FAIR', 'fifo') == 'fair'
+        with pytest.raises(ValueError):
+            parse_mode('random', 'fifo')
+
+    def test_sessions_without_rows(self, db_manager):
+        """Test messages of sessions with no session row still get their own queues"""
+        for session_id, count in (('session_x', 3), ('session_y', 1)):
+            for n in range(count):
+                db_manager.create_message(session_id, f'{session_id} {n}')
+        messages = db_manager.get_unprocessed_messages(2, 0, mode='fair')
+        assert [m['session_id'] for m in messages] == ['session_x', 'session_y']
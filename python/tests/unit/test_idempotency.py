@@ -0,0 +1,119 @@
+"""
+Unit tests for idempotency keys on message and outbox writes
+"""
+
+import pytest
+from unittest.mock import patch
+from app.utils.idempotency import DuplicateRequest, IdempotencyKeyError, parse_key
+from app.utils.retention import RetentionManager, build_policies
+from config import Config
+
+
+def count_rows(db_manager, table):
+    conn = db_manager.get_connection()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def backdate_keys(db_manager, key, age):
+    conn = db_manager.get_connection()
+    conn.execute("UPDATE idempotency_keys SET created_at = datetime('now', ?) WHERE key = ?", (age, key))
+    conn.commit()
+    conn.close()
+
+
+class TestParseKey:
+    """Test reading keys from requests"""
+
+    def test_header_wins_over_body(self):
+        """Test the Idempotency-Key header takes precedence over client_msg_id"""
+        assert parse_key('header-key', 'body-key') == 'header-key'
+        assert parse_key(None, 'body-key') == 'body-key'
+        assert parse_key(None, 42) == '42'
+        assert parse_key(None, None) is None
+        assert parse_key('  ', None) is None
+
+    def test_invalid_keys(self):
+        """Test overlong and non-printable keys are rejected"""
+        with pytest.raises(IdempotencyKeyError):
+            parse_key('x' * 129)
+        with pytest.raises(IdempotencyKeyError):
+            parse_key('line\nbreak')
+
+
+class TestWriteOnce:
+    """Test duplicate writes are rolled back"""
+
+    def test_duplicate_message_is_not_inserted(self, db_manager):
+        """Test the second write returns the original response"""
+        result = {'session_id': 'session_idem', 'uid': 'abc', 'is_new_user': True}
+        message_id = db_manager.create_message('session_idem', 'hello', idempotency_key='k1', response=result)
+
+        with pytest.raises(DuplicateRequest) as excinfo:
+            db_manager.create_message('session_idem', 'hello', idempotency_key='k1', response={})
+
+        assert excinfo.value.response == dict(result, message_id=message_id)
+        assert count_rows(db_manager, 'web_chat_messages') == 1
+
+    def test_keys_are_scoped(self, db_manager):
+        """Test the same key may be used by another session or endpoint"""
+        db_manager.create_message('session_one', 'hello', idempotency_key='k1')
+        db_manager.create_message('session_two', 'hello', idempotency_key='k1')
+        db_manager.create_response('session_one', 'reply', idempotency_key='k1')
+
+        assert count_rows(db_manager, 'web_chat_messages') == 2
+        assert count_rows(db_manager, 'web_chat_responses') == 1
+
+    def test_find_response(self, db_manager):
+        """Test stored responses are found before any write"""
+        response_id = db_manager.create_response('session_idem', 'reply', idempotency_key='r1',
+                                                 result={'session_id': 'session_idem'})
+        found = db_manager.find_idempotent_response('outbox', 'session_idem', 'r1')
+        assert found == {'session_id': 'session_idem', 'response_id': response_id}
+        assert db_manager.find_idempotent_response('outbox', 'session_idem', 'r2') is None
+
+    def test_writes_without_key_are_unchanged(self, db_manager):
+        """Test no key row is written without a key"""
+        db_manager.create_message('session_idem', 'hello')
+        db_manager.create_message('session_idem', 'hello')
+        assert count_rows(db_manager, 'web_chat_messages') == 2
+        assert count_rows(db_manager, 'idempotency_keys') == 0
+
+
+class TestRetention:
+    """Test keys are only kept for a bounded time"""
+
+    def test_expired_keys_are_purged(self, db_manager):
+        """Test the retention policy deletes keys older than the TTL"""
+        db_manager.create_message('session_idem', 'hello', idempotency_key='old')
+        db_manager.create_message('session_idem', 'hello', idempotency_key='new')
+        conn = db_manager.get_connection()
+        conn.execute("UPDATE idempotency_keys SET created_at = datetime('now', '-2 days') WHERE key = 'old'")
+        conn.commit()
+        conn.close()
+
+        policy = [p for p in build_policies(0, idempotency_ttl=86400) if p.name == 'expired_idempotency_keys'][0]
+        assert RetentionManager(db_manager).purge(policy)['deleted'] == 1
+        assert db_manager.find_idempotent_response('messages', 'session_idem', 'new') is not None
+
+    def test_expired_key_is_not_replayed(self, db_manager):
+        """Test a key older than IDEMPOTENCY_TTL is a new write, without the scheduler"""
+        db_manager.create_message('session_idem', 'hello', idempotency_key='old')
+        backdate_keys(db_manager, 'old', '-2 days')
+        assert db_manager.find_idempotent_response('messages', 'session_idem', 'old') is None
+
+        message_id = db_manager.create_message('session_idem', 'again', idempotency_key='old')
+        assert count_rows(db_manager, 'web_chat_messages') == 2
+        found = db_manager.find_idempotent_response('messages', 'session_idem', 'old')
+        assert found['message_id'] == message_id
+
+    def test_writes_purge_expired_keys(self, db_manager):
+        """Test keyed writes drop expired keys, throttled by IDEMPOTENCY_PURGE_INTERVAL"""
+        for key in ('a', 'b'):
+            db_manager.create_message('session_idem', 'hello', idempotency_key=key)
+            backdate_keys(db_manager, key, '-2 days')
+        with patch.object(Config, 'IDEMPOTENCY_PURGE_INTERVAL', 0):
+            db_manager.create_message('session_idem', 'hello', idempotency_key='c')
+        assert count_rows(db_manager, 'idempotency_keys') == 1
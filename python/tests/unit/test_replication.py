@@ -0,0 +1,215 @@
+"""
+Unit tests for change-feed replication to read replicas
+"""
+
+import os
+import shutil
+import pytest
+from unittest.mock import patch
+from app.utils.database import DatabaseManager
+from app.utils.replication import ReplicaFollower, ReplicationError, is_write
+from config import Config
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'db', 'init_database.sql')
+
+
+@pytest.fixture(autouse=True)
+def change_feed_enabled(test_db):
+    """Record changes on the primary (the app may be created before this fixture runs)"""
+    with patch.object(Config, 'CHANGE_FEED_ENABLED', True):
+        DatabaseManager(test_db).sync_change_feed()
+        yield
+
+
+class Reply:
+    """A Flask test response shaped like a requests response"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.data
+        self._response = response
+
+    def json(self):
+        return self._response.get_json()
+
+
+class ClientTransport:
+    """Sends the follower's HTTP calls to a primary app's test client"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        return Reply(self.client.get('/api/v1/', query_string=params, headers=headers))
+
+    def post(self, url, params=None, json=None, headers=None, timeout=None):
+        return Reply(self.client.post('/api/v1/', query_string=params, json=json, headers=headers))
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """An empty database for the replica"""
+    shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+    return DatabaseManager(str(tmp_path / 'replica.db'))
+
+
+@pytest.fixture
+def follower(client, replica):
+    return ReplicaFollower(replica.db_path, 'http://primary', 'test_api_key_123', batch_size=2,
+                           http=ClientTransport(client))
+
+
+def post_message(client, session_id, message):
+    return client.post('/api/v1/', query_string={'action': 'messages'},
+                       json={'session_id': session_id, 'message': message}).get_json()['data']
+
+
+class TestFollower:
+    """Test applying the primary's change feed"""
+
+    def test_replica_catches_up(self, client, replica, follower):
+        """Test sessions, messages and responses reach the replica in pages"""
+        message_id = post_message(client, 'session_replicated', 'hello')['message_id']
+        client.post('/api/v1/', query_string={'action': 'outbox'},
+                    json={'session_id': 'session_replicated', 'response': 'hi there', 'message_id': message_id},
+                    headers={'Authorization': 'Bearer test_api_key_123'})
+
+        result = follower.sync_once()
+        assert result['pages'] > 1
+        assert replica.session_exists('session_replicated')
+        responses = replica.get_session_responses('session_replicated')
+        assert [r['response'] for r in responses] == ['hi there']
+
+        # Resumes from the stored position
+        post_message(client, 'session_replicated', 'again')
+        assert follower.sync_once()['applied'] >= 1
+        assert replica.get_unprocessed_message_count() == 2
+        assert follower.sync_once()['applied'] == 0
+
+    def test_updates_and_deletes(self, client, db_manager, replica, follower):
+        """Test processed flags and deletions replicate"""
+        post_message(client, 'session_replicated', 'one')
+        post_message(client, 'session_gone', 'two')
+        client.get('/api/v1/', query_string={'action': 'inbox'}, headers={'Authorization': 'Bearer test_api_key_123'})
+        conn = db_manager.get_connection()
+        conn.execute("DELETE FROM web_chat_messages WHERE session_id = 'session_gone'")
+        conn.execute("DELETE FROM web_chat_sessions WHERE id = 'session_gone'")
+        conn.commit()
+        conn.close()
+
+        follower.sync_once()
+        assert replica.get_unprocessed_message_count() == 0
+        assert not replica.session_exists('session_gone')
+        assert replica.session_exists('session_replicated')
+
+    def test_reset_replicates(self, client, db_manager, replica, follower):
+        """Test a fast reset on the primary empties the replica"""
+        post_message(client, 'session_replicated', 'one')
+        follower.sync_once()
+        db_manager.reset_database()
+        follower.sync_once()
+        assert not replica.session_exists('session_replicated')
+
+    def test_truncated_log_is_detected(self, client, db_manager, replica, follower):
+        """Test the follower stops when retention purged events it never applied"""
+        post_message(client, 'session_replicated', 'one')
+        post_message(client, 'session_replicated', 'two')
+        conn = db_manager.get_connection()
+        conn.execute("DELETE FROM change_log WHERE seq = (SELECT MIN(seq) FROM change_log)")
+        conn.commit()
+        conn.close()
+        with pytest.raises(ReplicationError):
+            follower.sync_once()
+        assert 'seed the replica' in follower.status()['last_error']
+
+    def test_activity_is_forwarded(self, client, db_manager, follower):
+        """Test session activity seen by the replica reaches the primary"""
+        post_message(client, 'session_replicated', 'one')
+        conn = db_manager.get_connection()
+        conn.execute("UPDATE web_chat_sessions SET last_active = '2000-01-01 00:00:00'")
+        conn.commit()
+        conn.close()
+
+        follower.touch('session_replicated')
+        with patch.object(Config, 'ACTIVITY_FLUSH_INTERVAL', 0):
+            follower.sync_once()
+        conn = db_manager.get_connection()
+        last_active = conn.execute("SELECT last_active FROM web_chat_sessions").fetchone()[0]
+        conn.close()
+        assert last_active > '2000-01-01 00:00:00'
+        assert follower.status()['pending_activity'] == 0
+
+
+class TestReplicaHousekeeping:
+    """Test a replica's own tables stay bounded"""
+
+    def test_applied_rows_are_not_logged(self, client, replica, follower):
+        """Test a replica drops its change log triggers and records nothing it applies"""
+        with patch.object(Config, 'REPLICA_OF', 'http://primary'):
+            assert replica.sync_change_feed() is False
+        post_message(client, 'session_replicated', 'hello')
+        assert follower.sync_once()['applied'] > 0
+        conn = replica.get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == 0
+        conn.close()
+
+    def test_bookkeeping_retention(self, replica):
+        """Test replicas expire bookkeeping tables but leave conversations to the primary"""
+        with patch.object(Config, 'REPLICA_OF', 'http://primary'), \
+                patch.object(Config, 'RETENTION_SESSION_TTL', 1800), \
+                patch.object(Config, 'RETENTION_MESSAGE_TTL', 86400):
+            tables = {policy.table for policy in replica.get_retention_policies()}
+        assert tables == {'rate_limits', 'idempotency_keys', 'change_log'}
+
+
+class TestForwarding:
+    """Test which requests a replica sends to the primary"""
+
+    def test_is_write(self):
+        """Test writes and reads are told apart"""
+        assert is_write('messages', 'POST')
+        assert is_write('inbox', 'GET')
+        assert is_write('config', 'POST')
+        assert not is_write('config', 'GET')
+        assert not is_write('responses', 'GET')
+
+    def test_replica_forwards_writes(self, client, db_manager):
+        """Test a replica relays writes and serves known sessions locally"""
+        db_manager.create_session('session_local', '127.0.0.1')
+        relayed = []
+
+        def fake_forward(primary_url, method, path, query_string, body, headers, timeout):
+            relayed.append((method, query_string, headers.get('X-Forwarded-For')))
+            return b'{"success": true, "data": {"forwarded": true}}', 200, {'Content-Type': 'application/json'}
+
+        with patch.object(Config, 'REPLICA_OF', 'http://primary'), \
+                patch('app.api.replica.forward_request', side_effect=fake_forward):
+            response = client.post('/api/v1/', query_string={'action': 'messages'},
+                                   json={'session_id': 'session_local', 'message': 'hi'})
+            assert response.get_json()['data'] == {'forwarded': True}
+
+            response = client.get('/api/v1/', query_string={'action': 'responses', 'session_id': 'session_local'})
+            assert response.get_json()['data']['responses'] == []
+
+            client.get('/api/v1/', query_string={'action': 'responses', 'session_id': 'session_unknown'})
+
+        assert [(method, query) for method, query, _ in relayed] == [
+            ('POST', b'action=messages'), ('GET', b'action=responses&session_id=session_unknown')
+        ]
+        assert relayed[0][2] == '127.0.0.1'
+        assert db_manager.get_unprocessed_message_count() == 0
+
+    def test_primary_trusts_replica_address(self, client, db_manager):
+        """Test forwarded client addresses are only used with the replication key"""
+        with patch.object(Config, 'REPLICATION_KEY', 'shared-secret'):
+            client.post('/api/v1/', query_string={'action': 'messages'},
+                        json={'session_id': 'session_trusted', 'message': 'hi'},
+                        headers={'X-Replication-Key': 'shared-secret', 'X-Forwarded-For': '10.0.0.9'})
+            client.post('/api/v1/', query_string={'action': 'messages'},
+                        json={'session_id': 'session_spoofed', 'message': 'hi'},
+                        headers={'X-Replication-Key': 'wrong', 'X-Forwarded-For': '10.0.0.9'})
+        conn = db_manager.get_connection()
+        addresses = dict(conn.execute("SELECT id, ip_address FROM web_chat_sessions").fetchall())
+        conn.close()
+        assert addresses == {'session_trusted': '10.0.0.9', 'session_spoofed': '127.0.0.1'}
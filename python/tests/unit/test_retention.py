@@ -0,0 +1,185 @@
+"""
+Unit tests for batched retention and the retention scheduler
+"""
+
+from unittest.mock import patch
+from app.utils.retention import RetentionManager, RetentionPolicy, RetentionScheduler, build_policies
+from app.utils.rate_limiting import RateLimitManager
+from config import Config
+
+
+def age_sessions(db_manager, session_ids, seconds):
+    conn = db_manager.get_connection()
+    placeholders = ','.join('?' for _ in session_ids)
+    conn.execute(
+        f"UPDATE web_chat_sessions SET last_active = datetime('now', ?) WHERE id IN ({placeholders})",
+        [f'-{seconds} seconds'] + list(session_ids)
+    )
+    conn.commit()
+    conn.close()
+
+
+def count_rows(db_manager, table):
+    conn = db_manager.get_connection()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestBuildPolicies:
+    """Test policy construction from TTLs"""
+
+    def test_zero_ttl_disables_policy(self):
+        """Test tables with a zero TTL are kept forever"""
+        names = [policy.name for policy in build_policies(1800, 0, 0, 0)]
+        assert names == ['inactive_sessions']
+        assert build_policies(0, 0, 0, 0) == []
+
+    def test_cascade_is_opt_in(self):
+        """Test child rows are only deleted when cascading is enabled"""
+        assert build_policies(1800)[0].cascade is False
+        policies = build_policies(1800, rate_limit_ttl=0, cascade=True)
+        assert [policy.name for policy in policies] == ['inactive_sessions', 'orphaned_messages', 'orphaned_responses']
+        assert policies[0].cascade is True
+
+    def test_defaults_keep_conversations(self, db_manager):
+        """Test the configured defaults only expire bookkeeping tables"""
+        tables = {policy.table for policy in db_manager.get_retention_policies()}
+        assert tables == {'rate_limits', 'idempotency_keys'}
+        assert Config.RETENTION_INTERVAL == 0
+
+        with patch.object(Config, 'CHANGE_FEED_ENABLED', True):
+            db_manager.ensure_change_feed()
+            tables = {policy.table for policy in db_manager.get_retention_policies()}
+        assert tables == {'rate_limits', 'idempotency_keys', 'change_log'}
+
+    def test_all_policies(self):
+        """Test every policy is built when all TTLs are set"""
+        names = [policy.name for policy in build_policies(1800, 86400, 86400, 3600)]
+        assert 'processed_messages' in names
+        assert 'old_responses' in names
+        assert 'expired_rate_limits' in names
+
+
+class TestRetentionManager:
+    """Test batched deletes"""
+
+    def test_session_purge_cascades_in_batches(self, db_manager):
+        """Test expired sessions and their children are deleted batch by batch"""
+        session_ids = [f'session_old_{i}' for i in range(5)]
+        for session_id in session_ids:
+            db_manager.create_session(session_id, '127.0.0.1')
+            message_id = db_manager.create_message(session_id, 'hello')
+            db_manager.create_response(session_id, 'hi', message_id)
+        db_manager.create_session('session_fresh', '127.0.0.1')
+        db_manager.create_message('session_fresh', 'still here')
+        age_sessions(db_manager, session_ids, 7200)
+
+        manager = RetentionManager(db_manager, batch_size=2, pause=0)
+        progress = []
+        result = manager.purge(build_policies(1800, cascade=True)[0], progress.append)
+
+        assert result['deleted'] == 5
+        assert result['batches'] == 3
+        assert progress == [2, 4, 5]
+        assert count_rows(db_manager, 'web_chat_sessions') == 1
+        assert count_rows(db_manager, 'web_chat_messages') == 1
+        assert count_rows(db_manager, 'web_chat_responses') == 0
+        assert db_manager.session_exists('session_old_0') is False
+
+    def test_session_purge_keeps_children(self, db_manager):
+        """Test expired sessions are deleted alone when not cascading"""
+        db_manager.create_session('session_old', '127.0.0.1')
+        message_id = db_manager.create_message('session_old', 'hello')
+        db_manager.create_response('session_old', 'hi', message_id)
+        age_sessions(db_manager, ['session_old'], 7200)
+
+        result = RetentionManager(db_manager, pause=0).purge(build_policies(1800)[0])
+
+        assert result['deleted'] == 1
+        assert db_manager.session_exists('session_old') is False
+        assert count_rows(db_manager, 'web_chat_messages') == 1
+        assert count_rows(db_manager, 'web_chat_responses') == 1
+
+    def test_orphan_purge(self, db_manager):
+        """Test messages and responses without a session are removed"""
+        db_manager.create_message('session_gone', 'orphan')
+        db_manager.create_response('session_gone', 'orphan reply')
+
+        manager = RetentionManager(db_manager, batch_size=10, pause=0)
+        for policy in build_policies(0, cascade=True):
+            manager.purge(policy)
+
+        assert count_rows(db_manager, 'web_chat_messages') == 0
+        assert count_rows(db_manager, 'web_chat_responses') == 0
+
+    def test_generic_policy_respects_limit(self, db_manager):
+        """Test non-session policies delete at most batch_size rows per transaction"""
+        conn = db_manager.get_connection()
+        conn.executemany(
+            "INSERT INTO rate_limits (ip_address, endpoint, count, window_start) VALUES (?, '/api/messages', 1, '2000-01-01 00:00:00')",
+            [(f'10.0.0.{i}',) for i in range(7)]
+        )
+        conn.commit()
+        conn.close()
+
+        policy = RetentionPolicy('old_limits', 'rate_limits', "window_start < ?", ('2001-01-01 00:00:00',))
+        result = RetentionManager(db_manager, batch_size=3, pause=0).purge(policy)
+
+        assert result['deleted'] == 7
+        assert result['batches'] == 3
+        assert count_rows(db_manager, 'rate_limits') == 0
+
+    def test_incremental_vacuum_reports_mode(self, db_manager):
+        """Test incremental vacuum reports the auto_vacuum mode and free pages"""
+        result = RetentionManager(db_manager).incremental_vacuum(10)
+        assert 'auto_vacuum' in result
+        assert result['pages_freed'] >= 0
+
+
+class TestRetentionScheduler:
+    """Test scheduler runs and status reporting"""
+
+    def test_run_once_reports_timings(self, db_manager):
+        """Test a run records per-policy results"""
+        db_manager.create_session('session_stale', '127.0.0.1')
+        age_sessions(db_manager, ['session_stale'], 7200)
+
+        scheduler = RetentionScheduler(db_manager.db_path, interval=3600)
+        with patch.object(Config, 'RETENTION_SESSION_TTL', 1800):
+            result = scheduler.run_once()
+
+        assert result['deleted'] >= 1
+        assert result['error'] is None
+        assert result['policies'][0]['policy'] == 'inactive_sessions'
+        assert 'duration_ms' in result
+        status = scheduler.status()
+        assert status['runs'] == 1
+        assert status['running'] is False
+
+    def test_trigger_wait(self, db_manager):
+        """Test a synchronous trigger completes a run"""
+        scheduler = RetentionScheduler(db_manager.db_path, interval=3600)
+        assert scheduler.trigger(wait=True) is True
+        assert scheduler.last_run is not None
+
+    def test_trigger_refused_while_running(self, db_manager):
+        """Test concurrent runs are refused"""
+        scheduler = RetentionScheduler(db_manager.db_path, interval=3600)
+        scheduler.running = True
+        assert scheduler.trigger() is False
+
+
+class TestRateLimitPurgeThrottle:
+    """Test the request-path purge is throttled"""
+
+    def test_purge_runs_at_most_once_per_interval(self, db_manager):
+        """Test should_purge only allows one purge per interval"""
+        limiter = RateLimitManager(db_manager)
+        with patch.object(Config, 'RATE_LIMIT_PURGE_INTERVAL', 3600):
+            limiter.should_purge()
+            assert limiter.should_purge() is False
+
+        with patch.object(Config, 'RATE_LIMIT_PURGE_INTERVAL', 0):
+            assert limiter.should_purge() is True
@@ -0,0 +1,157 @@
+"""
+Unit tests for incrementally maintained hourly rollups
+"""
+
+from app.utils.rollups import RollupManager, query_rollups, request_counter
+from app.utils.rate_limiting import RateLimitManager
+from app.utils.sharding import SHARD_ID_BITS, seed_id_ranges
+
+
+def rollup_values(db_manager, metric):
+    conn = db_manager.get_connection()
+    try:
+        return {row['hour']: row['value'] for row in query_rollups(conn, metrics=[metric])}
+    finally:
+        conn.close()
+
+
+class TestRollupManager:
+    """Test watermark-based rollups"""
+
+    def test_counts_rows_per_hour(self, db_manager):
+        """Test messages and responses are counted into their hour"""
+        conn = db_manager.get_connection()
+        conn.executemany(
+            "INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES ('s', 'm', ?)",
+            [('2024-01-01 10:05:00',), ('2024-01-01 10:55:00',), ('2024-01-01 11:00:00',)]
+        )
+        conn.commit()
+        conn.close()
+
+        result = RollupManager(db_manager).run()
+
+        assert result['messages'] == 3
+        assert rollup_values(db_manager, 'messages') == {
+            '2024-01-01 10:00:00': 2,
+            '2024-01-01 11:00:00': 1
+        }
+
+    def test_only_new_rows_are_processed(self, db_manager):
+        """Test a second run only counts rows added since the watermark"""
+        db_manager.create_message('session_rollup', 'first')
+        manager = RollupManager(db_manager)
+        manager.run()
+        db_manager.create_message('session_rollup', 'second')
+
+        result = manager.run()
+
+        assert result['messages'] == 1
+        assert sum(rollup_values(db_manager, 'messages').values()) == 2
+        assert manager.run()['messages'] == 0
+
+    def test_batches_respect_batch_size(self, db_manager):
+        """Test catch-up proceeds in id batches"""
+        for i in range(5):
+            db_manager.create_response('session_rollup', f'reply {i}')
+
+        result = RollupManager(db_manager, batch_size=2).run()
+
+        assert result['responses'] == 5
+        assert sum(rollup_values(db_manager, 'responses').values()) == 5
+
+    def test_shard_id_range(self, db_manager):
+        """Test a shard whose ids start far above zero is caught up in a few batches"""
+        conn = db_manager.get_connection()
+        seed_id_ranges(conn, 3)
+        conn.close()
+        ids = [db_manager.create_message('session_rollup', f'message {i}') for i in range(5)]
+        assert ids[0] > 3 << SHARD_ID_BITS
+
+        result = RollupManager(db_manager, batch_size=2).run()
+
+        assert result['messages'] == 5
+        assert sum(rollup_values(db_manager, 'messages').values()) == 5
+
+    def test_sessions_counted_on_install(self, db_manager):
+        """Test stored sessions are counted into their hours when rollups start"""
+        conn = db_manager.get_connection()
+        conn.execute(
+            "INSERT INTO web_chat_sessions (id, uid, created_at) VALUES ('session_old', 'u1', '2024-01-01 10:30:00')"
+        )
+        conn.commit()
+        conn.close()
+        db_manager.create_session('session_now', '127.0.0.1')
+
+        result = RollupManager(db_manager).run()
+
+        assert result['sessions'] == 2
+        values = rollup_values(db_manager, 'sessions')
+        assert values.pop('2024-01-01 10:00:00') == 1
+        assert list(values.values()) == [1]
+
+    def test_sessions_deleted_before_their_hour_closes(self, db_manager):
+        """Test sessions are counted at insert, so purging them early keeps the count"""
+        manager = RollupManager(db_manager)
+        manager.run()
+        db_manager.create_session('session_brief', '127.0.0.1')
+        conn = db_manager.get_connection()
+        conn.execute("DELETE FROM web_chat_sessions WHERE id = 'session_brief'")
+        conn.commit()
+        conn.close()
+
+        assert manager.run()['sessions'] == 0
+        assert sum(rollup_values(db_manager, 'sessions').values()) == 1
+
+    def test_sessions_after_closed_hour_watermark(self, db_manager):
+        """Test a closed-hour watermark from earlier runs is honoured on install"""
+        conn = db_manager.get_connection()
+        RollupManager(db_manager).ensure_tables(conn)
+        conn.executemany(
+            "INSERT INTO web_chat_sessions (id, uid, created_at) VALUES (?, 'u', ?)",
+            [('session_counted', '2024-01-01 09:59:00'), ('session_new', '2024-01-01 10:01:00')]
+        )
+        conn.execute("INSERT INTO stats_watermarks (name, position) VALUES ('sessions', '2024-01-01 10:00:00')")
+        conn.commit()
+        conn.close()
+
+        assert RollupManager(db_manager).run()['sessions'] == 1
+        assert rollup_values(db_manager, 'sessions') == {'2024-01-01 10:00:00': 1}
+
+    def test_rollups_survive_retention(self, db_manager):
+        """Test counts stay after the raw rows are deleted"""
+        db_manager.create_message('session_rollup', 'short lived')
+        RollupManager(db_manager).run()
+        conn = db_manager.get_connection()
+        conn.execute("DELETE FROM web_chat_messages")
+        conn.commit()
+        conn.close()
+
+        assert sum(rollup_values(db_manager, 'messages').values()) == 1
+
+
+class TestRequestCounts:
+    """Test per-endpoint request counters"""
+
+    def test_rate_limited_requests_are_counted(self, db_manager):
+        """Test allowed and rejected requests are flushed per endpoint"""
+        request_counter.drain(db_manager.db_path)
+        limiter = RateLimitManager(db_manager)
+        for _ in range(3):
+            limiter.check_rate_limit('10.0.0.1', '/api/messages', 2)
+
+        assert request_counter.pending(db_manager.db_path) == 3
+        RollupManager(db_manager).run()
+
+        assert sum(rollup_values(db_manager, 'requests:/api/messages').values()) == 2
+        assert sum(rollup_values(db_manager, 'rejected:/api/messages').values()) == 1
+        assert request_counter.pending(db_manager.db_path) == 0
+
+    def test_prefix_filter(self, db_manager):
+        """Test a trailing colon selects every endpoint"""
+        request_counter.drain(db_manager.db_path)
+        request_counter.record(db_manager.db_path, '/api/inbox')
+        request_counter.record(db_manager.db_path, '/api/outbox')
+
+        rows = db_manager.get_rollups(metrics=['requests:'])
+
+        assert {row['metric'] for row in rows} == {'requests:/api/inbox', 'requests:/api/outbox'}
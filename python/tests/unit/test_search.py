@@ -0,0 +1,146 @@
+"""
+Unit tests for the FTS5 conversation search index
+"""
+
+import pytest
+from unittest.mock import patch
+from app.utils.compression import reset_codecs
+from app.utils.search import (
+    SearchIndexBuilder, SearchQueryError, build_match_query, decode_cursor, fts5_available, reset_search_index
+)
+from config import Config
+
+pytestmark = pytest.mark.skipif(not fts5_available(), reason='SQLite built without FTS5')
+
+
+@pytest.fixture(autouse=True)
+def search_enabled():
+    with patch.object(Config, 'SEARCH_INDEX_ENABLED', True):
+        yield
+
+
+@pytest.fixture
+def conversations(db_manager):
+    """A few sessions with messages and responses, indexed"""
+    db_manager.build_search_index()
+    db_manager.create_session('session_search_a', '127.0.0.1')
+    db_manager.create_session('session_search_b', '127.0.0.1')
+    message_id = db_manager.create_message('session_search_a', 'My invoice shows the wrong billing address')
+    db_manager.create_response('session_search_a', 'I have updated the billing address on your invoice', message_id)
+    db_manager.create_message('session_search_b', 'How do I reset my password?')
+    db_manager.create_response('session_search_b', 'Use the reset link on the login page')
+    return db_manager
+
+
+class TestMatchQuery:
+    """Test free-text query building"""
+
+    def test_terms_are_quoted(self):
+        """Test FTS5 operators in user input are treated as plain terms"""
+        assert build_match_query('billing OR address') == '"billing" "OR" "address"'
+
+    def test_prefix_terms(self):
+        """Test a trailing star keeps prefix matching"""
+        assert build_match_query('pass*') == '"pass"*'
+
+    def test_empty_query(self):
+        """Test a query without terms is rejected"""
+        with pytest.raises(SearchQueryError):
+            build_match_query('  "" ')
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected"""
+        with pytest.raises(SearchQueryError):
+            decode_cursor('rank', 'not-a-cursor')
+
+
+class TestConversationSearch:
+    """Test searching through DatabaseManager"""
+
+    def test_matches_messages_and_responses(self, conversations):
+        """Test both sources are searched and snippets highlight terms"""
+        data = conversations.search_conversations('billing')
+
+        assert {r['type'] for r in data['results']} == {'message', 'response'}
+        assert all(r['session_id'] == 'session_search_a' for r in data['results'])
+        assert '[billing]' in data['results'][0]['snippet']
+        assert data['next_cursor'] is None
+
+    def test_keyset_pagination(self, conversations):
+        """Test pages follow each other without overlap"""
+        first = conversations.search_conversations('reset OR billing', limit=2, raw=True)
+        assert len(first['results']) == 2
+        assert first['next_cursor'] is not None
+
+        second = conversations.search_conversations('reset OR billing', limit=2, cursor=first['next_cursor'], raw=True)
+        first_ids = {(r['type'], r['id']) for r in first['results']}
+        second_ids = {(r['type'], r['id']) for r in second['results']}
+        assert len(second_ids) == 2
+        assert not first_ids & second_ids
+
+    def test_recent_order_and_session_filter(self, conversations):
+        """Test ordering by recency within one session"""
+        data = conversations.search_conversations('reset', order='recent', session_id='session_search_b')
+        assert [r['type'] for r in data['results']] == ['response', 'message']
+
+    def test_deleted_rows_leave_the_index(self, conversations):
+        """Test triggers remove deleted rows"""
+        conn = conversations.get_connection()
+        conn.execute("DELETE FROM web_chat_responses WHERE session_id = 'session_search_b'")
+        conn.commit()
+        conn.close()
+
+        data = conversations.search_conversations('reset')
+        assert [r['type'] for r in data['results']] == ['message']
+
+    def test_compressed_bodies_are_indexed(self, db_manager):
+        """Test bodies stored compressed are still searchable"""
+        db_manager.build_search_index()
+        reset_codecs()
+        with patch.object(Config, 'COMPRESSION_THRESHOLD', 64):
+            db_manager.create_response('session_search_c', 'refund approved ' * 20)
+            assert db_manager.rebuild_search_index() >= 1
+        reset_codecs()
+
+        data = db_manager.search_conversations('refund')
+        assert len(data['results']) == 1
+
+    def test_raw_syntax_errors(self, conversations):
+        """Test FTS5 syntax errors surface as query errors"""
+        with pytest.raises(SearchQueryError):
+            conversations.search_conversations('AND (', raw=True)
+
+
+class TestIndexBuild:
+    """Test the index is only built on request, off the request path"""
+
+    def test_not_built_by_constructor(self, db_manager):
+        """Test writes and searches do not create the index"""
+        db_manager.create_message('session_search_a', 'unindexed')
+        assert db_manager.search_conversations('unindexed') is None
+        with patch.object(Config, 'SEARCH_INDEX_ENABLED', False):
+            assert db_manager.build_search_index() == 0
+        assert db_manager.ensure_search_index() is False
+
+    def test_backfill_in_batches(self, db_manager):
+        """Test existing rows are indexed a batch at a time and new rows by triggers"""
+        for n in range(7):
+            db_manager.create_message(f'session_{n}', f'backlog item {n}')
+        with patch.object(Config, 'SEARCH_INDEX_BATCH_SIZE', 3):
+            assert db_manager.build_search_index() == 7
+        assert db_manager.build_search_index() == 0
+
+        db_manager.create_message('session_new', 'backlog item new')
+        assert len(db_manager.search_conversations('backlog', limit=100)['results']) == 8
+        assert db_manager.rebuild_search_index() == 8
+
+    def test_builder_status(self, db_manager):
+        """Test a background build reports its result"""
+        reset_search_index(db_manager.db_path)
+        db_manager.create_message('session_search_a', 'built later')
+        builder = SearchIndexBuilder(db_manager.db_path)
+        assert builder.trigger(wait=True) is True
+        assert builder.last_run['indexed'] == 1
+        assert builder.last_run['error'] is None
+        assert builder.status()['runs'] == 1
+        assert len(db_manager.search_conversations('built')['results']) == 1
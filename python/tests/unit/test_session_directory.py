@@ -0,0 +1,192 @@
+"""
+Unit tests for the in-process session directory (LRU + Bloom filter)
+"""
+
+import sqlite3
+from unittest.mock import patch
+from app.utils.session_directory import BloomFilter, SessionDirectory, get_session_directory
+from config import Config
+
+
+class TestBloomFilter:
+    """Test BloomFilter membership"""
+
+    def test_added_items_are_members(self):
+        """Test there are no false negatives"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f'session_{i}' for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        assert all(item in bloom for item in items)
+        assert bloom.count == 1000
+
+    def test_false_positive_rate_is_bounded(self):
+        """Test the false positive rate stays near the configured error rate"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'session_{i}')
+
+        false_positives = sum(1 for i in range(10000) if f'other_{i}' in bloom)
+        assert false_positives < 500
+
+    def test_clear(self):
+        """Test clearing removes all members"""
+        bloom = BloomFilter(capacity=10)
+        bloom.add('session_a')
+        bloom.clear()
+
+        assert 'session_a' not in bloom
+        assert bloom.count == 0
+
+
+class TestSessionDirectory:
+    """Test SessionDirectory lookups and metrics"""
+
+    def test_hit_and_miss_metrics(self):
+        """Test lookups are counted as hits and misses"""
+        directory = SessionDirectory(capacity=10)
+        assert directory.get_uid('session_a') is None
+        directory.add('session_a', 'uid_a')
+        assert directory.get_uid('session_a') == 'uid_a'
+
+        stats = directory.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+        assert stats['entries'] == 1
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        directory = SessionDirectory(capacity=2)
+        directory.add('session_a', 'uid_a')
+        directory.add('session_b', 'uid_b')
+        directory.get_uid('session_a')
+        directory.add('session_c', 'uid_c')
+
+        assert directory.get_uid('session_b') is None
+        assert directory.get_uid('session_a') == 'uid_a'
+        assert directory.stats()['evictions'] == 1
+
+    def test_known_absent_requires_authoritative_and_warm(self):
+        """Test Bloom filter negatives are only trusted in authoritative mode"""
+        directory = SessionDirectory(capacity=10)
+        assert directory.known_absent('session_x') is False
+
+        directory.authoritative = True
+        assert directory.known_absent('session_x') is False
+
+        directory.warm(['session_a'])
+        assert directory.known_absent('session_x') is True
+        assert directory.known_absent('session_a') is False
+        assert directory.stats()['negative_hits'] == 1
+
+    def test_invalidate_keeps_bloom_bits(self):
+        """Test invalidation drops LRU entries but not Bloom membership"""
+        directory = SessionDirectory(capacity=10, authoritative=True)
+        directory.warm([])
+        directory.add('session_a', 'uid_a')
+        directory.invalidate(['session_a'])
+
+        assert directory.get_uid('session_a') is None
+        assert directory.known_absent('session_a') is False
+
+    def test_clear_forgets_everything(self):
+        """Test clear drops both the LRU and the Bloom filter"""
+        directory = SessionDirectory(capacity=10, authoritative=True)
+        directory.warm([])
+        directory.add('session_a', 'uid_a')
+        directory.clear()
+
+        assert directory.get_uid('session_a') is None
+        assert directory.known_absent('session_a') is True
+
+
+class TestDatabaseManagerDirectory:
+    """Test DatabaseManager lookups through the session directory"""
+
+    def test_session_exists_hit_skips_sql(self, db_manager):
+        """Test a cached session is answered without a connection"""
+        db_manager.create_session('session_cached', '127.0.0.1')
+        with patch.object(db_manager, 'get_connection') as mock_get_conn:
+            assert db_manager.session_exists('session_cached') is True
+            mock_get_conn.assert_not_called()
+
+    def test_get_or_create_uid_hit_skips_sql(self, db_manager):
+        """Test a cached uid is answered without a connection"""
+        uid = db_manager.create_session('session_cached', '127.0.0.1')
+        with patch.object(db_manager, 'get_connection') as mock_get_conn:
+            result = db_manager.get_or_create_uid('session_cached')
+            mock_get_conn.assert_not_called()
+
+        assert result == {'uid': uid, 'is_new': False}
+
+    def test_miss_fills_from_database(self, db_manager):
+        """Test a miss loads the uid from the database into the directory"""
+        uid = db_manager.create_session('session_filled', '127.0.0.1')
+        db_manager.invalidate_session_directory(['session_filled'])
+
+        assert db_manager.session_exists('session_filled') is True
+        assert db_manager.get_session_directory().get_uid('session_filled') == uid
+
+    def test_cleanup_drops_entries(self, db_manager):
+        """Test cleanup_inactive_sessions invalidates cached sessions"""
+        db_manager.create_session('session_old', '127.0.0.1')
+        conn = db_manager.get_connection()
+        conn.execute("UPDATE web_chat_sessions SET last_active = datetime('now', '-2 hours')")
+        conn.commit()
+        conn.close()
+
+        assert db_manager.cleanup_inactive_sessions() == 1
+        assert db_manager.session_exists('session_old') is False
+
+    def test_write_restores_session_deleted_elsewhere(self, db_manager):
+        """Test a write for a cached session deleted by another process recreates its row"""
+        uid = db_manager.create_session('session_gone', '127.0.0.1')
+        # Another worker's retention run: this process's directory is not told
+        conn = sqlite3.connect(db_manager.db_path)
+        conn.execute("DELETE FROM web_chat_sessions WHERE id = 'session_gone'")
+        conn.commit()
+        conn.close()
+
+        assert db_manager.session_exists('session_gone') is True
+        db_manager.create_message('session_gone', 'still here')
+        db_manager.create_response('session_gone', 'reply')
+
+        assert db_manager.get_or_create_uid('session_gone') == {'uid': uid, 'is_new': False}
+        conn = db_manager.get_connection()
+        row = conn.execute("SELECT uid FROM web_chat_sessions WHERE id = 'session_gone'").fetchone()
+        conn.close()
+        assert row['uid'] == uid
+
+    def test_authoritative_mode_answers_negatives(self, db_manager):
+        """Test authoritative mode proves absence without SQL"""
+        db_manager.create_session('session_present', '127.0.0.1')
+        with patch.object(Config, 'SESSION_DIRECTORY_AUTHORITATIVE', True):
+            directory = db_manager.get_session_directory()
+            assert directory.warmed is True
+            with patch.object(db_manager, 'get_connection') as mock_get_conn:
+                assert db_manager.session_exists('session_absent') is False
+                mock_get_conn.assert_not_called()
+        directory.authoritative = False
+
+    def test_disabled_directory(self, db_manager):
+        """Test a zero directory size disables caching"""
+        with patch.object(Config, 'SESSION_DIRECTORY_SIZE', 0):
+            assert db_manager.get_session_directory() is None
+            assert db_manager.session_exists('session_missing') is False
+
+    def test_runtime_stats(self, db_manager):
+        """Test runtime stats expose directory metrics"""
+        db_manager.session_exists('session_missing')
+        stats = db_manager.get_runtime_stats()
+
+        assert stats['session_directory']['misses'] >= 1
+        assert stats['activity_buffer'] == {'enabled': False}
+
+        with patch.object(Config, 'ACTIVITY_FLUSH_INTERVAL', 30):
+            assert 'pending' in db_manager.get_runtime_stats()['activity_buffer']
+
+    def test_registry_shares_directory(self):
+        """Test the registry returns one directory per database path"""
+        assert get_session_directory('shared.db') is get_session_directory('shared.db')
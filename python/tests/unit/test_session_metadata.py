@@ -0,0 +1,109 @@
+"""
+Unit tests for generated columns over session metadata
+"""
+
+import json
+import pytest
+from app.utils.session_metadata import MetadataColumnError, indexed_keys, parse_filters, parse_keys
+
+
+def add_session(db_manager, session_id, metadata):
+    conn = db_manager.get_connection()
+    conn.execute(
+        "INSERT INTO web_chat_sessions (id, uid, last_active, metadata) VALUES (?, 'uid', datetime('now'), ?)",
+        (session_id, metadata if isinstance(metadata, str) else json.dumps(metadata))
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def sessions(db_manager):
+    add_session(db_manager, 'session_a', {'site': 'shop', 'locale': 'en', 'campaign': 7})
+    add_session(db_manager, 'session_b', {'site': 'shop', 'locale': 'de'})
+    add_session(db_manager, 'session_c', {'site': 'blog'})
+    add_session(db_manager, 'session_d', 'not json')
+    return db_manager
+
+
+class TestConfiguration:
+    """Test declaring metadata columns through system_config"""
+
+    def test_parse_keys(self):
+        """Test keys are trimmed, deduplicated and validated"""
+        assert parse_keys(' site, locale ,site,') == ['site', 'locale']
+        assert parse_keys('') == []
+        with pytest.raises(MetadataColumnError):
+            parse_keys("site') --")
+
+    def test_config_update_creates_columns_and_indexes(self, sessions):
+        """Test updating the setting adds virtual columns with indexes"""
+        sessions.update_config({'session_metadata_columns': 'site,locale'})
+
+        conn = sessions.get_connection()
+        assert indexed_keys(conn) == ['site', 'locale']
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(web_chat_sessions)")}
+        conn.close()
+        assert {'idx_sessions_meta_site', 'idx_sessions_meta_locale'} <= indexes
+
+    def test_removed_keys_are_dropped(self, sessions):
+        """Test keys taken out of the setting lose their column"""
+        sessions.update_config({'session_metadata_columns': 'site,locale'})
+        sessions.update_config({'session_metadata_columns': 'site'})
+
+        conn = sessions.get_connection()
+        assert indexed_keys(conn) == ['site']
+        conn.close()
+
+    def test_invalid_setting_is_not_saved(self, sessions):
+        """Test a bad key is rejected before the config row is written"""
+        with pytest.raises(MetadataColumnError):
+            sessions.update_config({'session_metadata_columns': 'site-name'})
+        assert sessions.get_config('session_metadata_columns') is None
+
+    def test_sync_from_stored_setting(self, sessions):
+        """Test columns can be rebuilt from the stored setting"""
+        conn = sessions.get_connection()
+        conn.execute(
+            "INSERT INTO system_config (config_key, config_value) VALUES ('session_metadata_columns', 'campaign')"
+        )
+        conn.commit()
+        conn.close()
+
+        assert sessions.sync_metadata_columns()['added'] == ['campaign']
+
+
+class TestFiltering:
+    """Test metadata filters pushed into SQLite"""
+
+    def test_filter_uses_index(self, sessions):
+        """Test indexed keys are compared on the generated column"""
+        sessions.update_config({'session_metadata_columns': 'site'})
+        conn = sessions.get_connection()
+        plan = ' '.join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM web_chat_sessions WHERE meta_site = ?", ('shop',)
+        ))
+        conn.close()
+        assert 'idx_sessions_meta_site' in plan
+
+        found = sessions.get_active_sessions(50, 0, metadata={'site': 'shop'})
+        assert sorted(s['id'] for s in found) == ['session_a', 'session_b']
+        assert sessions.get_session_count(metadata={'site': 'shop'}) == 2
+
+    def test_filters_combine(self, sessions):
+        """Test several filters must all match, indexed or not"""
+        sessions.update_config({'session_metadata_columns': 'site'})
+        found = sessions.get_active_sessions(50, 0, metadata={'site': 'shop', 'locale': 'de'})
+        assert [s['id'] for s in found] == ['session_b']
+
+    def test_numbers_match_as_text(self, sessions):
+        """Test numeric metadata matches its query string form"""
+        assert sessions.get_session_count(metadata={'campaign': '7'}) == 1
+        sessions.update_config({'session_metadata_columns': 'campaign'})
+        assert sessions.get_session_count(metadata={'campaign': '7'}) == 1
+
+    def test_parse_filters(self):
+        """Test only meta.* arguments are filters"""
+        assert parse_filters({'meta.site': 'shop', 'limit': '10'}) == {'site': 'shop'}
+        with pytest.raises(MetadataColumnError):
+            parse_filters({'meta.a b': 'x'})
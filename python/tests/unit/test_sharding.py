@@ -0,0 +1,231 @@
+"""
+Unit tests for hash-sharded session storage
+"""
+
+import os
+import shutil
+import pytest
+from unittest.mock import patch
+from app import create_app
+from app.utils.sharding import (
+    SHARD_ID_BITS, ShardedDatabaseManager, merge_pages, shard_index, shard_of_id, shard_paths
+)
+from app.utils.search import fts5_available
+from app.utils.storage import open_database
+from config import Config
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'db', 'init_database.sql')
+
+SESSIONS = [f'session_{n:02d}' for n in range(12)]
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    """Three shards in an empty directory"""
+    shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+    return ShardedDatabaseManager(str(tmp_path / 'chat.db'), 3)
+
+
+def add_message(db, session_id, message, timestamp):
+    shard = db.shard_for(session_id)
+    conn = shard.get_connection()
+    conn.execute("INSERT OR IGNORE INTO web_chat_sessions (id, uid) VALUES (?, ?)", (session_id, f'uid_{session_id}'))
+    conn.execute("INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES (?, ?, ?)",
+                 (session_id, message, timestamp))
+    conn.commit()
+    conn.close()
+
+
+class TestPlacement:
+    """Test how sessions and ids map to shards"""
+
+    def test_shard_index_is_stable(self):
+        """Test sessions hash to a fixed shard and spread over all of them"""
+        assert [shard_index(s, 4) for s in SESSIONS] == [shard_index(s, 4) for s in SESSIONS]
+        assert {shard_index(f'session_{n}', 4) for n in range(100)} == {0, 1, 2, 3}
+
+    def test_shard_paths(self):
+        """Test shard 0 is the main file and the rest sit next to it"""
+        assert shard_paths('db/chat.db', 3) == ['db/chat.db', 'db/chat.shard1.db', 'db/chat.shard2.db']
+        assert shard_paths('db/chat.db', 1) == ['db/chat.db']
+
+    def test_single_session_calls_use_one_file(self, sharded):
+        """Test a session's rows live only in its shard, with ids naming the shard"""
+        for session_id in SESSIONS:
+            sharded.create_session(session_id, '127.0.0.1')
+            message_id = sharded.create_message(session_id, f'hello from {session_id}')
+            response_id = sharded.create_response(session_id, 'hi', message_id)
+            index = shard_index(session_id, 3)
+            assert shard_of_id(message_id) == index
+            assert shard_of_id(response_id) == index
+            assert message_id > index << SHARD_ID_BITS
+
+        for session_id in SESSIONS:
+            assert sharded.session_exists(session_id)
+            assert [r['response'] for r in sharded.get_session_responses(session_id)] == ['hi']
+            others = [sharded.shard(i) for i in range(3) if i != shard_index(session_id, 3)]
+            assert not any(other.session_exists(session_id) for other in others)
+
+    def test_open_database(self, tmp_path):
+        """Test the plain manager is used unless shards are configured"""
+        shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+        path = str(tmp_path / 'chat.db')
+        assert not isinstance(open_database(path), ShardedDatabaseManager)
+        with patch.object(Config, 'STORAGE_SHARDS', 2):
+            assert open_database(path).shards == 2
+
+
+class TestMergedReads:
+    """Test cross-shard reads merge the shards' sorted pages"""
+
+    def test_merge_pages(self):
+        """Test the k-way merge pages through the combined order"""
+        pages = [[{'t': 1}, {'t': 4}], [{'t': 2}, {'t': 3}, {'t': 6}], [{'t': 5}]]
+        assert [row['t'] for row in merge_pages(pages, lambda row: row['t'], 2, 3)] == [3, 4, 5]
+
+    def test_fifo_inbox(self, sharded):
+        """Test the inbox is oldest-first across shards and acks reach every shard"""
+        for n, session_id in enumerate(SESSIONS):
+            add_message(sharded, session_id, f'message {n:02d}', f'2024-01-01 10:00:{n:02d}')
+
+        first = sharded.get_unprocessed_messages(5, 0)
+        second = sharded.get_unprocessed_messages(10, 5)
+        assert [m['message'] for m in first + second] == [f'message {n:02d}' for n in range(12)]
+        assert first[0]['uid'] == 'uid_session_00'
+        assert sharded.get_unprocessed_message_count() == 12
+
+        sharded.mark_messages_processed([m['id'] for m in first + second])
+        assert sharded.get_unprocessed_message_count() == 0
+
+    def test_fair_inbox(self, sharded):
+        """Test fair rounds hold across shards"""
+        for n in range(3):
+            add_message(sharded, 'session_00', f'chatty {n}', f'2024-01-01 10:00:0{n}')
+        add_message(sharded, 'session_05', 'quiet a', '2024-01-01 10:00:05')
+        add_message(sharded, 'session_07', 'quiet b', '2024-01-01 10:00:07')
+
+        messages = sharded.get_unprocessed_messages(4, 0, mode='fair')
+        assert [m['message'] for m in messages] == ['chatty 0', 'quiet a', 'quiet b', 'chatty 1']
+        assert 'inbox_round' not in messages[0]
+        assert [m['message'] for m in sharded.get_unprocessed_messages(4, 3, mode='fair')] == ['chatty 1', 'chatty 2']
+
+    def test_active_sessions(self, sharded):
+        """Test session listings merge newest first and counts add up"""
+        for session_id in SESSIONS:
+            sharded.create_session(session_id)
+        for n, session_id in enumerate(SESSIONS):
+            conn = sharded.shard_for(session_id).get_connection()
+            conn.execute("UPDATE web_chat_sessions SET last_active = datetime('now', ?) WHERE id = ?",
+                         (f'-{n} minutes', session_id))
+            conn.commit()
+            conn.close()
+
+        sessions = sharded.get_active_sessions(4, 2)
+        assert [s['id'] for s in sessions] == SESSIONS[2:6]
+        assert sharded.get_session_count() == 12
+
+    def test_reset(self, sharded):
+        """Test a fast reset empties every shard"""
+        for session_id in SESSIONS:
+            sharded.create_message(session_id, 'hello')
+        sharded.reset_database()
+        assert sharded.get_unprocessed_message_count() == 0
+
+    def test_clear_all_data(self, sharded):
+        """Test clearing counts and empties every shard, not just the first"""
+        for session_id in SESSIONS:
+            sharded.create_session(session_id)
+            sharded.create_message(session_id, 'hello')
+        assert sharded.clear_all_data() == {'responses': 0, 'messages': 12, 'sessions': 12}
+        assert all(shard.get_session_count(active=False) == 0 for shard in sharded.shard_databases())
+
+
+    def test_export_rows(self, sharded):
+        """Test exports read every shard, ordered by time then id within each table"""
+        for n, session_id in enumerate(SESSIONS):
+            add_message(sharded, session_id, f'message {n}', f'2024-01-01 00:00:{n:02d}')
+        rows = list(sharded.export_rows(['sessions', 'messages']))
+        messages = [row for row in rows if row['table'] == 'messages']
+        assert [row['message'] for row in messages] == [f'message {n}' for n in range(12)]
+        assert {row['id'] for row in rows if row['table'] == 'sessions'} == set(SESSIONS)
+
+    def test_search(self, sharded):
+        """Test search merges every shard's matches and pages through them"""
+        if not fts5_available():
+            pytest.skip('SQLite built without FTS5')
+        for n, session_id in enumerate(SESSIONS):
+            add_message(sharded, session_id, f'needle {n}', f'2024-01-01 00:00:{n:02d}')
+        with patch.object(Config, 'SEARCH_INDEX_ENABLED', True):
+            assert sharded.build_search_index() == 12
+            first = sharded.search_conversations('needle', limit=8, order='recent')
+            second = sharded.search_conversations('needle', limit=8, cursor=first['next_cursor'], order='recent')
+            one = sharded.search_conversations('needle', session_id=SESSIONS[3])
+        found = [r['session_id'] for r in first['results'] + second['results']]
+        assert found == SESSIONS[::-1]
+        assert second['next_cursor'] is None
+        assert [r['session_id'] for r in one['results']] == [SESSIONS[3]]
+
+    def test_rollups(self, sharded):
+        """Test hourly counts are summed over the shards"""
+        for session_id in SESSIONS:
+            add_message(sharded, session_id, 'hello', '2024-01-01 10:15:00')
+        rows = sharded.get_rollups(metrics=['messages'])
+        assert rows == [{'hour': '2024-01-01 10:00:00', 'metric': 'messages', 'value': 12}]
+        assert not sharded.supports('analytics')
+
+
+class TestShardedApi:
+    """Test the API on sharded storage"""
+
+    def test_message_round_trip(self, tmp_path, test_config):
+        """Test messages, inbox, outbox and responses with two shards"""
+        shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+
+        class ShardedConfig(test_config):
+            DATABASE_PATH = str(tmp_path / 'chat.db')
+
+        with patch.object(Config, 'STORAGE_SHARDS', 2):
+            db = ShardedDatabaseManager(ShardedConfig.DATABASE_PATH, 2)
+            db.update_config({'api_key': 'test_api_key_123', 'admin_key': 'test_admin_key_456'})
+            client = create_app(ShardedConfig).test_client()
+            auth = {'Authorization': 'Bearer test_api_key_123'}
+            for session_id in SESSIONS[:4]:
+                response = client.post('/api/v1/', query_string={'action': 'messages'},
+                                       json={'session_id': session_id, 'message': f'from {session_id}'})
+                assert response.status_code == 200
+
+            data = client.get('/api/v1/', query_string={'action': 'inbox'}, headers=auth).get_json()['data']
+            assert sorted(m['session_id'] for m in data['messages']) == SESSIONS[:4]
+            for message in data['messages']:
+                client.post('/api/v1/', query_string={'action': 'outbox'}, headers=auth,
+                            json={'session_id': message['session_id'], 'response': 'ok', 'message_id': message['id']})
+
+            for session_id in SESSIONS[:4]:
+                data = client.get('/api/v1/', query_string={'action': 'responses', 'session_id': session_id}).get_json()
+                assert [r['response'] for r in data['data']['responses']] == ['ok']
+
+            # Every session's history is read from its own shard
+            admin = {'Authorization': 'Bearer test_admin_key_456'}
+            for session_id in SESSIONS[:4]:
+                data = client.get('/admin/api/session_messages', query_string={'session_id': session_id},
+                                  headers=admin).get_json()['data']
+                assert [m['message'] for m in data['messages']] == [f'from {session_id}']
+                assert [r['response'] for r in data['responses']] == ['ok']
+
+            for path in ('/admin/api/analytics', '/admin/api/export?format=npz'):
+                response = client.get(path, headers=admin)
+                assert response.status_code == 501
+                assert 'with 2 shards' in response.get_json()['error']
+            rows = client.get('/admin/api/export?tables=messages', headers=admin).data.decode().splitlines()
+            assert len(rows) == 4
+
+            response = client.post('/admin/api/clear_data', headers=admin)
+            assert response.get_json()['data']['cleaned_data']['sessions'] == 4
+            assert db.get_session_count(active=False) == 0
+        assert os.path.exists(tmp_path / 'chat.shard1.db')
+
+    def test_replication_is_refused(self, test_config):
+        """Test sharding cannot be combined with replication"""
+        with patch.object(Config, 'STORAGE_SHARDS', 2), patch.object(Config, 'REPLICA_OF', 'http://primary'):
+            with pytest.raises(ValueError):
+                create_app(test_config)
@@ -0,0 +1,279 @@
+"""
+Unit tests for the storage backend contract, run against every backend
+"""
+
+import os
+import shutil
+import pytest
+from unittest.mock import patch
+from app import create_app
+from app.utils.database import DatabaseManager
+from app.utils.idempotency import DuplicateRequest
+from app.utils.memory_storage import MemoryStorage, close_memory_storage, get_memory_storage, utc_now
+from app.utils.storage import StorageBackend, open_database
+from config import Config
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'db', 'init_database.sql')
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def storage(request, tmp_path):
+    """An empty store of each backend"""
+    if request.param == 'sqlite':
+        shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+        yield DatabaseManager(str(tmp_path / 'chat.db'))
+    else:
+        store = MemoryStorage(str(tmp_path / 'chat.db'))
+        yield store
+        store.close()
+
+
+def backdate_session(storage, session_id, seconds):
+    """Move a session's last activity into the past"""
+    if isinstance(storage, MemoryStorage):
+        storage._apply('activity', {'session_id': session_id, 'last_active': utc_now(-seconds)})
+        return
+    conn = storage.get_connection()
+    conn.execute("UPDATE web_chat_sessions SET last_active = datetime('now', ?) WHERE id = ?",
+                 (f'-{seconds} seconds', session_id))
+    conn.commit()
+    conn.close()
+
+
+class TestContract:
+    """Test each backend behaves the same through StorageBackend"""
+
+    def test_implements_interface(self, storage):
+        """Test both backends are StorageBackends"""
+        assert isinstance(storage, StorageBackend)
+
+    def test_sessions(self, storage):
+        """Test creating, finding and listing sessions"""
+        assert not storage.session_exists('session_a')
+        uid = storage.create_session('session_a', '127.0.0.1')
+        assert storage.session_exists('session_a')
+        assert storage.get_or_create_uid('session_a') == {'uid': uid, 'is_new': False}
+        assert storage.get_or_create_uid('session_b')['is_new'] is True
+
+        storage.create_message('session_a', 'hello')
+        storage.update_session_activity('session_a')
+        sessions = storage.get_active_sessions(10, 0)
+        assert {s['id'] for s in sessions} == {'session_a', 'session_b'}
+        counts = {s['id']: s['message_count'] for s in sessions}
+        assert counts == {'session_a': 1, 'session_b': 0}
+        assert storage.get_session_count() == 2
+
+    def test_fifo_inbox(self, storage):
+        """Test the inbox pages oldest first and acks remove messages"""
+        ids = [storage.create_message(f'session_{n % 2}', f'message {n}') for n in range(5)]
+        assert ids == sorted(ids)
+        page = storage.get_unprocessed_messages(3, 1)
+        assert [m['message'] for m in page] == ['message 1', 'message 2', 'message 3']
+        assert set(page[0]) >= {'id', 'session_id', 'message', 'timestamp', 'uid'}
+        assert storage.get_unprocessed_message_count() == 5
+
+        storage.mark_messages_processed(ids[:2])
+        assert [m['id'] for m in storage.get_unprocessed_messages(10, 0)] == ids[2:]
+        assert storage.get_unprocessed_message_count() == 3
+
+    def test_fair_inbox(self, storage):
+        """Test fair mode takes one message per session per round"""
+        for n in range(3):
+            storage.create_message('session_chatty', f'chatty {n}')
+        storage.create_message('session_quiet', 'quiet')
+        messages = storage.get_unprocessed_messages(3, 0, mode='fair')
+        assert [m['message'] for m in messages] == ['chatty 0', 'quiet', 'chatty 1']
+
+    def test_responses(self, storage):
+        """Test responses are returned per session, oldest first"""
+        message_id = storage.create_message('session_a', 'question')
+        first = storage.create_response('session_a', 'answer', message_id)
+        storage.create_response_with_message_id('session_a', 'more')
+        storage.create_response('session_b', 'elsewhere')
+        responses = storage.get_session_responses('session_a')
+        assert [(r['response'], r['message_id']) for r in responses] == [('answer', message_id), ('more', None)]
+        assert responses[0]['id'] == first
+        assert storage.get_session_responses('session_a', since='2999-01-01 00:00:00') == []
+
+    def test_session_messages(self, storage):
+        """Test a session's whole history is returned, and None for unknown sessions"""
+        storage.create_session('session_a', '127.0.0.1')
+        message_id = storage.create_message('session_a', 'question')
+        storage.create_message('session_b', 'elsewhere')
+        storage.mark_messages_processed([message_id])
+        storage.create_response('session_a', 'answer', message_id)
+
+        history = storage.get_session_messages('session_a')
+        assert history['session']['id'] == 'session_a'
+        assert history['session']['ip_address'] == '127.0.0.1'
+        assert [(m['id'], m['message']) for m in history['messages']] == [(message_id, 'question')]
+        assert [(r['response'], r['message_id']) for r in history['responses']] == [('answer', message_id)]
+        assert storage.get_session_messages('session_missing') is None
+
+    def test_idempotency(self, storage):
+        """Test a repeated key returns the first write's response"""
+        message_id = storage.create_message('session_a', 'once', idempotency_key='key-1', response={'uid': 'u'})
+        with pytest.raises(DuplicateRequest) as raised:
+            storage.create_message('session_a', 'once', idempotency_key='key-1', response={'uid': 'u'})
+        assert raised.value.response == {'uid': 'u', 'message_id': message_id}
+        assert storage.get_unprocessed_message_count() == 1
+        assert storage.find_idempotent_response('messages', 'session_b', 'key-1') is None
+
+    def test_idempotency_expires(self, storage):
+        """Test a key is forgotten after IDEMPOTENCY_TTL seconds"""
+        message_id = storage.create_message('session_a', 'once', idempotency_key='key-1')
+        if isinstance(storage, MemoryStorage):
+            storage._apply('idempotency', {'scope': 'messages', 'session_id': 'session_a', 'key': 'key-1',
+                                           'result_id': message_id, 'response': {}, 'created_at': utc_now(-60)})
+        else:
+            conn = storage.get_connection()
+            conn.execute("UPDATE idempotency_keys SET created_at = datetime('now', '-60 seconds')")
+            conn.commit()
+            conn.close()
+        with patch.object(Config, 'IDEMPOTENCY_TTL', 30):
+            assert storage.find_idempotent_response('messages', 'session_a', 'key-1') is None
+            storage.create_message('session_a', 'twice', idempotency_key='key-1')
+            with pytest.raises(DuplicateRequest):
+                storage.create_message('session_a', 'twice', idempotency_key='key-1')
+        assert storage.get_unprocessed_message_count() == 2
+
+    def test_config(self, storage):
+        """Test config values round trip as strings"""
+        storage.update_config({'api_key': 'contract-key', 'session_timeout': 60})
+        assert storage.get_config('api_key') == 'contract-key'
+        assert storage.get_all_config()['session_timeout'] == '60'
+
+    def test_cleanup_and_clear(self, storage):
+        """Test idle sessions are removed with their messages, and clearing empties the store"""
+        storage.create_message('session_idle', 'old')
+        storage.create_session('session_idle')
+        storage.create_message('session_busy', 'new')
+        storage.create_session('session_busy')
+        backdate_session(storage, 'session_idle', int(Config.SESSION_TIMEOUT) + 60)
+        with patch.object(Config, 'RETENTION_CASCADE', True):
+            assert storage.cleanup_inactive_sessions() == 1
+        assert not storage.session_exists('session_idle')
+        assert [m['message'] for m in storage.get_unprocessed_messages(10, 0)] == ['new']
+
+        storage.update_config({'api_key': 'kept-key'})
+        assert storage.clear_all_data()['sessions'] == 1
+        assert storage.get_session_count(active=False) == 0
+        assert storage.get_unprocessed_message_count() == 0
+        assert storage.get_config('api_key') == 'kept-key'
+
+    def test_cleanup_keeps_messages_by_default(self, storage):
+        """Test idle sessions are removed without their messages unless cascading"""
+        storage.create_message('session_idle', 'kept')
+        storage.create_session('session_idle')
+        backdate_session(storage, 'session_idle', int(Config.SESSION_TIMEOUT) + 60)
+        assert storage.cleanup_inactive_sessions() == 1
+        assert not storage.session_exists('session_idle')
+        assert [m['message'] for m in storage.get_unprocessed_messages(10, 0)] == ['kept']
+
+    def test_consumer_groups(self, storage):
+        """Test consumers split the inbox between them"""
+        for n in range(8):
+            storage.create_message(f'session_{n}', f'message {n}')
+        assert storage.join_consumer_group('agents', 'a').consumers == ('a',)
+        second = storage.join_consumer_group('agents', 'b')
+        first = storage.join_consumer_group('agents', 'a')
+        share_a = storage.get_unprocessed_messages(10, 0, assignment=first)
+        share_b = storage.get_unprocessed_messages(10, 0, assignment=second)
+        assert len(share_a) + len(share_b) == 8
+        assert storage.get_unprocessed_message_count(assignment=first) == len(share_a)
+        assert storage.leave_consumer_group('agents', 'b')
+        assert [m['consumer'] for m in storage.get_consumer_groups()['agents']] == ['a']
+
+
+class TestMemoryPersistence:
+    """Test the in-memory engine survives a restart"""
+
+    def test_replays_log(self, tmp_path):
+        """Test changes are rebuilt from the append-only log"""
+        path = str(tmp_path / 'chat.db')
+        store = MemoryStorage(path)
+        ids = [store.create_message('session_a', f'message {n}') for n in range(3)]
+        store.mark_messages_processed(ids[:1])
+        store.create_response('session_a', 'reply', ids[0], idempotency_key='key-1')
+        store.close()
+
+        reloaded = MemoryStorage(path)
+        assert [m['id'] for m in reloaded.get_unprocessed_messages(10, 0)] == ids[1:]
+        assert reloaded.find_idempotent_response('outbox', 'session_a', 'key-1')['response_id'] == 1
+        assert reloaded.create_message('session_a', 'next') == ids[-1] + 1
+        reloaded.close()
+
+    def test_snapshot_then_log(self, tmp_path):
+        """Test a snapshot truncates the log and later changes still replay"""
+        path = str(tmp_path / 'chat.db')
+        store = MemoryStorage(path)
+        store.create_message('session_a', 'before')
+        stats = store.snapshot()
+        assert stats['duration_ms'] >= 0
+        assert os.path.getsize(store.log_path) == 0
+        store.create_message('session_a', 'after')
+        store.close()
+
+        # A torn final write is ignored
+        with open(store.log_path, 'a') as f:
+            f.write('{"op": "message", "ar')
+
+        reloaded = MemoryStorage(path)
+        assert [m['message'] for m in reloaded.get_unprocessed_messages(10, 0)] == ['before', 'after']
+        reloaded.close()
+
+    def test_without_persistence(self, tmp_path):
+        """Test nothing is written when persistence is off"""
+        store = MemoryStorage(str(tmp_path / 'chat.db'), persistence=False)
+        store.create_message('session_a', 'hello')
+        assert store.snapshot() == {'enabled': False}
+        assert os.listdir(tmp_path) == []
+        store.close()
+
+
+class TestMemoryApi:
+    """Test the API on the in-memory engine"""
+
+    def test_message_round_trip(self, tmp_path, test_config):
+        """Test messages, inbox, outbox and responses without a database file"""
+        class MemoryConfig(test_config):
+            DATABASE_PATH = str(tmp_path / 'chat.db')
+
+        with patch.object(Config, 'STORAGE_BACKEND', 'memory'):
+            assert isinstance(open_database(MemoryConfig.DATABASE_PATH), MemoryStorage)
+            try:
+                client = create_app(MemoryConfig).test_client()
+                auth = {'Authorization': 'Bearer test_api_key_123'}
+                response = client.post('/api/v1/', query_string={'action': 'messages'},
+                                       json={'session_id': 'session_memory', 'message': 'hello'})
+                assert response.status_code == 200
+
+                data = client.get('/api/v1/', query_string={'action': 'inbox'}, headers=auth).get_json()['data']
+                assert [m['message'] for m in data['messages']] == ['hello']
+                message_id = data['messages'][0]['id']
+                response = client.post('/api/v1/', query_string={'action': 'outbox'}, headers=auth,
+                                       json={'session_id': 'session_memory', 'response': 'hi', 'message_id': message_id})
+                assert response.status_code == 200
+
+                data = client.get('/api/v1/', query_string={'action': 'responses', 'session_id': 'session_memory'})
+                assert [r['response'] for r in data.get_json()['data']['responses']] == ['hi']
+
+                admin = {'Authorization': 'Bearer test_admin_key_456'}
+                response = client.get('/admin/api/session_messages', query_string={'session_id': 'session_memory'},
+                                      headers=admin)
+                assert [m['message'] for m in response.get_json()['data']['messages']] == ['hello']
+
+                # SQLite-only tools answer 501 rather than failing
+                for path in ('/admin/api/search?q=hello', '/admin/api/export', '/admin/api/archive',
+                             '/admin/api/session_timeline?session_id=session_memory', '/admin/api/stats?storage=true'):
+                    response = client.get(path, headers=admin)
+                    assert response.status_code == 501
+                    assert response.get_json()['success'] is False
+                assert client.get('/admin/api/stats', headers=admin).status_code == 200
+
+                response = client.post('/admin/api/clear_data', headers=admin)
+                assert response.get_json()['data']['cleaned_data'] == {'sessions': 1, 'messages': 1, 'responses': 1}
+                assert get_memory_storage(MemoryConfig.DATABASE_PATH).get_session_count(active=False) == 0
+            finally:
+                close_memory_storage(MemoryConfig.DATABASE_PATH)
+        assert not os.path.exists(tmp_path / 'chat.db')
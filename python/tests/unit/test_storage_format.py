@@ -0,0 +1,194 @@
+"""
+Unit tests for integer session keys and epoch-millisecond timestamps
+"""
+
+import sqlite3
+import pytest
+from app.utils.database import DatabaseManager
+from app.utils.storage_format import STORAGE_FORMAT_VERSION, StorageFormatMigration, to_epoch_ms
+
+LEGACY_SCHEMA = """
+    CREATE TABLE web_chat_sessions (id VARCHAR(64) PRIMARY KEY, uid VARCHAR(16), created_at TEXT,
+                                    last_active TEXT, ip_address VARCHAR(45), metadata TEXT);
+    CREATE TABLE web_chat_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id VARCHAR(64), message TEXT,
+                                    timestamp TEXT, processed INTEGER DEFAULT 0, broca_message_id INTEGER);
+    CREATE TABLE web_chat_responses (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id VARCHAR(64), response TEXT,
+                                     timestamp TEXT, message_id INTEGER);
+    CREATE TABLE system_config (id INTEGER PRIMARY KEY AUTOINCREMENT, config_key TEXT UNIQUE NOT NULL,
+                                config_value TEXT NOT NULL, description TEXT);
+"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A database written before the integer columns existed"""
+    db_path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.executemany(
+        "INSERT INTO web_chat_sessions (id, uid, created_at, last_active) VALUES (?, ?, ?, datetime('now'))",
+        [(f'session_{i}', f'uid{i}', '2024-01-01 00:00:00') for i in range(5)]
+    )
+    conn.executemany(
+        "INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES (?, ?, ?)",
+        [(f'session_{i % 5}', f'message {i}', f'2024-01-01 10:00:{i:02d}') for i in range(12)]
+    )
+    conn.executemany(
+        "INSERT INTO web_chat_responses (session_id, response, timestamp) VALUES (?, ?, ?)",
+        [(f'session_{i % 5}', f'response {i}', f'2024-01-01 11:00:{i:02d}') for i in range(7)]
+    )
+    conn.commit()
+    conn.close()
+    return DatabaseManager(db_path)
+
+
+class TestMigration:
+    """Test the batched backfill of an existing database"""
+
+    def test_legacy_database_starts_on_text_path(self, legacy_db):
+        """Test an unmigrated database keeps working through the text columns"""
+        assert legacy_db.get_storage_format()['version'] == 0
+        assert legacy_db.get_unprocessed_message_count() == 12
+        assert len(legacy_db.get_session_responses('session_0')) == 2
+
+    def test_migration_backfills_every_row(self, legacy_db):
+        """Test keys and timestamps are filled in batches and the version bumped"""
+        before = legacy_db.get_unprocessed_messages(100, 0)
+
+        result = StorageFormatMigration(legacy_db, batch_size=3).run()
+
+        assert result['migrated'] is True
+        assert result['sessions'] == 5
+        assert result['messages'] == 12
+        assert result['responses'] == 7
+        status = legacy_db.get_storage_format()
+        assert status['version'] == STORAGE_FORMAT_VERSION
+        assert set(status['pending'].values()) == {0}
+        assert legacy_db.get_unprocessed_messages(100, 0) == before
+
+    def test_session_keys_are_unique(self, legacy_db):
+        """Test every session gets its own surrogate key"""
+        legacy_db.migrate_storage_format()
+        conn = legacy_db.get_connection()
+        keys = [row[0] for row in conn.execute("SELECT session_key FROM web_chat_sessions")]
+        conn.close()
+        assert sorted(keys) == [1, 2, 3, 4, 5]
+
+    def test_migration_is_idempotent(self, legacy_db):
+        """Test a second run finds nothing left to fill"""
+        legacy_db.migrate_storage_format()
+        result = legacy_db.migrate_storage_format()
+        assert result['sessions'] == 0
+        assert result['messages'] == 0
+
+    def test_unsupported_schema_is_skipped(self, tmp_path):
+        """Test databases without the expected columns are left alone"""
+        db_path = str(tmp_path / 'other.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE web_chat_sessions (session_id TEXT)")
+        conn.commit()
+        conn.close()
+        manager = DatabaseManager(db_path)
+        assert manager.migrate_storage_format() == {'migrated': False, 'reason': 'unsupported schema'}
+
+
+@pytest.fixture
+def migrated(db_manager):
+    """A fresh database switched to the integer format"""
+    db_manager.migrate_storage_format()
+    return db_manager
+
+
+class TestIntegerPath:
+    """Test reads and writes once the integer columns are populated"""
+
+    def test_format_is_opt_in(self, db_manager):
+        """Test a fresh database stays on the text format until migrated"""
+        conn = db_manager.get_connection()
+        assert not db_manager.uses_integer_keys(conn)
+        assert 'session_key' not in {row[1] for row in conn.execute("PRAGMA table_info(web_chat_messages)")}
+        conn.close()
+
+        db_manager.migrate_storage_format()
+        conn = db_manager.get_connection()
+        assert db_manager.uses_integer_keys(conn)
+        conn.close()
+
+    def test_only_queried_indexes(self, migrated):
+        """Test the migration adds no activity trigger and drops objects nothing queries"""
+        conn = migrated.get_connection()
+        conn.execute("ALTER TABLE web_chat_sessions ADD COLUMN last_active_ms INTEGER")
+        conn.execute("CREATE INDEX idx_messages_pending_ts ON web_chat_messages(processed, ts)")
+        conn.commit()
+        conn.close()
+
+        migrated.migrate_storage_format()
+        conn = migrated.get_connection()
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(web_chat_sessions)")}
+        conn.close()
+        assert {'idx_sessions_key', 'idx_messages_key_ts', 'idx_responses_key_ts'} <= names
+        assert 'idx_messages_pending_ts' not in names
+        assert not any(name.endswith('_activity') for name in names)
+        assert 'last_active_ms' not in columns
+
+    def test_rows_get_key_and_timestamp(self, migrated):
+        """Test writes fill the integer columns"""
+        migrated.create_session('session_keys', '127.0.0.1')
+        message_id = migrated.create_message('session_keys', 'hello')
+        conn = migrated.get_connection()
+        row = conn.execute("""
+            SELECT m.ts, m.timestamp, s.session_key, m.session_key AS message_key
+            FROM web_chat_messages m JOIN web_chat_sessions s ON s.id = m.session_id WHERE m.id = ?
+        """, (message_id,)).fetchone()
+        conn.close()
+        assert row['message_key'] == row['session_key']
+        assert row['ts'] == to_epoch_ms(row['timestamp'])
+
+    def test_rows_written_before_their_session_are_rekeyed(self, migrated):
+        """Test a session created after its messages adopts them"""
+        migrated.create_message('session_late', 'early bird')
+        migrated.create_session('session_late', '127.0.0.1')
+        messages = migrated.get_unprocessed_messages(10, 0)
+        assert [m['uid'] for m in messages if m['session_id'] == 'session_late'][0] is not None
+
+    def test_since_filters_on_integer_timestamps(self, migrated):
+        """Test since accepts both SQLite and ISO 8601 timestamps"""
+        conn = migrated.get_connection()
+        conn.executemany(
+            "INSERT INTO web_chat_responses (session_id, response, timestamp) VALUES ('session_since', ?, ?)",
+            [('old', '2024-01-01 10:00:00'), ('new', '2024-01-01 12:00:00')]
+        )
+        conn.execute("INSERT INTO web_chat_sessions (id, uid, last_active) VALUES ('session_since', 'u', datetime('now'))")
+        conn.commit()
+        conn.close()
+
+        for since in ('2024-01-01 11:00:00', '2024-01-01T11:00:00Z'):
+            responses = migrated.get_session_responses('session_since', since)
+            assert [r['response'] for r in responses] == ['new']
+
+    def test_timestamp_updates_refresh_integer_columns(self, migrated):
+        """Test direct timestamp updates keep ts in step"""
+        message_id = migrated.create_message('session_update', 'hello')
+        conn = migrated.get_connection()
+        conn.execute("UPDATE web_chat_messages SET timestamp = '2000-01-01 00:00:00' WHERE id = ?", (message_id,))
+        conn.commit()
+        ts = conn.execute("SELECT ts FROM web_chat_messages WHERE id = ?", (message_id,)).fetchone()[0]
+        conn.close()
+        assert ts == 946684800000
+
+    def test_fast_reset_keeps_format(self, migrated):
+        """Test the swapped-in empty database keeps its format version"""
+        migrated.reset_database()
+        assert migrated.get_storage_format()['version'] == STORAGE_FORMAT_VERSION
+
+
+class TestEpochParsing:
+    """Test timestamp conversion"""
+
+    def test_to_epoch_ms(self):
+        """Test naive values are UTC and garbage is rejected"""
+        assert to_epoch_ms('1970-01-01 00:00:01') == 1000
+        assert to_epoch_ms('1970-01-01T01:00:00+01:00') == 0
+        assert to_epoch_ms('yesterday') is None
+        assert to_epoch_ms('') is None
@@ -0,0 +1,200 @@
+"""
+Unit tests for tenant-partitioned storage
+"""
+
+import os
+import shutil
+import pytest
+from unittest.mock import patch
+from app import create_app
+from app.utils.database import DatabaseManager
+from app.utils.tenants import TenantError, tenant_db_path
+from config import Config
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'db', 'init_database.sql')
+
+ADMIN = {'Authorization': 'Bearer test_admin_key_456'}
+
+
+@pytest.fixture
+def global_db(tmp_path):
+    """A global database in its own directory, with the test keys"""
+    os.makedirs(tmp_path / 'tenants')
+    shutil.copy(SCHEMA, tmp_path / 'init_database.sql')
+    shutil.copy(SCHEMA, tmp_path / 'tenants' / 'init_database.sql')
+    db = DatabaseManager(str(tmp_path / 'global.db'))
+    db.update_config({'api_key': 'test_api_key_123', 'admin_key': 'test_admin_key_456'})
+    return db
+
+
+@pytest.fixture
+def tenant_client(test_config, global_db):
+    class TenantConfig(test_config):
+        DATABASE_PATH = global_db.db_path
+
+    with patch.object(Config, 'TENANT_MODE', True):
+        yield create_app(TenantConfig).test_client()
+
+
+def post_message(client, message, **query):
+    return client.post('/api/v1/', query_string=dict(query, action='messages'),
+                       json={'session_id': 'session_tenant', 'message': message})
+
+
+def inbox(client, api_key):
+    response = client.get('/api/v1/', query_string={'action': 'inbox'},
+                          headers={'Authorization': f'Bearer {api_key}'})
+    return response.status_code, [m['message'] for m in response.get_json().get('data', {}).get('messages', [])]
+
+
+class TestRegistry:
+    """Test registering tenants and their databases"""
+
+    def test_save_and_rotate(self, global_db):
+        """Test tenants get a generated key and their own file, without a copy of the admin key"""
+        tenant = global_db.save_tenant('acme')
+        assert len(tenant['api_key']) >= 8
+        assert tenant['db_path'] == tenant_db_path(global_db.db_path, 'acme')
+
+        tenant_db = DatabaseManager(tenant['db_path'])
+        assert tenant_db.get_config('api_key') == tenant['api_key']
+        assert tenant_db.get_config('admin_key') != 'test_admin_key_456'
+
+        global_db.save_tenant('acme', 'rotated-key-1')
+        assert tenant_db.get_config('api_key') == 'rotated-key-1'
+        assert global_db.get_tenant_registry().by_key('rotated-key-1')['id'] == 'acme'
+        assert global_db.get_tenant_registry().by_key(tenant['api_key']) is None
+
+    def test_invalid_tenants(self, global_db):
+        """Test bad ids and keys shared between tenants are rejected"""
+        global_db.save_tenant('acme', 'shared-key-1')
+        with pytest.raises(TenantError):
+            global_db.save_tenant('other', 'shared-key-1')
+        with pytest.raises(TenantError):
+            global_db.save_tenant('../escape')
+        with pytest.raises(TenantError):
+            global_db.save_tenant('short', 'abc')
+
+    def test_remove(self, global_db):
+        """Test removing a tenant keeps its file unless asked to delete it"""
+        path = global_db.save_tenant('acme')['db_path']
+        assert global_db.remove_tenant('acme')
+        assert os.path.exists(path)
+        assert not global_db.remove_tenant('acme')
+
+        global_db.save_tenant('acme')
+        global_db.remove_tenant('acme', delete_data=True)
+        assert not os.path.exists(path)
+        assert global_db.list_tenants() == []
+
+    def test_tenants_survive_reset(self, global_db):
+        """Test a fast reset of the global database keeps the tenant list"""
+        global_db.save_tenant('acme')
+        global_db.reset_database()
+        assert [t['id'] for t in global_db.list_tenants()] == ['acme']
+
+    def test_per_tenant_retention(self, global_db):
+        """Test a tenant database can override the message TTL"""
+        tenant_db = DatabaseManager(global_db.save_tenant('acme')['db_path'])
+        tenant_db.update_config({'retention_message_ttl': '60'})
+        with patch.object(Config, 'RETENTION_MESSAGE_TTL', 0):
+            global_names = {p.name for p in global_db.get_retention_policies()}
+            tenant_names = {p.name for p in tenant_db.get_retention_policies()}
+        assert 'processed_messages' in tenant_names - global_names
+
+
+class TestRouting:
+    """Test requests reach the database of their tenant"""
+
+    def test_requests_use_tenant_database(self, tenant_client, global_db):
+        """Test sites post with ?tenant= and agents drain with the tenant's key"""
+        global_db.save_tenant('acme', 'acme-key-123')
+        assert post_message(tenant_client, 'for acme', tenant='acme').status_code == 200
+        assert post_message(tenant_client, 'for everyone').status_code == 200
+
+        assert inbox(tenant_client, 'acme-key-123') == (200, ['for acme'])
+        assert inbox(tenant_client, 'test_api_key_123') == (200, ['for everyone'])
+
+        # The global key is not valid for a tenant's database
+        response = tenant_client.get('/api/v1/', query_string={'action': 'inbox', 'tenant': 'acme'},
+                                     headers={'Authorization': 'Bearer test_api_key_123'})
+        assert response.status_code == 401
+
+    def test_unknown_tenant(self, tenant_client):
+        """Test naming a tenant that does not exist is a 404"""
+        assert post_message(tenant_client, 'hello', tenant='missing').status_code == 404
+
+    def test_admin_tenants_api(self, tenant_client, global_db):
+        """Test registering, listing and administering a tenant over the admin API"""
+        response = tenant_client.post('/admin/api/tenants', json={'tenant_id': 'acme', 'api_key': 'acme-key-123'},
+                                      headers=ADMIN)
+        assert response.status_code == 200
+        post_message(tenant_client, 'for acme', tenant='acme')
+
+        response = tenant_client.get('/admin/api/tenants', headers=ADMIN)
+        data = response.get_json()['data']
+        assert data['tenant_mode'] is True
+        assert [t['id'] for t in data['tenants']] == ['acme']
+
+        response = tenant_client.get('/admin/api/sessions', query_string={'tenant': 'acme'}, headers=ADMIN)
+        assert [s['id'] for s in response.get_json()['data']['sessions']] == ['session_tenant']
+        response = tenant_client.get('/admin/api/sessions', headers=ADMIN)
+        assert response.get_json()['data']['sessions'] == []
+
+        response = tenant_client.post('/admin/api/tenants', json={'tenant_id': 'Bad Id'}, headers=ADMIN)
+        assert response.status_code == 400
+
+        response = tenant_client.delete('/admin/api/tenants', query_string={'tenant_id': 'acme'}, headers=ADMIN)
+        assert response.get_json()['data'] == {'removed': True}
+
+    def test_admin_key_is_global(self, tenant_client, global_db):
+        """Test admin requests for a tenant are checked against the global admin key"""
+        tenant_db = DatabaseManager(global_db.save_tenant('acme', 'acme-key-123')['db_path'])
+        sessions = {'tenant': 'acme'}
+        assert tenant_client.get('/admin/api/sessions', query_string=sessions, headers=ADMIN).status_code == 200
+
+        global_db.update_config({'admin_key': 'rotated-admin-key'})
+        assert tenant_client.get('/admin/api/sessions', query_string=sessions, headers=ADMIN).status_code == 401
+        stale = {'Authorization': f"Bearer {tenant_db.get_config('admin_key')}"}
+        assert tenant_client.get('/admin/api/sessions', query_string=sessions, headers=stale).status_code == 401
+        rotated = {'Authorization': 'Bearer rotated-admin-key'}
+        assert tenant_client.get('/admin/api/sessions', query_string=sessions, headers=rotated).status_code == 200
+        assert inbox(tenant_client, 'test_admin_key_456')[0] == 401
+
+    def test_jobs_start_once(self, test_config, global_db):
+        """Test a tenant's retention and backups are started by its first request only"""
+        class TenantConfig(test_config):
+            DATABASE_PATH = global_db.db_path
+            RETENTION_INTERVAL = 300
+            BACKUP_INTERVAL = 3600
+
+        global_db.save_tenant('acme', 'acme-key-123')
+        with patch.object(Config, 'TENANT_MODE', True), \
+                patch('app.utils.retention.start_retention_scheduler') as retention, \
+                patch('app.utils.backup.start_backup_scheduler') as backup:
+            client = create_app(TenantConfig).test_client()
+            for _ in range(3):
+                assert inbox(client, 'acme-key-123')[0] == 200
+        path = tenant_db_path(global_db.db_path, 'acme')
+        # create_app starts the global database's jobs itself
+        assert [call.args for call in retention.call_args_list] == [(global_db.db_path, 300.0), (path, 300.0)]
+        assert [call.args for call in backup.call_args_list] == [(global_db.db_path, 3600.0), (path, 3600.0)]
+
+    def test_shared_archive_is_refused(self, test_config):
+        """Test tenant mode refuses one archive file for every tenant"""
+        with patch.object(Config, 'TENANT_MODE', True), patch.object(Config, 'ARCHIVE_DATABASE_PATH', 'archive.db'):
+            with pytest.raises(ValueError):
+                create_app(test_config)
+
+    def test_replica_is_refused(self, test_config):
+        """Test tenant mode refuses to run on a replica, whose follower covers the global database only"""
+        with patch.object(Config, 'TENANT_MODE', True), patch.object(Config, 'REPLICA_OF', 'http://primary'):
+            with pytest.raises(ValueError):
+                create_app(test_config)
+
+    def test_tenant_mode_off(self, client, db_manager):
+        """Test ?tenant= is ignored when tenant mode is off"""
+        response = client.post('/api/v1/', query_string={'action': 'messages', 'tenant': 'missing'},
+                               json={'session_id': 'session_tenant', 'message': 'hello'})
+        assert response.status_code == 200
+        assert db_manager.get_unprocessed_message_count() == 1
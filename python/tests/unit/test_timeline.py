@@ -0,0 +1,93 @@
+"""
+Unit tests for the paginated merged conversation timeline
+"""
+
+import pytest
+from app.utils.timeline import TimelineError, timeline_page
+
+
+@pytest.fixture
+def conversation(db_manager):
+    """Three exchanges, two of them stamped in the same second"""
+    db_manager.migrate_storage_format()
+    db_manager.create_session('session_timeline', '127.0.0.1')
+    conn = db_manager.get_connection()
+    for second, text in ((0, 'first'), (0, 'second'), (5, 'third')):
+        cursor = conn.execute(
+            "INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES ('session_timeline', ?, ?)",
+            (f'ask {text}', f'2024-01-01 10:00:0{second}')
+        )
+        conn.execute(
+            "INSERT INTO web_chat_responses (session_id, response, message_id, timestamp) "
+            "VALUES ('session_timeline', ?, ?, ?)",
+            (f'answer {text}', cursor.lastrowid, f'2024-01-01 10:00:0{second}')
+        )
+    conn.execute("INSERT INTO web_chat_messages (session_id, message, timestamp) VALUES ('session_other', 'x', '2024-01-01')")
+    conn.commit()
+    conn.close()
+    return db_manager
+
+
+def page_through(fetch, limit):
+    items = []
+    cursor = None
+    while True:
+        page = fetch(limit, cursor)
+        items.extend(page['items'])
+        assert len(page['items']) <= limit
+        if not page['has_more']:
+            assert page['next_cursor'] is None
+            return items
+        cursor = page['next_cursor']
+
+
+EXPECTED = [
+    'ask first', 'ask second', 'answer first', 'answer second', 'ask third', 'answer third'
+]
+
+
+class TestTimeline:
+    """Test merging and keyset pagination"""
+
+    def test_merged_order(self, conversation):
+        """Test messages and responses interleave by time, messages first within a second"""
+        page = conversation.get_session_timeline('session_timeline', 100)
+        assert [item['content'] for item in page['items']] == EXPECTED
+        assert page['items'][2]['type'] == 'response'
+        assert page['items'][2]['message_id'] == page['items'][0]['id']
+        assert 'message_id' not in page['items'][0]
+
+    @pytest.mark.parametrize('limit', [1, 2, 4])
+    def test_pages_cover_everything_once(self, conversation, limit):
+        """Test following next_cursor visits every row exactly once"""
+        items = page_through(
+            lambda size, cursor: conversation.get_session_timeline('session_timeline', size, cursor), limit
+        )
+        assert [item['content'] for item in items] == EXPECTED
+
+    def test_text_columns(self, conversation):
+        """Test the same order on databases without the integer columns"""
+        conn = conversation.get_connection()
+        try:
+            items = page_through(
+                lambda size, cursor: timeline_page(conn, 'session_timeline', size, cursor, integer_keys=False), 2
+            )
+        finally:
+            conn.close()
+        assert [item['content'] for item in items] == EXPECTED
+
+    def test_invalid_cursor(self, conversation):
+        """Test a malformed cursor is rejected"""
+        with pytest.raises(TimelineError):
+            conversation.get_session_timeline('session_timeline', 10, 'not-a-cursor')
+
+    def test_arms_use_session_index(self, conversation):
+        """Test each side of the union is read through the (session_key, ts) indexes"""
+        conn = conversation.get_connection()
+        plan = ' '.join(row[3] for row in conn.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT id, ts FROM web_chat_messages
+            WHERE session_key = (SELECT session_key FROM web_chat_sessions WHERE id = ?) AND (ts, id) > (?, ?)
+        """, ('session_timeline', 0, 0)))
+        conn.close()
+        assert 'idx_messages_key_ts' in plan